@@ -52,6 +52,8 @@ from main import settings
 
 from lib import nameurl
 
+from crypt import key
+
 from userid import identity
 from userid import id_url
 
@@ -193,6 +195,11 @@ def idset(idurl, id_obj):
     if not has_idurl(idurl):
         if _Debug:
             lg.out(_DebugLevel, 'identitydb.idset new identity: %r' % idurl)
+    else:
+        old_id_obj = _IdentityCache[idurl]
+        if old_id_obj.publickey != id_obj.publickey or old_id_obj.getRevisionValue() != id_obj.getRevisionValue():
+            # identity was rotated or changed, parsed public key must be loaded again
+            key.ForgetPublicKey(old_id_obj.publickey)
     _IdentityCache[idurl] = id_obj
     _IdentityCacheModifiedTime[idurl] = time.time()
     identid = _IdentityCacheIDs.get(idurl, None)
@@ -250,6 +257,8 @@ def idremove(idurl):
     global _IPPort2IDURL
     idurl = id_url.to_original(idurl)
     idobj = _IdentityCache.pop(idurl, None)
+    if idobj is not None:
+        key.ForgetPublicKey(idobj.publickey)
     identid = _IdentityCacheIDs.pop(idurl, None)
     _IdentityCacheModifiedTime.pop(idurl, None)
     _IDURL2Contacts.pop(idurl, None)
@@ -53,6 +53,12 @@ RAIDMAKE:
 RAIDREAD:
     It can also rebuild the ``encrypted`` from packets and will
     generate the read requests to get fetch the packets.
+
+Block can be serialized in JSON (default) or in a length-prefixed binary form,
+see ``lib.serialization.FieldsToBytes()``. ``Unserialize()`` detects the format automatically.
+
+Data can be compressed before encryption, codec is stored in the ``Compression`` field
+and ``Data()`` decompresses it transparently, see ``lib.compression``.
 """
 
 #------------------------------------------------------------------------------
@@ -74,6 +80,7 @@ from logs import lg
 
 from lib import strng
 from lib import serialization
+from lib import compression
 
 from contacts import contactsdb
 
@@ -85,6 +92,11 @@ from crypt import my_keys
 
 #------------------------------------------------------------------------------
 
+BINARY_FORMAT_KIND = b'b'
+BINARY_FORMAT_VERSION = 1
+
+#------------------------------------------------------------------------------
+
 
 class Block(object):
     """
@@ -99,6 +111,7 @@ class Block(object):
                            and multiple of #nodes in eccmap (usually 64) for division
                            into packets
     Length                 real length of data when cleartext (encrypted may be padded)
+    Compression            codec used to compress data before encryption, empty if not compressed
     LastBlock              should now be "True" or "False" - careful in using
     SessionKeyType         which crypto is used for session key
     EncryptedSessionKey    encrypted with our public key so only we can read this
@@ -121,6 +134,7 @@ class Block(object):
             EncryptedData=None,
             Length=None,
             Signature=None,
+            Compression=None,
         ):
         self.CreatorID = CreatorID
         if not self.CreatorID:
@@ -130,6 +144,7 @@ class Block(object):
         self.BackupID = strng.to_text(BackupID)
         self.BlockNumber = BlockNumber
         self.LastBlock = bool(LastBlock)
+        self.Compression = strng.to_text(Compression) if Compression and Compression != 'none' else ''
         self.SessionKeyType = SessionKeyType or key.SessionKeyType()
         if EncryptedSessionKey:
             # this block to be decrypted after receiving
@@ -194,6 +209,8 @@ class Block(object):
         StringToHash += sep + strng.to_bin(self.EncryptedSessionKey)
         StringToHash += sep + strng.to_bin(str(self.Length))
         StringToHash += sep + strng.to_bin(str(self.LastBlock))
+        if self.Compression:
+            StringToHash += sep + strng.to_bin(self.Compression)
         StringToHash += sep + strng.to_bin(self.EncryptedData)
         return StringToHash
 
@@ -244,17 +261,22 @@ class Block(object):
     def Data(self):
         """
         Return an original data, decrypt using ``EncryptedData`` and
-        ``EncryptedSessionKey``.
+        ``EncryptedSessionKey`` and decompress if needed.
         """
         SessionKey = self.SessionKey()
         ClearLongData = key.DecryptWithSessionKey(SessionKey, self.EncryptedData, session_key_type=self.SessionKeyType)
+        if self.Compression:
+            return compression.decompress(ClearLongData[0:self.Length], self.Compression)
         return ClearLongData[0:self.Length]    # remove padding
 
-    def Serialize(self):
+    def Serialize(self, binary=False):
         """
         Create a string that stores all data fields of that ``encrypted.Block``
-        object.
+        object. If ``binary`` is True the string is in binary form and
+        ``EncryptedData`` is not escaped.
         """
+        if binary:
+            return self.SerializeBinary()
         dct = {
             'c': self.CreatorID.to_text(),
             'b': self.BackupID,
@@ -266,47 +288,80 @@ class Block(object):
             'p': self.EncryptedData,
             's': self.Signature,
         }
+        if self.Compression:
+            dct['z'] = self.Compression
         if _Debug:
             lg.out(_DebugLevel, 'encrypted.Serialize %s' % repr(dct)[:100])
         return serialization.DictToBytes(dct, encoding='utf-8')
 
+    def SerializeBinary(self):
+        """
+        Create a binary string from that ``encrypted.Block`` object.
+        """
+        return serialization.FieldsToBytes([
+            strng.to_bin(self.CreatorID.to_text()),
+            strng.to_bin(self.BackupID),
+            strng.to_bin(str(self.BlockNumber)),
+            b'1' if self.LastBlock else b'0',
+            strng.to_bin(self.SessionKeyType),
+            strng.to_bin(self.EncryptedSessionKey),
+            strng.to_bin(str(self.Length)),
+            strng.to_bin(self.Signature),
+            strng.to_bin(self.EncryptedData),
+        ] + ([strng.to_bin(self.Compression), ] if self.Compression else []), kind=BINARY_FORMAT_KIND, version=BINARY_FORMAT_VERSION)
+
 #------------------------------------------------------------------------------
 
 
 def Unserialize(data, decrypt_key=None):
     """
-    A method to create a ``encrypted.Block`` instance from input string.
+    A method to create a ``encrypted.Block`` instance from input string,
+    both JSON and binary forms are accepted.
     """
-    dct = serialization.BytesToDict(data, keys_to_text=True, encoding='utf-8')
-    if _Debug:
-        lg.out(_DebugLevel, 'encrypted.Unserialize %s' % repr(dct)[:100])
-    try:
-        _c = dct['c']
-        _b = dct['b']
-        _n = dct['n']
-        _e = dct['e']
-        _k = dct['k']
-        _t = dct['t']
-        _l = dct['l']
-        _p = dct['p']
-        _s = dct['s']
-    except Exception as exc:
-        lg.exc('data unserialize failed with %r: %r' % (exc, list(dct.keys())))
+    if serialization.IsBinary(data):
+        try:
+            _, fields = serialization.BytesToFields(data, kind=BINARY_FORMAT_KIND)
+            _c, _b, _n, _e, _t, _k, _l, _s, _p = fields[:9]
+            _z = fields[9] if len(fields) > 9 else None
+            _n = int(_n)
+            _e = (_e == b'1')
+            _l = int(_l)
+        except Exception as exc:
+            lg.exc('binary data unserialize failed with %r' % exc)
+            return None
+    else:
+        dct = serialization.BytesToDict(data, keys_to_text=True, encoding='utf-8')
         if _Debug:
-            lg.out(_DebugLevel, repr(dct))
-        return None
+            lg.out(_DebugLevel, 'encrypted.Unserialize %s' % repr(dct)[:100])
+        try:
+            _c = dct['c']
+            _b = dct['b']
+            _n = dct['n']
+            _e = dct['e']
+            _k = base64.b64decode(strng.to_bin(dct['k']))
+            _t = dct['t']
+            _l = dct['l']
+            _p = dct['p']
+            _s = dct['s']
+            _z = dct.get('z')
+        except Exception as exc:
+            lg.exc('data unserialize failed with %r: %r' % (exc, list(dct.keys())))
+            if _Debug:
+                lg.out(_DebugLevel, repr(dct))
+            return None
     try:
         newobject = Block(
             CreatorID=id_url.field(_c),
             BackupID=strng.to_text(_b),
             BlockNumber=_n,
             LastBlock=_e,
-            EncryptedSessionKey=base64.b64decode(strng.to_bin(_k)),
+            EncryptedSessionKey=_k,
             SessionKeyType=strng.to_text(_t),
             Length=_l,
             EncryptedData=_p,
             Signature=_s,
             DecryptKey=decrypt_key,
+            Compression=_z,
         )
     except:
         lg.exc()
@@ -30,6 +30,9 @@ Here is a bunch of cryptography methods used in all parts of the software.
 BitDust uses PyCryptodome library: https://www.pycryptodome.org/
 Our local key is always on hand.
 Main thing here is to be able to use public keys in contacts to verify packets.
+
+Parsed public keys of other users are kept in a small LRU cache,
+so the key text is not parsed again for every incoming packet.
 """
 
 #------------------------------------------------------------------------------
@@ -49,6 +52,9 @@ import os
 import sys
 import gc
 import tempfile
+import threading
+
+from collections import OrderedDict
 
 #------------------------------------------------------------------------------
 
@@ -60,6 +66,8 @@ if __name__ == '__main__':
 
 from logs import lg
 
+from lib import strng
+
 from system import bpio
 from system import local_fs
 
@@ -73,6 +81,12 @@ from crypt import cipher
 
 _MyKeyObject = None
 
+_PublicKeysCache = OrderedDict()
+_PublicKeysCacheMaxSize = 500
+_PublicKeysCacheLock = threading.Lock()
+_PublicKeysCacheHits = 0
+_PublicKeysCacheMisses = 0
+
 #------------------------------------------------------------------------------
 
 
@@ -247,8 +261,7 @@ def VerifySignature(pubkeystring, hashcode, signature):
 
     Return True if signature is correct, otherwise False.
     """
-    pub_key = rsa_key.RSAKey()
-    pub_key.fromString(pubkeystring)
+    pub_key = GetPublicKeyObject(pubkeystring)
     result = pub_key.verify(signature, hashcode)
     return result
 
@@ -266,6 +279,65 @@ def Verify(ConIdentity, hashcode, signature):
 #------------------------------------------------------------------------------
 
 
+def _public_key_fingerprint(pubkeystring):
+    return hashes.sha1(strng.to_bin(pubkeystring))
+
+
+def GetPublicKeyObject(pubkeystring):
+    """
+    Returns ``rsa_key.RSAKey`` object for given public key in openssh format,
+    same object is returned from the cache next time.
+    """
+    global _PublicKeysCacheHits
+    global _PublicKeysCacheMisses
+    fingerprint = _public_key_fingerprint(pubkeystring)
+    with _PublicKeysCacheLock:
+        pub_key = _PublicKeysCache.get(fingerprint)
+        if pub_key is not None:
+            _PublicKeysCache.move_to_end(fingerprint)
+            _PublicKeysCacheHits += 1
+            return pub_key
+        _PublicKeysCacheMisses += 1
+    pub_key = rsa_key.RSAKey()
+    pub_key.fromString(pubkeystring)
+    with _PublicKeysCacheLock:
+        _PublicKeysCache[fingerprint] = pub_key
+        while len(_PublicKeysCache) > _PublicKeysCacheMaxSize:
+            _PublicKeysCache.popitem(last=False)
+    return pub_key
+
+
+def ForgetPublicKey(pubkeystring):
+    """
+    Removes parsed public key from the cache, called when identity was changed or removed from the local cache.
+    """
+    with _PublicKeysCacheLock:
+        return _PublicKeysCache.pop(_public_key_fingerprint(pubkeystring), None) is not None
+
+
+def ClearPublicKeysCache():
+    global _PublicKeysCacheHits
+    global _PublicKeysCacheMisses
+    with _PublicKeysCacheLock:
+        _PublicKeysCache.clear()
+        _PublicKeysCacheHits = 0
+        _PublicKeysCacheMisses = 0
+
+
+def PublicKeysCacheInfo():
+    """
+    Returns current size and hit/miss counters of the public keys cache.
+    """
+    return {
+        'size': len(_PublicKeysCache),
+        'max_size': _PublicKeysCacheMaxSize,
+        'hits': _PublicKeysCacheHits,
+        'misses': _PublicKeysCacheMisses,
+    }
+
+#------------------------------------------------------------------------------
+
+
 def HashMD5(inp, hexdigest=False):
     """
     Use MD5 method to calculate the hash of ``inp`` string.
@@ -40,6 +40,14 @@ Packet Fields are all strings (no integers, objects, etc)
     - RemoteID : want full IDURL for other party so troublemaker could not
                 use his packets to mess up other nodes by sending it to them
     - Signature : signature on Hash is always by CreatorID
+
+Packet can be serialized in two forms: JSON (default) and a length-prefixed binary form,
+see ``lib.serialization.FieldsToBytes()``. In the binary form ``Payload`` is written as is,
+without any escaping. ``Unserialize()`` detects the format automatically.
+
+Binary form is only used to send packets to nodes which announced in their identity
+that they are able to read it, see ``IsBinaryFormatSupported()``. Signature and JSON form
+of the packet are not changed, so nodes which do not know about binary form are not affected.
 """
 
 #------------------------------------------------------------------------------
@@ -73,6 +81,7 @@ from lib import strng
 from lib import serialization
 
 from contacts import contactsdb
+from contacts import identitycache
 
 from crypt import key
 
@@ -81,6 +90,28 @@ from userid import id_url
 
 #------------------------------------------------------------------------------
 
+BINARY_FORMAT_KIND = b'p'
+BINARY_FORMAT_VERSION = 1
+
+#------------------------------------------------------------------------------
+
+def IsBinaryFormatSupported(idurl):
+    """
+    Returns True if identity of given node says it can read binary packets,
+    the version field is covered by the identity signature.
+    """
+    if not idurl:
+        return False
+    idurl = id_url.field(idurl)
+    if not identitycache.HasKey(idurl):
+        return False
+    ident = identitycache.FromCache(idurl)
+    if not ident:
+        return False
+    return serialization.IsBinaryFormatAnnounced(ident.getVersionStr())
+
+#------------------------------------------------------------------------------
+
 class Packet(object):
     """
     Init with: Command, OwnerID, CreatorID, PacketID, Payload, RemoteID The
@@ -212,7 +243,7 @@ class Packet(object):
 #                     lg.exc()
         return signature
 
-    def SignatureChecksOut(self, raise_signature_invalid=False):
+    def SignatureChecksOut(self, raise_signature_invalid=False, creator_identity=None):
         """
         This check correctness of signature, uses ``crypt.key.Verify``. To
         verify we need 3 things:
@@ -220,8 +251,11 @@ class Packet(object):
         - the packet ``Creator`` identity ( it keeps the public key ),
         - hash of that packet - just call ``GenerateHash()`` to make it,
         - the signature itself.
+
+        Identity of the creator can be passed in ``creator_identity``,
+        this way the method is safe to be called outside of the main thread.
         """
-        CreatorIdentity = contactsdb.get_contact_identity(self.CreatorID)
+        CreatorIdentity = creator_identity or contactsdb.get_contact_identity(self.CreatorID)
         if CreatorIdentity is None:
             # OwnerIdentity = contactsdb.get_contact_identity(self.OwnerID)
             # if OwnerIdentity is None:
@@ -264,7 +298,7 @@ class Packet(object):
         """
         return self.Signature is not None
 
-    def Valid(self, raise_signature_invalid=False):
+    def Valid(self, raise_signature_invalid=False, creator_identity=None):
         """
         ``Valid()`` should check every one of packet header fields: 1) that
         command is one of the legal commands 2) signature is good (which means
@@ -280,7 +314,7 @@ class Packet(object):
         if not commands.IsCommand(self.Command):
             lg.warn("signed.Valid bad Command " + str(self.Command))
             return False
-        if not self.SignatureChecksOut(raise_signature_invalid=raise_signature_invalid):
+        if not self.SignatureChecksOut(raise_signature_invalid=raise_signature_invalid, creator_identity=creator_identity):
             if raise_signature_invalid:
                 creator_xml = contactsdb.get_contact_identity(self.CreatorID)
                 if creator_xml:
@@ -318,11 +352,14 @@ class Packet(object):
         """
         return packetid.SupplierNumber(self.PacketID)
 
-    def Serialize(self):
+    def Serialize(self, binary=False):
         """
         Create a string from packet object.
         This is useful when need to save the packet on disk or send via network.
+        If ``binary`` is True packet is written in a binary form, remote node must be able to read it.
         """
+        if binary:
+            return self.SerializeBinary()
         dct = {
             'm': self.Command,
             'o': self.OwnerID.original(),
@@ -333,7 +370,7 @@ class Packet(object):
             'r': self.RemoteID.original(),
             'k': self.KeyID,
             's': self.Signature,
-        }        
+        }
         src = serialization.DictToBytes(dct, encoding='latin1')
         # if _Debug:
         #     lg.out(_DebugLevel, 'signed.Serialize %d bytes %s(%s) %s/%s/%s KeyID=%s\n%r' % (
@@ -341,6 +378,22 @@ class Packet(object):
         #         nameurl.GetName(self.CreatorID), nameurl.GetName(self.RemoteID), self.KeyID, dct['s']))
         return src
 
+    def SerializeBinary(self):
+        """
+        Create a binary string from packet object, ``Payload`` is not escaped.
+        """
+        return serialization.FieldsToBytes([
+            strng.to_bin(self.Command),
+            self.OwnerID.original(),
+            self.CreatorID.original(),
+            strng.to_bin(self.PacketID),
+            strng.to_bin(self.Date),
+            self.RemoteID.original(),
+            strng.to_bin(self.KeyID),
+            strng.to_bin(self.Signature),
+            self.Payload,
+        ], kind=BINARY_FORMAT_KIND, version=BINARY_FORMAT_VERSION)
+
     def __len__(self):
         """
         Return a length of serialized packet .
@@ -359,31 +412,43 @@ class PacketZeroSigned(Packet):
 
 def Unserialize(data):
     """
-    We expect here a string containing a whole packet object in text form.
+    We expect here a string containing a whole packet object in JSON or binary form.
     Will return a real object in the memory from given string.
     All class fields are loaded, signature can be verified to be sure - it was truly original string.
     """
     if data is None:
         return None
 
-    dct = serialization.BytesToDict(data, keys_to_text=True, encoding='latin1')
+    if serialization.IsBinary(data):
+        try:
+            _, fields = serialization.BytesToFields(data, kind=BINARY_FORMAT_KIND)
+            Command, OwnerID, CreatorID, PacketID, Date, RemoteID, KeyID, Signature, Payload = fields[:9]
+            Command = strng.to_text(Command)
+            PacketID = strng.to_text(PacketID)
+            Date = strng.to_text(Date)
+            KeyID = strng.to_text(KeyID)
+        except:
+            lg.exc()
+            return None
+    else:
+        dct = serialization.BytesToDict(data, keys_to_text=True, encoding='latin1')
 
-    # if _Debug:
-    #     lg.out(_DebugLevel, 'signed.Unserialize %d bytes : %r' % (len(data), dct['s']))
+        # if _Debug:
+        #     lg.out(_DebugLevel, 'signed.Unserialize %d bytes : %r' % (len(data), dct['s']))
 
-    try:
-        Command = strng.to_text(dct['m'])
-        OwnerID = dct['o']
-        CreatorID = dct['c']
-        PacketID = strng.to_text(dct['i'])
-        Date = strng.to_text(dct['d'])
-        Payload = dct['p']
-        RemoteID = dct['r']
-        KeyID = strng.to_text(dct['k'])
-        Signature = dct['s']
-    except:
-        lg.exc()
-        return None
+        try:
+            Command = strng.to_text(dct['m'])
+            OwnerID = dct['o']
+            CreatorID = dct['c']
+            PacketID = strng.to_text(dct['i'])
+            Date = strng.to_text(dct['d'])
+            Payload = dct['p']
+            RemoteID = dct['r']
+            KeyID = strng.to_text(dct['k'])
+            Signature = dct['s']
+        except:
+            lg.exc()
+            return None
 
     try:
         newobject = Packet(
@@ -46,6 +46,9 @@ import random
 import optparse
 import pprint
 import json
+import sqlite3
+
+from collections import OrderedDict
 
 #------------------------------------------------------------------------------
 
@@ -64,7 +67,6 @@ if __name__ == '__main__':
 from logs import lg
 
 from system import bpio
-from system import local_fs
 
 from main import settings
 from main import events
@@ -83,7 +85,7 @@ from dht.entangled.kademlia import constants  # @UnresolvedImport
 from dht.entangled.kademlia.datastore import SQLiteVersionedJsonDataStore  # @UnresolvedImport
 from dht.entangled.kademlia.node import rpcmethod, MultiLayerNode  # @UnresolvedImport
 from dht.entangled.kademlia.protocol import KademliaMultiLayerProtocol, encoding, msgformat  # @UnresolvedImport
-from dht.entangled.kademlia.routingtable import TreeRoutingTable  # @UnresolvedImport
+from dht.entangled.kademlia.routingtable import TreeRoutingTable, VectorRoutingTable  # @UnresolvedImport
 from dht.entangled.kademlia.contact import Contact  # @UnresolvedImport
 
 
@@ -96,6 +98,15 @@ SENDING_FREQUENCY_SEC = 0.02  # must be always slower than receiving frequency!
 RECEIVING_QUEUE_LENGTH_CRITICAL = 100
 SENDING_QUEUE_LENGTH_CRITICAL = 50
 DEFAULT_CACHE_TTL = 60 * 60 * 3
+CACHE_MAX_AGE = 60 * 60 * 24
+CACHE_MISSING_TTL = 60 * 5
+CACHE_MAX_MEMORY_RECORDS = 1000
+CACHE_MAX_DISK_RECORDS = 20000
+
+ROUTING_TABLES = {
+    'tree': TreeRoutingTable,
+    'vector': VectorRoutingTable,
+}
 
 #------------------------------------------------------------------------------
 
@@ -104,11 +115,15 @@ _ActiveLookup = None
 _ActiveLookupLayerID = None
 _Counters = {}
 _ProtocolVersion = 7
-_Cache = {}
+_Cache = None
 
 #------------------------------------------------------------------------------
 
-def init(udp_port, dht_dir_path=None, open_layers=[]):
+def init(udp_port, dht_dir_path=None, open_layers=[], routing_tables={}):
+    """
+    Parameter `routing_tables` allows to select routing table implementation per layer,
+    for example: `{2: 'vector', }`, see `ROUTING_TABLES`.
+    """
     global _MyNode
     if _MyNode is not None:
         if _Debug:
@@ -134,10 +149,11 @@ def init(udp_port, dht_dir_path=None, open_layers=[]):
     list_layers = []
     if os.path.isdir(dht_dir_path):
         list_layers = os.listdir(dht_dir_path)
+    init_cache(os.path.join(dht_dir_path, 'cache.db'))
     cache_dir_path = os.path.join(dht_dir_path, 'cache')
-    if not os.path.isdir(cache_dir_path):
-        os.makedirs(cache_dir_path)
-    load_cache(cache_dir_path)
+    if os.path.isdir(cache_dir_path):
+        # older versions stored every cached record in a separate file
+        bpio.rmdir_recursive(cache_dir_path, ignore_errors=True)
     if _Debug:
         lg.dbg(_DebugLevel, 'dht_dir_path=%r list_layers=%r network_info=%r' % (
             dht_dir_path, list_layers, nw_info))
@@ -169,11 +185,20 @@ def init(udp_port, dht_dir_path=None, open_layers=[]):
         db_file_path = os.path.join(dht_dir_path, 'db_0')
         dbPath = bpio.portablePath(db_file_path)
         layerStores[0] = SQLiteVersionedJsonDataStore(dbFile=dbPath)
+    routingTableClasses = {}
+    for layer_id, routing_table in routing_tables.items():
+        if routing_table not in ROUTING_TABLES:
+            lg.warn('unknown routing table %r for DHT layer %d, using default' % (routing_table, layer_id, ))
+            continue
+        routingTableClasses[layer_id] = ROUTING_TABLES[routing_table]
     _MyNode = DHTNode(
         udpPort=udp_port,
         dataStores=layerStores,
         networkProtocol=DHTProtocol,
+        routingTableClasses=routingTableClasses,
     )
+    for layer_id, parallel_calls in nw_info.get('layers_parallel_calls', {}).items():
+        _MyNode.setParallelCalls(int(layer_id), parallel_calls)
     for layer_id in open_layers:
         open_layer(layer_id=layer_id, dht_dir_path=dht_dir_path, connect_now=False)
     if _Debug:
@@ -183,6 +208,7 @@ def init(udp_port, dht_dir_path=None, open_layers=[]):
 
 def shutdown():
     global _MyNode
+    shutdown_cache()
     if _MyNode is not None:
         for ds in _MyNode._dataStores.values():
             ds._db.close()
@@ -347,12 +373,14 @@ def is_layer_active(layer_id):
     return layer_id in node().active_layers
 
 
-def open_layer(layer_id, seed_nodes=[], dht_dir_path=None, connect_now=False, attach=False):
+def open_layer(layer_id, seed_nodes=[], dht_dir_path=None, connect_now=False, attach=False, parallel_calls=None):
     global _MyNode
     if not node():
         result = Deferred()
         result.callback(False)
         return result
+    if parallel_calls:
+        node().setParallelCalls(layer_id, parallel_calls)
     if not layer_id in node().layers:
         if dht_dir_path is None:
             dht_dir_path = settings.ServiceDir('service_entangled_dht')
@@ -383,11 +411,11 @@ def close_layer(layer_id):
 
 #------------------------------------------------------------------------------
 
-def count(name):
+def count(name, amount=1):
     global _Counters
     if name not in _Counters:
         _Counters[name] = 0
-    _Counters[name] += 1
+    _Counters[name] += amount
     return True
 
 
@@ -605,11 +633,12 @@ def get_json_value(key, layer_id=0, update_cache=True):
     if _Debug:
         lg.out(_DebugLevel, 'dht_service.get_json_value key=[%r] layer_id=%d update_cache=%s' % (key, layer_id, update_cache, ))
     ret = Deferred()
+    if update_cache:
+        # added first, so the result is cached before any other callbacks, failed lookups are not cached
+        ret.addCallback(on_json_response_to_be_cached, key=key, layer_id=layer_id)
     d = get_value(key, layer_id=layer_id)
     d.addCallback(on_read_json_response, key, ret)
     d.addErrback(ret.errback)
-    if update_cache:
-        d.addCallback(on_json_response_to_be_cached, key=key, layer_id=layer_id)
     return ret
 
 
@@ -622,6 +651,8 @@ def set_json_value(key, json_data, age=0, expire=KEY_EXPIRE_MAX_SECONDS, collect
         return fail(Exception('bad input json data'))
     if _Debug:
         lg.out(_DebugLevel, 'dht_service.set_json_value key=[%r] layer_id=%d with %d bytes' % (key, layer_id, len(repr(value))))
+    # the key is going to exist now, it must not be reported as missing from the cache
+    cache().forget_missing(key_to_hash(key), layer_id=layer_id)
     return set_value(key=key, value=value, age=age, expire=expire, collect_results=collect_results, layer_id=layer_id)
 
 #------------------------------------------------------------------------------
@@ -1129,77 +1160,74 @@ def dump_local_db(value_as_json=False):
 
 #------------------------------------------------------------------------------
 
-def cache():
+def init_cache(db_path=None):
     global _Cache
-    return _Cache
+    if _Cache is not None:
+        _Cache.close()
+    _Cache = DHTValueCache(db_path=db_path)
+    if _Debug:
+        lg.args(_DebugLevel, db_path=db_path)
 
 
-def load_cache(cache_dir_path):
+def shutdown_cache():
     global _Cache
-    _Cache.clear()
-    total_records = 0
-    records_per_layer = {}
-    for layer_id_str in os.listdir(cache_dir_path):
-        layer_id = int(layer_id_str)
-        if layer_id not in _Cache:
-            _Cache[layer_id] = {}
-        records_per_layer[layer_id] = 0
-        for hash_key in os.listdir(cache_dir_path):
-            _Cache[layer_id][hash_key] = jsn.loads_text(local_fs.ReadTextFile(os.path.join(cache_dir_path, hash_key)))
-            total_records += 1
-            records_per_layer[layer_id] += 1
-    if _Debug:
-        lg.args(_DebugLevel, total_records=total_records, records_per_layer=records_per_layer)
-    return total_records
+    if _Cache is not None:
+        _Cache.close()
+        _Cache = None
 
 
-def store_cached_key(hash_key, json_value, layer_id=0, timestamp=None):
+def cache():
     global _Cache
-    if not timestamp:
-        timestamp = utime.get_sec1970()
-    if layer_id not in _Cache:
-        _Cache[layer_id] = {}
-    cached_json_record = {
-        'v': json_value,
-        't': timestamp,
-    }
-    dht_dir_path = settings.ServiceDir('service_entangled_dht')
-    layer_cache_dir_path = os.path.join(dht_dir_path, 'cache', strng.to_text(layer_id))
-    if not os.path.isdir(layer_cache_dir_path):
-        os.makedirs(layer_cache_dir_path)
-    cached_record_file_path = os.path.join(layer_cache_dir_path, hash_key)
-    if not local_fs.WriteTextFile(cached_record_file_path, jsn.dumps(cached_json_record)):
-        lg.err('failed to store cached dht key %r in layer %d' % (hash_key, layer_id, ))
-        return False
-    _Cache[layer_id][hash_key] = cached_json_record
-    if _Debug:
-        lg.args(_DebugLevel, hash_key=hash_key, layer_id=layer_id, timestamp=timestamp, cached_records=len(_Cache[layer_id]))
+    if _Cache is None:
+        # DHT service was not started yet, keep records only in memory
+        _Cache = DHTValueCache()
+    return _Cache
+
+
+def store_cached_key(hash_key, json_value, layer_id=0, timestamp=None):
+    cache().set(hash_key, json_value, layer_id=layer_id, timestamp=timestamp)
     return True
 
 
 def get_cached_value(hash_key, layer_id=0):
-    global _Cache
-    value = _Cache.get(layer_id, {}).get(hash_key)
+    value = cache().get(hash_key, layer_id=layer_id)
     if _Debug:
         lg.args(_DebugLevel, layer_id=layer_id, hash_key=hash_key, value_exist=(value is not None))
     return value
 
 
 def on_json_response_to_be_cached(json_value, key, layer_id):
-    if not json_value:
-        return json_value
     hash_key = key_to_hash(key)
-    store_cached_key(hash_key, json_value, layer_id)
+    if isinstance(json_value, list):
+        # list of closest nodes means the key was not found,
+        # remember that to not repeat same lookup too often
+        cache().set_missing(hash_key, layer_id=layer_id)
+        return json_value
+    if json_value:
+        store_cached_key(hash_key, json_value, layer_id)
     return json_value
 
 
 def get_cached_json_value(key, layer_id=0, cache_ttl=DEFAULT_CACHE_TTL):
     hash_key = key_to_hash(key)
-    cached_record = get_cached_value(hash_key)
+    cached_record = get_cached_value(hash_key, layer_id=layer_id)
     if not cached_record:
+        count('dht_cache_miss')
         return get_json_value(key, layer_id=layer_id, update_cache=True)
-    if utime.get_sec1970() - int(cached_record['t']) > cache_ttl:
+    age = utime.get_sec1970() - int(cached_record['t'])
+    if cached_record['v'] is None:
+        if age > min(cache_ttl, CACHE_MISSING_TTL):
+            count('dht_cache_miss')
+            return get_json_value(key, layer_id=layer_id, update_cache=True)
+        count('dht_cache_missing_hit')
+        ret = Deferred()
+        # same result as for not existing key: no closest nodes are known
+        ret.callback([])
+        return ret
+    if age > cache_ttl:
+        count('dht_cache_miss')
         return get_json_value(key, layer_id=layer_id, update_cache=True)
+    count('dht_cache_hit')
     if _Debug:
         lg.out(_DebugLevel, 'dht_service.get_cached_json_value key=[%r] layer_id=%d cache_ttl=%d' % (key, layer_id, cache_ttl, ))
     ret = Deferred()
@@ -1208,10 +1236,166 @@ def get_cached_json_value(key, layer_id=0, cache_ttl=DEFAULT_CACHE_TTL):
 
 #------------------------------------------------------------------------------
 
+class DHTValueCache(object):
+    """
+    Keeps values received from DHT network to not repeat same lookups too often.
+
+    Latest used records are kept in memory, at most ``CACHE_MAX_MEMORY_RECORDS`` of them,
+    all other records are only stored in a single SQLite file and read from there when needed.
+    Records older than ``CACHE_MAX_AGE`` are removed from the file, also only
+    ``CACHE_MAX_DISK_RECORDS`` most recent records are kept there.
+    Not existing keys are remembered only in memory.
+    """
+
+    def __init__(self, db_path=None, max_memory_records=CACHE_MAX_MEMORY_RECORDS, max_disk_records=CACHE_MAX_DISK_RECORDS, max_age=CACHE_MAX_AGE):
+        self.db_path = db_path
+        self.max_memory_records = max_memory_records
+        self.max_disk_records = max_disk_records
+        self.max_age = max_age
+        self.records = OrderedDict()
+        self.writes_count = 0
+        self._db = None
+
+    def _open(self):
+        if self._db is not None or not self.db_path:
+            return self._db
+        try:
+            self._db = sqlite3.connect(self.db_path)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache(layer_id INTEGER, hash_key TEXT, value TEXT, t INTEGER, PRIMARY KEY(layer_id, hash_key))')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_t ON cache(t)')
+            self._db.commit()
+        except:
+            lg.exc()
+            self.db_path = None
+            self._db = None
+        return self._db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        self.records.clear()
+
+    def _remember(self, layer_id, hash_key, record):
+        self.records[(layer_id, hash_key, )] = record
+        self.records.move_to_end((layer_id, hash_key, ))
+        while len(self.records) > self.max_memory_records:
+            self.records.popitem(last=False)
+            count('dht_cache_eviction')
+
+    def get(self, hash_key, layer_id=0):
+        record = self.records.get((layer_id, hash_key, ))
+        if record is not None:
+            if utime.get_sec1970() - int(record['t']) > self.max_age:
+                self.records.pop((layer_id, hash_key, ))
+                return None
+            self.records.move_to_end((layer_id, hash_key, ))
+            return record
+        db = self._open()
+        if db is None:
+            return None
+        row = db.execute('SELECT value, t FROM cache WHERE layer_id=? AND hash_key=?', (layer_id, hash_key, )).fetchone()
+        if not row:
+            return None
+        try:
+            record = {'v': jsn.loads_text(row[0]), 't': row[1], }
+        except:
+            lg.exc()
+            return None
+        self._remember(layer_id, hash_key, record)
+        return record
+
+    def set(self, hash_key, json_value, layer_id=0, timestamp=None):
+        if not timestamp:
+            timestamp = utime.get_sec1970()
+        record = {'v': json_value, 't': timestamp, }
+        self._remember(layer_id, hash_key, record)
+        db = self._open()
+        if db is None:
+            return record
+        try:
+            db.execute('INSERT OR REPLACE INTO cache(layer_id, hash_key, value, t) VALUES (?, ?, ?, ?)', (
+                layer_id, hash_key, jsn.dumps(json_value), int(timestamp), ))
+            db.commit()
+        except:
+            lg.exc()
+            return record
+        self.writes_count += 1
+        if self.writes_count % 100 == 0:
+            self.cleanup()
+        if _Debug:
+            lg.args(_DebugLevel, hash_key=hash_key, layer_id=layer_id, timestamp=timestamp, memory_records=len(self.records))
+        return record
+
+    def set_missing(self, hash_key, layer_id=0, timestamp=None):
+        """
+        Remembers that key was not found, but a valid record received before is kept:
+        value can be not found just because the nodes storing it were not reachable.
+        """
+        existing = self.get(hash_key, layer_id=layer_id)
+        if existing is not None and existing['v'] is not None:
+            return existing
+        record = {'v': None, 't': timestamp or utime.get_sec1970(), }
+        self._remember(layer_id, hash_key, record)
+        return record
+
+    def forget_missing(self, hash_key, layer_id=0):
+        record = self.records.get((layer_id, hash_key, ))
+        if record is not None and record['v'] is None:
+            self.records.pop((layer_id, hash_key, ))
+
+    def remove(self, hash_key, layer_id=0):
+        self.records.pop((layer_id, hash_key, ), None)
+        db = self._open()
+        if db is not None:
+            db.execute('DELETE FROM cache WHERE layer_id=? AND hash_key=?', (layer_id, hash_key, ))
+            db.commit()
+
+    def cleanup(self):
+        """
+        Removes out-dated records from the file and keeps only allowed number of most recent records there.
+        """
+        db = self._open()
+        if db is None:
+            return 0
+        removed = db.execute('DELETE FROM cache WHERE t<?', (utime.get_sec1970() - self.max_age, )).rowcount
+        total = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if total > self.max_disk_records:
+            removed += db.execute('DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY t LIMIT ?)', (
+                total - self.max_disk_records, )).rowcount
+        db.commit()
+        if removed:
+            count('dht_cache_eviction', removed)
+        if _Debug:
+            lg.args(_DebugLevel, removed=removed, total=total)
+        return removed
+
+    def count(self, layer_id=None):
+        """
+        Returns number of stored records (not counting not existing keys).
+        """
+        db = self._open()
+        if db is None:
+            return len([k for k, r in self.records.items() if r['v'] is not None and (layer_id is None or k[0] == layer_id)])
+        if layer_id is None:
+            return db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        return db.execute('SELECT COUNT(*) FROM cache WHERE layer_id=?', (layer_id, )).fetchone()[0]
+
+#------------------------------------------------------------------------------
+
 class DHTNode(MultiLayerNode):
 
-    def __init__(self, udpPort=4000, dataStores=None, routingTables=None, networkProtocol=None, nodeID=None):
-        super(DHTNode, self).__init__(udpPort=udpPort, dataStores=dataStores, routingTables=routingTables, networkProtocol=networkProtocol, id=nodeID, )
+    def __init__(self, udpPort=4000, dataStores=None, routingTables=None, networkProtocol=None, nodeID=None, routingTableClasses=None):
+        super(DHTNode, self).__init__(
+            udpPort=udpPort,
+            dataStores=dataStores,
+            routingTables=routingTables,
+            networkProtocol=networkProtocol,
+            routingTableClasses=routingTableClasses,
+            id=nodeID,
+        )
         self._counter = count
         self.data = {0: {}, }
         if dataStores:
@@ -1249,22 +1433,11 @@ class DHTNode(MultiLayerNode):
     def expire(self):
         now = utime.get_sec1970()
         for layer_id in self._dataStores.keys():
-            expired_keys = []
-            for key in self._dataStores[layer_id].keys():
-                if key == self.nodeStateKey:
-                    continue
-                item_data = self._dataStores[layer_id].getItem(key)
-                if item_data:
-                    originaly_published = item_data.get('originallyPublished')
-                    expireSeconds = item_data.get('expireSeconds')
-                    if expireSeconds and originaly_published:
-                        age = now - originaly_published
-                        if age > expireSeconds:
-                            expired_keys.append(key)
-            for key in expired_keys:
-                if _Debug:
+            expired_keys = self._dataStores[layer_id].getExpiredKeys(now, skipKeys=(self.nodeStateKey, ))
+            if _Debug:
+                for key in expired_keys:
                     lg.out(_DebugLevel, 'dht_service.expire   [%s] removed from layer %d' % (key, layer_id))
-                del self._dataStores[layer_id][key]
+            self._dataStores[layer_id].removeItems(expired_keys)
 
     @rpcmethod
     def store(self, key, value, originalPublisherID=None,
@@ -24,6 +24,7 @@ except ImportError:
 import sqlite3
 import os
 import json
+import threading
 
 from . import constants  # @UnresolvedImport
 from . import encoding  # @UnresolvedImport
@@ -37,6 +38,8 @@ except:
 
 PROTOCOL_VERSION = 1
 
+SCHEMA_VERSION = 1
+
 PICKLE_PROTOCOL = 2
 
 _Debug = False
@@ -82,6 +85,39 @@ class DataStore(DictMixin):
         """
         """
 
+    def getAllItems(self):
+        """
+        Return a list of all stored items, same as C{getItem} returns.
+        """
+        items = []
+        for key in self.keys():
+            item = self.getItem(key)
+            if item:
+                items.append(item)
+        return items
+
+    def getExpiredKeys(self, now, skipKeys=()):
+        """
+        Return a list of keys which were originally published more than
+        "expireSeconds" ago.
+        """
+        expired_keys = []
+        for key in self.keys():
+            if key in skipKeys:
+                continue
+            item = self.getItem(key)
+            if item and item.get('expireSeconds') and item.get('originallyPublished'):
+                if now - item['originallyPublished'] > item['expireSeconds']:
+                    expired_keys.append(key)
+        return expired_keys
+
+    def removeItems(self, keys):
+        """
+        Delete all given keys (and their values).
+        """
+        for key in keys:
+            del self[key]
+
     def setItem(self, key, value, lastPublished, originallyPublished, originalPublisherID, **kwargs):
         """
         Set the value of the (key, value) pair identified by C{key}; this
@@ -128,7 +164,7 @@ class DictDataStore(DataStore):
 
     def __init__(self):
         # Dictionary format:
-        # { <key>: (<value>, <lastPublished>, <originallyPublished> <originalPublisherID>) }
+        # { <key>: (<value>, <lastPublished>, <originallyPublished> <originalPublisherID>, <expireSeconds>, <revision>) }
         self._dict = {}
 
     def keys(self):
@@ -169,7 +205,11 @@ class DictDataStore(DataStore):
         should set the "last published" value for the (key, value) pair to the
         current time.
         """
-        self._dict[key] = (value, lastPublished, originallyPublished, originalPublisherID)
+        expireSeconds = kwargs.get('expireSeconds', constants.dataExpireSecondsDefaut)
+        revision = kwargs.get('revision', None)
+        if revision is None:
+            revision = (self._dict[key][5] + 1) if key in self._dict else 1
+        self._dict[key] = (value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision)
 
     def __getitem__(self, key):
         """
@@ -187,11 +227,13 @@ class DictDataStore(DataStore):
         try:
             row = self._dict[key]
             result = dict(
-                key=row[0].encode(),
-                value=row[1],
-                lastPublished=row[2],
-                originallyPublished=row[3],
-                originalPublisherID=None if not row[4] else row[4].encode(),
+                key=key,
+                value=row[0],
+                lastPublished=row[1],
+                originallyPublished=row[2],
+                originalPublisherID=row[3] or None,
+                expireSeconds=row[4],
+                revision=row[5],
             )
         except:
             return None
@@ -202,6 +244,13 @@ class DictDataStore(DataStore):
 class SQLiteVersionedJsonDataStore(DataStore):
     """
     SQLite database-based datastore.
+
+    Records are indexed by unique key and by expiration time, file database is
+    opened in WAL mode. Database created by older versions (without any index)
+    is migrated when opened.
+
+    Same object is used from the main thread and from the republishing thread,
+    so all queries are protected with a lock.
     """
 
     def __init__(self, dbFile=':memory:'):
@@ -214,39 +263,105 @@ class SQLiteVersionedJsonDataStore(DataStore):
         createDB = not os.path.exists(dbFile)
         if _Debug:
             print('[DHT DB] dbFile=%r   createDB=%r' % (dbFile, createDB, ))
-        self._db = sqlite3.connect(dbFile)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(dbFile, check_same_thread=False)
         self._db.isolation_level = None
         self._db.text_factory = encoding.to_text
+        if dbFile != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
         if createDB:
             self.create_table()
             if _Debug:
                 print('[DHT DB]  Created empty table for DHT records')
+        else:
+            self.migrate()
         self._cursor = self._db.cursor()
 
     def _dbQuery(self, key, columnName):
         try:
-            self._cursor.execute("SELECT %s FROM data WHERE key=:reqKey" % columnName, {
-                'reqKey': key,
-            })
-            row = self._cursor.fetchone()
+            with self._lock:
+                self._cursor.execute("SELECT %s FROM data WHERE key=:reqKey" % columnName, {
+                    'reqKey': encoding.to_text(key),
+                })
+                row = self._cursor.fetchone()
             value = row[0]
         except:
             raise KeyError(key)
         else:
             return value
 
+    def _execute_many(self, query, params_list):
+        """
+        Executes same query for every item in one transaction.
+        """
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany(query, params_list)
+            except:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
     def __getitem__(self, key):
         v = self._dbQuery(key, 'value')
         v = json.loads(v)
         return v['d']
 
     def __delitem__(self, key):
-        self._cursor.execute("DELETE FROM data WHERE key=:reqKey", {
-            'reqKey': key,
-        })
+        with self._lock:
+            self._cursor.execute("DELETE FROM data WHERE key=:reqKey", {
+                'reqKey': encoding.to_text(key),
+            })
+
+    def __contains__(self, key):
+        with self._lock:
+            self._cursor.execute("SELECT 1 FROM data WHERE key=:reqKey", {
+                'reqKey': encoding.to_text(key),
+            })
+            return self._cursor.fetchone() is not None
 
-    def create_table(self):
-        self._db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision)')
+    def __len__(self):
+        with self._lock:
+            self._cursor.execute("SELECT COUNT(*) FROM data")
+            return self._cursor.fetchone()[0]
+
+    def create_table(self, table_name='data'):
+        self._db.execute('CREATE TABLE %s(key PRIMARY KEY, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision, expireAt)' % table_name)
+        self._db.execute('CREATE INDEX %s_expire_at ON %s(expireAt)' % (table_name, table_name, ))
+        self._db.execute('PRAGMA user_version=%d' % SCHEMA_VERSION)
+
+    def migrate(self):
+        """
+        Re-creates "data" table created by older version: with indexes and "expireAt" column.
+        If same key was stored multiple times only the latest record is kept.
+        """
+        with self._lock:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return False
+            tables = [row[0] for row in self._db.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+            self._db.execute('BEGIN')
+            try:
+                if 'data' in tables:
+                    self._db.execute('ALTER TABLE data RENAME TO data_old')
+                self.create_table()
+                if 'data' in tables:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision, expireAt) '
+                        'SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision, '
+                        'CASE WHEN expireSeconds AND originallyPublished THEN originallyPublished + expireSeconds ELSE NULL END '
+                        'FROM data_old ORDER BY rowid'
+                    )
+                    self._db.execute('DROP TABLE data_old')
+            except:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+        if _Debug:
+            print('[DHT DB] %r migrated from version %d to %d' % (self.dbFile, version, SCHEMA_VERSION))
+        return True
 
     def keys(self):
         """
@@ -254,9 +369,10 @@ class SQLiteVersionedJsonDataStore(DataStore):
         """
         keys = []
         try:
-            self._cursor.execute("SELECT key FROM data")
-            for row in self._cursor:
-                keys.append(row[0])
+            with self._lock:
+                self._cursor.execute("SELECT key FROM data")
+                for row in self._cursor:
+                    keys.append(row[0])
         finally:
             return keys
 
@@ -308,13 +424,15 @@ class SQLiteVersionedJsonDataStore(DataStore):
                 expireSeconds=constants.dataExpireSecondsDefaut,
                 **kwargs):
         key_hex = encoding.to_text(key)
-        new_revision = kwargs.get('revision', None)
-        if new_revision is None:
-            new_revision = self.revision(key) + 1
-        self._cursor.execute("select key from data where key=:reqKey", {'reqKey': key_hex})
         opID = originalPublisherID or None
-        if self._cursor.fetchone() is None:
-            self._cursor.execute('INSERT INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision) VALUES (?, ?, ?, ?, ?, ?, ?)', (
+        expireAt = None
+        if expireSeconds and originallyPublished:
+            expireAt = originallyPublished + expireSeconds
+        with self._lock:
+            new_revision = kwargs.get('revision', None)
+            if new_revision is None:
+                new_revision = self.revision(key) + 1
+            self._cursor.execute('INSERT OR REPLACE INTO data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision, expireAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
                 key_hex,
                 json.dumps({'k': key_hex, 'd': value, 'v': PROTOCOL_VERSION, }, ),
                 lastPublished,
@@ -322,92 +440,63 @@ class SQLiteVersionedJsonDataStore(DataStore):
                 opID,
                 expireSeconds,
                 new_revision,
+                expireAt,
             ))
-            if _Debug:
-                print('[DHT DB] %r setItem  stored new value for key [%s] with revision %d' % (self.dbFile, key, new_revision))
-        else:
-            self._cursor.execute('UPDATE data SET value=?, lastPublished=?, originallyPublished=?, originalPublisherID=?, expireSeconds=?, revision=? WHERE key=?', (
-                json.dumps({'k': key_hex, 'd': value, 'v': PROTOCOL_VERSION, }, ),
-                lastPublished,
-                originallyPublished,
-                opID,
-                expireSeconds,
-                new_revision,
-                key_hex,
-            ))
-            if _Debug:
-                print('[DHT DB] %r setItem  updated existing value for key [%s] with revision %d' % (self.dbFile, key, new_revision))
-
-    def getItem(self, key):
-        key_hex = key
-        key_hex = encoding.to_text(key)
-        self._cursor.execute("SELECT * FROM data WHERE key=:reqKey", {
-            'reqKey': key_hex,
-        })
-
-        row = self._cursor.fetchone()
-        if not row:
-            if _Debug:
-                print('[DHT DB] %r getItem [%s]  return None : did not found key in dataStore' % (self.dbfile, key))
-            return None
+        if _Debug:
+            print('[DHT DB] %r setItem  stored value for key [%s] with revision %d' % (self.dbFile, key, new_revision))
 
+    def _rowToItem(self, row):
         v = row[1]
         if isinstance(v, buffer):
             v = encoding.to_text(v)
 
         v = json.loads(v)
-        
+
         # TODO: check / verify v['k'] against key_hex
         # TODO: check / verify v['v'] against PROTOCOL_VERSION
 
-        value = v['d']
-
-        key_orig = row[0]
-
-        # TODO: check / verify key_orig against key
-
-        opID = row[4] or None
-
-        result = dict(
-            key=key_orig,
-            value=value,
+        return dict(
+            key=row[0],
+            value=v['d'],
             lastPublished=row[2],
             originallyPublished=row[3],
-            originalPublisherID=opID,
+            originalPublisherID=row[4] or None,
             expireSeconds=row[5],
             revision=row[6],
         )
 
+    def getItem(self, key):
+        key_hex = encoding.to_text(key)
+        with self._lock:
+            self._cursor.execute("SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision FROM data WHERE key=:reqKey", {
+                'reqKey': key_hex,
+            })
+            row = self._cursor.fetchone()
+        if not row:
+            if _Debug:
+                print('[DHT DB] %r getItem [%s]  return None : did not found key in dataStore' % (self.dbFile, key))
+            return None
+
+        result = self._rowToItem(row)
+
         if _Debug:
             print('[DHT DB] %r getItem   found one record for key [%s], revision is %d' % (self.dbFile, key, row[6]))
         return result
 
     def getAllItems(self):
-        self._cursor.execute("SELECT * FROM data")
-        rows = self._cursor.fetchall()
-        items = []
-        for row in rows:
-
-            v = row[1]
-            if isinstance(v, buffer):
-                v = encoding.to_text(v)
-
-            v = json.loads(v)
-            
-            # TODO: check / verify v['k'] against key_hex
-            # TODO: check / verify v['v'] against PROTOCOL_VERSION
-    
-            value = v['d']
-
-            _k = row[0]
-            _opID = row[4] or None
-
-            items.append(dict(
-                value=value,
-                lastPublished=row[2],
-                originallyPublished=row[3],
-                originalPublisherID=_opID,
-                expireSeconds=row[5],
-                revision=row[6],
-            ))
-        return items
+        with self._lock:
+            self._cursor.execute("SELECT key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision FROM data")
+            rows = self._cursor.fetchall()
+        return [self._rowToItem(row) for row in rows]
+
+    def getExpiredKeys(self, now, skipKeys=()):
+        with self._lock:
+            self._cursor.execute("SELECT key FROM data WHERE expireAt IS NOT NULL AND expireAt < :now", {
+                'now': now,
+            })
+            return [row[0] for row in self._cursor.fetchall() if row[0] not in skipKeys]
+
+    def removeItems(self, keys):
+        if not keys:
+            return
+        self._execute_many("DELETE FROM data WHERE key=?", [(encoding.to_text(key), ) for key in keys])
@@ -987,15 +987,16 @@ class Node(object):
         if _Debug:
             print('[DHT NODE]  SINGLE republishData called, node: %r' % self.id)
         expiredKeys = []
-        for key in self._dataStore.keys():
+        now = int(time.time())
+        # all records are read with one query
+        for itemData in self._dataStore.getAllItems():
+            key = itemData['key']
             if _Debug:
                 print('[DHT NODE]  SINGLE    %r' % key)
             # Filter internal variables stored in the datastore
             if key == 'nodeState':
                 continue
 
-            now = int(time.time())
-            itemData = self._dataStore.getItem(key)
             originallyPublished = itemData['originallyPublished']
             originalPublisherID = itemData['originalPublisherID']
             lastPublished = itemData['lastPublished']
@@ -1024,18 +1025,18 @@ class Node(object):
                     twisted.internet.reactor.callFromThread(  # @UndefinedVariable
                         self.iterativeStore,
                         key=key,
-                        value=self._dataStore[key],
+                        value=itemData['value'],
                         originalPublisherID=originalPublisherID,
                         age=age,
                         expireSeconds=expireSeconds,
                     )
-        for key in expiredKeys:
-            del self._dataStore[key]
+        # expired records are removed in one transaction
+        self._dataStore.removeItems(expiredKeys)
 
 
 class MultiLayerNode(Node):
 
-    def __init__(self, udpPort=4000, dataStores=None, routingTables=None, networkProtocol=None, **kwargs):
+    def __init__(self, udpPort=4000, dataStores=None, routingTables=None, networkProtocol=None, routingTableClasses=None, **kwargs):
         self._counter = None
         self.port = udpPort
         self.listener = None
@@ -1044,11 +1045,21 @@ class MultiLayerNode(Node):
         self.nodeStateKey = h.hexdigest()
 
         self._routingTables = {}
+        # Routing table class to be used for given layer, by default TreeRoutingTable
+        self._routingTableClasses = dict(routingTableClasses or {})
         self._dataStores = {}
         self.layers = {}
         self.refreshers = {}
         self.active_layers = set()
         self.attached_layers = set()
+        # Number of parallel RPCs for every lookup in given layer, by default constants.alpha
+        self.parallelCalls = {}
+
+        # Lookups in progress: (layerID, rpc, key, deep) -> list of deferreds waiting for the same result
+        self._activeLookups = {}
+        # Iterations of all running lookups are executed together in a single reactor call
+        self._pendingIterations = []
+        self._pendingIterationsCall = None
 
         self.rpc_calls = {}
         self.rpc_responses = {}
@@ -1084,11 +1095,14 @@ class MultiLayerNode(Node):
         self.active_layers.add(0)
         self.attachLayer(0)
 
-    def createLayer(self, layer_id, dataStore, nodeID=None, routingTable=None):
+    def createLayer(self, layer_id, dataStore, nodeID=None, routingTable=None, routingTableClass=None):
         if layer_id in self.layers or layer_id in self._dataStores or layer_id in self._routingTables:
             if _Debug:
                 print('[DHT NODE]    createLayer : layer %d already exist' % layer_id)
             return False
+        if routingTableClass:
+            self._routingTableClasses[layer_id] = routingTableClass
+        routingTableClass = self._routingTableClasses.get(layer_id, routingtable.TreeRoutingTable)
         self._dataStores[layer_id] = dataStore
         self.layers[layer_id] = nodeID
         loaded = False
@@ -1097,7 +1111,7 @@ class MultiLayerNode(Node):
             state = json.loads(json_state)
             self.layers[layer_id] = state['id']
             if layer_id not in self._routingTables:
-                self._routingTables[layer_id] = routingTable or routingtable.TreeRoutingTable(self.layers[layer_id], layerID=layer_id)
+                self._routingTables[layer_id] = routingTable or routingTableClass(self.layers[layer_id], layerID=layer_id)
             for contactTriple in state['closestNodes']:
                 contact = LayeredContact(encoding.to_text(contactTriple[0]), contactTriple[1], contactTriple[2], self._protocol, layerID=layer_id)
                 self._routingTables[layer_id].addContact(contact)
@@ -1108,7 +1122,7 @@ class MultiLayerNode(Node):
         if not self.layers[layer_id]:
             self.layers[layer_id] = self._generateID()
         if layer_id not in self._routingTables:
-            self._routingTables[layer_id] = routingTable or routingtable.TreeRoutingTable(self.layers[layer_id], layerID=layer_id)
+            self._routingTables[layer_id] = routingTable or routingTableClass(self.layers[layer_id], layerID=layer_id)
 #         if layer_id != 0 and not loaded and warmUp:
 #             loaded = self.warmUpLayer(layer_id)
         if _Debug:
@@ -1127,10 +1141,23 @@ class MultiLayerNode(Node):
         self.layers.pop(layer_id, None)
         self._routingTables.pop(layer_id, None)
         self._dataStores.pop(layer_id, None)
+        for lookupKey in list(self._activeLookups.keys()):
+            if lookupKey[0] == layer_id:
+                self._activeLookups.pop(lookupKey)
         if _Debug:
             print('[DHT NODE]    destroyLayer : layer %d destroyed' % layer_id)
         return True
 
+    def setParallelCalls(self, layerID, parallel_calls=None):
+        """
+        Set the number of parallel RPCs every lookup in the given layer is
+        allowed to run, pass C{None} to use C{constants.alpha}.
+        """
+        if parallel_calls:
+            self.parallelCalls[layerID] = parallel_calls
+        else:
+            self.parallelCalls.pop(layerID, None)
+
     def connectingTask(self, layerID=0):
         if layerID not in self._joinDeferreds:
             return None
@@ -1544,7 +1571,69 @@ class MultiLayerNode(Node):
             print('[DHT NODE]        NOT found key in local dataStore')
         return self.findNode(key, **kwargs)
 
+    def _scheduleIteration(self, searchIteration):
+        """
+        Run given search iteration on the next reactor loop together with
+        iterations of all other lookups which are ready to continue.
+        """
+        if searchIteration not in self._pendingIterations:
+            self._pendingIterations.append(searchIteration)
+        if not self._pendingIterationsCall:
+            self._pendingIterationsCall = twisted.internet.reactor.callLater(0, self._runPendingIterations)  # IGNORE:E1101  @UndefinedVariable
+
+    def _runPendingIterations(self):
+        self._pendingIterationsCall = None
+        pending = self._pendingIterations
+        self._pendingIterations = []
+        if _Debug:
+            print('[DHT NODE]    _runPendingIterations %d lookups' % len(pending))
+        for searchIteration in pending:
+            try:
+                searchIteration()
+            except:
+                traceback.print_exc()
+
     def _iterativeFind(self, key, startupShortlist=None, rpc='findNode', deep=False, layerID=0, parallel_calls=None):
+        """
+        Concurrent lookups of the same key in the same layer are coalesced:
+        only one set of RPCs is sent and every caller receives a copy of the result.
+        """
+        if startupShortlist is not None or rpc not in ('findNode', 'findValue', ):
+            return self._doIterativeFind(key, startupShortlist, rpc, deep, layerID, parallel_calls)
+        lookupKey = (layerID, rpc, key, deep, )
+        if lookupKey in self._activeLookups:
+            if _Debug:
+                print('[DHT NODE]    _iterativeFind   layerID=%d   rpc=%r   key=%r  joined to already running lookup' % (layerID, rpc, key, ))
+            waiter = defer.Deferred()
+            self._activeLookups[lookupKey].append(waiter)
+            return waiter
+        self._activeLookups[lookupKey] = []
+
+        def _lookupFinished(result):
+            waiters = self._activeLookups.pop(lookupKey, [])
+            for waiter in waiters:
+                if isinstance(result, dict):
+                    waiterResult = dict(result)
+                    waiterResult['values'] = list(result.get('values', []))
+                elif isinstance(result, list):
+                    waiterResult = list(result)
+                else:
+                    waiterResult = result
+                waiter.callback(waiterResult)
+            return result
+
+        def _lookupFailed(err):
+            waiters = self._activeLookups.pop(lookupKey, [])
+            for waiter in waiters:
+                waiter.errback(err)
+            return err
+
+        d = self._doIterativeFind(key, startupShortlist, rpc, deep, layerID, parallel_calls)
+        d.addCallbacks(_lookupFinished, _lookupFailed)
+        return d
+
+    def _doIterativeFind(self, key, startupShortlist=None, rpc='findNode', deep=False, layerID=0, parallel_calls=None):
+        parallel_calls = parallel_calls or self.parallelCalls.get(layerID) or constants.alpha
         if _Debug:
             print('[DHT NODE]    _iterativeFind   layerID=%d   rpc=%r   key=%r  startupShortlist=%r routingTables=%r parallel_calls=%r' % (
                 layerID, rpc, key, startupShortlist, self._routingTables, parallel_calls))
@@ -1554,7 +1643,7 @@ class MultiLayerNode(Node):
             findValue = False
         shortlist = []
         if startupShortlist is None:
-            shortlist = self._routingTables[layerID].findCloseNodes(key, parallel_calls or constants.alpha)
+            shortlist = self._routingTables[layerID].findCloseNodes(key, parallel_calls)
             if key != self.layers[layerID]:
                 # Update the "last accessed" timestamp for the appropriate k-bucket
                 self._routingTables[layerID].touchKBucket(key)
@@ -1656,18 +1745,27 @@ class MultiLayerNode(Node):
                 shortlist.remove(deadContactID)
             return deadContactID
 
+        def quorumReached():
+            if not activeProbes:
+                return True
+            if findValue:
+                return key in findValueResult and not deep
+            return len(activeContacts) >= constants.k
+
         def cancelActiveProbe(contactID):
             activeProbes.pop()
-            if len(activeProbes) <= int((parallel_calls or constants.alpha) / 2.0) and len(pendingIterationCalls):
-                # Force the iteration
+            if len(pendingIterationCalls) and (len(activeProbes) <= int(parallel_calls / 2.0) or quorumReached()):
+                # Force the iteration, do not wait for the slow nodes if the result is already known
                 pendingIterationCalls[0].cancel()
                 del pendingIterationCalls[0]
                 if _Debug:
                     print('[DHT NODE]    forcing iteration =================')
-                searchIteration()
+                self._scheduleIteration(searchIteration)
 
         # Send parallel, asynchronous FIND_NODE RPCs to the shortlist of contacts
         def searchIteration():
+            if outerDf.called:
+                return
             if not self._routingTables or layerID not in self._routingTables:
                 if _Debug:
                     print('[DHT NODE]    ++++++++++++++ searchIteration INTERRUPTED +++++++++++++++\n\n')
@@ -1727,7 +1825,7 @@ class MultiLayerNode(Node):
                     df.addCallback(cancelActiveProbe)
                     alreadyContacted.append(contact.id)
                     contactedNow += 1
-                if contactedNow == (parallel_calls or constants.alpha):
+                if contactedNow == parallel_calls:
                     break
             if len(activeProbes) > slowNodeCount[0] \
                     or (len(shortlist) < constants.k and len(activeContacts) < len(shortlist) and len(activeProbes) > 0):
@@ -1840,15 +1938,16 @@ class MultiLayerNode(Node):
         if _Debug:
             print('[DHT NODE]    republishData called, node: %r' % self.layers[layerID])
         expiredKeys = []
-        for key in self._dataStores[layerID].keys():
+        now = int(time.time())
+        # all records are read with one query
+        for itemData in self._dataStores[layerID].getAllItems():
+            key = itemData['key']
             if _Debug:
                 print('[DHT NODE]        %r' % key)
             # Filter internal variables stored in the datastore
             if key == 'nodeState':
                 continue
 
-            now = int(time.time())
-            itemData = self._dataStores[layerID].getItem(key)
             originallyPublished = itemData['originallyPublished']
             originalPublisherID = itemData['originalPublisherID']
             lastPublished = itemData['lastPublished']
@@ -1878,14 +1977,14 @@ class MultiLayerNode(Node):
                     twisted.internet.reactor.callFromThread(  # @UndefinedVariable
                         self.iterativeStore,
                         key=key,
-                        value=self._dataStore[key],
+                        value=itemData['value'],
                         originalPublisherID=originalPublisherID,
                         age=age,
                         expireSeconds=expireSeconds,
                         layerID=layerID,
                     )
-        for key in expiredKeys:
-            del self._dataStores[layerID][key]
+        # expired records are removed in one transaction
+        self._dataStores[layerID].removeItems(expiredKeys)
 
 
 
@@ -16,7 +16,10 @@
 
 from __future__ import absolute_import
 from __future__ import print_function
+import six
 import time
+import heapq
+import bisect
 import random
 
 from . import constants  # @UnresolvedImport
@@ -219,11 +222,8 @@ class TreeRoutingTable(RoutingTable):
                     deadContactID = failure.getErrorMessage()
                     if _Debug:
                         print('[DHT RTABLE] layerID=%d   replacing dead contact %r' % (self._layerID, deadContactID, ))
-                    try:
-                        self._buckets[bucketIndex].removeContact(deadContactID)
-                    except ValueError:
-                        # The contact has already been removed (probably due to a timeout)
-                        pass
+                    # The contact may have already been removed (probably due to a timeout)
+                    self.removeContact(deadContactID)
                     # ...and add the new one at the tail of the bucket
                     self.addContact(contact)
 
@@ -512,3 +512,145 @@ class OptimizedTreeRoutingTable(TreeRoutingTable):
             if bucketIndex in self._replacementCache:
                 if len(self._replacementCache[bucketIndex]) > 0:
                     self._buckets[bucketIndex].addContact(self._replacementCache[bucketIndex].pop())
+
+
+class VectorRoutingTable(TreeRoutingTable):
+    """
+    A "tree"-type routing table which, in addition to the k-buckets, keeps
+    the IDs of all known contacts in one flat array of integers.
+
+    k-buckets are still used to decide which contacts are kept (splitting and
+    PING-based eviction work exactly like in L{TreeRoutingTable}), but
+    L{findCloseNodes} computes XOR distances for the whole array at once and
+    only partially sorts them, so it returns the contacts which are really the
+    closest to the key instead of walking the neighbouring k-buckets.
+    """
+
+    def __init__(self, parentNodeID, **kwargs):
+        TreeRoutingTable.__init__(self, parentNodeID, **kwargs)
+        # Parallel arrays: integer node IDs and the corresponding contacts
+        self._packedIDs = []
+        self._packedContacts = []
+        # Maps contact ID to its position in the arrays above
+        self._positions = {}
+        # Lower boundaries of all k-buckets, used to locate a k-bucket by bisection
+        self._rangeMins = [self._buckets[0].rangeMin, ]
+
+    def __str__(self):
+        return '<VRTable(%d) %d buckets %d contacts for %r>' % (
+            self._layerID, len(self._buckets), len(self._packedIDs), self._parentNodeID)
+
+    def totalContacts(self):
+        return len(self._packedIDs)
+
+    def addContact(self, contact):
+        """
+        Add the given contact to the correct k-bucket; if it already exists,
+        its status will be updated.
+
+        @param contact: The contact to add to this node's k-buckets
+        @type contact: kademlia.contact.Contact
+        """
+        TreeRoutingTable.addContact(self, contact)
+        if contact.id == self._parentNodeID:
+            return
+        bucket = self._buckets[self._kbucketIndex(contact.id)]
+        if contact in bucket._contacts:
+            self._indexContact(contact)
+
+    def removeContact(self, contactID):
+        """
+        Remove the contact with the specified node ID from the routing table.
+
+        @param contactID: The node ID of the contact to remove
+        @type contactID: str
+        """
+        TreeRoutingTable.removeContact(self, contactID)
+        self._unindexContact(contactID)
+
+    def findCloseNodes(self, key, count, _rpcNodeID=None):
+        """
+        Finds a number of known nodes closest to the node/value with the
+        specified key.
+
+        @param key: the 160-bit key (i.e. the node or value ID) to search for
+        @type key: str
+        @param count: the amount of contacts to return
+        @type count: int
+        @param _rpcNodeID: Used during RPC, this is be the sender's Node ID
+                           Whatever ID is passed in the paramater will get
+                           excluded from the list of returned contacts.
+        @type _rpcNodeID: str
+
+        @return: A list of node contacts (C{kademlia.contact.Contact instances})
+                 closest to the specified key, ordered by the distance.
+        @rtype: list
+        """
+        if count <= 0:
+            count = constants.k
+        excluded = self._positions.get(_rpcNodeID, None) if _rpcNodeID else None
+        wanted = count if excluded is None else count + 1
+        distances = list(map(int(key, 16).__xor__, self._packedIDs))
+        if wanted >= len(distances):
+            positions = sorted(range(len(distances)), key=distances.__getitem__)
+        else:
+            positions = heapq.nsmallest(wanted, range(len(distances)), key=distances.__getitem__)
+        closestNodes = [self._packedContacts[pos] for pos in positions if pos != excluded][:count]
+        if _Debug:
+            print('[DHT RTABLE] layerID=%d   findCloseNodes %r   _rpcNodeID=%r   result=%r' % (
+                self._layerID, key, _rpcNodeID, closestNodes, ))
+        return closestNodes
+
+    def getContact(self, contactID):
+        """
+        Returns the (known) contact with the specified node ID.
+
+        @raise ValueError: No contact with the specified contact ID is known
+                           by this node
+        """
+        pos = self._positions.get(contactID, None)
+        if pos is None:
+            raise ValueError('Contact %r not in routing table' % contactID)
+        return self._packedContacts[pos]
+
+    def _indexContact(self, contact):
+        pos = self._positions.get(contact.id, None)
+        if pos is not None:
+            # keep the most recent object, same as the k-bucket does
+            self._packedContacts[pos] = contact
+            return
+        self._positions[contact.id] = len(self._packedIDs)
+        self._packedIDs.append(int(contact.id, 16))
+        self._packedContacts.append(contact)
+
+    def _unindexContact(self, contactID):
+        pos = self._positions.pop(contactID, None)
+        if pos is None:
+            return
+        # move the last item into the freed slot to keep the arrays dense
+        lastID = self._packedIDs.pop()
+        lastContact = self._packedContacts.pop()
+        if pos < len(self._packedIDs):
+            self._packedIDs[pos] = lastID
+            self._packedContacts[pos] = lastContact
+            self._positions[lastContact.id] = pos
+
+    def _kbucketIndex(self, key):
+        """
+        Calculate the index of the k-bucket which is responsible for the
+        specified key (or ID)
+
+        @param key: The key for which to find the appropriate k-bucket index
+        @type key: str
+
+        @return: The index of the k-bucket responsible for the specified key
+        @rtype: int
+        """
+        valKey = key if isinstance(key, six.integer_types) else int(key, 16)
+        if valKey >= self._buckets[-1].rangeMax:
+            return len(self._buckets)
+        return max(0, bisect.bisect_right(self._rangeMins, valKey) - 1)
+
+    def _splitBucket(self, oldBucketIndex):
+        TreeRoutingTable._splitBucket(self, oldBucketIndex)
+        self._rangeMins.insert(oldBucketIndex + 1, self._buckets[oldBucketIndex + 1].rangeMin)
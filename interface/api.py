@@ -437,7 +437,7 @@ def process_info():
         result['dht']['bytes_in'] = dht_service.node().bytes_in
         for layer_id in dht_service.node().active_layers:
             result['dht']['layers'][layer_id] = {
-                'cache': len(dht_service.cache().get(layer_id, [])),
+                'cache': dht_service.cache().count(layer_id),
                 'packets_in': dht_service.node().packets_in.get(layer_id, 0),
                 'packets_out': dht_service.node().packets_out.get(layer_id, 0),
             }
@@ -1307,6 +1307,7 @@ def files_list(remote_path=None, key_id=None, recursive=True, all_customers=Fals
                         'work_blocks': len(j.workBlocks),
                         'block_number': j.blockNumber,
                         'bytes_processed': j.dataSent,
+                        'raid_bytes_processed': j.raidProgress(),
                         'progress': misc.percent2string(j.progress()),
                         'total_size': j.totalSize,
                     })
@@ -1467,6 +1468,7 @@ def file_info(remote_path, include_uploads=True, include_downloads=True):
                     'work_blocks': len(j.workBlocks),
                     'block_number': j.blockNumber,
                     'bytes_processed': j.dataSent,
+                    'raid_bytes_processed': j.raidProgress(),
                     'progress': misc.percent2string(j.progress()),
                     'total_size': j.totalSize,
                 })
@@ -1752,6 +1754,7 @@ def files_uploads(include_running=True, include_pending=True):
             'work_blocks': len(j.workBlocks),
             'block_number': j.blockNumber,
             'bytes_processed': j.dataSent,
+            'raid_bytes_processed': j.raidProgress(),
             'progress': misc.percent2string(j.progress()),
             'total_size': j.totalSize,
         } for j in backup_control.jobs().values()])
@@ -4345,7 +4348,8 @@ def packets_list():
 
 def packets_stats():
     """
-    Returns detailed info about overall network usage.
+    Returns detailed info about overall network usage, counters of the parsed public keys cache
+    and queue depth of the incoming packets signature verification.
 
     ###### HTTP
         curl -X GET 'localhost:8180/packet/stats/v1'
@@ -4356,9 +4360,13 @@ def packets_stats():
     if not driver.is_on('service_gateway'):
         return ERROR('service_gateway() is not started')
     from p2p import p2p_stats
+    from crypt import key
+    from transport import packet_in
     return OK({
         'in': p2p_stats.counters_in(),
         'out': p2p_stats.counters_out(),
+        'public_keys_cache': key.PublicKeysCacheInfo(),
+        'verification': packet_in.verification_stats(),
     })
 
 #------------------------------------------------------------------------------
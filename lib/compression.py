@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# compression.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (compression.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: compression.
+
+Compression of independent pieces of data with codecs from standard library.
+Codec names are the same as used by ``tarfile``: "gz", "bz2" and "xz", "none" means data is not compressed.
+
+All of the codecs release GIL while working, so many pieces can be compressed
+in parallel in a thread pool, see ``storage.backup.encryption_pool()``.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+import bz2
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+#------------------------------------------------------------------------------
+
+CODECS = ('none', 'gz', 'bz2', 'xz', )
+
+DEFAULT_LEVEL = 6
+
+# a few pieces of the data are compressed with the fastest level to check if it is worth to compress at all
+SAMPLE_SIZE = 64 * 1024
+SAMPLES_COUNT = 4
+INCOMPRESSIBLE_RATIO = 0.95
+
+#------------------------------------------------------------------------------
+
+
+def is_valid_codec(codec):
+    return codec in CODECS
+
+
+def is_compressible(data):
+    """
+    Compress a few samples from the start, middle and end of the data with the fastest
+    ``zlib`` level and return False if they did not become noticeably smaller,
+    this is usually the case for already compressed or encrypted files.
+    """
+    total = len(data)
+    if total <= SAMPLE_SIZE * SAMPLES_COUNT:
+        samples = [data, ]
+    else:
+        step = (total - SAMPLE_SIZE) // (SAMPLES_COUNT - 1)
+        samples = [data[i * step:i * step + SAMPLE_SIZE] for i in range(SAMPLES_COUNT)]
+    raw_size = 0
+    compressed_size = 0
+    for sample in samples:
+        raw_size += len(sample)
+        compressed_size += len(zlib.compress(sample, 1))
+    return compressed_size < raw_size * INCOMPRESSIBLE_RATIO
+
+
+def compress(data, codec, level=DEFAULT_LEVEL):
+    """
+    Returns tuple (codec, output), codec is "none" and output is the input data
+    if data was found incompressible or compressed output is not smaller than input.
+    """
+    if not data or codec == 'none':
+        return 'none', data
+    if not is_compressible(data):
+        return 'none', data
+    level = min(max(int(level), 1), 9)
+    if codec == 'gz':
+        output = zlib.compress(data, level)
+    elif codec == 'bz2':
+        output = bz2.compress(data, level)
+    elif codec == 'xz' and lzma:
+        output = lzma.compress(data, preset=level)
+    else:
+        raise ValueError('unknown compression codec: %r' % codec)
+    if len(output) >= len(data):
+        return 'none', data
+    return codec, output
+
+
+def decompress(data, codec):
+    if not codec or codec == 'none':
+        return data
+    if codec == 'gz':
+        return zlib.decompress(data)
+    if codec == 'bz2':
+        return bz2.decompress(data)
+    if codec == 'xz' and lzma:
+        return lzma.decompress(data)
+    raise ValueError('unknown compression codec: %r' % codec)
@@ -26,6 +26,10 @@ from __future__ import absolute_import
 
 #------------------------------------------------------------------------------
 
+import struct
+
+#------------------------------------------------------------------------------
+
 from lib import jsn
 from lib import strng
 
@@ -77,3 +81,68 @@ def BytesToDict(inp, encoding='latin1', errors='strict', keys_to_text=False, val
     if keys_to_text:
         return jsn.dict_keys_to_text(jsn.loads(_t, encoding=encoding))
     return jsn.loads(_t, encoding=encoding)
+
+#------------------------------------------------------------------------------
+
+BINARY_PREFIX = b'\x00'
+
+
+def IsBinary(inp):
+    """
+    Returns True if input bytes were built with `FieldsToBytes()`.
+    Output of `DictToBytes()` always starts with "{" character, so the first byte is enough to detect the format.
+    """
+    return bool(inp) and inp[:1] == BINARY_PREFIX
+
+
+# added to the version field of the identity by nodes which are able to read data in binary format
+BINARY_FORMAT_TAG = 'binary1'
+
+
+def IsBinaryFormatAnnounced(version_string):
+    """
+    Returns True if given identity version string contains `BINARY_FORMAT_TAG`.
+    """
+    return BINARY_FORMAT_TAG in strng.to_text(version_string or '').split()
+
+
+def FieldsToBytes(fields, kind, version=1):
+    """
+    Builds a versioned, length-prefixed binary representation of a list of byte strings.
+    Output is: zero byte, one byte `kind` tag, one byte `version` and then for every field
+    4 bytes length (big-endian) followed by the field bytes.
+    The last field is usually a large binary payload, it is written as is without any escaping.
+    """
+    header = BINARY_PREFIX + strng.to_bin(kind)[:1] + struct.pack('>B', version)
+    items = [header, ]
+    for field in fields:
+        items.append(struct.pack('>I', len(field)))
+        items.append(field)
+    return b''.join(items)
+
+
+def BytesToFields(inp, kind):
+    """
+    Reads fields written by `FieldsToBytes()` and returns a tuple (version, list of byte strings).
+    Raises `ValueError` if input is not valid.
+    """
+    view = memoryview(inp)
+    if len(view) < 3 or view[:1].tobytes() != BINARY_PREFIX:
+        raise ValueError('input is not in binary format')
+    if view[1:2].tobytes() != strng.to_bin(kind)[:1]:
+        raise ValueError('unexpected kind of binary data: %r' % view[1:2].tobytes())
+    version = struct.unpack('>B', view[2:3])[0]
+    fields = []
+    pos = 3
+    total = len(view)
+    while pos < total:
+        if pos + 4 > total:
+            raise ValueError('binary data is truncated')
+        length = struct.unpack('>I', view[pos:pos + 4])[0]
+        pos += 4
+        if pos + length > total:
+            raise ValueError('binary data is truncated')
+        fields.append(view[pos:pos + length].tobytes())
+        pos += length
+    view.release()
+    return version, fields
@@ -64,6 +64,8 @@ CMD_PING = b'p'
 CMD_GREETING = b'g'
 CMD_DATA = b'd'
 CMD_ACK = b'k'
+CMD_DATA2 = b'D'
+CMD_SACK = b'K'
 CMD_ALIVE = b'a'
 CMD_STUN = b's'
 CMD_MYIPPORT = b'm'
@@ -248,6 +250,8 @@ class CommandsProtocol(BasicProtocol):
         * 'd' = ``DATA``        a data packet, payload format will be described bellow.
         * 'r' = ``REPORT``      a response after receiving a ``DATA`` packet,
                                 so sender can send next packets.
+        * 'D' = ``DATA2``       a data packet of congestion controlled stream, same format as ``DATA``.
+        * 'K' = ``SACK``        a selective ACK packet of congestion controlled stream.
         * 'a' = ``ALIVE``       periodically need to send an empty packet to keep session alive.
         * 's' = ``STUN``        request remote peer for my external IP:PORT.
         * 'm' = ``MYIPPORT``    response to ``STUN`` packet, payload will contain IP:PORT of remote peer
@@ -44,6 +44,7 @@ import datetime
 import threading
 import traceback
 import platform
+import collections
 from io import open
 
 #------------------------------------------------------------------------------
@@ -72,6 +73,16 @@ _TimePush = 0.0
 _TimeTotalDict = {}
 _TimeDeltaDict = {}
 _TimeCountsDict = {}
+_TimeStringCache = [None, '']
+_LogWriter = None
+
+#------------------------------------------------------------------------------
+
+LOG_BUFFER_MAX_LINES = 100000
+LOG_FLUSH_INTERVAL = 0.5
+LOG_FLUSH_LINES = 1000
+LOG_ROTATE_BYTES = 100 * 1024 * 1024
+LOG_ROTATE_BACKUPS = 3
 
 #------------------------------------------------------------------------------
 
@@ -105,6 +116,7 @@ def out(_DebugLevel, msg, nl='\n', log_name='stdout', showtime=False):
     global _UseColors
     global _GlobalDebugLevel
     global _AllLogFiles
+    global _LogWriter
     s = msg
     s_ = s
     level = _DebugLevel
@@ -117,7 +129,7 @@ def out(_DebugLevel, msg, nl='\n', log_name='stdout', showtime=False):
     if _IsAndroid is None:
         _IsAndroid = (sys.executable == 'android_python' or ('ANDROID_ARGUMENT' in os.environ))
     if ( _ShowTime and level > 0 ) or showtime:
-        tm_string = time.strftime('%H:%M:%S')
+        tm_string = time_string()
         if _LifeBeginsTime != 0:
             dt = time.time() - _LifeBeginsTime
             mn = dt // 60
@@ -144,7 +156,16 @@ def out(_DebugLevel, msg, nl='\n', log_name='stdout', showtime=False):
     if not _LogsEnabled:
         return
     if is_debug(level):
-        if log_name == 'stdout':
+        if _LogWriter is not None:
+            o = s + nl
+            if sys.version_info[0] == 3:
+                if not isinstance(o, str):
+                    o = o.decode('utf-8')
+            else:
+                if not isinstance(o, unicode):  # @UndefinedVariable
+                    o = o.decode('utf-8')
+            _LogWriter.write(log_name, o, urgent=(level == 0))
+        elif log_name == 'stdout':
             if _LogFile is not None:
                 o = s + nl
                 if sys.version_info[0] == 3:
@@ -196,6 +217,18 @@ def out(_DebugLevel, msg, nl='\n', log_name='stdout', showtime=False):
     return None
 
 
+def time_string():
+    """
+    Returns current time formatted for the log lines, `time.strftime()` is called only once per second.
+    """
+    global _TimeStringCache
+    now = int(time.time())
+    if _TimeStringCache[0] != now:
+        _TimeStringCache[0] = now
+        _TimeStringCache[1] = time.strftime('%H:%M:%S', time.localtime(now))
+    return _TimeStringCache[1]
+
+
 def dbg(_DebugLevel, message, *args, **kwargs):
     level = _DebugLevel
     cod = sys._getframe().f_back.f_code
@@ -581,9 +614,10 @@ def exception_hook(typ, value, traceback):
     exc(exc_info=(typ, value, traceback))
 
 
-def open_log_file(filename, append_mode=False):
+def open_log_file(filename, append_mode=False, async_writer=True):
     """
     Open a log file, so all logs will go here instead of STDOUT.
+    By default lines are written to the file from a background thread, see `LogWriter`.
     """
     global _LogFile
     global _LogFileName
@@ -600,6 +634,8 @@ def open_log_file(filename, append_mode=False):
     except:
         _LogFile = None
         _LogFileName = None
+    if _LogFile and async_writer:
+        start_log_writer()
     return _LogFile
 
 
@@ -609,6 +645,7 @@ def close_log_file():
     """
     global _LogFile
     global _AllLogFiles
+    stop_log_writer()
     if not _LogFile:
         return
     _LogFile.flush()
@@ -620,6 +657,41 @@ def close_log_file():
     _AllLogFiles.clear()
 
 
+def start_log_writer(max_lines=LOG_BUFFER_MAX_LINES, flush_interval=LOG_FLUSH_INTERVAL,
+                     rotate_bytes=LOG_ROTATE_BYTES, rotate_backups=LOG_ROTATE_BACKUPS):
+    global _LogWriter
+    if _LogWriter:
+        return False
+    _LogWriter = LogWriter(
+        max_lines=max_lines,
+        flush_interval=flush_interval,
+        rotate_bytes=rotate_bytes,
+        rotate_backups=rotate_backups,
+    )
+    _LogWriter.start()
+    return True
+
+
+def stop_log_writer():
+    """
+    Writes all buffered lines to the files and stops the background thread.
+    """
+    global _LogWriter
+    if not _LogWriter:
+        return False
+    writer = _LogWriter
+    _LogWriter = None
+    writer.stop()
+    return True
+
+
+def log_writer_stats():
+    global _LogWriter
+    if not _LogWriter:
+        return {}
+    return _LogWriter.stats()
+
+
 def open_intercepted_log_file(filename, mode='w'):
     global _InterceptedLogFile
     if not _InterceptedLogFile:
@@ -900,3 +972,121 @@ class STDERR_unbuffered(object):
 
     def __getattr__(self, attr):
         return getattr(self.stream, attr)
+
+#------------------------------------------------------------------------------
+
+class LogWriter(threading.Thread):
+    """
+    Writes log lines to the files in a background thread.
+
+    Lines are collected in a bounded in-memory buffer, writer thread wakes up every `flush_interval` seconds
+    or when `LOG_FLUSH_LINES` lines are buffered (or an error is logged) and writes all of them at once.
+    When the buffer is full new lines are dropped and counted.
+    Files are rotated when reached `rotate_bytes` size.
+    """
+
+    def __init__(self, max_lines=LOG_BUFFER_MAX_LINES, flush_interval=LOG_FLUSH_INTERVAL,
+                 rotate_bytes=LOG_ROTATE_BYTES, rotate_backups=LOG_ROTATE_BACKUPS):
+        threading.Thread.__init__(self, name='LogWriter')
+        self.daemon = True
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_backups = rotate_backups
+        self.buffer = collections.deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.rotated = 0
+
+    def stats(self):
+        return {
+            'buffered': len(self.buffer),
+            'max_lines': self.max_lines,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'rotated': self.rotated,
+        }
+
+    def write(self, log_name, line, urgent=False):
+        with self.lock:
+            if len(self.buffer) >= self.max_lines:
+                self.dropped += 1
+                return False
+            self.buffer.append((log_name, line, ))
+            if urgent or len(self.buffer) >= LOG_FLUSH_LINES:
+                self.wakeup.set()
+        return True
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        else:
+            self._write_batch()
+
+    def run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self._write_batch()
+        self._write_batch()
+
+    def _write_batch(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            batch = self.buffer
+            self.buffer = collections.deque()
+        lines = collections.OrderedDict()
+        for log_name, line in batch:
+            lines.setdefault(log_name, []).append(line)
+        for log_name, log_lines in lines.items():
+            try:
+                self._write_lines(log_name, ''.join(log_lines))
+            except:
+                continue
+            self.written += len(log_lines)
+        self.batches += 1
+
+    def _write_lines(self, log_name, data):
+        global _LogFile
+        global _LogFileName
+        global _AllLogFiles
+        if log_name == 'stdout':
+            if _LogFile is None:
+                return
+            f = _LogFile
+        else:
+            if not _LogFileName:
+                return
+            if log_name not in _AllLogFiles:
+                filename = os.path.join(os.path.dirname(_LogFileName), log_name + '.log')
+                if not os.path.isdir(os.path.dirname(os.path.abspath(filename))):
+                    os.makedirs(os.path.dirname(os.path.abspath(filename)))
+                _AllLogFiles[log_name] = open(os.path.abspath(filename), 'w')
+            f = _AllLogFiles[log_name]
+        f.write(data)
+        f.flush()
+        if self.rotate_bytes and f.tell() >= self.rotate_bytes:
+            new_file = self._rotate_file(f)
+            if log_name == 'stdout':
+                _LogFile = new_file
+            else:
+                _AllLogFiles[log_name] = new_file
+
+    def _rotate_file(self, f):
+        filename = f.name
+        f.close()
+        for i in range(self.rotate_backups - 1, 0, -1):
+            if os.path.exists('%s.%d' % (filename, i)):
+                os.replace('%s.%d' % (filename, i), '%s.%d' % (filename, i + 1))
+        if self.rotate_backups > 0:
+            os.replace(filename, '%s.1' % filename)
+        self.rotated += 1
+        return open(filename, 'w')
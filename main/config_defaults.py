@@ -85,6 +85,9 @@ def reset(conf_obj):
     conf_obj.setDefaultValue('services/backups/max-copies', '2')
     conf_obj.setDefaultValue('services/backups/keep-local-copies-enabled', 'true')
     conf_obj.setDefaultValue('services/backups/wait-suppliers-enabled', 'true')
+    conf_obj.setDefaultValue('services/backups/encryption-threads', 2)
+    conf_obj.setDefaultValue('services/backups/compression', 'gz')
+    conf_obj.setDefaultValue('services/backups/compression-level', 6)
 
     conf_obj.setDefaultValue('services/blockchain/enabled', 'false')
     conf_obj.setDefaultValue('services/blockchain/host', '127.0.0.1')
@@ -120,17 +123,22 @@ def reset(conf_obj):
     conf_obj.setDefaultValue('services/data-motion/enabled', 'true')
     conf_obj.setDefaultValue('services/data-motion/supplier-request-queue-size', 4)
     conf_obj.setDefaultValue('services/data-motion/supplier-sending-queue-size', 4)
+    conf_obj.setDefaultValue('services/data-motion/supplier-queue-max-size', 32)
 
     conf_obj.setDefaultValue('services/entangled-dht/enabled', 'true')
     conf_obj.setDefaultValue('services/entangled-dht/udp-port', settings.DefaultDHTPort())
     conf_obj.setDefaultValue('services/entangled-dht/known-nodes', '')
     conf_obj.setDefaultValue('services/entangled-dht/attached-layers', '')
+    conf_obj.setDefaultValue('services/entangled-dht/vector-routing-layers', '')
 
     conf_obj.setDefaultValue('services/employer/enabled', 'true')
     conf_obj.setDefaultValue('services/employer/replace-critically-offline-enabled', 'true')
     conf_obj.setDefaultValue('services/employer/candidates', '')
 
     conf_obj.setDefaultValue('services/gateway/enabled', 'true')
+    conf_obj.setDefaultValue('services/gateway/verification-threads', 2)
+    conf_obj.setDefaultValue('services/gateway/verification-queue-size', 200)
+    conf_obj.setDefaultValue('services/gateway/memory-transfer-threshold', 64 * 1024)
 
     conf_obj.setDefaultValue('services/http-connections/enabled', 'false')
     conf_obj.setDefaultValue('services/http-connections/http-port', settings.DefaultHTTPPort())
@@ -220,8 +228,11 @@ def reset(conf_obj):
     conf_obj.setDefaultValue('services/proxy-transport/current-router', '')
 
     conf_obj.setDefaultValue('services/rebuilding/enabled', 'true')
+    conf_obj.setDefaultValue('services/rebuilding/child-processes-enabled', 'true')
+    conf_obj.setDefaultValue('services/rebuilding/child-processes-count', 0)
 
     conf_obj.setDefaultValue('services/restores/enabled', 'true')
+    conf_obj.setDefaultValue('services/restores/prefetch-blocks', 4)
 
     conf_obj.setDefaultValue('services/shared-data/enabled', 'true')
 
@@ -121,6 +121,17 @@ When critical amount of your suppliers become unreliable - your uploaded data is
 Enable this option to wait for 24 hours after any file upload and perform an extra check of all suppliers before cleaning up the local copy.
 This is a compromise solution that does not sacrifice reliability but also decrease local storage consumption.
 
+{services/backups/encryption-threads} number of encryption threads
+How many threads are used to encrypt and sign blocks of uploaded data.
+Reading of the next block continues while previous blocks are encrypted, higher values make uploading faster on multi-core devices but use more memory.
+
+{services/backups/compression} compression codec
+Every block of uploaded data is compressed before encryption: "gz", "bz2", "xz" or "none" to switch compression off.
+Blocks which are already compressed, like media files or archives, are detected and sent as they are.
+
+{services/backups/compression-level} compression level
+From 1 (fastest) to 9 (smallest output).
+
 {services/blockchain/enabled} enable blockchain
 The service is under development.
 
@@ -189,13 +200,17 @@ Data processing includes error correction codes and redundancy to enable restora
 The service creates a queue of incoming and outgoing encrypted fragments of your data when uploading and downloading from the nodes of remote providers.
 
 {services/data-motion/supplier-request-queue-size} concurrent outgoing packets
-Determines the maximum number of encrypted data packets sent at the same time.
+Determines the initial number of encrypted data packets sent at the same time.
 Affects the speed of data uploading to the suppliers' machines.
 
 {services/data-motion/supplier-sending-queue-size} concurrent incoming packets
-Determines the maximum number of simultaneously received encrypted data packets.
+Determines the initial number of simultaneously received encrypted data packets.
 Affects the speed of data downloading from the suppliers' machines.
 
+{services/data-motion/supplier-queue-max-size} maximum concurrent packets per supplier
+The number of packets transferred at the same time is adjusted for every supplier separately,
+depending on how fast the packets are delivered. Fast suppliers get more packets in progress, up to that limit.
+
 {services/entangled-dht/enabled} distributed hash-table node
 Your device becomes one of the peers in the DHT network.
 Provides the ability to read and write to a distributed hash table and access networking service layers.
@@ -214,6 +229,10 @@ This allows the network services to be separated from each other and also makes
 On startup, your device will be automatically connected to some of the layers.
 This value overrides this list and is intended for advanced software use.
 
+{services/entangled-dht/vector-routing-layers} layers with vector routing table
+Comma-separated list of DHT layers which will keep all known contacts in a flat array and always return the closest contacts to a key.
+Lookups in those layers are more precise, at the expense of some memory and CPU.
+
 {services/employer/enabled} search & connect with available suppliers
 In order to store data on the network, you must already have your suppliers ready and accepting your uploads.
 The `employer` network service automatically searches for new suppliers through the DHT network and monitors their reliability.
@@ -232,6 +251,18 @@ You can use `TCP`, `UDP`, and other network protocols to communicate with people
 The `gateway` service controls application transport protocols and all encrypted packets passing through and reaching application engine.
 Every incoming packet is digitally verified here, processed and sent to the underlying services.
 
+{services/gateway/verification-threads} number of verification threads
+Digital signatures of incoming packets are verified in that many threads at the same time.
+Set to 0 to verify all packets one by one in the main thread.
+
+{services/gateway/verification-queue-size} verification queue size
+Maximum number of incoming packets waiting for verification.
+When the queue is full next packets are verified in the main thread, this slows down reading from the network.
+
+{services/gateway/memory-transfer-threshold} in-memory transfer threshold
+Packets smaller than that number of bytes are passed between the gateway and the transports in memory
+instead of temporary files on disk. Set to 0 to always use temporary files.
+
 {services/http-connections/enabled} HTTP enabled
 This will allow BitDust to use the HTTP protocol for service data and encrypted traffic
 
@@ -422,9 +453,20 @@ When one of your suppliers is not available for some reason, all encrypted fragm
 The `rebuilding` service will automatically download the available fragments from those suppliers that are still online, and "rebuild" the lost fragments that the new supplier receives.
 **WARNING!** At the moment when a critical number of fragments are lost, downloading data is no longer possible.
 
+{services/rebuilding/child-processes-enabled} use multiple CPU cores
+Run RAID processing of backups, restores and rebuilding in separate child processes, so that many blocks are processed at the same time on different CPU cores.
+When disabled, all RAID tasks are executed one by one in a single thread.
+
+{services/rebuilding/child-processes-count} number of child processes
+How many child processes to start for RAID processing, set to 0 to use half of all available CPU cores.
+
 {services/restores/enabled} enable data downloading
 Controls network connections and incoming data streams when downloading encrypted fragments from suppliers nodes.
 
+{services/restores/prefetch-blocks} number of blocks to download ahead
+While one block is restored, fragments of that many next blocks are requested from suppliers and decoded in parallel.
+Higher values make downloading faster when suppliers are far away, but use more disk space, set to 0 to restore one block at a time.
+
 {services/shared-data/enabled} enable data sharing
 Makes possible decentralized sharing of encrypted files with other users. 
 
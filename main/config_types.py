@@ -101,7 +101,10 @@ def defaults():
         'services/accountant/enabled': TYPE_BOOLEAN,
         'services/backup-db/enabled': TYPE_BOOLEAN,
         'services/backups/block-size': TYPE_DISK_SPACE,
+        'services/backups/compression': TYPE_STRING,
+        'services/backups/compression-level': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/backups/enabled': TYPE_BOOLEAN,
+        'services/backups/encryption-threads': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/backups/keep-local-copies-enabled': TYPE_BOOLEAN,
         'services/backups/max-block-size': TYPE_DISK_SPACE,
         'services/backups/max-copies': TYPE_POSITIVE_INTEGER,
@@ -130,14 +133,19 @@ def defaults():
         'services/data-motion/enabled': TYPE_BOOLEAN,
         'services/data-motion/supplier-request-queue-size': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/data-motion/supplier-sending-queue-size': TYPE_NON_ZERO_POSITIVE_INTEGER,
+        'services/data-motion/supplier-queue-max-size': TYPE_NON_ZERO_POSITIVE_INTEGER,
         'services/entangled-dht/enabled': TYPE_BOOLEAN,
         'services/entangled-dht/udp-port': TYPE_PORT_NUMBER,
         'services/entangled-dht/known-nodes': TYPE_STRING,
         'services/entangled-dht/attached-layers': TYPE_STRING,
+        'services/entangled-dht/vector-routing-layers': TYPE_STRING,
         'services/employer/enabled': TYPE_BOOLEAN,
         'services/employer/replace-critically-offline-enabled': TYPE_BOOLEAN,
         'services/employer/candidates': TYPE_STRING,
         'services/gateway/enabled': TYPE_BOOLEAN,
+        'services/gateway/memory-transfer-threshold': TYPE_POSITIVE_INTEGER,
+        'services/gateway/verification-queue-size': TYPE_NON_ZERO_POSITIVE_INTEGER,
+        'services/gateway/verification-threads': TYPE_POSITIVE_INTEGER,
         'services/http-connections/enabled': TYPE_BOOLEAN,
         'services/http-connections/http-port': TYPE_PORT_NUMBER,
         'services/http-transport/enabled': TYPE_BOOLEAN,
@@ -201,7 +209,10 @@ def defaults():
         'services/proxy-transport/preferred-routers': TYPE_TEXT,
         # 'services/proxy-transport/router-lifetime-seconds': TYPE_POSITIVE_INTEGER,
         'services/rebuilding/enabled': TYPE_BOOLEAN,
+        'services/rebuilding/child-processes-enabled': TYPE_BOOLEAN,
+        'services/rebuilding/child-processes-count': TYPE_POSITIVE_INTEGER,
         'services/restores/enabled': TYPE_BOOLEAN,
+        'services/restores/prefetch-blocks': TYPE_POSITIVE_INTEGER,
         'services/shared-data/enabled': TYPE_BOOLEAN,
         'services/supplier/donated-space': TYPE_DISK_SPACE,
         'services/supplier/enabled': TYPE_BOOLEAN,
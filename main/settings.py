@@ -1904,6 +1904,27 @@ def getGeneralWaitSuppliers():
     return config.conf().getBool('services/backups/wait-suppliers-enabled')
 
 
+def getBackupCompression():
+    """
+    Codec to compress blocks of uploaded data with, "none" means do not compress.
+    """
+    codec = config.conf().getData('services/backups/compression', 'gz')
+    if codec not in ('gz', 'bz2', 'xz', ):
+        return 'none'
+    return codec
+
+
+def getBackupCompressionLevel():
+    return config.conf().getInt('services/backups/compression-level', 6)
+
+
+def getRestorePrefetchBlocks():
+    """
+    How many blocks after the current one are downloaded and decoded ahead during restore.
+    """
+    return config.conf().getInt('services/restores/prefetch-blocks', 4)
+
+
 def getBackupBlockSizeStr():
     return config.conf().getData('services/backups/block-size')
 
@@ -490,6 +490,8 @@ class IdRotator(automat.Automat):
         if event == 'ping-done':
             self.result_defer.callback((self._is_healthy(args[0]), False))
         elif event == 'my-id-exist':
+            if self.rotated:
+                my_id.forgetKnownIDURLs()
             self.result_defer.callback((True, self.rotated, ))
             # if self.rotated:
             #     events.send('my-identity-rotate-complete', data=dict())
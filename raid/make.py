@@ -59,7 +59,7 @@ _Debug = False
 
 import os
 import sys
-import copy
+import mmap
 import array
 
 #------------------------------------------------------------------------------
@@ -137,6 +137,48 @@ def ReadBinaryFileAsArray(filename):
     return values
 
 
+def MapBinaryFile(f):
+    """
+    Returns read-only ``mmap`` of an opened file, empty files can not be mapped.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _make_pieces(wholefile, myeccmap, blockNumber, targetDir, threshold_control=None):
+    view = memoryview(wholefile)
+    length = len(view)
+    seglength = int((length + myeccmap.datasegments - 1) / myeccmap.datasegments)
+    # list of data segments, all are slices of the same buffer
+    sds = []
+    try:
+        for seg_num, chunk in enumerate(raid.raidutils.chunks(view, seglength)):
+            FileName = targetDir + '/' + str(blockNumber) + '-' + str(seg_num) + '-Data'
+            with open(FileName, mode='wb') as f:
+                f.write(chunk)
+            sds.append(chunk)
+
+        # parity is written stripe by stripe, so only one stripe of every Parity segment is in memory
+        parity_files = {}
+        try:
+            for PSegNum in range(myeccmap.paritysegments):
+                FileName = targetDir + '/' + str(blockNumber) + '-' + str(PSegNum) + '-Parity'
+                parity_files[PSegNum] = open(FileName, mode='wb')
+            for stripe in raid.raidutils.iterate_parity_stripes(sds, myeccmap, threshold_control=threshold_control):
+                for PSegNum, parity_bytes in stripe.items():
+                    parity_files[PSegNum].write(parity_bytes)
+        finally:
+            for f in parity_files.values():
+                f.close()
+
+        return len(sds), len(parity_files)
+
+    finally:
+        del sds[:]
+        view.release()
+
+
 def do_in_memory(filename, eccmapname, version, blockNumber, targetDir, threshold_control=None):
     try:
         if _Debug:
@@ -146,37 +188,18 @@ def do_in_memory(filename, eccmapname, version, blockNumber, targetDir, threshol
         myeccmap = raid.eccmap.eccmap(eccmapname)
         # any padding at end and block.Length fixes
         RoundupFile(filename, myeccmap.datasegments * INTSIZE)
-        wholefile = ReadBinaryFileAsArray(filename)
-        length = len(wholefile)
-        length = length * 4
-        seglength = (length + myeccmap.datasegments - 1) / myeccmap.datasegments
-
-        # dict of data segments
-        sds = {}
-        for seg_num, chunk in enumerate(raid.raidutils.chunks(wholefile, int(seglength / 4))):
-            FileName = targetDir + '/' + str(blockNumber) + '-' + str(seg_num) + '-Data'
-            with open(FileName, mode='wb') as f:
-                chunk_to_write = copy.copy(chunk)
-                chunk_to_write.byteswap()
-                sds[seg_num] = iter(chunk)
-                f.write(chunk_to_write)
-
-        psds_list = raid.raidutils.build_parity(
-            sds,
-            int(seglength / INTSIZE),
-            myeccmap.datasegments,
-            myeccmap,
-            myeccmap.paritysegments,
-            threshold_control=threshold_control,
-        )
-
-        dataNum = len(sds)
-        parityNum = len(psds_list)
-
-        for PSegNum, _ in psds_list.items():
-            FileName = targetDir + '/' + str(blockNumber) + '-' + str(PSegNum) + '-Parity'
-            with open(FileName, mode='wb') as f:
-                f.write(psds_list[PSegNum])
+        with open(filename, mode='rb') as infile:
+            # the file is memory-mapped, so all data segments are just slices of it and no copy is made
+            wholefile = MapBinaryFile(infile)
+            try:
+                dataNum, parityNum = _make_pieces(wholefile, myeccmap, blockNumber, targetDir, threshold_control)
+            finally:
+                if isinstance(wholefile, mmap.mmap):
+                    try:
+                        wholefile.close()
+                    except BufferError:
+                        # slices are still referenced from the traceback, will be closed by garbage collector
+                        pass
 
         return dataNum, parityNum
 
@@ -87,6 +87,8 @@ from automats import automat
 
 from system import bpio
 
+from main import config
+
 from raid import read
 from raid import make
 from raid import rebuild
@@ -104,11 +106,15 @@ _MODULES = (
     'sys',
     'copy',
     'array',
+    'mmap',
     'traceback',
     'six',
     'io',
 )
 
+# threaded RAID task gives other threads a chance to run every time after that amount of bytes was processed
+_YIELD_BYTES = 1024 * 1024
+
 _VALID_TASKS = {
     'make': (make.do_in_memory, (make.RoundupFile, make.ReadBinaryFile, make.WriteFile, make.ReadBinaryFileAsArray, )),
     'read': (read.raidread, (read.RebuildOne, read.ReadBinaryFile, )),
@@ -158,6 +164,19 @@ def cancel_task(cmd, first_parameter):
         return False
     return True
 
+
+def get_task_progress(cmd, first_parameter):
+    """
+    Returns number of bytes already processed by the task, or None if task is not running.
+    """
+    if not A() or not A().processor:
+        return None
+    for task_id, task_data in A().activetasks.items():
+        t_proc, t_cmd, t_params = task_data
+        if cmd == t_cmd and first_parameter == t_params[0]:
+            return A().processor.get_progress(t_proc.tid)
+    return None
+
 #------------------------------------------------------------------------------
 
 
@@ -294,30 +313,26 @@ class RaidWorker(automat.Automat):
         """
         Action method.
         """
-        ncpus = bpio.detect_number_of_cpu_cores()
-        if ncpus > 1:
-            # do not use all CPU cors at once
-            # need to keep at least one for all other operations
-            # even decided to use only half of CPUs at the moment
-            # TODO: make an option in the software settings
-            ncpus = int(ncpus / 2.0)
-
-        self.processor = ThreadedRaidProcessor()
-
-        # if bpio.Android() or not config.conf().getBool('services/rebuilding/child-processes-enabled'):
-        #     self.processor = ThreadedRaidProcessor()
-        # else:
-        #     os.environ['PYTHONUNBUFFERED'] = '1'
-        #     from parallelp import pp
-        #     self.processor = pp.Server(
-        #         secret='bitdust',
-        #         ncpus=ncpus,
-        #         loglevel=lg.get_loging_level(_DebugLevel),
-        #         logfile=settings.ParallelPLogFilename(),
-        #     )
-        # else:
-        #     from raid import worker
-        #     self.processor = worker.Manager(ncpus=ncpus)
+        self.processor = None
+        if not bpio.Android() and config.conf() and config.conf().getBool('services/rebuilding/child-processes-enabled'):
+            ncpus = config.conf().getInt('services/rebuilding/child-processes-count')
+            if not ncpus or ncpus <= 0:
+                ncpus = bpio.detect_number_of_cpu_cores()
+                if ncpus > 1:
+                    # do not use all CPU cors at once
+                    # need to keep at least one for all other operations
+                    # even decided to use only half of CPUs at the moment
+                    ncpus = int(ncpus / 2.0)
+            try:
+                from raid import worker
+                self.processor = worker.ProcessRaidProcessor(ncpus=ncpus)
+            except:
+                lg.exc('failed to start child processes, will use threaded RAID processor')
+                self.processor = None
+        if self.processor is None:
+            self.processor = ThreadedRaidProcessor()
+        if _Debug:
+            lg.args(_DebugLevel, processor=self.processor, ncpus=self.processor.get_ncpus())
 
         self.automat('process-started')
 
@@ -443,16 +458,18 @@ class RaidTask(object):
         self._worker_args = worker_args or ()
         self._stopped = False
         self._bytes_processed = 0
+        self._bytes_since_yield = 0
         self._started = None
 
     def threshold_control(self, more_bytes):
         if self._stopped:
             return False
         self._bytes_processed += more_bytes
-        time_running = time.time() - self._started
-        if self._bytes_processed % 10000 == 0:
+        self._bytes_since_yield += more_bytes
+        if self._bytes_since_yield >= _YIELD_BYTES:
+            self._bytes_since_yield = 0
             if _Debug:
-                lg.args(_DebugLevel, bytes_processed=self._bytes_processed, time_running=time_running)
+                lg.args(_DebugLevel, bytes_processed=self._bytes_processed, time_running=time.time() - self._started)
             time.sleep(0.01)
         return True
 
@@ -491,6 +508,10 @@ class ThreadedRaidProcessor(object):
         self.max_simultaneous_tasks = 1
 
     def cancel(self, task_id):
+        if task_id in self.tasks:
+            # task was submitted but not started yet, it will fail right after start
+            self.tasks[task_id].stop()
+            return
         if task_id not in self.active_tasks:
             lg.warn('can not cancel task %r, task was not found' % task_id)
             return
@@ -503,6 +524,12 @@ class ThreadedRaidProcessor(object):
     def get_ncpus(self):
         return self.max_simultaneous_tasks
 
+    def get_progress(self, task_id):
+        ts = self.active_tasks.get(task_id) or self.tasks.get(task_id)
+        if not ts:
+            return None
+        return ts._bytes_processed
+
     def on_success(self, task_id, result, callback):
         ts = self.active_tasks.pop(task_id)
         if _Debug:
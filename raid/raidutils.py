@@ -27,12 +27,44 @@
 """
 .. module:: raidutils.
 
+Parity for a block is a bytewise XOR of the Data segments listed for every
+Parity segment in the ecc map. The byte order does not matter for XOR, so the
+whole segment can be processed at once instead of one 32-bit int at a time.
+
+If NumPy is installed ``build_parity_block()`` XORs segments as ``uint64`` (or
+``uint32``) arrays, otherwise it falls back to Python long integers created with
+``int.from_bytes()`` - both are done in C and give byte-identical results.
+
+Reconstruction of missing pieces works the same way: ``build_rebuild_plan()``
+finds once for given ecc map and set of available pieces which pieces must be
+XOR-ed to get every missing one, and ``rebuild_block()`` executes that plan in a
+single pass over memory-mapped piece files.
 """
 
+import os
+import mmap
 import array
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#------------------------------------------------------------------------------
+
+STRIPE_SIZE = 256 * 1024
+
+_RebuildPlans = {}
+_MaxRebuildPlans = 1000
+
+#------------------------------------------------------------------------------
+
 
 def build_parity(sds, iters, datasegments, myeccmap, paritysegments, threshold_control=None):
+    """
+    Old reference implementation, XOR one int at a time.
+    Kept to compare results and speed with ``build_parity_block()``.
+    """
     psds_list = {seg_num: array.array('i') for seg_num in range(myeccmap.paritysegments)}
 
     for i in range(iters):
@@ -61,6 +93,247 @@ def build_parity(sds, iters, datasegments, myeccmap, paritysegments, threshold_c
     return psds_list
 
 
+def build_parity_block(data_segments, myeccmap, threshold_control=None, stripe_size=STRIPE_SIZE, use_numpy=True):
+    """
+    Build all Parity segments for a block.
+
+    Input ``data_segments`` is a list of bytes-like objects (``bytes``, ``memoryview``, ``mmap``),
+    one per Data segment, all of the same length.
+    Returns a dict with Parity segment number as key and ``bytes`` as value.
+    """
+    parity_stripes = {PSegNum: [] for PSegNum in range(myeccmap.paritysegments)}
+    for stripe in iterate_parity_stripes(data_segments, myeccmap, threshold_control=threshold_control, stripe_size=stripe_size, use_numpy=use_numpy):
+        for PSegNum, parity_bytes in stripe.items():
+            parity_stripes[PSegNum].append(parity_bytes)
+    return {PSegNum: b''.join(parts) for PSegNum, parts in parity_stripes.items()}
+
+
+def iterate_parity_stripes(data_segments, myeccmap, threshold_control=None, stripe_size=STRIPE_SIZE, use_numpy=True):
+    """
+    Same as ``build_parity_block()``, but yields Parity segments stripe by stripe,
+    so caller can write them to the disk without keeping whole Parity segments in memory.
+
+    Segments are processed in stripes of ``stripe_size`` bytes, so the task can be cancelled
+    via ``threshold_control()`` while working on a big block.
+    """
+    if len(data_segments) != myeccmap.datasegments:
+        raise Exception('expected %d data segments, but %d were given' % (myeccmap.datasegments, len(data_segments)))
+    seglength = len(data_segments[0]) if data_segments else 0
+    for seg in data_segments:
+        if len(seg) != seglength:
+            raise Exception('data segments must be of the same length')
+    for DSegNum in range(myeccmap.datasegments):
+        for PSegNum in myeccmap.DataToParity[DSegNum]:
+            if PSegNum >= myeccmap.paritysegments:
+                myeccmap.check()
+                raise Exception("eccmap error")
+    views = [memoryview(seg).cast('B') for seg in data_segments]
+    if numpy is not None and use_numpy:
+        xor_stripe = _xor_stripe_numpy
+    else:
+        xor_stripe = _xor_stripe_int
+    for offset in range(0, seglength, stripe_size):
+        yield xor_stripe([v[offset:offset + stripe_size] for v in views], myeccmap, threshold_control)
+
+
+def _xor_stripe_numpy(stripe, myeccmap, threshold_control=None):
+    length = len(stripe[0])
+    dtype = numpy.uint64 if length % 8 == 0 else (numpy.uint32 if length % 4 == 0 else numpy.uint8)
+    parities = {PSegNum: numpy.zeros(length // numpy.dtype(dtype).itemsize, dtype=dtype) for PSegNum in range(myeccmap.paritysegments)}
+    for DSegNum in range(myeccmap.datasegments):
+        if threshold_control:
+            if not threshold_control(length):
+                raise Exception('task cancelled')
+        d = numpy.frombuffer(stripe[DSegNum], dtype=dtype)
+        for PSegNum in myeccmap.DataToParity[DSegNum]:
+            numpy.bitwise_xor(parities[PSegNum], d, out=parities[PSegNum])
+    return {PSegNum: p.tobytes() for PSegNum, p in parities.items()}
+
+
+def _xor_stripe_int(stripe, myeccmap, threshold_control=None):
+    length = len(stripe[0])
+    parities = {PSegNum: 0 for PSegNum in range(myeccmap.paritysegments)}
+    for DSegNum in range(myeccmap.datasegments):
+        if threshold_control:
+            if not threshold_control(length):
+                raise Exception('task cancelled')
+        d = int.from_bytes(stripe[DSegNum], 'little')
+        for PSegNum in myeccmap.DataToParity[DSegNum]:
+            parities[PSegNum] ^= d
+    return {PSegNum: p.to_bytes(length, 'little') for PSegNum, p in parities.items()}
+
+
+def xor_buffers(buffers, use_numpy=True):
+    """
+    Returns bytes which is a XOR of all given bytes-like objects of the same length.
+    """
+    length = len(buffers[0])
+    if numpy is not None and use_numpy:
+        dtype = numpy.uint64 if length % 8 == 0 else (numpy.uint32 if length % 4 == 0 else numpy.uint8)
+        result = numpy.frombuffer(buffers[0], dtype=dtype).copy()
+        for buf in buffers[1:]:
+            numpy.bitwise_xor(result, numpy.frombuffer(buf, dtype=dtype), out=result)
+        return result.tobytes()
+    result = int.from_bytes(buffers[0], 'little')
+    for buf in buffers[1:]:
+        result ^= int.from_bytes(buf, 'little')
+    return result.to_bytes(length, 'little')
+
+#------------------------------------------------------------------------------
+
+
+def build_rebuild_plan(myeccmap, data_segs, parity_segs, rebuild_parity=True):
+    """
+    Decide how to reconstruct missing pieces of a block.
+
+    Lists ``data_segs`` and ``parity_segs`` are like [0,1,1,1,0...], 1 means we have that piece.
+    Returns a tuple of steps, every step is ``(target, sources)`` where pieces are
+    identified as ``(segment number, 'Data')`` or ``(segment number, 'Parity')``.
+    Target of a step can be used as a source in the next steps.
+    Missing Data segments are fixed first with the shortest possible Parity (see ``eccmap.GetDataFixPath()``),
+    then missing Parity segments are built from the Data if ``rebuild_parity`` is True.
+
+    Plans are cached because during rebuilding same situation happens for many blocks in a row.
+    """
+    global _RebuildPlans
+    data = tuple(1 if d == 1 else 0 for d in data_segs)
+    parity = tuple(1 if p == 1 else 0 for p in parity_segs)
+    plan_key = (myeccmap.name, data, parity, rebuild_parity)
+    plan = _RebuildPlans.get(plan_key)
+    if plan is not None:
+        return plan
+    data = list(data)
+    parity = list(parity)
+    steps = []
+    progress = True
+    while progress:
+        progress = False
+        for DSegNum in range(myeccmap.datasegments):
+            if data[DSegNum]:
+                continue
+            PSegNum, PMap = myeccmap.GetDataFixPath(data, parity, DSegNum)
+            if PSegNum == -1:
+                continue
+            sources = ((PSegNum, 'Parity'), ) + tuple((d, 'Data') for d in PMap if d != DSegNum)
+            steps.append(((DSegNum, 'Data'), sources))
+            data[DSegNum] = 1
+            progress = True
+    if rebuild_parity:
+        for PSegNum in range(myeccmap.paritysegments):
+            if parity[PSegNum]:
+                continue
+            PMap = myeccmap.ParityToData[PSegNum]
+            if all(data[d] for d in PMap):
+                steps.append(((PSegNum, 'Parity'), tuple((d, 'Data') for d in PMap)))
+                parity[PSegNum] = 1
+    plan = tuple(steps)
+    if len(_RebuildPlans) >= _MaxRebuildPlans:
+        _RebuildPlans.clear()
+    _RebuildPlans[plan_key] = plan
+    return plan
+
+
+def rebuild_block(plan, filename_method, threshold_control=None, stripe_size=STRIPE_SIZE, use_numpy=True):
+    """
+    Execute a plan from ``build_rebuild_plan()`` and write reconstructed pieces to the disk.
+
+    The ``filename_method(piece)`` must return local file path for given piece.
+    Available pieces are memory-mapped and read only once, all steps are done stripe by stripe.
+    Steps which can not be done because some source files are missing or have different size are skipped.
+    Returns list of reconstructed pieces.
+    """
+    steps = []
+    produced = set()
+    lengths = {}
+    for target, sources in plan:
+        ok = True
+        for source in sources:
+            if source not in lengths:
+                if source in produced:
+                    ok = False
+                    break
+                try:
+                    lengths[source] = os.path.getsize(filename_method(source))
+                except (OSError, IOError):
+                    lengths[source] = None
+            if lengths[source] is None:
+                ok = False
+                break
+        if ok and len(set(lengths[source] for source in sources)) != 1:
+            ok = False
+        if not ok:
+            lengths[target] = None
+            produced.add(target)
+            continue
+        lengths[target] = lengths[sources[0]]
+        produced.add(target)
+        steps.append((target, sources))
+    if not steps:
+        return []
+    files = {}
+    maps = []
+    views = {}
+    outputs = {}
+    try:
+        for target, sources in steps:
+            for source in sources:
+                if source in views or source in outputs:
+                    continue
+                f = open(filename_method(source), 'rb')
+                files[source] = f
+                if lengths[source] > 0:
+                    maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                    views[source] = memoryview(maps[-1])
+                else:
+                    views[source] = memoryview(b'')
+            outputs[target] = open(filename_method(target), 'wb')
+        length = max(lengths[target] for target, _ in steps)
+        for offset in range(0, length, stripe_size):
+            _rebuild_stripe(steps, views, lengths, outputs, offset, stripe_size, threshold_control, use_numpy)
+    except:
+        for target, f in outputs.items():
+            f.close()
+            try:
+                os.remove(filename_method(target))
+            except:
+                pass
+        outputs.clear()
+        raise
+    finally:
+        for f in outputs.values():
+            f.close()
+        for v in views.values():
+            v.release()
+        for m in maps:
+            try:
+                m.close()
+            except BufferError:
+                # slices are still referenced from the traceback, will be closed by garbage collector
+                pass
+        for f in files.values():
+            f.close()
+    return [target for target, _ in steps]
+
+
+def _rebuild_stripe(steps, views, lengths, outputs, offset, stripe_size, threshold_control=None, use_numpy=True):
+    stripe = {}
+    for target, sources in steps:
+        if offset >= lengths[target]:
+            continue
+        if threshold_control:
+            if not threshold_control(min(stripe_size, lengths[target] - offset)):
+                raise Exception('task cancelled')
+        parts = []
+        for source in sources:
+            if source not in stripe:
+                stripe[source] = views[source][offset:offset + stripe_size]
+            parts.append(stripe[source])
+        stripe[target] = xor_buffers(parts, use_numpy=use_numpy)
+        outputs[target].write(stripe[target])
+
+#------------------------------------------------------------------------------
+
+
 def chunks(l, n):
     """Yield successive n-sized chunks from l."""
     for i in range(0, len(l), n):
@@ -56,7 +56,6 @@
 
 from __future__ import absolute_import
 from __future__ import print_function
-import six
 from io import open
 from six.moves import range
 
@@ -81,6 +80,7 @@ if __name__ == '__main__':
 import logs.lg
 
 import raid.eccmap
+import raid.raidutils
 
 #------------------------------------------------------------------------------
 
@@ -96,55 +96,25 @@ def ReadBinaryFile(filename):
 
 
 def RebuildOne(inlist, listlen, outfilename, threshold_control=None):
-    readsize = 1  # vary from 1 byte to 4 bytes
-    raidfiles = [''] * listlen  # just need a list of this size
-    raidreads = [''] * listlen
-    for filenum in range(listlen):
-        try:
-            raidfiles[filenum] = open(inlist[filenum], "rb")
-        except:
-            logs.lg.exc()
-            for f in raidfiles:
-                try:
-                    f.close()
-                except:
-                    pass
+    """
+    Write XOR of first ``listlen`` files from ``inlist`` into ``outfilename``.
+    """
+    filenames = list(inlist[:listlen])
+    for filename in filenames:
+        if not os.path.isfile(filename):
+            logs.lg.warn('file %r not found' % filename)
             return False
-
-    rebuildfile = open(outfilename, "wb")
-    progress = 0
-    while True:
-        for k in range(listlen):
-            raidreads[k] = raidfiles[k].read(2048)
-        if not raidreads[0]:
-            break
-        i = 0
-        while i < len(raidreads[0]):
-            xor = 0
-            for j in range(listlen):
-                b1 = ord(raidreads[j][i:i+1])
-                xor = xor ^ b1
-            if six.PY3:
-                out_byte = bytes([xor, ])
-            else:
-                out_byte = chr(xor)
-            rebuildfile.write(out_byte)
-            i += readsize
-            progress += 1
-
-            if threshold_control:
-                if not threshold_control(readsize):
-                    raise Exception('task cancelled')
-
-    for filenum in range(listlen):
-        raidfiles[filenum].close()
-    rebuildfile.close()
+    rebuilt = raid.raidutils.rebuild_block(
+        ((outfilename, tuple(filenames)), ),
+        lambda filename: filename,
+        threshold_control=threshold_control,
+    )
 
     if _Debug:
         with open('/tmp/raid.log', 'a') as logfile:
-            logfile.write(u'raidread.RebuildOne inlist=%d listlen=%d outfilename=%r progress=%d\n' % (
-                len(inlist), listlen, outfilename, progress))
-    return True
+            logfile.write(u'raidread.RebuildOne inlist=%d listlen=%d outfilename=%r rebuilt=%r\n' % (
+                len(inlist), listlen, outfilename, rebuilt))
+    return bool(rebuilt)
 
 
 # If segment is good, there is a file for it, if not then no file exists.
@@ -169,38 +139,21 @@ def raidread(
             open('/tmp/raid.log', 'a').write(u'raidread OutputFileName=%s blockNumber=%s eccmapname=%s\n' % (repr(OutputFileName), blockNumber, eccmapname))
 
         myeccmap = raid.eccmap.eccmap(eccmapname)
-        GoodFiles = ['', ] * (myeccmap.datasegments + myeccmap.paritysegments)
-        MakingProgress = 1
-        while MakingProgress == 1:
-            MakingProgress = 0
-            for PSegNum in range(myeccmap.paritysegments):
-                PFileName = os.path.join(
-                    data_parity_dir,
-                    version,
-                    str(blockNumber) + '-' + str(PSegNum) + '-Parity',
-                )
-                if os.path.exists(PFileName):
-                    Map = myeccmap.ParityToData[PSegNum]
-                    TotalDSegs = 0
-                    GoodDSegs = 0
-                    BadName = ''
-                    for DSegNum in Map:
-                        TotalDSegs += 1
-                        FileName = os.path.join(
-                            data_parity_dir,
-                            version,
-                            str(blockNumber) + '-' + str(DSegNum) + '-Data',
-                        )
-                        if os.path.exists(FileName):
-                            GoodFiles[GoodDSegs] = FileName
-                            GoodDSegs += 1
-                        else:
-                            BadName = FileName
-                    if GoodDSegs == TotalDSegs - 1:
-                        MakingProgress = 1
-                        GoodFiles[GoodDSegs] = PFileName
-                        GoodDSegs += 1
-                        RebuildOne(GoodFiles, GoodDSegs, BadName, threshold_control=threshold_control)
+
+        def _piece_file_name(piece):
+            segNum, dataOrParity = piece
+            return os.path.join(
+                data_parity_dir,
+                version,
+                str(blockNumber) + '-' + str(segNum) + '-' + dataOrParity,
+            )
+
+        # find which Data segments can be fixed with available Parity and Data,
+        # and then XOR all of them in one pass over the files
+        dataSegs = [(1 if os.path.exists(_piece_file_name((DSegNum, 'Data'))) else 0) for DSegNum in range(myeccmap.datasegments)]
+        paritySegs = [(1 if os.path.exists(_piece_file_name((PSegNum, 'Parity'))) else 0) for PSegNum in range(myeccmap.paritysegments)]
+        plan = raid.raidutils.build_rebuild_plan(myeccmap, dataSegs, paritySegs, rebuild_parity=False)
+        raid.raidutils.rebuild_block(plan, _piece_file_name, threshold_control=threshold_control)
 
         GoodFiles = []
         #  Count up the good segments and combine
@@ -46,8 +46,8 @@ if __name__ == '__main__':
 
 import logs.lg
 
-import raid.read
 import raid.eccmap
+import raid.raidutils
 
 #------------------------------------------------------------------------------
 
@@ -106,68 +106,38 @@ def rebuild(backupID, blockNum, eccMap, availableSuppliers, remoteMatrix, localM
 
         # This made an attempt to rebuild the missing pieces
         # from pieces we have on hands.
-        # lg.out(14, 'block_rebuilder.AttemptRebuild %s %d BEGIN' % (self.backupID, self.blockNum))
+        # Data files we already have on disk do not need to be rebuilt.
+        for supplierNum in range(supplierCount):
+            if localData[supplierNum] == 0 and os.path.exists(_build_raid_file_name(supplierNum, 'Data')):
+                localData[supplierNum] = 1
+        # The plan says which pieces to XOR for every missing Data and Parity,
+        # it is the same for all blocks with same pieces missing so it is cached.
+        plan = raid.raidutils.build_rebuild_plan(myeccmap, localData, localParity)
+        raid.raidutils.rebuild_block(
+            plan,
+            lambda piece: _build_raid_file_name(*piece),
+            threshold_control=threshold_control,
+        )
+        for target, _ in plan:
+            supplierNum, dataOrParity = target
+            if os.path.exists(_build_raid_file_name(supplierNum, dataOrParity)):
+                if dataOrParity == 'Data':
+                    localData[supplierNum] = 1
+                else:
+                    localParity[supplierNum] = 1
+        # now we check again if we have the data on hand after rebuild at it is missing - send it
+        # but also check to not duplicate sending to this man
+        # now sending is separated, see the file data_sender.py
         newData = False
-        madeProgress = True
-        while madeProgress:
-            madeProgress = False
-            # will check all data packets we have
-            for supplierNum in range(supplierCount):
-                dataFileName = _build_raid_file_name(supplierNum, 'Data')
-                # if we do not have this item on hands - we will reconstruct it from other items
-                if localData[supplierNum] == 0:
-                    parityNum, parityMap = myeccmap.GetDataFixPath(localData, localParity, supplierNum)
-                    if parityNum != -1:
-                        rebuildFileList = []
-                        rebuildFileList.append(_build_raid_file_name(parityNum, 'Parity'))
-                        for supplierParity in parityMap:
-                            if supplierParity != supplierNum:
-                                filename = _build_raid_file_name(supplierParity, 'Data')
-                                if os.path.isfile(filename):
-                                    rebuildFileList.append(filename)
-                        # lg.out(10, '    rebuilding file %s from %d files' % (os.path.basename(dataFileName), len(rebuildFileList)))
-                        raid.read.RebuildOne(rebuildFileList, len(rebuildFileList), dataFileName, threshold_control=threshold_control)
-                    if os.path.exists(dataFileName):
-                        localData[supplierNum] = 1
-                        madeProgress = True
-                        # lg.out(10, '        Data file %s found after rebuilding for supplier %d' % (os.path.basename(dataFileName), supplierNum))
-                # now we check again if we have the data on hand after rebuild at it is missing - send it
-                # but also check to not duplicate sending to this man
-                # now sending is separated, see the file data_sender.py
-                if localData[supplierNum] == 1 and missingData[supplierNum] == 1:  # and self.dataSent[supplierNum] == 0:
-                    # lg.out(10, '            rebuilt a new Data for supplier %d' % supplierNum)
-                    newData = True
-                    reconstructedData[supplierNum] = 1
-                    # self.outstandingFilesList.append((dataFileName, self.BuildFileName(supplierNum, 'Data'), supplierNum))
-                    # self.dataSent[supplierNum] = 1
-        # now with parities ...
         for supplierNum in range(supplierCount):
-            parityFileName = _build_raid_file_name(supplierNum, 'Parity')
-            if localParity[supplierNum] == 0:
-                parityMap = myeccmap.ParityToData[supplierNum]
-                HaveAllData = True
-                for segment in parityMap:
-                    if localData[segment] == 0:
-                        HaveAllData = False
-                        break
-                if HaveAllData:
-                    rebuildFileList = []
-                    for supplierParity in parityMap:
-                        filename = _build_raid_file_name(supplierParity, 'Data')  # ??? why not 'Parity'
-                        if os.path.isfile(filename):
-                            rebuildFileList.append(filename)
-                    # lg.out(10, '    rebuilding file %s from %d files' % (os.path.basename(parityFileName), len(rebuildFileList)))
-                    raid.read.RebuildOne(rebuildFileList, len(rebuildFileList), parityFileName, threshold_control=threshold_control)
-                    if os.path.exists(parityFileName):
-                        # lg.out(10, '        Parity file %s found after rebuilding for supplier %d' % (os.path.basename(parityFileName), supplierNum))
-                        localParity[supplierNum] = 1
-            # so we have the parity on hand and it is missing - send it
-            if localParity[supplierNum] == 1 and missingParity[supplierNum] == 1:  # and self.paritySent[supplierNum] == 0:
-                # lg.out(10, '            rebuilt a new Parity for supplier %d' % supplierNum)
+            if localData[supplierNum] == 1 and missingData[supplierNum] == 1:
+                newData = True
+                reconstructedData[supplierNum] = 1
+        # so we have the parity on hand and it is missing - send it
+        for supplierNum in range(supplierCount):
+            if localParity[supplierNum] == 1 and missingParity[supplierNum] == 1:
                 newData = True
                 reconstructedParity[supplierNum] = 1
-                # self.outstandingFilesList.append((parityFileName, self.BuildFileName(supplierNum, 'Parity'), supplierNum))
-                # self.paritySent[supplierNum] = 1
         # lg.out(14, 'block_rebuilder.AttemptRebuild END')
 
         if _Debug:
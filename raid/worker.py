@@ -1,9 +1,9 @@
-    #!/usr/bin/env python
-# rebuild.py
+#!/usr/bin/env python
+# worker.py
 #
 # Copyright (C) 2008 Stanislav Evseev, Veselin Penev  https://bitdust.io
 #
-# This file (rebuild.py) is part of BitDust Software.
+# This file (worker.py) is part of BitDust Software.
 #
 # BitDust is free software: you can redistribute it and/or modify
 # it under the terms of the GNU Affero General Public License as published by
@@ -20,10 +20,21 @@
 #
 # Please contact us if you have any questions at bitdust.io@gmail.com
 
+"""
+.. module:: worker.
+
+Process pool to run RAID tasks on multiple CPU cores, has same interface as
+``raid.raid_worker.ThreadedRaidProcessor``.
+
+Every running task gets a "slot" in two shared memory arrays: one holds amount
+of bytes processed so far and is read from the main process to report the
+progress, another one is a flag to cancel the task - it is checked inside
+``threshold_control()`` of the child process.
+"""
+
 #------------------------------------------------------------------------------
 
 from __future__ import absolute_import
-import six
 
 #------------------------------------------------------------------------------
 
@@ -33,13 +44,11 @@ _DebugLevel = 6
 #------------------------------------------------------------------------------
 
 import os
-import time
-import traceback
 import multiprocessing
 
 from collections import OrderedDict
 
-from threading import Thread, Lock
+from twisted.internet import reactor  # @UnresolvedImport
 
 #------------------------------------------------------------------------------
 
@@ -47,136 +56,143 @@ from logs import lg
 
 #------------------------------------------------------------------------------
 
-_WorkerQueue = multiprocessing.Queue()
-_WorkerLock = Lock()
+_ChildProgress = None
+_ChildCancelFlags = None
 
 #------------------------------------------------------------------------------
 
-class my_decorator_class(object):
-
-    def __init__(self, target):
-        self.target = target
-
-    def __call__(self, *args, **kwargs):
-        task_id = args[-1]
-        args = args[:-1]
-        res = None
-
-        try:
-            res = self.target(*args)
-        except Exception as e:
-            traceback.print_exc()
-            res = e
-        finally:
-            try:
-                _WorkerQueue.put(1)
-            except Exception:
-                print('worker got Exception in queue -- exiting')
-
-        return res
-
-
-def func_thread(tasks, pool):
-    while True:
-        try:
-            _WorkerQueue.get()
-        except (EOFError, OSError, IOError):
-            print('publisher got EOFError or OSError or IOError -- exiting')
-            break
-
-        with _WorkerLock:
-            try:
-                task = tasks.popitem(last=False)
-            except KeyError:
-                task = None
-
-        if task:
-            func, params, callback, error_callback, task_id = task[1]
-            if _Debug:
-                lg.out(_DebugLevel, 'raid.worker.func_thread is going to apply task %s' % task_id)
-            if six.PY3:
-                pool.apply_async(func=func, args=params + (task_id,), callback=callback, error_callback=error_callback)
-            else:
-                pool.apply_async(func=func, args=params + (task_id,), callback=callback)
-        else:
-            try:
-                _WorkerQueue.put(1)
-            except Exception:
-                print('publisher got Exception with queue -- exiting')
-                break
-
-            time.sleep(0.1)
-
-    pool.terminate()
-
-
-class Task(object):
-
-    def __init__(self, task_id):
-        self.task_id = task_id
-        if _Debug:
-            lg.out(_DebugLevel, 'raid.worker.Task created  task_id=%s' % task_id)
 
-    @property
-    def tid(self):
-        return self.task_id
+def _init_child(progress, cancel_flags):
+    """
+    Executed once in every child process of the pool.
+    """
+    global _ChildProgress
+    global _ChildCancelFlags
+    _ChildProgress = progress
+    _ChildCancelFlags = cancel_flags
 
 
-class Manager(object):
+def _run_child_task(slot, func, args):
+    """
+    Executed in the child process for every task.
+    """
+    def _threshold_control(more_bytes):
+        if _ChildCancelFlags[slot]:
+            return False
+        _ChildProgress[slot] += more_bytes
+        return True
 
-    def __init__(self, ncpus):
-        self._ncpus = ncpus
+    return func(*(tuple(args) + (_threshold_control, )))
+
+#------------------------------------------------------------------------------
+
+
+class ProcessRaidTaskInfo(object):
 
-        if six.PY34:
-            try:
-                multiprocessing.set_start_method('spawn')
-            except RuntimeError:
-                pass
+    def __init__(self, task_id, func, args, callback):
+        self.tid = task_id
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.slot = None
+        self.cancelled = False
+        self.bytes_processed = 0
 
-        multiprocessing.util.log_to_stderr(multiprocessing.util.SUBDEBUG)
 
+class ProcessRaidProcessor(object):
+
+    def __init__(self, ncpus):
+        self.ncpus = max(1, int(ncpus))
+        self.latest_task_id = 0
+        self.tasks = OrderedDict()
+        self.active_tasks = {}
+        self.free_slots = list(range(self.ncpus))
+        # "fork" is not safe with running reactor threads
+        ctx = multiprocessing.get_context('spawn')
         from system import bpio
         if bpio.Windows():
             from system import deploy
             deploy.init_base_dir()
             venv_python_path = os.path.join(deploy.current_base_dir(), 'venv', 'Scripts', 'BitDustNode.exe')
             lg.info('will use %s as multiprocessing executable' % venv_python_path)
-            multiprocessing.set_executable(venv_python_path)
-
-        self.processor = multiprocessing.Pool(ncpus)
-
-        #: implement queue per Manager instance
-        # self.queue = multiprocessing.Queue()
-
-        self.tasks = OrderedDict({})
-        self.task_id = 0
-
-        self.thread = Thread(target=func_thread, args=(self.tasks, self.processor))
-        self.thread.daemon = True
-        self.thread.start()
-
-        self._propagate_queue()
-
-    def _propagate_queue(self):
-        for i in range(self.ncpus):
-            _WorkerQueue.put(1)
-
-    def submit(self, func, params, callback, error_callback=None):
-        with _WorkerLock:
-            self.task_id += 1
-            self.tasks[self.task_id] = (my_decorator_class(target=func), params, callback, error_callback, self.task_id)
-        return Task(self.task_id)
-
-    @property
-    def ncpus(self):
-        return self._ncpus
-
-    def terminate(self):
-        self.processor.terminate()
+            ctx.set_executable(venv_python_path)
+        self.progress = ctx.Array('q', self.ncpus, lock=False)
+        self.cancel_flags = ctx.Array('b', self.ncpus, lock=False)
+        self.pool = ctx.Pool(
+            processes=self.ncpus,
+            initializer=_init_child,
+            initargs=(self.progress, self.cancel_flags, ),
+        )
+        if _Debug:
+            lg.args(_DebugLevel, ncpus=self.ncpus)
 
     def cancel(self, task_id):
-        with _WorkerLock:
-            try:
-                del self.tasks[task_id]
-            except KeyError:
-                pass
+        if task_id in self.tasks:
+            # task was submitted but not started yet, it will fail right after start
+            self.tasks[task_id].cancelled = True
+            return
+        if task_id not in self.active_tasks:
+            lg.warn('can not cancel task %r, task was not found' % task_id)
+            return
+        self.active_tasks[task_id].cancelled = True
+        self.cancel_flags[self.active_tasks[task_id].slot] = 1
+
+    def destroy(self):
+        for slot in range(self.ncpus):
+            self.cancel_flags[slot] = 1
+        self.pool.terminate()
+
+    def get_ncpus(self):
+        return self.ncpus
+
+    def get_progress(self, task_id):
+        """
+        Returns number of bytes processed so far by given task.
+        """
+        ts = self.active_tasks.get(task_id) or self.tasks.get(task_id)
+        if not ts:
+            return None
+        if ts.slot is not None:
+            ts.bytes_processed = self.progress[ts.slot]
+        return ts.bytes_processed
+
+    def on_done(self, task_id, result):
+        ts = self.active_tasks.pop(task_id, None)
+        if not ts:
+            return None
+        ts.bytes_processed = self.progress[ts.slot]
+        self.free_slots.append(ts.slot)
+        if _Debug:
+            lg.args(_DebugLevel, task_id=task_id, result=result, bytes_processed=ts.bytes_processed, active_tasks=list(self.active_tasks.keys()))
+        reactor.callLater(0, ts.callback, result)  # @UndefinedVariable
+        reactor.callLater(0, self.process)  # @UndefinedVariable
+        return None
+
+    def on_fail(self, task_id, err):
+        lg.err('task %r failed in child process: %r' % (task_id, err))
+        return self.on_done(task_id, None)
+
+    def process(self):
+        while self.tasks and self.free_slots:
+            _, ts = self.tasks.popitem(last=False)
+            ts.slot = self.free_slots.pop(0)
+            self.progress[ts.slot] = 0
+            self.cancel_flags[ts.slot] = 1 if ts.cancelled else 0
+            self.active_tasks[ts.tid] = ts
+            self.pool.apply_async(
+                _run_child_task,
+                args=(ts.slot, ts.func, ts.args, ),
+                callback=lambda result, task_id=ts.tid: reactor.callFromThread(self.on_done, task_id, result),  # @UndefinedVariable
+                error_callback=lambda err, task_id=ts.tid: reactor.callFromThread(self.on_fail, task_id, err),  # @UndefinedVariable
+            )
+
+    def submit(self, func, args=None, depfuncs=None, modules=None, callback=None):
+        task_id = self.latest_task_id + 1
+        if task_id in self.tasks:
+            raise Exception('another task already exists with task_id=%r' % task_id)
+        self.tasks[task_id] = ProcessRaidTaskInfo(task_id, func, tuple(args or ()), callback)
+        self.latest_task_id = task_id
+        if _Debug:
+            lg.args(_DebugLevel, task_id=task_id, func=func, total_tasks=len(self.tasks))
+        reactor.callLater(0, self.process)  # @UndefinedVariable
+        return self.tasks[task_id]
@@ -93,10 +93,16 @@ class EntangledDHTService(LocalService):
         conf().addConfigNotifier('services/entangled-dht/udp-port', self._on_udp_port_modified)
         known_seeds = known_nodes.nodes()
         dht_layers = list(dht_records.LAYERS_REGISTRY.keys())
+        vector_routing_layers = conf().getData('services/entangled-dht/vector-routing-layers', default='')
+        if vector_routing_layers:
+            vector_routing_layers = list(map(lambda v: int(str(v).strip()), filter(None, vector_routing_layers.split(','))))
+        else:
+            vector_routing_layers = []
         dht_service.init(
             udp_port=settings.getDHTPort(),
             dht_dir_path=settings.ServiceDir('service_entangled_dht'),
             open_layers=dht_layers,
+            routing_tables={layer_id: 'vector' for layer_id in vector_routing_layers},
         )
         lg.info('DHT known seed nodes are : %r   DHT layers are : %r' % (known_seeds, dht_layers, ))
         self.starting_deferred = Deferred()
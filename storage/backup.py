@@ -50,6 +50,16 @@ Main idea:
    7) call ``p2p.raidmake`` to split block and make "Parity" packets (pieces of block)
    8) notify the top level code about new pieces of data to send on suppliers
 
+Encryption and signing of the blocks is executed in a separate thread pool,
+so the main thread is not blocked. The process is pipelined: next block is read
+from the pipe while previous blocks are encrypted and RAID-ed.
+Number of blocks encrypted at same time is limited by the size of the pool,
+see ``services/backups/encryption-threads`` config option.
+
+Optionally every block is compressed in the same thread pool right before encryption,
+codec is stored inside ``encrypted.Block`` and restore decompresses it transparently.
+Blocks which look incompressible are not compressed, see ``lib.compression``.
+
 This state machine controls the data read from the folder,
 partition the data into blocks,
 block encryption using the private key and the transfer of units to the suppliers.
@@ -67,7 +77,6 @@ and all blocks will receive a delivery report.
 EVENTS:
     * :red:`block-encrypted`
     * :red:`block-raid-done`
-    * :red:`block-raid-started`
     * :red:`fail`
     * :red:`read-success`
     * :red:`start`
@@ -91,13 +100,16 @@ import os
 import sys
 import time
 import gc
+import threading
 
 try:
     from twisted.internet import reactor  # @UnresolvedImport
 except:
     sys.exit('Error initializing twisted.internet.reactor in backup.py')
 
-from twisted.internet.defer import maybeDeferred, Deferred, succeed
+from twisted.internet import threads
+from twisted.internet.defer import Deferred, succeed
+from twisted.python.threadpool import ThreadPool
 
 #------------------------------------------------------------------------------
 
@@ -111,6 +123,7 @@ from logs import lg
 
 from lib import packetid
 from lib import strng
+from lib import compression
 
 from userid import my_id
 from userid import global_id
@@ -118,6 +131,7 @@ from userid import global_id
 from system import nonblocking
 from system import tmpfile
 
+from main import config
 from main import settings
 from main import events
 
@@ -129,7 +143,46 @@ from raid import raid_worker
 from crypt import encrypted
 from crypt import key
 
-#-------------------------------------------------------------------------------
+#------------------------------------------------------------------------------
+
+_EncryptionPool = None
+
+#------------------------------------------------------------------------------
+
+
+def encryption_pool():
+    """
+    Returns thread pool to encrypt and sign backup blocks, it is started on first call.
+    """
+    global _EncryptionPool
+    if _EncryptionPool is None:
+        threads_count = 2
+        if config.conf():
+            threads_count = max(1, config.conf().getInt('services/backups/encryption-threads', 2))
+        _EncryptionPool = ThreadPool(minthreads=0, maxthreads=threads_count, name='backup_encryption')
+        # do not block the process exit if reactor was not stopped properly
+        _EncryptionPool.threadFactory = _daemon_thread
+        _EncryptionPool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', shutdown_encryption_pool)  # @UndefinedVariable
+        if _Debug:
+            lg.args(_DebugLevel, threads_count=threads_count)
+    return _EncryptionPool
+
+
+def _daemon_thread(*args, **kwargs):
+    t = threading.Thread(*args, **kwargs)
+    t.daemon = True
+    return t
+
+
+def shutdown_encryption_pool():
+    global _EncryptionPool
+    if _EncryptionPool is None:
+        return
+    _EncryptionPool.stop()
+    _EncryptionPool = None
+
+#------------------------------------------------------------------------------
 
 
 class backup(automat.Automat):
@@ -138,7 +191,7 @@ class backup(automat.Automat):
     """
 
     timers = {
-        'timer-01sec': (0.1, ['RAID']),
+        'timer-01sec': (0.1, ['ENCRYPT', 'RAID']),
         'timer-001sec': (0.01, ['READ']),
     }
 
@@ -152,7 +205,9 @@ class backup(automat.Automat):
                  sourcePath=None,
                  keyID=None,
                  ecc_map=None,
-                 creatorIDURL=None,):
+                 creatorIDURL=None,
+                 compression=None,
+                 compression_level=None,):
         self.backupID = backupID
         self.creatorIDURL = creatorIDURL or my_id.getIDURL()
         _parts = packetid.SplitBackupID(self.backupID)
@@ -167,6 +222,8 @@ class backup(automat.Automat):
         self.blockSize = blockSize
         if self.blockSize is None:
             self.blockSize = settings.getBackupBlockSize()
+        self.compression = compression or 'none'
+        self.compressionLevel = compression_level
         self.ask4abort = False
         self.terminating = False
         self.stateEOF = False
@@ -175,6 +232,7 @@ class backup(automat.Automat):
         self.currentBlockData = BytesIO()
         self.currentBlockSize = 0
         self.workBlocks = {}
+        self.encryptingBlocks = set()
         self.blockNumber = 0
         self.dataSent = 0
         self.blocksSent = 0
@@ -200,16 +258,38 @@ class backup(automat.Automat):
                 self.doFirstBlock(*args, **kwargs)
         #---READ---
         elif self.state == 'READ':
-            if event == 'read-success' and not self.isReadingNow(*args, **kwargs) and ( self.isBlockReady(*args, **kwargs) or self.isEOF(*args, **kwargs) ):
+            if event == 'fail' or ( ( event == 'read-success' or event == 'timer-001sec' ) and self.isAborted(*args, **kwargs) ):
+                self.state = 'ABORTED'
+                self.doClose(*args, **kwargs)
+                self.doReport(*args, **kwargs)
+                self.doDestroyMe(*args, **kwargs)
+            elif ( event == 'read-success' or event == 'timer-001sec' ) and not self.isReadingNow(*args, **kwargs) and self.isEOF(*args, **kwargs) and not self.isEncryptionQueueFull(*args, **kwargs):
                 self.state = 'ENCRYPT'
                 self.doEncryptBlock(*args, **kwargs)
-            elif event == 'fail' or ( ( event == 'read-success' or event == 'timer-001sec' ) and self.isAborted(*args, **kwargs) ):
+            elif ( event == 'read-success' or event == 'timer-001sec' ) and not self.isReadingNow(*args, **kwargs) and not self.isEOF(*args, **kwargs) and self.isBlockReady(*args, **kwargs) and not self.isEncryptionQueueFull(*args, **kwargs):
+                self.doEncryptBlock(*args, **kwargs)
+                self.doNextBlock(*args, **kwargs)
+                self.doRead(*args, **kwargs)
+            elif ( event == 'read-success' or event == 'timer-001sec' ) and self.isPipeReady(*args, **kwargs) and not self.isEOF(*args, **kwargs) and not self.isReadingNow(*args, **kwargs) and not self.isBlockReady(*args, **kwargs):
+                self.doRead(*args, **kwargs)
+            elif event == 'block-encrypted':
+                self.doBlockPushAndRaid(*args, **kwargs)
+            elif event == 'block-raid-done' and not self.isAborted(*args, **kwargs):
+                self.doPopBlock(*args, **kwargs)
+                self.doBlockReport(*args, **kwargs)
+                self.doNotifyNewData(*args, **kwargs)
+        #---ENCRYPT---
+        elif self.state == 'ENCRYPT':
+            if event == 'block-encrypted' and not self.isEncryptingNow(*args, **kwargs):
+                self.state = 'RAID'
+                self.doBlockPushAndRaid(*args, **kwargs)
+            elif event == 'block-encrypted' and self.isEncryptingNow(*args, **kwargs):
+                self.doBlockPushAndRaid(*args, **kwargs)
+            elif event == 'fail' or ( event == 'timer-01sec' and self.isAborted(*args, **kwargs) ):
                 self.state = 'ABORTED'
                 self.doClose(*args, **kwargs)
                 self.doReport(*args, **kwargs)
                 self.doDestroyMe(*args, **kwargs)
-            elif ( event == 'read-success' or event == 'timer-001sec' ) and not self.isAborted(*args, **kwargs) and self.isPipeReady(*args, **kwargs) and not self.isEOF(*args, **kwargs) and not self.isReadingNow(*args, **kwargs) and not self.isBlockReady(*args, **kwargs):
-                self.doRead(*args, **kwargs)
             elif event == 'block-raid-done' and not self.isAborted(*args, **kwargs):
                 self.doPopBlock(*args, **kwargs)
                 self.doBlockReport(*args, **kwargs)
@@ -224,33 +304,15 @@ class backup(automat.Automat):
                 self.doClose(*args, **kwargs)
                 self.doReport(*args, **kwargs)
                 self.doDestroyMe(*args, **kwargs)
-            elif event == 'block-raid-started' and not self.isEOF(*args, **kwargs) and not self.isAborted(*args, **kwargs):
-                self.state = 'READ'
-                self.doNextBlock(*args, **kwargs)
-                self.doRead(*args, **kwargs)
             elif event == 'block-raid-done' and self.isMoreBlocks(*args, **kwargs) and not self.isAborted(*args, **kwargs):
                 self.doPopBlock(*args, **kwargs)
                 self.doBlockReport(*args, **kwargs)
                 self.doNotifyNewData(*args, **kwargs)
-            elif event == 'fail' or ( ( event == 'timer-01sec' or event == 'block-raid-done' or event == 'block-raid-started' ) and self.isAborted(*args, **kwargs) ):
+            elif event == 'fail' or ( ( event == 'timer-01sec' or event == 'block-raid-done' ) and self.isAborted(*args, **kwargs) ):
                 self.state = 'ABORTED'
                 self.doClose(*args, **kwargs)
                 self.doReport(*args, **kwargs)
                 self.doDestroyMe(*args, **kwargs)
-        #---ENCRYPT---
-        elif self.state == 'ENCRYPT':
-            if event == 'block-encrypted':
-                self.state = 'RAID'
-                self.doBlockPushAndRaid(*args, **kwargs)
-            elif event == 'fail':
-                self.state = 'ABORTED'
-                self.doClose(*args, **kwargs)
-                self.doReport(*args, **kwargs)
-                self.doDestroyMe(*args, **kwargs)
-            elif event == 'block-raid-done' and not self.isAborted(*args, **kwargs):
-                self.doPopBlock(*args, **kwargs)
-                self.doBlockReport(*args, **kwargs)
-                self.doNotifyNewData(*args, **kwargs)
         #---DONE---
         elif self.state == 'DONE':
             pass
@@ -302,6 +364,18 @@ class backup(automat.Automat):
             lg.args(_DebugLevel, workBlocks=len(self.workBlocks))
         return len(self.workBlocks) > 1
 
+    def isEncryptingNow(self, *args, **kwargs):
+        """
+        Condition method.
+        """
+        return len(self.encryptingBlocks) > 0
+
+    def isEncryptionQueueFull(self, *args, **kwargs):
+        """
+        Condition method.
+        """
+        return len(self.encryptingBlocks) >= encryption_pool().max
+
     def doInit(self, *args, **kwargs):
         """
         Action method.
@@ -366,62 +440,93 @@ class backup(automat.Automat):
         """
         Action method.
         """
-        def _doBlock():
+        blockNumber = self.blockNumber
+        lastBlock = self.stateEOF
+        creatorIDURL = self.creatorIDURL
+        backupID = self.backupID
+        keyID = self.keyID
+        codec = self.compression
+        level = self.compressionLevel or compression.DEFAULT_LEVEL
+        raw_bytes = self.currentBlockData.getvalue()
+        # release the buffer right away, only raw bytes are needed from now
+        self.currentBlockData.close()
+        self.currentBlockData = BytesIO()
+        session_key_type = key.SessionKeyType()
+        fileno, filename = tmpfile.make('raid', extension='.raid')
+
+        def _doBlock(raw_bytes):
+            # executed in the encryption thread pool
             dt = time.time()
-            raw_bytes = self.currentBlockData.getvalue()
-            block = encrypted.Block(
-                CreatorID=self.creatorIDURL,
-                BackupID=self.backupID,
-                BlockNumber=self.blockNumber,
-                SessionKey=key.NewSessionKey(session_key_type=key.SessionKeyType()),
-                SessionKeyType=key.SessionKeyType(),
-                LastBlock=self.stateEOF,
-                Data=raw_bytes,
-                EncryptKey=self.keyID,
-            )
-            del raw_bytes
+            raw_size = len(raw_bytes)
+            used_codec, raw_bytes = compression.compress(raw_bytes, codec, level)
+            with os.fdopen(fileno, 'wb') as f:
+                block = encrypted.Block(
+                    CreatorID=creatorIDURL,
+                    BackupID=backupID,
+                    BlockNumber=blockNumber,
+                    SessionKey=key.NewSessionKey(session_key_type=session_key_type),
+                    SessionKeyType=session_key_type,
+                    LastBlock=lastBlock,
+                    Data=raw_bytes,
+                    EncryptKey=keyID,
+                    Compression=used_codec,
+                )
+                serializedblock = block.Serialize()
+                del block
+                # write header and block separately to not make one more copy of the whole block in memory
+                f.write(strng.to_bin(len(serializedblock)) + b":")
+                f.write(serializedblock)
+                del serializedblock
             if _Debug:
-                lg.out(_DebugLevel, 'backup.doEncryptBlock blockNumber=%d size=%d atEOF=%s dt=%s EncryptKey=%s' % (
-                    self.blockNumber, self.currentBlockSize, self.stateEOF, str(time.time() - dt), self.keyID))
-            return block
+                lg.out(_DebugLevel, 'backup.doEncryptBlock blockNumber=%d size=%d/%d %s atEOF=%s dt=%s EncryptKey=%s' % (
+                    blockNumber, len(raw_bytes), raw_size, used_codec, lastBlock, str(time.time() - dt), keyID))
+            return blockNumber, filename
+
+        def _blockEncrypted(result):
+            if self.encryptingBlocks is None:
+                # backup was already closed
+                tmpfile.throw_out(filename, 'backup closed')
+                return None
+            self.encryptingBlocks.discard(blockNumber)
+            self.automat('block-encrypted', result)
+            return None
+
+        def _blockFailed(err):
+            tmpfile.throw_out(filename, 'block encryption failed')
+            if self.encryptingBlocks is None:
+                return None
+            lg.err('failed to encrypt block %d: %r' % (blockNumber, err))
+            self.encryptingBlocks.discard(blockNumber)
+            self.abort()
+            self.automat('fail', err)
+            return None
 
-        d = maybeDeferred(_doBlock)
-        d.addCallback(lambda block: self.automat('block-encrypted', block))
-        d.addErrback(lambda err: self.automat('fail', err))
+        self.encryptingBlocks.add(blockNumber)
+        d = threads.deferToThreadPool(reactor, encryption_pool(), _doBlock, raw_bytes)
+        d.addCallback(_blockEncrypted)
+        d.addErrback(_blockFailed)
+        del raw_bytes
 
     def doBlockPushAndRaid(self, *args, **kwargs):
         """
         Action method.
         """
-        newblock = args[0]
-        if newblock is None:
-            self.abort()
-            self.automat('fail')
-            if _Debug:
-                lg.out(_DebugLevel, 'backup.doBlockPushAndRaid ERROR newblock is empty, terminating=%s' % self.terminating)
-            lg.warn('failed to encrypt block, ABORTING')
-            return
+        blockNumber, filename = args[0]
         if self.terminating:
-            self.automat('block-raid-done', (newblock.BlockNumber, None))
+            tmpfile.throw_out(filename, 'backup aborted')
+            self.automat('block-raid-done', (blockNumber, None))
             if _Debug:
                 lg.out(_DebugLevel, 'backup.doBlockPushAndRaid SKIP, terminating=True')
             return
-        fileno, filename = tmpfile.make('raid', extension='.raid')
-        serializedblock = newblock.Serialize()
-        blocklen = len(serializedblock)
-        os.write(fileno, strng.to_bin(blocklen) + b":" + serializedblock)
-        os.close(fileno)
-        self.workBlocks[newblock.BlockNumber] = filename
+        self.workBlocks[blockNumber] = filename
         dt = time.time()
         outputpath = os.path.join(
             settings.getLocalBackupsDir(), self.customerGlobalID, self.pathID, self.version)
-        task_params = (filename, self.eccmap.name, self.version, newblock.BlockNumber, outputpath)
+        task_params = (filename, self.eccmap.name, self.version, blockNumber, outputpath)
         raid_worker.add_task('make', task_params, lambda cmd, params, result: self._raidmakeCallback(params, result, dt))
-        self.automat('block-raid-started', newblock)
-        del serializedblock
         if _Debug:
             lg.out(_DebugLevel, 'backup.doBlockPushAndRaid %s : start process data from %s to %s, %d' % (
-                newblock.BlockNumber, filename, outputpath, id(self.terminating)))
+                blockNumber, filename, outputpath, id(self.terminating)))
 
     def doPopBlock(self, *args, **kwargs):
         """
@@ -503,6 +608,7 @@ class backup(automat.Automat):
         self.stateReading = False
         self.closed = False
         self.workBlocks = None
+        self.encryptingBlocks = None
         self.resultDefer = None
         self.finishCallback = None
         self.blockResultCallback = None
@@ -535,6 +641,17 @@ class backup(automat.Automat):
         percent = min(100.0, 100.0 * self.dataSent / self.totalSize)
         return percent
 
+    def raidProgress(self):
+        """
+        Returns number of bytes already processed by RAID tasks of blocks which are currently being encoded.
+        """
+        if not self.workBlocks:
+            return 0
+        processed = 0
+        for filename in self.workBlocks.values():
+            processed += raid_worker.get_task_progress('make', filename) or 0
+        return processed
+
     def _raidmakeCallback(self, params, result, dt):
         _, _, _, blockNumber, _ = params
         if result is None:
@@ -608,13 +608,14 @@ class Task():
         if bpio.Android():
             compress_mode = 'none'
         else:
-            compress_mode = 'bz2'  # 'none' # 'gz'
+            # blocks are compressed in parallel by the backup() itself, tar stream is not compressed
+            compress_mode = settings.getBackupCompression()
         arcname = os.path.basename(sourcePath)
         from storage import backup_tar
         if bpio.pathIsDir(self.localPath):
-            backupPipe = backup_tar.backuptardir_thread(self.localPath, arcname=arcname, compress=compress_mode)
+            backupPipe = backup_tar.backuptardir_thread(self.localPath, arcname=arcname, compress='none')
         else:
-            backupPipe = backup_tar.backuptarfile_thread(self.localPath, arcname=arcname, compress=compress_mode)
+            backupPipe = backup_tar.backuptarfile_thread(self.localPath, arcname=arcname, compress='none')
         job = backup.backup(
             self.backupID,
             backupPipe,
@@ -624,6 +625,8 @@ class Task():
             blockSize=settings.getBackupBlockSize(),
             sourcePath=self.localPath,
             keyID=self.keyID or itemInfo.key_id,
+            compression=compress_mode,
+            compression_level=settings.getBackupCompressionLevel(),
         )
         jobs()[self.backupID] = job
         itemInfo.add_version(dataID)
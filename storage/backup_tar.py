@@ -43,7 +43,10 @@ _DebugLevel = 10
 
 import os
 import sys
+import threading
+
 from io import open
+from collections import deque
 
 #------------------------------------------------------------------------------
 
@@ -70,77 +73,138 @@ BYTES_LOOP_EMPTY = 0
 BYTES_LOOP_READY2READ = 1
 BYTES_LOOP_CLOSED = 2
 
+# Producer thread is blocked when that many bytes are waiting to be read.
+DEFAULT_MAX_BUFFER_SIZE = 8 * 1024 * 1024
+
 #------------------------------------------------------------------------------
 
 class BytesLoop:
+    """
+    A pipe between a thread which produces data, for example ``tar_file.writetar()``,
+    and a reader in the main thread.
+
+    Written chunks are kept in a queue as they are, a partially read chunk is replaced
+    with a ``memoryview`` of its remaining part, so no bytes are copied when buffer grows or shrinks.
+    When more than ``max_buffer_size`` bytes are waiting to be read the ``write()`` call
+    blocks the producer thread until reader drains the buffer.
+    """
 
-    def __init__(self, s=b''):
-        self._buffer = s
+    def __init__(self, s=b'', max_buffer_size=DEFAULT_MAX_BUFFER_SIZE):
+        self._chunks = deque()
+        self._size = 0
+        self._max_size = max_buffer_size
+        self._lock = threading.Condition()
+        self._wake_pending = False
         self._reader = None
         self._last_read = -1
         self._finished = False
         self._closed = False
+        if s:
+            self._chunks.append(s)
+            self._size = len(s)
 
     def read_defer(self, n=-1):
         if self._reader:
             raise Exception('already reading')
         self._reader = (Deferred(), n, )
-        if len(self._buffer) > 0:
+        if self._size > 0:
             chunk = self.read(n=n)
             d = self._reader[0]
-            self._reader = None 
+            self._reader = None
             d.callback(chunk)
             return d
         if self._finished:
             chunk = b''
             d = self._reader[0]
-            self._reader = None 
+            self._reader = None
             d.callback(chunk)
             return d
         return self._reader[0]
 
     def read(self, n=-1):
-        before_bytes = len(self._buffer)
-        chunk = self._buffer[:n]
-        self._buffer = self._buffer[n:]
-        after_bytes = len(self._buffer)
+        with self._lock:
+            before_bytes = self._size
+            if n is None or n < 0 or n >= self._size:
+                n = self._size
+            pieces = []
+            left = n
+            while left > 0:
+                piece = self._chunks[0]
+                if len(piece) <= left:
+                    self._chunks.popleft()
+                    left -= len(piece)
+                else:
+                    piece = memoryview(piece)
+                    self._chunks[0] = piece[left:]
+                    piece = piece[:left]
+                    left = 0
+                pieces.append(piece)
+            self._size -= n
+            self._lock.notify_all()
+        if len(pieces) == 1 and isinstance(pieces[0], bytes):
+            chunk = pieces[0]
+        else:
+            chunk = b''.join(pieces)
         self._last_read = len(chunk)
         if _Debug:
-            lg.args(_DebugLevel, before_bytes=before_bytes, after_bytes=after_bytes, chunk_bytes=len(chunk))
+            lg.args(_DebugLevel, before_bytes=before_bytes, after_bytes=self._size, chunk_bytes=len(chunk))
         return chunk
 
     def write(self, chunk):
-        reactor.callFromThread(self._write, chunk)  # @UndefinedVariable
-
-    def _write(self, chunk):
-        self._buffer += chunk
+        """
+        Called from the producer thread, blocks while buffer is full.
+        Raises ``IOError`` if the pipe was closed by reader.
+        """
+        if not chunk:
+            return
+        with self._lock:
+            while self._size >= self._max_size and not self._closed:
+                self._lock.wait()
+            if self._closed:
+                raise IOError('pipe is closed')
+            self._chunks.append(bytes(chunk))
+            self._size += len(chunk)
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        reactor.callFromThread(self._wake_reader)  # @UndefinedVariable
+
+    def _wake_reader(self):
+        with self._lock:
+            self._wake_pending = False
         if _Debug:
-            lg.args(_DebugLevel, buffer_bytes=len(self._buffer), chunk_bytes=len(chunk))
-        if len(self._buffer) > 0:
-            if self._reader:
-                chunk = self.read(n=self._reader[1])
-                d = self._reader[0]
-                self._reader = None
-                d.callback(chunk)
+            lg.args(_DebugLevel, buffer_bytes=self._size, finished=self._finished)
+        if not self._reader:
+            return
+        if self._size == 0 and not self._finished:
+            return
+        chunk = self.read(n=self._reader[1])
+        d = self._reader[0]
+        self._reader = None
+        d.callback(chunk)
 
     def close(self):
         if self._reader:
             d = self._reader[0]
             self._reader = None
             d.callback(b'')
-        self._closed = True
-        self._buffer = b''
+        with self._lock:
+            self._closed = True
+            self._chunks.clear()
+            self._size = 0
+            self._lock.notify_all()
 
     def kill(self):
         self.close()
 
     def mark_finished(self):
         self._finished = True
+        reactor.callFromThread(self._wake_reader)  # @UndefinedVariable
 
     def state(self):
         if self._closed:
             return BYTES_LOOP_CLOSED
-        if len(self._buffer) > 0:
+        if self._size > 0:
             if self._reader:
                 return BYTES_LOOP_EMPTY
             return BYTES_LOOP_READY2READ
@@ -154,7 +218,7 @@ class BytesLoop:
 
 #------------------------------------------------------------------------------
 
-def backuptarfile_thread(filepath, arcname=None, compress=None):
+def backuptarfile_thread(filepath, arcname=None, compress=None, max_buffer_size=DEFAULT_MAX_BUFFER_SIZE):
     """
     Makes tar archive of a folder inside a thread.
     Returns `BytesLoop` object instance which can be used to read produced data in parallel.
@@ -164,18 +228,23 @@ def backuptarfile_thread(filepath, arcname=None, compress=None):
         return None
     if arcname is None:
         arcname = os.path.basename(filepath)
-    p = BytesLoop()
+    p = BytesLoop(max_buffer_size=max_buffer_size)
 
     def _run():
         from storage import tar_file
-        ret = tar_file.writetar(
-            sourcepath=filepath,
-            arcname=arcname,
-            subdirs=False,
-            compression=compress or 'none',
-            encoding='utf-8',
-            fileobj=p,
-        )
+        try:
+            ret = tar_file.writetar(
+                sourcepath=filepath,
+                arcname=arcname,
+                subdirs=False,
+                compression=compress or 'none',
+                encoding='utf-8',
+                fileobj=p,
+            )
+        except:
+            if p.state() != BYTES_LOOP_CLOSED:
+                lg.exc()
+            ret = False
         p.mark_finished()
         if _Debug:
             lg.out(_DebugLevel, 'backup_tar.backuptarfile_thread writetar() finished')
@@ -185,7 +254,7 @@ def backuptarfile_thread(filepath, arcname=None, compress=None):
     return p
 
 
-def backuptardir_thread(directorypath, arcname=None, recursive_subfolders=True, compress=None):
+def backuptardir_thread(directorypath, arcname=None, recursive_subfolders=True, compress=None, max_buffer_size=DEFAULT_MAX_BUFFER_SIZE):
     """
     Makes tar archive of a single file inside a thread.
     Returns `BytesLoop` object instance which can be used to read produced data in parallel.
@@ -195,18 +264,23 @@ def backuptardir_thread(directorypath, arcname=None, recursive_subfolders=True,
         return None
     if arcname is None:
         arcname = os.path.basename(directorypath)
-    p = BytesLoop()
+    p = BytesLoop(max_buffer_size=max_buffer_size)
 
     def _run():
         from storage import tar_file
-        ret = tar_file.writetar(
-            sourcepath=directorypath,
-            arcname=arcname,
-            subdirs=recursive_subfolders,
-            compression=compress or 'none',
-            encoding='utf-8',
-            fileobj=p,
-        )
+        try:
+            ret = tar_file.writetar(
+                sourcepath=directorypath,
+                arcname=arcname,
+                subdirs=recursive_subfolders,
+                compression=compress or 'none',
+                encoding='utf-8',
+                fileobj=p,
+            )
+        except:
+            if p.state() != BYTES_LOOP_CLOSED:
+                lg.exc()
+            ret = False
         p.mark_finished()
         if _Debug:
             lg.out(_DebugLevel, 'backup_tar.backuptardir_thread writetar() finished')
@@ -42,17 +42,26 @@ EVENTS:
     * :red:`timer-5sec`
 
 
-At least for now we will work one block at a time, though packets in parallel.
+The state machine works on one "current" block at a time, though packets in parallel.
 We ask transport_control for all the data packets for a block then see if we
 get them all or need to ask for some parity packets.  We do this till we have
-gotten a block with the "LastBlock" flag set.  If we have tried several times
+gotten a block with the "LastBlock" flag set.
+
+To not wait a full round trip for every block, requests for pieces of the next few blocks
+are sent ahead via ``io_throttle`` while current block is processed, see ``services/restores/prefetch-blocks``.
+Received pieces are stored locally and ``raid_worker`` starts decoding a prefetched block as soon
+as enough pieces are here, so several blocks are decoded in parallel.
+When the block become current it is already on hand and only written to the output file,
+blocks are always written in order. Disk usage is limited by the prefetch window.  If we have tried several times
 and not gotten data packets from a supplier we can flag him as suspect-bad
 and start requesting a parity packet to cover him right away.
 
-When we are missing a data packet we pick a parity packet where we have all the
-other data packets for that parity so we can recover the missing data packet.
-This network cost for this is just as low as if we read the data packet.
-But most of the time we won't bother reading the parities.  Just uses up bandwidth.
+For the current block we request only as many pieces as needed to rebuild it, Data or Parity.
+Pieces are picked one by one from the supplier expected to deliver first, see ``io_throttle.EstimateRequestTime()``,
+until ``eccmap.Fixable()`` says the block can be decoded.  While suppliers are equally fast only Data pieces are requested.
+When a piece takes longer than 90th percentile of recent downloads from that supplier
+one more piece is requested from others to cover it, and as soon as the block is decodable
+all requests which are still in progress are cancelled.  So a single slow supplier does not hold up the restore.
 
 We don't want to fire someone till
 after we have finished a restore in case we have other problems and they might come
@@ -133,6 +142,12 @@ from userid import my_id
 
 #------------------------------------------------------------------------------
 
+# request which takes longer than that percentile of recent downloads from the supplier is covered by another piece
+HEDGE_PERCENTILE = 0.9
+HEDGE_MIN_DELAY = 1.0
+
+#------------------------------------------------------------------------------
+
 class RestoreWorker(automat.Automat):
     """
     This class implements all the functionality of ``restore_worker()`` state machine.
@@ -147,6 +162,7 @@ class RestoreWorker(automat.Automat):
                  OutputFile,
                  KeyID=None,
                  ecc_map=None,
+                 prefetch_blocks=None,
                  debug_level=_DebugLevel,
                  log_events=False,
                  log_transitions=_Debug,
@@ -178,12 +194,22 @@ class RestoreWorker(automat.Automat):
         self.LastAction = time.time()
         self.RequestFails = []
         self.block_requests = {}
+        # packetID -> time when request is considered lagging and will be hedged
+        self.request_deadlines = {}
+        self.hedge_task = None
         self.AlreadyRequestedCounts = {}
         # For anyone who wants to know when we finish
         self.MyDeferred = Deferred()
         self.packetInCallback = None
         self.blockRestoredCallback = None
         self.Attempts = 0
+        self.prefetch_blocks = settings.getRestorePrefetchBlocks() if prefetch_blocks is None else prefetch_blocks
+        # requests for the next blocks sent ahead: packetID -> block number
+        self.prefetch_requests = {}
+        # pieces which suppliers failed to deliver while prefetching, they are not requested again
+        self.prefetch_failed = set()
+        # block number -> dict(filename, done, result, waiting), filename is set when raid_worker started decoding
+        self.prefetched_blocks = {}
 
         super(RestoreWorker, self).__init__(
             name='restore_worker_%s' % self.version,
@@ -407,6 +433,7 @@ class RestoreWorker(automat.Automat):
         self.OnHandParity = [False, ] * self.EccMap.paritysegments
         self.RequestFails = []
         self.block_requests = {}
+        self.request_deadlines = {}
         self.AlreadyRequestedCounts = {}
 
     def doPingOfflineSuppliers(self, *args, **kwargs):
@@ -469,6 +496,7 @@ class RestoreWorker(automat.Automat):
         Action method.
         """
         self._do_check_run_requests()
+        self._do_prefetch_next_blocks()
 
     def doSavePacket(self, *args, **kwargs):
         """
@@ -477,7 +505,6 @@ class RestoreWorker(automat.Automat):
         if not args or not args[0]:
             raise Exception('no input found')
         NewPacket, PacketID = args[0]
-        glob_path = global_id.NormalizeGlobalID(PacketID, detect_version=True)
         packetID = global_id.CanonicalID(PacketID)
         customer_id, _, _, _, SupplierNumber, dataORparity = packetid.SplitFull(packetID)
         if dataORparity == 'Data':
@@ -487,35 +514,25 @@ class RestoreWorker(automat.Automat):
         if not NewPacket:
             lg.warn('packet %r already exists locally' % packetID)
             return
-        filename = os.path.join(settings.getLocalBackupsDir(), customer_id, glob_path['path'])
-        dirpath = os.path.dirname(filename)
-        if not os.path.exists(dirpath):
-            try:
-                bpio._dirs_make(dirpath)
-            except:
-                lg.exc()
-        # either way the payload of packet is saved
-        if not bpio.WriteBinaryFile(filename, NewPacket.Payload):
-            lg.err("unable to write to %s" % filename)
-            return
-        if self.packetInCallback is not None:
-            self.packetInCallback(self.backup_id, NewPacket)
-        if _Debug:
-            lg.out(_DebugLevel, "restore_worker.doSavePacket %s saved to %s" % (packetID, filename))
+        self._do_save_packet(NewPacket, PacketID)
 
     def doReadRaid(self, *args, **kwargs):
         """
         Action method.
         """
-        _, outfilename = tmpfile.make(
-            'restore',
-            extension='.raid',
-            prefix=self.backup_id.replace(':', '_').replace('@', '_').replace('/', '_') + '_' + str(self.block_number) + '_',
-            close_fd=True,
-        )
-        inputpath = os.path.join(settings.getLocalBackupsDir(), self.customer_id, self.path_id)
-        task_params = (outfilename, self.EccMap.name, self.version, self.block_number, inputpath)
-        raid_worker.add_task('read', task_params, lambda cmd, params, result: self._on_block_restored(result, outfilename))
+        self._do_cancel_redundant_requests()
+        info = self.prefetched_blocks.pop(self.block_number, None)
+        if info and info['filename']:
+            if not info['done']:
+                # raid_worker is still decoding that block, wait for the result
+                info['waiting'] = True
+                self.prefetched_blocks[self.block_number] = info
+                return
+            if info['result'] is not None:
+                reactor.callLater(0, self._on_block_restored, info['result'], info['filename'])  # @UndefinedVariable
+                return
+            tmpfile.throw_out(info['filename'], 'prefetched block failed')
+        self._do_start_raid_read(self.block_number, self._on_block_restored)
 
     def doRemoveTempFile(self, *args, **kwargs):
         """
@@ -614,6 +631,9 @@ class RestoreWorker(automat.Automat):
         Remove all references to the state machine object to destroy it.
         """
         self._do_unblock_rebuilding()
+        if self.hedge_task and self.hedge_task.active():
+            self.hedge_task.cancel()
+        self.hedge_task = None
         if data_receiver.A():
             data_receiver.A().removeStateChangedCallback(self._on_data_receiver_state_changed)
         self.OnHandData = None
@@ -623,6 +643,13 @@ class RestoreWorker(automat.Automat):
         self.RequestFails = []
         self.AlreadyRequestedCounts = None
         self.block_requests = None
+        self.request_deadlines = None
+        for info in self.prefetched_blocks.values():
+            if info['done'] and info['filename']:
+                tmpfile.throw_out(info['filename'], 'restore finished')
+        self.prefetched_blocks = None
+        self.prefetch_requests = None
+        self.prefetch_failed = None
         self.MyDeferred = None
         self.output_stream = None
         self.destroy()
@@ -636,52 +663,82 @@ class RestoreWorker(automat.Automat):
         from storage import backup_rebuilder
         backup_rebuilder.UnBlockBackup(self.backup_id)
 
-    def _do_check_run_requests(self):
+    def _do_save_packet(self, NewPacket, PacketID):
+        glob_path = global_id.NormalizeGlobalID(PacketID, detect_version=True)
+        packetID = global_id.CanonicalID(PacketID)
+        customer_id = packetid.SplitFull(packetID)[0]
+        filename = os.path.join(settings.getLocalBackupsDir(), customer_id, glob_path['path'])
+        dirpath = os.path.dirname(filename)
+        if not os.path.exists(dirpath):
+            try:
+                bpio._dirs_make(dirpath)
+            except:
+                lg.exc()
+        # either way the payload of packet is saved
+        if not bpio.WriteBinaryFile(filename, NewPacket.Payload):
+            lg.err("unable to write to %s" % filename)
+            return
+        if self.packetInCallback is not None:
+            self.packetInCallback(self.backup_id, NewPacket)
+        if _Debug:
+            lg.out(_DebugLevel, "restore_worker.doSavePacket %s saved to %s" % (packetID, filename))
+
+    def _do_start_raid_read(self, block_number, callback):
+        _, outfilename = tmpfile.make(
+            'restore',
+            extension='.raid',
+            prefix=self.backup_id.replace(':', '_').replace('@', '_').replace('/', '_') + '_' + str(block_number) + '_',
+            close_fd=True,
+        )
+        inputpath = os.path.join(settings.getLocalBackupsDir(), self.customer_id, self.path_id)
+        task_params = (outfilename, self.EccMap.name, self.version, block_number, inputpath)
+        raid_worker.add_task('read', task_params, lambda cmd, params, result: callback(result, outfilename))
+        return outfilename
+
+    def _do_check_run_requests(self, lagging=None):
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker._do_check_run_requests for %s at block %d' % (self.backup_id, self.block_number, ))
-        packetsToRequest = []
-        for SupplierNumber in range(self.EccMap.datasegments):
-            request_packet_id = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Data')
-            if self.OnHandData[SupplierNumber]:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, OnHandData is True for supplier %d' % SupplierNumber)
-                if request_packet_id not in self.block_requests:
-                    self.block_requests[request_packet_id] = True
-                continue
-            if request_packet_id in self.block_requests:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, request for packet %r already sent to IO queue for supplier %d' % (request_packet_id, SupplierNumber, ))
-                continue
-            SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
-            if not SupplierID:
-                lg.warn('unknown supplier at position %s' % SupplierNumber)
-                continue
-            if online_status.isOffline(SupplierID):
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, offline supplier: %s' % SupplierID)
-                continue
-            packetsToRequest.append((SupplierID, request_packet_id, ))
-        for SupplierNumber in range(self.EccMap.paritysegments):
-            request_packet_id = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, 'Parity')
-            if self.OnHandParity[SupplierNumber]:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, OnHandParity is True for supplier %d' % SupplierNumber)
-                if request_packet_id not in self.block_requests:
-                    self.block_requests[request_packet_id] = True
-                continue
-            if request_packet_id in self.block_requests:
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, request for packet %r already sent to IO queue for supplier %d' % (request_packet_id, SupplierNumber, ))
-                continue
-            SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
-            if not SupplierID:
-                lg.warn('unknown supplier at position %s' % SupplierNumber)
-                continue
-            if online_status.isOffline(SupplierID):
-                if _Debug:
-                    lg.out(_DebugLevel, '        SKIP, offline supplier: %s' % SupplierID)
-                continue
-            packetsToRequest.append((SupplierID, request_packet_id, ))
+        # pieces on hand and pieces which are expected to arrive soon
+        expectedData = list(self.OnHandData)
+        expectedParity = list(self.OnHandParity)
+        candidates = []
+        for dataORparity, onHand, expected in (('Data', self.OnHandData, expectedData), ('Parity', self.OnHandParity, expectedParity), ):
+            for SupplierNumber in range(len(onHand)):
+                request_packet_id = packetid.MakePacketID(self.backup_id, self.block_number, SupplierNumber, dataORparity)
+                if onHand[SupplierNumber]:
+                    if _Debug:
+                        lg.out(_DebugLevel, '        SKIP, OnHand%s is True for supplier %d' % (dataORparity, SupplierNumber))
+                    if request_packet_id not in self.block_requests:
+                        self.block_requests[request_packet_id] = True
+                    continue
+                if request_packet_id in self.block_requests:
+                    if _Debug:
+                        lg.out(_DebugLevel, '        SKIP, request for packet %r already sent to IO queue for supplier %d' % (request_packet_id, SupplierNumber, ))
+                    if self.block_requests[request_packet_id] is None and request_packet_id not in (lagging or ()):
+                        expected[SupplierNumber] = True
+                    continue
+                if request_packet_id in self.prefetch_failed:
+                    # supplier already answered Fail for that piece, other pieces will be selected to cover it
+                    self.prefetch_failed.discard(request_packet_id)
+                    self.block_requests[request_packet_id] = False
+                    self.RequestFails.append(request_packet_id)
+                    continue
+                if request_packet_id in self.prefetch_requests:
+                    # request was already sent ahead, the result will be passed to _on_packet_request_result()
+                    self.block_requests[request_packet_id] = None
+                    self.request_deadlines[request_packet_id] = time.time() + HEDGE_MIN_DELAY
+                    expected[SupplierNumber] = True
+                    continue
+                SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
+                if not SupplierID:
+                    lg.warn('unknown supplier at position %s' % SupplierNumber)
+                    continue
+                if online_status.isOffline(SupplierID):
+                    if _Debug:
+                        lg.out(_DebugLevel, '        SKIP, offline supplier: %s' % SupplierID)
+                    continue
+                candidates.append((dataORparity, SupplierNumber, SupplierID, request_packet_id, ))
+        packetsToRequest = self._do_select_fastest_pieces(candidates, expectedData, expectedParity)
         requests_made = 0
         # already_requested = 0
         for SupplierID, packetID in packetsToRequest:
@@ -701,12 +758,15 @@ class RestoreWorker(automat.Automat):
                 remoteID=SupplierID,
             ):
                 requests_made += 1
+                self.request_deadlines[packetID] = time.time() + max(HEDGE_MIN_DELAY, io_throttle.GetRequestTimePercentile(
+                    SupplierID, HEDGE_PERCENTILE) * max(1, io_throttle.GetRequestQueueLength(SupplierID)))
             else:
                 self.block_requests[packetID] = False
             if _Debug:
                 lg.dbg(_DebugLevel, 'sent request %r to %r, other requests: %r' % (
                     packetID, SupplierID, list(self.block_requests.values())))
         del packetsToRequest
+        self._do_schedule_hedging()
         if requests_made:
             if _Debug:
                 lg.out(_DebugLevel, "        requested %d packets for block %d" % (requests_made, self.block_number, ))
@@ -728,6 +788,196 @@ class RestoreWorker(automat.Automat):
             lg.out(_DebugLevel, "        all requests finished for block %d : %r" % (self.block_number, current_block_requests_results, ))
         reactor.callLater(0, self.automat, 'request-finished', None)  # @UndefinedVariable
 
+    def _do_select_fastest_pieces(self, candidates, expectedData, expectedParity):
+        """
+        Picks pieces one by one from the suppliers expected to deliver first until the block can be decoded.
+        If that is not possible all candidates are selected.
+        """
+        packetsToRequest = []
+        # estimated time grows linearly with the number of packets queued for that supplier
+        estimates = {}
+        queued = {}
+        for _, _, SupplierID, _ in candidates:
+            if SupplierID not in estimates:
+                first = io_throttle.EstimateRequestTime(SupplierID)
+                estimates[SupplierID] = (first, io_throttle.EstimateRequestTime(SupplierID, queued=1) - first, )
+                queued[SupplierID] = 0
+        candidates = list(candidates)
+        while candidates and not self.EccMap.Fixable(expectedData, expectedParity):
+            best = min(candidates, key=lambda c: (
+                estimates[c[2]][0] + estimates[c[2]][1] * queued[c[2]], c[0] != 'Data', ))
+            candidates.remove(best)
+            dataORparity, SupplierNumber, SupplierID, packetID = best
+            queued[SupplierID] += 1
+            if dataORparity == 'Data':
+                expectedData[SupplierNumber] = True
+            else:
+                expectedParity[SupplierNumber] = True
+            packetsToRequest.append((SupplierID, packetID, ))
+        return packetsToRequest
+
+    def _do_schedule_hedging(self):
+        if self.hedge_task and self.hedge_task.active():
+            self.hedge_task.cancel()
+        self.hedge_task = None
+        deadlines = [d for packetID, d in self.request_deadlines.items() if self.block_requests.get(packetID, False) is None]
+        if not deadlines:
+            return
+        self.hedge_task = reactor.callLater(max(0.01, min(deadlines) - time.time()), self._do_hedge_requests)  # @UndefinedVariable
+
+    def _do_hedge_requests(self):
+        """
+        Requests more pieces to cover the ones which are taking too long.
+        """
+        self.hedge_task = None
+        if self.block_requests is None or self.state not in ['REQUESTED', 'RECEIVING', ]:
+            return
+        now = time.time()
+        lagging = set()
+        for packetID, deadline in list(self.request_deadlines.items()):
+            if deadline > now:
+                continue
+            # every request is hedged only once
+            self.request_deadlines.pop(packetID)
+            if self.block_requests.get(packetID, False) is None:
+                lagging.add(packetID)
+        if lagging:
+            if _Debug:
+                lg.args(_DebugLevel, block_number=self.block_number, lagging=lagging)
+            self._do_check_run_requests(lagging=lagging)
+        else:
+            self._do_schedule_hedging()
+
+    def _do_cancel_redundant_requests(self):
+        """
+        Block is decodable already, other pieces are not needed anymore.
+        """
+        if self.hedge_task and self.hedge_task.active():
+            self.hedge_task.cancel()
+        self.hedge_task = None
+        self.request_deadlines.clear()
+        for packetID, result in list(self.block_requests.items()):
+            if result is not None:
+                continue
+            SupplierNumber = packetid.SplitFull(packetID)[4]
+            SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
+            self.block_requests.pop(packetID)
+            self.prefetch_requests.pop(packetID, None)
+            if SupplierID:
+                io_throttle.CancelRequestFile(SupplierID, packetID)
+            if _Debug:
+                lg.out(_DebugLevel, '        cancelled redundant request %r to %r' % (packetID, SupplierID, ))
+
+    def _do_prefetch_next_blocks(self):
+        if not self.prefetch_blocks or self.prefetched_blocks is None:
+            return
+        from storage import backup_matrix
+        max_block_number = backup_matrix.GetKnownMaxBlockNum(self.backup_id)
+        for block_number in range(self.block_number + 1, self.block_number + 1 + self.prefetch_blocks):
+            if max_block_number >= 0 and block_number > max_block_number:
+                break
+            if block_number in self.prefetched_blocks:
+                continue
+            self.prefetched_blocks[block_number] = dict(filename=None, done=False, result=None, waiting=False)
+            requests_made = 0
+            onHandData = [False, ] * self.EccMap.datasegments
+            onHandParity = [False, ] * self.EccMap.paritysegments
+            candidates = []
+            for dataORparity, onHand in (('Data', onHandData), ('Parity', onHandParity), ):
+                for SupplierNumber in range(len(onHand)):
+                    packetID = packetid.MakePacketID(self.backup_id, block_number, SupplierNumber, dataORparity)
+                    if self._is_packet_on_hand(packetID):
+                        onHand[SupplierNumber] = True
+                        continue
+                    # missing pieces of lagging or offline suppliers will be covered when the block become current
+                    SupplierID = contactsdb.supplier(SupplierNumber, customer_idurl=self.customer_idurl)
+                    if not SupplierID or online_status.isOffline(SupplierID):
+                        continue
+                    if io_throttle.HasPacketInRequestQueue(SupplierID, packetID):
+                        continue
+                    candidates.append((dataORparity, SupplierNumber, SupplierID, packetID, ))
+            for SupplierID, packetID in self._do_select_fastest_pieces(candidates, onHandData, onHandParity):
+                self.prefetch_requests[packetID] = block_number
+                if io_throttle.QueueRequestFile(
+                    callOnReceived=self._on_prefetch_request_result,
+                    creatorID=self.creator_id,
+                    packetID=packetID,
+                    ownerID=self.creator_id,
+                    remoteID=SupplierID,
+                ):
+                    requests_made += 1
+                else:
+                    self.prefetch_requests.pop(packetID, None)
+            if _Debug:
+                lg.args(_DebugLevel, current=self.block_number, block_number=block_number, requests_made=requests_made)
+            self._do_check_prefetched_block(block_number)
+
+    def _do_check_prefetched_block(self, block_number):
+        """
+        Starts decoding of a prefetched block as soon as enough pieces are on hand.
+        """
+        if block_number <= self.block_number:
+            return
+        info = self.prefetched_blocks.get(block_number)
+        if not info or info['filename']:
+            return
+        onHandData = [self._is_packet_on_hand(packetid.MakePacketID(
+            self.backup_id, block_number, SupplierNumber, 'Data')) for SupplierNumber in range(self.EccMap.datasegments)]
+        onHandParity = [self._is_packet_on_hand(packetid.MakePacketID(
+            self.backup_id, block_number, SupplierNumber, 'Parity')) for SupplierNumber in range(self.EccMap.paritysegments)]
+        if not self.EccMap.Fixable(onHandData, onHandParity):
+            return
+        info['filename'] = self._do_start_raid_read(
+            block_number, lambda result, filename: self._on_prefetched_block_restored(block_number, result, filename))
+        for packetID, prefetch_block_number in list(self.prefetch_requests.items()):
+            if prefetch_block_number == block_number:
+                self.prefetch_requests.pop(packetID)
+                SupplierID = contactsdb.supplier(packetid.SplitFull(packetID)[4], customer_idurl=self.customer_idurl)
+                if SupplierID:
+                    io_throttle.CancelRequestFile(SupplierID, packetID)
+
+    def _is_packet_on_hand(self, packetID):
+        customerID, remotePath = packetid.SplitPacketID(packetID)
+        return os.path.exists(os.path.join(settings.getLocalBackupsDir(), customerID, remotePath))
+
+    def _on_prefetched_block_restored(self, block_number, restored_blocks, filename):
+        info = self.prefetched_blocks.get(block_number) if self.prefetched_blocks is not None else None
+        if not info or info['filename'] != filename:
+            tmpfile.throw_out(filename, 'restore finished')
+            return
+        if _Debug:
+            lg.args(_DebugLevel, block_number=block_number, result=restored_blocks, waiting=info['waiting'])
+        info['done'] = True
+        info['result'] = restored_blocks
+        if info['waiting']:
+            self.prefetched_blocks.pop(block_number)
+            self._on_block_restored(restored_blocks, filename)
+
+    def _on_prefetch_request_result(self, NewPacketOrPacketID, result):
+        if self.prefetch_requests is None:
+            return
+        if strng.is_string(NewPacketOrPacketID):
+            packet_id = NewPacketOrPacketID
+        else:
+            packet_id = getattr(NewPacketOrPacketID, 'PacketID', None)
+        if result == 'in queue':
+            return
+        if packet_id in self.block_requests:
+            # the block become current while request was in progress
+            self.prefetch_requests.pop(packet_id, None)
+            self._on_packet_request_result(NewPacketOrPacketID, result)
+            return
+        block_number = self.prefetch_requests.pop(packet_id, None)
+        if block_number is None:
+            if _Debug:
+                lg.args(_DebugLevel, packet_id=packet_id, result=result)
+            return
+        if result == 'received':
+            self._do_save_packet(NewPacketOrPacketID, packet_id)
+        elif result not in ['exist', 'cancelled', ]:
+            self.prefetch_failed.add(packet_id)
+        self._do_check_prefetched_block(block_number)
+
     def _on_block_restored(self, restored_blocks, filename):
         if _Debug:
             lg.out(_DebugLevel, 'restore_worker._on_block_restored at %s with result: %s' % (filename, restored_blocks))
@@ -759,6 +1009,9 @@ class RestoreWorker(automat.Automat):
                             lg.warn('found matching packet request %r for rotated idurl %r' % (packet_id, resp['idurl'], ))
                             break
         if packet_id not in self.block_requests:
+            if result == 'cancelled':
+                # redundant request was cancelled because block was already decodable
+                return
             if _Debug:
                 lg.args(_DebugLevel, block_requests=self.block_requests)
             raise Exception('packet ID not registered')
@@ -780,6 +1033,9 @@ class RestoreWorker(automat.Automat):
             self.RequestFails.append(packet_id)
             # reactor.callLater(0, self.automat, 'request-failed', packet_id)  # @UndefinedVariable
             self.event('request-failed', packet_id)
+            if self.block_requests is not None and self.state == 'RECEIVING' and self.isStillCorrectable():
+                # in REQUESTED state doRequestPackets() already asked for other pieces to cover the failed one
+                self._do_check_run_requests()
 
     def _on_data_receiver_state_changed(self, oldstate, newstate, event_string, *args, **kwargs):
         if newstate == 'RECEIVING' and oldstate != 'RECEIVING':
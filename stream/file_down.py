@@ -225,21 +225,15 @@ class FileDown(automat.Automat):
         """
         if self.packetID in self.parent.fileRequestQueue:
             raise Exception('file %r already in downloading queue for %r' % (self.packetID, self.remoteID))
-        if self.packetID in self.parent.fileRequestDict:
-            raise Exception('file %r already in downloading dict for %r' % (self.packetID, self.remoteID))
-        self.parent.fileRequestDict[self.packetID] = self
-        self.parent.fileRequestQueue.append(self.packetID)
+        self.parent.fileRequestQueue.append(self.packetID, self)
 
     def doQueueRemove(self, *args, **kwargs):
         """
         Action method.
         """
-        if self.packetID not in self.parent.fileRequestDict:
-            raise Exception('file %r not found in downloading dict for %r' % (self.packetID, self.remoteID))
         if self.packetID not in self.parent.fileRequestQueue:
             raise Exception('file %r not found in downloading queue for %r' % (self.packetID, self.remoteID))
         self.parent.fileRequestQueue.remove(self.packetID)
-        del self.parent.fileRequestDict[self.packetID]
 
     def doSendRetreive(self, *args, **kwargs):
         """
@@ -298,6 +292,10 @@ class FileDown(automat.Automat):
         Action method.
         """
         self.fileReceivedTime = time.time()
+        if self.requestTime:
+            io_throttle.RegisterRequestResult(
+                self.remoteID, self.fileReceivedTime - self.requestTime, len(getattr(args[0], 'Payload', None) or b''), True)
+            self.parent.requestWindow.on_success(self.fileReceivedTime - self.requestTime, len(self.parent.fileRequestQueue) + 1)
         for callBack in self.callOnReceived:
             reactor.callLater(0, callBack, args[0], 'received')  # @UndefinedVariable
 
@@ -305,6 +303,10 @@ class FileDown(automat.Automat):
         """
         Action method.
         """
+        if self.requestTime:
+            io_throttle.RegisterRequestResult(self.remoteID, time.time() - self.requestTime, 0, False)
+        if event == 'request-failed':
+            self.parent.requestWindow.on_failure()
         if event == 'fail-received':
             for callBack in self.callOnReceived:
                 reactor.callLater(0, callBack, args[0], 'failed')  # @UndefinedVariable
@@ -242,21 +242,15 @@ class FileUp(automat.Automat):
         """
         if self.packetID in self.parent.fileSendQueue:
             raise Exception('file %r already in uploading queue for %r' % (self.packetID, self.remoteID))
-        if self.packetID in self.parent.fileSendDict:
-            raise Exception('file %r already in uploading dict for %r' % (self.packetID, self.remoteID))
-        self.parent.fileSendQueue.append(self.packetID)
-        self.parent.fileSendDict[self.packetID] = self
+        self.parent.fileSendQueue.append(self.packetID, self)
 
     def doQueueRemove(self, *args, **kwargs):
         """
         Action method.
         """
-        if self.packetID not in self.parent.fileSendDict:
-            raise Exception('file %r not found in uploading dict for %r' % (self.packetID, self.remoteID))
         if self.packetID not in self.parent.fileSendQueue:
             raise Exception('file %r not found in uploading queue for %r' % (self.packetID, self.remoteID))
         self.parent.fileSendQueue.remove(self.packetID)
-        del self.parent.fileSendDict[self.packetID]
 
     def doSendData(self, *args, **kwargs):
         """
@@ -303,6 +297,8 @@ class FileUp(automat.Automat):
         """
         self.ackTime = time.time()
         self.parent.uploadingTimeoutCount = 0
+        if self.sendTime:
+            self.parent.sendWindow.on_success(self.ackTime - self.sendTime, len(self.parent.fileSendQueue) + 1)
         if self.callOnAck:
             newpacket = args[0]
             reactor.callLater(0, self.callOnAck, newpacket, newpacket.OwnerID, self.packetID)  # @UndefinedVariable
@@ -323,9 +319,11 @@ class FileUp(automat.Automat):
                 reactor.callLater(0, self.callOnFail, self.remoteID, self.packetID, 'failed')  # @UndefinedVariable
         elif event == 'timeout':
             self.parent.uploadingTimeoutCount += 1
+            self.parent.sendWindow.on_failure()
             if self.callOnFail:
                 reactor.callLater(0, self.callOnFail, self.remoteID, self.packetID, 'timeout')  # @UndefinedVariable
         elif event == 'sending-failed':
+            self.parent.sendWindow.on_failure()
             if self.callOnFail:
                 reactor.callLater(0, self.callOnFail, self.remoteID, self.packetID, 'failed')  # @UndefinedVariable
         else:
@@ -38,6 +38,9 @@ Before requesting another file or sending another one out
 I check to see how much stuff I have waiting.
 
 Keep track of every supplier, store packets send/request in many queues.
+Number of packets in progress for every supplier is not fixed, see ``TransferWindow``:
+fast suppliers get deep pipelines while slow ones do not hold up the others.
+Queues are processed only when a packet is added, acked or received, there is no polling.
 
 TODO:
 We probably want to be able to send not only to suppliers but to any contacts.
@@ -59,6 +62,9 @@ _DebugLevel = 12
 import os
 import sys
 import time
+import itertools
+
+from collections import deque, OrderedDict
 
 #------------------------------------------------------------------------------
 
@@ -71,7 +77,6 @@ except:
 
 from logs import lg
 
-from lib import misc
 from lib import nameurl
 from lib import packetid
 
@@ -94,6 +99,17 @@ from transport import callback
 _IOThrottle = None
 _PacketReportCallbackFunc = None
 
+# supplier IDURL -> download statistics, see RegisterRequestResult()
+_RequestStats = {}
+_RequestStatsSamples = 50
+_DefaultRequestTime = 2.0
+
+# limits for the adaptive windows of every supplier queue, see TransferWindow()
+_WindowMinSize = 2
+_WindowSamples = 32
+_WindowQueuedLow = 1.0
+_WindowQueuedHigh = 3.0
+
 #------------------------------------------------------------------------------
 
 
@@ -255,6 +271,209 @@ def GetSendQueueLength(supplierIDURL):
 def GetRequestQueueLength(supplierIDURL):
     return throttle().GetRequestQueueLength(supplierIDURL)
 
+
+def CancelRequestFile(supplierIDURL, packetID):
+    """
+    Stops a single download from given supplier, callback will receive "cancelled" result.
+    """
+    return throttle().CancelRequestFile(supplierIDURL, packetID)
+
+#------------------------------------------------------------------------------
+
+def RegisterRequestResult(supplierIDURL, duration, size, success, finished=True):
+    """
+    Called by ``file_down()`` when a requested packet was received or failed,
+    ``duration`` is the time between sending Retrieve() and receiving the response.
+    Cancelled download is registered with ``finished=False``: it is known to take at least ``duration``.
+    """
+    supplier_key = id_url.to_bin(supplierIDURL)
+    stats = _RequestStats.get(supplier_key)
+    if stats is None:
+        stats = _RequestStats[supplier_key] = {
+            'durations': deque(maxlen=_RequestStatsSamples),
+            'received': 0,
+            'failed': 0,
+            'bytes': 0,
+            'time': 0.0,
+        }
+    if not finished:
+        stats['durations'].append(duration)
+        return
+    if not success:
+        stats['failed'] += 1
+        return
+    stats['received'] += 1
+    stats['durations'].append(duration)
+    stats['bytes'] += size
+    stats['time'] += duration
+
+
+def GetRequestTimePercentile(supplierIDURL, percentile=0.5):
+    """
+    Returns given percentile of the recent download times from that supplier in seconds,
+    when supplier is not known yet - percentile of all known suppliers is used.
+    """
+    stats = _RequestStats.get(id_url.to_bin(supplierIDURL))
+    if stats and len(stats['durations']) >= 3:
+        durations = sorted(stats['durations'])
+    else:
+        durations = sorted(d for st in _RequestStats.values() for d in st['durations'])
+    if not durations:
+        return _DefaultRequestTime
+    return durations[min(len(durations) - 1, int(len(durations) * percentile))]
+
+
+def EstimateRequestTime(supplierIDURL, queued=0):
+    """
+    How long it will take to receive one more packet from that supplier,
+    counts requests already waiting in the queue and recent failures.
+    """
+    median = GetRequestTimePercentile(supplierIDURL, 0.5)
+    waiting = GetRequestQueueLength(supplierIDURL) + queued
+    stats = _RequestStats.get(id_url.to_bin(supplierIDURL))
+    penalty = 1.0
+    if stats and stats['failed']:
+        penalty += 2.0 * stats['failed'] / float(stats['failed'] + stats['received'])
+    return median * (1 + waiting) * penalty
+
+
+def GetRequestStats(supplierIDURL):
+    stats = _RequestStats.get(id_url.to_bin(supplierIDURL))
+    if not stats:
+        return {}
+    return {
+        'received': stats['received'],
+        'failed': stats['failed'],
+        'median': GetRequestTimePercentile(supplierIDURL, 0.5),
+        'p90': GetRequestTimePercentile(supplierIDURL, 0.9),
+        'bytes_per_sec': (stats['bytes'] / stats['time']) if stats['time'] else 0.0,
+    }
+
+#------------------------------------------------------------------------------
+
+class PacketsQueue(object):
+    """
+    FIFO of ``file_up()`` or ``file_down()`` objects indexed by packetID and by backupID,
+    adding, removing and looking up a packet or all packets of a backup do not scan the whole queue.
+    """
+
+    def __init__(self):
+        self.items = OrderedDict()
+        # backupID -> set of packetIDs
+        self.backups = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, packetID):
+        return packetID in self.items
+
+    def __getitem__(self, packetID):
+        return self.items[packetID]
+
+    def get(self, packetID, default=None):
+        return self.items.get(packetID, default)
+
+    def append(self, packetID, item):
+        if packetID in self.items:
+            raise Exception('packet %r already in the queue' % packetID)
+        self.items[packetID] = item
+        self.backups.setdefault(packetID.rpartition('/')[0], set()).add(packetID)
+
+    def remove(self, packetID):
+        item = self.items.pop(packetID)
+        backupID = packetID.rpartition('/')[0]
+        self.backups[backupID].discard(packetID)
+        if not self.backups[backupID]:
+            del self.backups[backupID]
+        return item
+
+    def head(self, count):
+        """
+        Returns list of (packetID, item) tuples for the first ``count`` items.
+        """
+        return list(itertools.islice(self.items.items(), count))
+
+    def keys(self):
+        return list(self.items.keys())
+
+    def backup_keys(self, backupID):
+        """
+        Returns packetIDs of given backup, if ``backupID`` is empty all packetIDs are returned.
+        Same as checking ``packetID.count(backupID)`` for every item, but only backups are scanned.
+        """
+        if not backupID:
+            return self.keys()
+        if backupID in self.backups:
+            return list(self.backups[backupID])
+        result = []
+        for known_backup_id, packet_ids in self.backups.items():
+            if known_backup_id.count(backupID):
+                result.extend(packet_ids)
+        return result
+
+    def has_backup(self, backupID):
+        if backupID in self.backups:
+            return True
+        for known_backup_id in self.backups.keys():
+            if known_backup_id.count(backupID):
+                return True
+        return False
+
+
+class TransferWindow(object):
+    """
+    Number of packets which are sent to or requested from one supplier at the same time.
+
+    Window grows by one packet for every finished transfer while transfer times stay close
+    to the lowest recent time, so fast suppliers quickly get a deep pipeline.
+    After that it works similar to TCP Vegas: ``size * (1 - min_rtt / srtt)`` is an estimate
+    of how many of our packets are waiting in the supplier's queue, window slowly grows
+    when less than ``_WindowQueuedLow`` packets are waiting and shrinks when more than ``_WindowQueuedHigh``.
+    Timed out or failed transfer cuts the window in half.
+    """
+
+    def __init__(self, initial, maximum, minimum=None):
+        self.maximum = max(1, maximum)
+        self.minimum = min(self.maximum, minimum or _WindowMinSize)
+        self.size = float(min(max(initial, self.minimum), self.maximum))
+        self.slow_start = True
+        self.srtt = None
+        self.samples = deque(maxlen=_WindowSamples)
+
+    def __repr__(self):
+        return 'TransferWindow(%d/%d srtt=%s)' % (self.limit(), self.maximum, ('%.3f' % self.srtt) if self.srtt else None)
+
+    def limit(self):
+        return int(self.size)
+
+    def on_success(self, duration, queued):
+        """
+        Called when a packet was transferred, ``queued`` is number of packets in the queue at that moment
+        including the finished one: window is not growing when it was not used completely.
+        """
+        if not duration or duration <= 0:
+            return
+        self.samples.append(duration)
+        if self.srtt is None:
+            self.srtt = duration
+        else:
+            self.srtt = 0.875 * self.srtt + 0.125 * duration
+        waiting = self.size * (1.0 - min(self.samples) / self.srtt)
+        if waiting > _WindowQueuedHigh:
+            self.slow_start = False
+            self.size -= 1.0 / self.size
+        elif queued >= self.limit():
+            if self.slow_start:
+                self.size += 1.0
+            elif waiting < _WindowQueuedLow:
+                self.size += 1.0 / self.size
+        self.size = min(max(self.size, float(self.minimum)), float(self.maximum))
+
+    def on_failure(self):
+        self.slow_start = False
+        self.size = max(float(self.minimum), self.size / 2.0)
+
 #------------------------------------------------------------------------------
 
 class SupplierQueue:
@@ -267,25 +486,23 @@ class SupplierQueue:
         self.remoteID = supplierIdentity
         self.remoteName = nameurl.GetName(self.remoteID)
 
+        maxWindow = config.conf().getInt('services/data-motion/supplier-queue-max-size', 32)
+
         # all sends we'll hold on to, only several will be active,
         # but will hold onto the next ones to be sent
-        # active files
-        self.fileSendMaxLength = config.conf().getInt('services/data-motion/supplier-sending-queue-size', 8)
-        # an array of packetId, preserving first in first out,
-        # of which the first maxLength are the "active" sends
-        self.fileSendQueue = []
-        # dictionary of FileUp's using packetId as index,
-        # hold onto stuff sent and acked for some period as a history?
-        self.fileSendDict = {}
+        # number of active files is adjusted to that supplier
+        self.sendWindow = TransferWindow(
+            config.conf().getInt('services/data-motion/supplier-sending-queue-size', 8), maxWindow)
+        # FileUp's indexed by packetId, preserving first in first out,
+        # the first items which fit into the window are the "active" sends
+        self.fileSendQueue = PacketsQueue()
 
         # all requests we'll hold on to,
         # only several will be active, but will hold onto the next ones to be sent
-        # active requests
-        self.fileRequestMaxLength = config.conf().getInt('services/data-motion/supplier-request-queue-size', 8)
-        # an array of PacketIDs, preserving first in first out
-        self.fileRequestQueue = []
-        # FileDown's, indexed by PacketIDs
-        self.fileRequestDict = {}
+        self.requestWindow = TransferWindow(
+            config.conf().getInt('services/data-motion/supplier-request-queue-size', 8), maxWindow)
+        # FileDown's indexed by PacketIDs, preserving first in first out
+        self.fileRequestQueue = PacketsQueue()
 
         self.shutdown = False
 
@@ -296,10 +513,10 @@ class SupplierQueue:
         self.downloadingTimeoutCount = 0
 
         self._runSend = False
+        # queues are processed when something is added or finished, not periodically
         self.sendTask = None
-        self.sendTaskDelay = 0.1
+        self.sendTimeoutTask = None
         self.requestTask = None
-        self.requestTaskDelay = 0.1
 
 
     #------------------------------------------------------------------------------
@@ -341,8 +558,8 @@ class SupplierQueue:
         return True
 
     def StopAllSindings(self):
-        for packetID in list(self.fileSendDict.keys()):
-            f_up = self.fileSendDict.get(packetID)
+        for packetID in self.fileSendQueue.keys():
+            f_up = self.fileSendQueue.get(packetID)
             if f_up:
                 if _Debug:
                     lg.args(_DebugLevel, packetID=packetID, obj=f_up, event='stop')
@@ -355,21 +572,16 @@ class SupplierQueue:
             return
         if _Debug:
             lg.args(_DebugLevel, backupName=backupName)
-        packetsToRemove = set()
-        for packetID in self.fileSendQueue:
-            if (backupName and packetID.count(backupName)) or not backupName:
-                packetsToRemove.add(packetID)
-                if _Debug:
-                    lg.out(_DebugLevel, 'io_throttle.DeleteBackupRequests %s from downloading queue' % packetID)
+        packetsToRemove = self.fileSendQueue.backup_keys(backupName)
         for packetID in packetsToRemove:
-            if packetID in self.fileSendDict:
-                f_up = self.fileSendDict[packetID]
+            f_up = self.fileSendQueue.get(packetID)
+            if f_up:
                 f_up.event('stop')
                 if _Debug:
                     lg.out(_DebugLevel, "io_throttle.DeleteBackupRequests stopped %s in %s uploading queue, %d more items" % (
                         packetID, self.remoteID, len(self.fileSendQueue)))
         if len(self.fileSendQueue) > 0:
-            reactor.callLater(0, self.DoSend)  # @UndefinedVariable
+            self.DoSend()
 
     def OnFileSendAckReceived(self, newpacket, info):
         if self.shutdown:
@@ -386,10 +598,7 @@ class SupplierQueue:
         if packetID not in self.fileSendQueue:
             lg.warn("packet %s not in sending queue for %s" % (newpacket.PacketID, self.remoteName))
             return
-        if packetID not in list(self.fileSendDict.keys()):
-            lg.warn("packet %s not in sending dict for %s" % (newpacket.PacketID, self.remoteName))
-            return
-        f_up = self.fileSendDict[packetID]
+        f_up = self.fileSendQueue[packetID]
         if newpacket.Command == commands.Ack():
             f_up.event('ack-received', newpacket)
         elif newpacket.Command == commands.Fail():
@@ -413,86 +622,70 @@ class SupplierQueue:
 
     def RunSend(self):
         if self._runSend:
-            return
+            return 0
         self._runSend = True
         if _Debug:
-            lg.out(_DebugLevel * 2, 'io_throttle.RunSend  fileSendQueue=%d' % len(self.fileSendQueue))
+            lg.out(_DebugLevel * 2, 'io_throttle.RunSend  fileSendQueue=%d window=%r' % (len(self.fileSendQueue), self.sendWindow))
         packetsToBeFailed = {}
-        packetsToRemove = set()
         packetsSent = 0
-        # let's check only beginning of the queue and try to process it.
-        # once we finish and remove some items from the queue we can take more items
-        for i in range(0, min(self.fileSendMaxLength, len(self.fileSendQueue))):
-            try:
-                packetID = self.fileSendQueue[i]
-            except:
-                lg.warn("item at position %d not exist in send queue" % i)
-                continue
-
-            f_up = self.fileSendDict[packetID]
-
-            if f_up.state != 'IN_QUEUE':
-                # we are sending that file at the moment
-                packetsSent += 1
-                # and we got ack
-                if f_up.ackTime is None:
-                    # if we did not get an ack yet we do not want to wait to long
-                    if time.time() - f_up.sendTime > f_up.sendTimeout:
-                        # so this packet is failed because no response for too long
-                        packetsToBeFailed[packetID] = 'timeout'
-                        lg.warn('uploading %r failed because of timeout %d src' % (packetID, f_up.sendTimeout, ))
-                # this packet already in progress - check next one
-                continue
-
-            # the data file to send no longer exists - it is failed situation
-            if not os.path.exists(f_up.fileName):
-                lg.warn("file %s not exist" % (f_up.fileName))
-                packetsToBeFailed[packetID] = 'not exist'
-                continue
-
-            # item is in the queue, but not started yet
-            f_up.event('start')
-
+        nextTimeout = None
+        # only the beginning of the queue which fits into the window is processed,
+        # once some items are finished and removed from the queue we can take more items
+        for packetID, f_up in self.fileSendQueue.head(self.sendWindow.limit()):
+            if f_up.state == 'IN_QUEUE':
+                # the data file to send no longer exists - it is failed situation
+                if not os.path.exists(f_up.fileName):
+                    lg.warn("file %s not exist" % (f_up.fileName))
+                    packetsToBeFailed[packetID] = 'not exist'
+                    continue
+                # item is in the queue, but not started yet
+                f_up.event('start')
+            # we are sending that file at the moment
+            packetsSent += 1
+            if f_up.ackTime is None and f_up.sendTime is not None:
+                # if we did not get an ack yet we do not want to wait to long
+                if time.time() - f_up.sendTime > f_up.sendTimeout:
+                    # so this packet is failed because no response for too long
+                    packetsToBeFailed[packetID] = 'timeout'
+                    lg.warn('uploading %r failed because of timeout %d src' % (packetID, f_up.sendTimeout, ))
+                elif nextTimeout is None or f_up.sendTime + f_up.sendTimeout < nextTimeout:
+                    nextTimeout = f_up.sendTime + f_up.sendTimeout
         # process failed packets
         for packetID, why in packetsToBeFailed.items():
-            f_up = self.fileSendDict[packetID]
+            f_up = self.fileSendQueue.get(packetID)
+            if not f_up:
+                continue
             if why == 'timeout':
                 f_up.event('timeout')
             elif why == 'not exist':
                 f_up.event('file-not-exist')
             else:
                 raise Exception('unknown result %r for %r' % (why, packetID))
-        # remember results
-        result = max(len(packetsToRemove), packetsSent)
-        # erase temp lists
         del packetsToBeFailed
-        del packetsToRemove
+        # wake up when the oldest packet in progress is timed out
+        if self.sendTimeoutTask and self.sendTimeoutTask.active():
+            self.sendTimeoutTask.cancel()
+        self.sendTimeoutTask = None
+        if nextTimeout is not None:
+            self.sendTimeoutTask = reactor.callLater(max(0, nextTimeout - time.time()) + 0.1, self.DoSend)  # @UndefinedVariable
         self._runSend = False
-        return result
+        return packetsSent
 
     def SendingTask(self):
+        self.sendTask = None
         if self.shutdown:
             self.StopAllSindings()
             return
-        sends = self.RunSend()
-        self.sendTaskDelay = misc.LoopAttenuation(
-            self.sendTaskDelay,
-            sends > 0,
-            settings.MinimumSendingDelay(),
-            settings.MaximumSendingDelay())
-        # attenuation
-        self.sendTask = reactor.callLater(self.sendTaskDelay, self.SendingTask)  # @UndefinedVariable
+        self.RunSend()
 
     def DoSend(self):
-        if self.sendTask is None:
-            self.SendingTask()
-            return
-        if self._runSend:
+        """
+        Called when a new file was added to the queue or one of the files was finished,
+        all calls within one reactor iteration are processed at once.
+        """
+        if self.sendTask and self.sendTask.active():
             return
-        if self.sendTaskDelay > 1.0:
-            self.sendTask.cancel()
-            self.sendTask = None
-            reactor.callLater(0, self.SendingTask)  # @UndefinedVariable
+        self.sendTask = reactor.callLater(0, self.SendingTask)  # @UndefinedVariable
 
     #------------------------------------------------------------------------------
 
@@ -519,8 +712,8 @@ class SupplierQueue:
         return True
 
     def StopAllRequests(self):
-        for packetID in list(self.fileRequestDict.keys()):
-            f_down = self.fileRequestDict.get(packetID)
+        for packetID in self.fileRequestQueue.keys():
+            f_down = self.fileRequestQueue.get(packetID)
             if f_down:
                 if _Debug:
                     lg.args(_DebugLevel, packetID=packetID, obj=f_down, event='stop')
@@ -534,14 +727,9 @@ class SupplierQueue:
             return
         if _Debug:
             lg.out(_DebugLevel, 'io_throttle.DeleteBackupRequests  will cancel all requests for %s' % backupName)
-        packetsToRemove = set()
-        for packetID in self.fileRequestQueue:
-            if (backupName and packetID.count(backupName)) or not backupName:
-                packetsToRemove.add(packetID)
-                if _Debug:
-                    lg.out(_DebugLevel, 'io_throttle.DeleteBackupRequests %s from downloading queue' % packetID)
+        packetsToRemove = self.fileRequestQueue.backup_keys(backupName)
         for packetID in packetsToRemove:
-            f_down = self.fileRequestDict.get(packetID)
+            f_down = self.fileRequestQueue.get(packetID)
             if f_down:
                 f_down.event('stop')
                 if _Debug:
@@ -550,7 +738,7 @@ class SupplierQueue:
             else:
                 lg.warn('can not find %r in request queue' % packetID)
         if len(self.fileRequestQueue) > 0:
-            reactor.callLater(0, self.DoRequest)  # @UndefinedVariable
+            self.DoRequest()
 
     def OnDataReceived(self, newpacket, result):
         # we requested some data from a supplier, and just received it
@@ -561,16 +749,16 @@ class SupplierQueue:
         if _Debug:
             lg.args(_DebugLevel, newpacket=newpacket, result=result, queue=len(self.fileRequestQueue), remoteName=self.remoteName)
         packetID = global_id.CanonicalID(newpacket.PacketID)
-        if (packetID not in self.fileRequestQueue) or (packetID not in self.fileRequestDict):
+        if packetID not in self.fileRequestQueue:
             latest_idurl = global_id.NormalizeGlobalID(packetID, as_field=True)['idurl'].latest
             another_packetID = global_id.SubstitutePacketID(packetID, idurl=latest_idurl)
-            if (another_packetID in self.fileRequestQueue) and (another_packetID in self.fileRequestDict):
+            if another_packetID in self.fileRequestQueue:
                 packetID = another_packetID
                 lg.warn('found incoming %r with outdated packet id, corrected: %r' % (newpacket, another_packetID, ))
-        if (packetID not in self.fileRequestQueue) or (packetID not in self.fileRequestDict):
+        if packetID not in self.fileRequestQueue:
             lg.err('unexpected %r received which is not in the downloading queue' % newpacket)
         else:
-            f_down = self.fileRequestDict[packetID]
+            f_down = self.fileRequestQueue[packetID]
             if newpacket.Command == commands.Data():
                 wrapped_packet = signed.Unserialize(newpacket.Payload)
                 if not wrapped_packet or not wrapped_packet.Valid():
@@ -585,14 +773,7 @@ class SupplierQueue:
 
     def RunRequest(self):
         packetsToRemove = {}
-        for i in range(0, min(self.fileRequestMaxLength, len(self.fileRequestQueue))):
-            packetID = self.fileRequestQueue[i]
-            # must never happen, but just in case
-            if packetID not in self.fileRequestDict:
-                packetsToRemove[packetID] = 'broken'
-                lg.err('file %r not found in downloading queue for %r' % (packetID, self.remoteID))
-                continue
-            f_down = self.fileRequestDict[packetID]
+        for packetID, f_down in self.fileRequestQueue.head(self.requestWindow.limit()):
             if f_down.state == 'IN_QUEUE':
                 customer, pathID = packetid.SplitPacketID(packetID)
                 if os.path.exists(os.path.join(settings.getLocalBackupsDir(), customer, pathID)):
@@ -608,7 +789,7 @@ class SupplierQueue:
                 lg.out(_DebugLevel, "io_throttle.RunRequest %r to be removed from [%s] downloading queue because %r, %d more items" % (
                     packetID, self.remoteID, why, len(self.fileRequestQueue)))
             if packetID in self.fileRequestQueue:
-                f_down = self.fileRequestDict[packetID]
+                f_down = self.fileRequestQueue[packetID]
                 if why == 'exist':
                     f_down.event('file-already-exists')
                 else:
@@ -624,26 +805,19 @@ class SupplierQueue:
         return result
 
     def RequestTask(self):
+        self.requestTask = None
         if self.shutdown:
             self.StopAllRequests()
             return
-        requests = self.RunRequest()
-        self.requestTaskDelay = misc.LoopAttenuation(
-            self.requestTaskDelay,
-            requests > 0,
-            settings.MinimumReceivingDelay(),
-            settings.MaximumReceivingDelay())
-        # attenuation
-        self.requestTask = reactor.callLater(self.requestTaskDelay, self.RequestTask)  # @UndefinedVariable
+        self.RunRequest()
 
     def DoRequest(self):
-        if self.requestTask is None:
-            self.RequestTask()
-        else:
-            if self.requestTaskDelay > 1.0:
-                self.requestTask.cancel()
-                self.requestTask = None
-                self.RequestTask()
+        """
+        Called when a new request was added to the queue or one of the requests was finished.
+        """
+        if self.requestTask and self.requestTask.active():
+            return
+        self.requestTask = reactor.callLater(0, self.RequestTask)  # @UndefinedVariable
 
     #------------------------------------------------------------------------------
 
@@ -658,13 +832,13 @@ class SupplierQueue:
         if status == 'finished':
             if pkt_out.outpacket.Command == commands.Retrieve():
                 if packetID in self.fileRequestQueue:
-                    f_down = self.fileRequestDict[packetID]
+                    f_down = self.fileRequestQueue[packetID]
                     if _Debug:
                         lg.args(_DebugLevel, obj=f_down, status=status, packetID=packetID, event='retrieve-sent')
                     f_down.event('retrieve-sent', pkt_out.outpacket)
             elif pkt_out.outpacket.Command == commands.Data():
                 if packetID in self.fileSendQueue:
-                    f_up = self.fileSendDict[packetID]
+                    f_up = self.fileSendQueue[packetID]
                     if _Debug:
                         lg.args(_DebugLevel, obj=f_up, status=status, packetID=packetID, event='data-sent')
                     f_up.event('data-sent', pkt_out.outpacket)
@@ -673,13 +847,13 @@ class SupplierQueue:
                 if packetID in self.fileRequestQueue:
                     if _Debug:
                         lg.dbg(_DebugLevel, 'packet %r is %r during downloading from %s' % (packetID, status, self.remoteID))
-                    f_down = self.fileRequestDict[packetID]
+                    f_down = self.fileRequestQueue[packetID]
                     f_down.event('request-failed')
             elif pkt_out.outpacket.Command == commands.Data():
                 if packetID in self.fileSendQueue:
                     if _Debug:
                         lg.dbg(_DebugLevel, 'packet %r is %r during uploading to %s' % (packetID, status, self.remoteID))
-                    f_up = self.fileSendDict[packetID]
+                    f_up = self.fileSendQueue[packetID]
                     f_up.event('sending-failed')
 
     def OutboxStatus(self, pkt_out, status, error):
@@ -690,7 +864,7 @@ class SupplierQueue:
         if status == 'finished':
             if pkt_out.outpacket.Command == commands.Data():
                 if packetID in self.fileSendQueue:
-                    f_up = self.fileSendDict[packetID]
+                    f_up = self.fileSendQueue[packetID]
                     if _Debug:
                         lg.args(_DebugLevel, obj=f_up, status=status, packetID=packetID, event='data-sent')
                     if error == 'unanswered':
@@ -702,7 +876,7 @@ class SupplierQueue:
             if pkt_out.outpacket.Command == commands.Data():
                 if packetID in self.fileSendQueue:
                     lg.warn('packet %r is %r during uploading to %s' % (packetID, status, self.remoteID))
-                    f_up = self.fileSendDict[packetID]
+                    f_up = self.fileSendQueue[packetID]
                     f_up.event('sending-failed')
                     return False
         return False
@@ -718,16 +892,16 @@ class SupplierQueue:
     #------------------------------------------------------------------------------
 
     def ListSendItems(self):
-        return self.fileSendQueue
+        return self.fileSendQueue.keys()
 
     def GetSendItem(self, packetID):
-        return self.fileSendDict.get(packetID)
+        return self.fileSendQueue.get(packetID)
 
     def ListRequestItems(self):
-        return self.fileRequestQueue
+        return self.fileRequestQueue.keys()
 
     def GetRequestItem(self, packetID):
-        return self.fileRequestDict.get(packetID)
+        return self.fileRequestQueue.get(packetID)
 
     def HasSendingFiles(self):
         return len(self.fileSendQueue) > 0
@@ -736,10 +910,11 @@ class SupplierQueue:
         return len(self.fileRequestQueue) > 0
 
     def OkToSend(self):
-        return len(self.fileSendQueue) < self.fileSendMaxLength
+        # one more window of files is waiting, so the next ones start right after acks received
+        return len(self.fileSendQueue) < 2 * self.sendWindow.limit()
 
     def OkToRequest(self):
-        return len(self.fileRequestQueue) < self.fileRequestMaxLength
+        return len(self.fileRequestQueue) < 2 * self.requestWindow.limit()
 
     def GetSendQueueLength(self):
         return len(self.fileSendQueue)
@@ -747,6 +922,16 @@ class SupplierQueue:
     def GetRequestQueueLength(self):
         return len(self.fileRequestQueue)
 
+    def CancelRequestFile(self, packetID):
+        packetID = global_id.CanonicalID(packetID)
+        f_down = self.fileRequestQueue.get(packetID)
+        if not f_down:
+            return False
+        if f_down.requestTime:
+            RegisterRequestResult(self.remoteID, time.time() - f_down.requestTime, 0, False, finished=False)
+        f_down.event('stop')
+        return True
+
 #------------------------------------------------------------------------------
 
 
@@ -860,7 +1045,7 @@ class IOThrottle:
             if not self.supplierQueues[idurl].HasRequestedFiles():
                 if _Debug:
                     lg.out(_DebugLevel, 'io_throttle.IsRequestQueueEmpty   supplier %r has requested files:\n%r' % (
-                        idurl, self.supplierQueues[idurl].fileRequestQueue))
+                        idurl, self.supplierQueues[idurl].fileRequestQueue.keys()))
                 return False
         return True
 
@@ -872,7 +1057,7 @@ class IOThrottle:
         supplierIDURL = id_url.field(supplierIDURL)
         if supplierIDURL not in self.supplierQueues:
             return False
-        return packetID in self.supplierQueues[supplierIDURL].fileSendDict
+        return packetID in self.supplierQueues[supplierIDURL].fileSendQueue
 
     def HasPacketInRequestQueue(self, supplierIDURL, packetID):
         """
@@ -882,7 +1067,7 @@ class IOThrottle:
         supplierIDURL = id_url.field(supplierIDURL)
         if supplierIDURL not in self.supplierQueues:
             return False
-        return packetID in self.supplierQueues[supplierIDURL].fileRequestDict
+        return packetID in self.supplierQueues[supplierIDURL].fileRequestQueue
 
     def HasBackupIDInSendQueue(self, supplierIDURL, backupID):
         """
@@ -892,10 +1077,7 @@ class IOThrottle:
         supplierIDURL = id_url.field(supplierIDURL)
         if supplierIDURL not in self.supplierQueues:
             return False
-        for packetID in self.supplierQueues[supplierIDURL].fileSendDict.keys():
-            if packetID.count(backupID):
-                return True
-        return False
+        return self.supplierQueues[supplierIDURL].fileSendQueue.has_backup(backupID)
 
     def HasBackupIDInRequestQueue(self, supplierIDURL, backupID):
         """
@@ -905,10 +1087,7 @@ class IOThrottle:
         supplierIDURL = id_url.field(supplierIDURL)
         if supplierIDURL not in self.supplierQueues:
             return False
-        for packetID in self.supplierQueues[supplierIDURL].fileRequestDict.keys():
-            if packetID.count(backupID):
-                return True
-        return False
+        return self.supplierQueues[supplierIDURL].fileRequestQueue.has_backup(backupID)
 
     def IsBackupSending(self, backupID):
         """
@@ -954,6 +1133,15 @@ class IOThrottle:
             return 0
         return self.supplierQueues[supplierIDURL].GetRequestQueueLength()
 
+    def CancelRequestFile(self, supplierIDURL, packetID):
+        """
+        Stop downloading of given packet from that user.
+        """
+        supplierIDURL = id_url.field(supplierIDURL)
+        if supplierIDURL not in self.supplierQueues:
+            return False
+        return self.supplierQueues[supplierIDURL].CancelRequestFile(packetID)
+
     def GetSendQueueLength(self, supplierIDURL):
         """
         Return number of packets sent to this guy.
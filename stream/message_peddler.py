@@ -100,6 +100,7 @@ from storage import archive_writer
 
 from stream import p2p_queue
 from stream import queue_keeper
+from stream import queue_log
 from stream import message
 
 from userid import global_id
@@ -112,6 +113,7 @@ _MessagePeddler = None
 
 _ActiveStreams = {}
 _ActiveCustomers = {}
+_QueueLogs = {}
 
 #------------------------------------------------------------------------------
 
@@ -124,6 +126,11 @@ def customers():
     global _ActiveCustomers
     return _ActiveCustomers
 
+
+def queue_logs():
+    global _QueueLogs
+    return _QueueLogs
+
 #------------------------------------------------------------------------------
 
 def register_stream(queue_id):
@@ -460,29 +467,74 @@ def increment_sequence_id(queue_id):
 
 #------------------------------------------------------------------------------
 
-def store_message(queue_id, sequence_id, producer_id, payload, created, processed=None):
+def open_queue_log(queue_id):
+    """
+    Returns opened `queue_log.QueueLog` object where messages of given queue are stored.
+    """
+    ql = queue_logs().get(queue_id)
+    if ql:
+        return ql
+    service_dir = settings.ServiceDir('service_message_broker')
+    queues_dir = os.path.join(service_dir, 'queues')
+    queue_dir = os.path.join(queues_dir, queue_id)
+    ql = queue_log.QueueLog(os.path.join(queue_dir, 'log'))
+    ql.open()
+    queue_logs()[queue_id] = ql
+    migrate_legacy_messages(queue_id, ql)
+    return ql
+
+
+def close_queue_log(queue_id):
+    ql = queue_logs().pop(queue_id, None)
+    if not ql:
+        return False
+    ql.close()
+    return True
+
+
+def migrate_legacy_messages(queue_id, ql):
+    """
+    Older versions stored every message in a separate file in the "messages" sub-folder,
+    all of them are moved into the queue log.
+    """
     service_dir = settings.ServiceDir('service_message_broker')
     queues_dir = os.path.join(service_dir, 'queues')
     queue_dir = os.path.join(queues_dir, queue_id)
     messages_dir = os.path.join(queue_dir, 'messages')
-    message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
-    stored_json_message = {
-        'sequence_id': sequence_id,
-        'created': created,
-        'producer_id': producer_id,
-        'payload': payload,
-        'attempts': [],
-        'processed': None,
-    }
-    if processed:
-        stored_json_message['attempts'].append({
-            'message_id': payload['message_id'],
-            'started': None,
-            'finished': utime.get_sec1970(),
-            'failed_consumers': [],
-        })
-        stored_json_message['processed'] = processed
-    if not local_fs.WriteTextFile(message_path, jsn.dumps(stored_json_message)):
+    if not os.path.isdir(messages_dir):
+        return 0
+    migrated = 0
+    all_stored_queue_messages = os.listdir(messages_dir)
+    all_stored_queue_messages.sort(key=lambda i: int(i))
+    for _sequence_id in all_stored_queue_messages:
+        stored_json_message = jsn.loads_text(local_fs.ReadTextFile(os.path.join(messages_dir, _sequence_id)))
+        if not stored_json_message:
+            lg.err('failed reading message %s from %r' % (_sequence_id, queue_id, ))
+            continue
+        sequence_id = int(_sequence_id)
+        ql.append(sequence_id, stored_json_message['producer_id'], stored_json_message['payload'], stored_json_message['created'])
+        for attempt in stored_json_message.get('attempts') or []:
+            ql.start_attempt(sequence_id, attempt['message_id'], started=attempt.get('started'),
+                             finished=attempt.get('finished'), failed_consumers=attempt.get('failed_consumers') or [])
+        if stored_json_message.get('processed'):
+            ql.mark_processed(sequence_id, stored_json_message['processed'])
+        migrated += 1
+    bpio.rmdir_recursive(messages_dir, ignore_errors=True)
+    lg.info('migrated %d messages of %r into %r' % (migrated, queue_id, ql, ))
+    return migrated
+
+#------------------------------------------------------------------------------
+
+def store_message(queue_id, sequence_id, producer_id, payload, created, processed=None):
+    try:
+        ql = open_queue_log(queue_id)
+        ql.append(sequence_id, producer_id, payload, created)
+        if processed:
+            ql.start_attempt(sequence_id, payload['message_id'], finished=utime.get_sec1970())
+            ql.mark_processed(sequence_id, processed)
+        stored_json_message = ql.read(sequence_id)
+    except:
+        lg.exc()
         lg.err('failed to store message %d in %r from %r' % (sequence_id, queue_id, producer_id, ))
         return None
     if _Debug:
@@ -493,31 +545,19 @@ def store_message(queue_id, sequence_id, producer_id, payload, created, processe
 def update_processed_message(queue_id, sequence_id):
     if _Debug:
         lg.args(_DebugLevel, queue_id=queue_id, sequence_id=sequence_id)
-    service_dir = settings.ServiceDir('service_message_broker')
-    queues_dir = os.path.join(service_dir, 'queues')
-    queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
-    message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
-    stored_json_message = jsn.loads_text(local_fs.ReadTextFile(message_path))
-    if not stored_json_message:
+    if not open_queue_log(queue_id).mark_processed(sequence_id):
         lg.err('failed reading message %d from %r' % (sequence_id, queue_id, ))
         return False
-    stored_json_message['processed'] = utime.get_sec1970()
-    if not local_fs.WriteTextFile(message_path, jsn.dumps(stored_json_message)):
-        return False
     return True
 
 
 def erase_message(queue_id, sequence_id):
     if _Debug:
         lg.args(_DebugLevel, queue_id=queue_id, sequence_id=sequence_id)
-    service_dir = settings.ServiceDir('service_message_broker')
-    queues_dir = os.path.join(service_dir, 'queues')
-    queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
-    message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
     try:
-        os.remove(message_path)
+        if not open_queue_log(queue_id).erase(sequence_id):
+            lg.err('message %d was not found in %r' % (sequence_id, queue_id, ))
+            return False
     except:
         lg.exc()
         return False
@@ -525,48 +565,20 @@ def erase_message(queue_id, sequence_id):
 
 
 def read_messages(queue_id, sequence_id_list=[]):
-    service_dir = settings.ServiceDir('service_message_broker')
-    queues_dir = os.path.join(service_dir, 'queues')
-    queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
-    if not sequence_id_list:
-        sequence_id_list = sorted([int(sequence_id) for sequence_id in os.listdir(messages_dir)])
-    result = []
-    for sequence_id in sequence_id_list:
-        message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
-        stored_json_message = jsn.loads_text(local_fs.ReadTextFile(message_path))
-        if not stored_json_message:
-            lg.err('failed reading message %d from %r' % (sequence_id, queue_id, ))
-            continue
+    result = open_queue_log(queue_id).read_many(sequence_id_list or None)
+    for stored_json_message in result:
         stored_json_message.pop('attempts')
-        result.append(stored_json_message)
     return result
 
 
 def get_messages_for_consumer(queue_id, consumer_id, consumer_last_sequence_id, max_messages_count=100):
-    service_dir = settings.ServiceDir('service_message_broker')
-    queues_dir = os.path.join(service_dir, 'queues')
-    queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
-    all_stored_queue_messages = os.listdir(messages_dir)
-    all_stored_queue_messages.sort(key=lambda i: int(i))
     result = []
-    for sequence_id in all_stored_queue_messages:
-        if consumer_last_sequence_id >= int(sequence_id):
-            continue
-        message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
-        try:
-            stored_json_message = jsn.loads_text(local_fs.ReadTextFile(message_path))
-        except:
-            lg.exc()
-            continue
-        if not stored_json_message:
-            lg.err('failed reading message %d from %r' % (sequence_id, queue_id, ))
-            continue
+    try:
+        result = open_queue_log(queue_id).read_after(consumer_last_sequence_id, max_messages_count=max_messages_count)
+    except:
+        lg.exc()
+    for stored_json_message in result:
         stored_json_message.pop('attempts')
-        result.append(stored_json_message)
-        if len(result) >= max_messages_count:
-            break
     if _Debug:
         lg.args(_DebugLevel, queue_id=queue_id, consumer_id=consumer_id,
                 consumer_last_sequence_id=consumer_last_sequence_id, result=len(result))
@@ -577,52 +589,16 @@ def get_messages_for_consumer(queue_id, consumer_id, consumer_last_sequence_id,
 def register_delivery(queue_id, sequence_id, message_id):
     if _Debug:
         lg.args(_DebugLevel, queue_id=queue_id, sequence_id=sequence_id, message_id=message_id)
-    service_dir = settings.ServiceDir('service_message_broker')
-    queues_dir = os.path.join(service_dir, 'queues')
-    queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
-    message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
-    stored_json_message = jsn.loads_text(local_fs.ReadTextFile(message_path))
-    if not stored_json_message:
+    if not open_queue_log(queue_id).start_attempt(sequence_id, message_id, started=utime.get_sec1970()):
         lg.err('failed reading message %d from %r' % (sequence_id, queue_id, ))
         return False
-    stored_json_message['attempts'].append({
-        'message_id': message_id,
-        'started': utime.get_sec1970(),
-        'finished': None,
-        'failed_consumers': [],
-    })
-    if not local_fs.WriteTextFile(message_path, jsn.dumps(stored_json_message)):
-        return False
     return True
 
 
 def unregister_delivery(queue_id, sequence_id, message_id, failed_consumers):
     if _Debug:
         lg.args(_DebugLevel, queue_id=queue_id, sequence_id=sequence_id, message_id=message_id, failed_consumers=failed_consumers)
-    service_dir = settings.ServiceDir('service_message_broker')
-    queues_dir = os.path.join(service_dir, 'queues')
-    queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
-    message_path = os.path.join(messages_dir, strng.to_text(sequence_id))
-    stored_json_message = jsn.loads_text(local_fs.ReadTextFile(message_path))
-    if not stored_json_message:
-        lg.err('failed reading message %d from %r' % (sequence_id, queue_id, ))
-        return False
-    found_attempt_number = None
-    for attempt_number in range(len(stored_json_message['attempts'])-1, -1, -1):
-        if stored_json_message['attempts'][attempt_number]['message_id'] == message_id:
-            found_attempt_number = attempt_number
-            break
-    if found_attempt_number is None:
-        return False
-    stored_json_message['attempts'][found_attempt_number].update({
-        'finished': utime.get_sec1970(),
-        'failed_consumers': failed_consumers,
-    })
-    if not local_fs.WriteTextFile(message_path, jsn.dumps(stored_json_message)):
-        return False
-    return True
+    return open_queue_log(queue_id).finish_attempt(sequence_id, message_id, failed_consumers)
 
 #------------------------------------------------------------------------------
 
@@ -632,6 +608,8 @@ def close_all_streams():
     list_queues = os.listdir(queues_dir)
     for queue_id in list_queues:
         close_stream(queue_id, erase_data=False)
+    for queue_id in list(queue_logs().keys()):
+        close_queue_log(queue_id)
     return True
 
 
@@ -650,6 +628,8 @@ def check_rotate_queues():
             if latest_queue_id != queue_id:
                 latest_queue_path = os.path.join(queues_dir, latest_queue_id)
                 old_queue_path = os.path.join(queues_dir, queue_id)
+                # segments of the queue log are moved to another folder, they will be indexed again when opened
+                close_queue_log(queue_id)
                 if not os.path.isfile(latest_queue_path):
                     bpio.move_dir_recursive(old_queue_path, latest_queue_path)
                     try:
@@ -688,6 +668,7 @@ def close_stream(queue_id, erase_data=True):
     if erase_data:
         erase_stream(queue_id)
     unregister_stream(queue_id)
+    close_queue_log(queue_id)
     return True
 
 
@@ -695,14 +676,12 @@ def save_stream(queue_id):
     service_dir = settings.ServiceDir('service_message_broker')
     queues_dir = os.path.join(service_dir, 'queues')
     queue_dir = os.path.join(queues_dir, queue_id)
-    messages_dir = os.path.join(queue_dir, 'messages')
     consumers_dir = os.path.join(queue_dir, 'consumers')
     producers_dir = os.path.join(queue_dir, 'producers')
     stream_info = streams()[queue_id]
     if _Debug:
         lg.args(_DebugLevel, queue_id=queue_id, typ=type(queue_id))
-    if not os.path.isdir(messages_dir):
-        bpio._dirs_make(messages_dir)
+    open_queue_log(queue_id)
     if not os.path.isdir(consumers_dir):
         bpio._dirs_make(consumers_dir)
     if not os.path.isdir(producers_dir):
@@ -718,6 +697,7 @@ def erase_stream(queue_id):
     service_dir = settings.ServiceDir('service_message_broker')
     queues_dir = os.path.join(service_dir, 'queues')
     queue_dir = os.path.join(queues_dir, queue_id)
+    close_queue_log(queue_id)
     erased_files = 0
     if os.path.isdir(queue_dir):
         erased_files += bpio.rmdir_recursive(queue_dir, ignore_errors=True)
@@ -737,6 +717,8 @@ def rename_stream(old_queue_id, new_queue_id):
         return False
     if old_queue_id not in customers()[old_customer_idurl]:
         return False
+    close_queue_log(old_queue_id)
+    close_queue_log(new_queue_id)
     customers()[old_customer_idurl].remove(old_queue_id)
     if not customers()[old_customer_idurl]:
         customers().pop(old_customer_idurl)
@@ -1866,7 +1848,6 @@ class MessagePeddler(automat.Automat):
                 lg.err('found unclean rotated queue_id: %r' % queue_id)
                 continue
             queue_dir = os.path.join(queues_dir, queue_id)
-            messages_dir = os.path.join(queue_dir, 'messages')
             consumers_dir = os.path.join(queue_dir, 'consumers')
             producers_dir = os.path.join(queue_dir, 'producers')
             if queue_id not in streams():
@@ -1885,24 +1866,20 @@ class MessagePeddler(automat.Automat):
             else:
                 to_be_started.add(queue_id)
             last_sequence_id = -1
-            all_stored_queue_messages = []
-            if os.path.isdir(messages_dir):
-                all_stored_queue_messages = os.listdir(messages_dir)
-                all_stored_queue_messages.sort(key=lambda i: int(i))
-            for _sequence_id in all_stored_queue_messages:
-                sequence_id = int(_sequence_id)
-                stored_json_message = jsn.loads_text(local_fs.ReadTextFile(os.path.join(messages_dir, strng.to_text(_sequence_id))))
-                if stored_json_message:
-                    if stored_json_message.get('processed'):
-                        streams()[queue_id]['archive'].append(sequence_id)
-                        loaded_archive_messages += 1
-                    else:
-                        streams()[queue_id]['messages'].append(sequence_id)
-                    if sequence_id >= last_sequence_id:
-                        last_sequence_id = sequence_id
-                    loaded_messages += 1
+            try:
+                ql = open_queue_log(queue_id)
+            except:
+                lg.exc()
+                continue
+            for sequence_id in ql.sequence_ids:
+                if ql.is_processed(sequence_id):
+                    streams()[queue_id]['archive'].append(sequence_id)
+                    loaded_archive_messages += 1
                 else:
-                    lg.err('failed reading message %d from %r' % (sequence_id, queue_id, ))
+                    streams()[queue_id]['messages'].append(sequence_id)
+                if sequence_id >= last_sequence_id:
+                    last_sequence_id = sequence_id
+                loaded_messages += 1
             streams()[queue_id]['last_sequence_id'] = last_sequence_id
             for consumer_id in (os.listdir(consumers_dir) if os.path.isdir(consumers_dir) else []):
                 if consumer_id in streams()[queue_id]['consumers']:
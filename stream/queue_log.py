@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# queue_log.py
+#
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (queue_log.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+#
+#
+#
+#
+
+"""
+.. module:: queue_log.
+
+Append-only storage of the messages in a single queue of message_peddler().
+
+Every message is written once as a single line at the end of the current "segment" file:
+
+    <sequence_id> <json message>\\n
+
+When segment reached `SEGMENT_MAX_MESSAGES` lines a new segment is started.
+An in-memory index of sequence ID -> (segment, offset, length) is built when the log is opened,
+so reading messages of a consumer starting from some position does not need to scan the folder.
+
+Delivery attempts and "processed"/"erased" markers are never written into the segments,
+they are appended to a side "journal" file instead:
+
+    <sequence_id> <operation> <json value>\\n
+
+Segments where all messages were erased are removed, journal is compacted on every segment rotation.
+Incomplete lines at the end of the files (after a crash) are truncated when the log is opened.
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+
+#------------------------------------------------------------------------------
+
+_Debug = False
+_DebugLevel = 10
+
+#------------------------------------------------------------------------------
+
+import os
+import bisect
+
+#------------------------------------------------------------------------------
+
+from logs import lg
+
+from lib import jsn
+from lib import utime
+
+#------------------------------------------------------------------------------
+
+SEGMENT_MAX_MESSAGES = 1000
+
+SEGMENT_EXTENSION = '.seg'
+JOURNAL_FILENAME = 'journal'
+
+#------------------------------------------------------------------------------
+
+class QueueLog(object):
+
+    def __init__(self, log_dir, segment_max_messages=SEGMENT_MAX_MESSAGES):
+        self.log_dir = log_dir
+        self.segment_max_messages = segment_max_messages
+        # sequence_id -> (segment_id, offset, length)
+        self.index = {}
+        # sorted list of all stored sequence IDs
+        self.sequence_ids = []
+        # segment_id -> set of sequence IDs which are still stored in that segment
+        self.segments = {}
+        # segment_id -> number of lines written to that segment
+        self.segments_lines = {}
+        # sequence_id -> segment_id, messages which were erased but their segment still exist
+        self.erased = {}
+        # sequence_id -> {'attempts': [], 'processed': None}
+        self.states = {}
+        self.active_segment_id = None
+        self.journal_lines = 0
+        self._writer = None
+        self._journal = None
+        self._readers = {}
+
+    def __repr__(self):
+        return 'QueueLog(%r, %d messages, %d segments)' % (self.log_dir, len(self.sequence_ids), len(self.segments), )
+
+    def __len__(self):
+        return len(self.sequence_ids)
+
+    def __contains__(self, sequence_id):
+        return sequence_id in self.index
+
+    #------------------------------------------------------------------------------
+
+    def open(self):
+        if not os.path.isdir(self.log_dir):
+            os.makedirs(self.log_dir)
+        segment_ids = []
+        for filename in os.listdir(self.log_dir):
+            if filename.endswith(SEGMENT_EXTENSION):
+                try:
+                    segment_ids.append(int(filename[:-len(SEGMENT_EXTENSION)]))
+                except:
+                    lg.warn('unexpected file in queue log folder: %r' % filename)
+        segment_ids.sort()
+        for segment_id in segment_ids:
+            self._load_segment(segment_id)
+        if segment_ids:
+            self.active_segment_id = segment_ids[-1]
+        else:
+            self.active_segment_id = 0
+            self.segments[0] = set()
+            self.segments_lines[0] = 0
+        self._load_journal()
+        self._writer = open(self._segment_path(self.active_segment_id), 'ab')
+        self._journal = open(self._journal_path(), 'ab')
+        if self.journal_lines > 2 * (len(self.states) + len(self.erased)) + self.segment_max_messages:
+            self.compact()
+        if _Debug:
+            lg.args(_DebugLevel, log=self)
+        return True
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+        for reader in self._readers.values():
+            reader.close()
+        self._readers.clear()
+        if _Debug:
+            lg.args(_DebugLevel, log=self)
+        return True
+
+    #------------------------------------------------------------------------------
+
+    def append(self, sequence_id, producer_id, payload, created):
+        """
+        Stores new message at the end of the active segment, returns stored message.
+        If given sequence ID already exists, the older copy will be replaced.
+        """
+        if self.segments_lines[self.active_segment_id] >= self.segment_max_messages:
+            self.rotate()
+        line = b'%d %s\n' % (sequence_id, jsn.dumps({
+            'sequence_id': sequence_id,
+            'created': created,
+            'producer_id': producer_id,
+            'payload': payload,
+        }, separators=(',', ':')).encode('utf-8'), )
+        offset = self._writer.tell()
+        self._writer.write(line)
+        self._writer.flush()
+        self._write_journal(sequence_id, 'n')
+        self._index_message(sequence_id, self.active_segment_id, offset, len(line))
+        self.segments_lines[self.active_segment_id] += 1
+        self.states[sequence_id] = {'attempts': [], 'processed': None, }
+        return self.read(sequence_id)
+
+    def read(self, sequence_id):
+        """
+        Returns stored message together with delivery attempts and "processed" marker.
+        """
+        segment_id, offset, length = self.index[sequence_id]
+        if segment_id == self.active_segment_id:
+            self._writer.flush()
+        reader = self._readers.get(segment_id)
+        if not reader:
+            reader = open(self._segment_path(segment_id), 'rb')
+            self._readers[segment_id] = reader
+        reader.seek(offset)
+        line = reader.read(length)
+        stored_json_message = jsn.loads_text(line.split(b' ', 1)[1].decode('utf-8'))
+        state = self.states.get(sequence_id) or {'attempts': [], 'processed': None, }
+        stored_json_message['attempts'] = [dict(a) for a in state['attempts']]
+        stored_json_message['processed'] = state['processed']
+        return stored_json_message
+
+    def read_many(self, sequence_id_list=None):
+        if sequence_id_list is None:
+            sequence_id_list = self.sequence_ids
+        result = []
+        for sequence_id in sequence_id_list:
+            if sequence_id not in self.index:
+                lg.err('message %d was not found in %r' % (sequence_id, self, ))
+                continue
+            result.append(self.read(sequence_id))
+        return result
+
+    def read_after(self, last_sequence_id, max_messages_count=100):
+        """
+        Returns up to `max_messages_count` messages stored after given sequence ID.
+        """
+        pos = bisect.bisect_right(self.sequence_ids, last_sequence_id)
+        return self.read_many(self.sequence_ids[pos:pos + max_messages_count])
+
+    def is_processed(self, sequence_id):
+        state = self.states.get(sequence_id)
+        return bool(state and state['processed'])
+
+    def mark_processed(self, sequence_id, processed=None):
+        if sequence_id not in self.index:
+            return False
+        processed = processed or utime.get_sec1970()
+        self._write_journal(sequence_id, 'p', processed)
+        self.states[sequence_id]['processed'] = processed
+        return True
+
+    def start_attempt(self, sequence_id, message_id, started=None, finished=None, failed_consumers=[]):
+        if sequence_id not in self.index:
+            return False
+        attempt = {
+            'message_id': message_id,
+            'started': started,
+            'finished': finished,
+            'failed_consumers': list(failed_consumers),
+        }
+        self._write_journal(sequence_id, 'a', attempt)
+        self.states[sequence_id]['attempts'].append(attempt)
+        return True
+
+    def finish_attempt(self, sequence_id, message_id, failed_consumers, finished=None):
+        if sequence_id not in self.index:
+            return False
+        attempts = self.states[sequence_id]['attempts']
+        for attempt_number in range(len(attempts) - 1, -1, -1):
+            if attempts[attempt_number]['message_id'] == message_id:
+                update = {
+                    'message_id': message_id,
+                    'finished': finished or utime.get_sec1970(),
+                    'failed_consumers': list(failed_consumers),
+                }
+                self._write_journal(sequence_id, 'f', update)
+                attempts[attempt_number].update(update)
+                return True
+        return False
+
+    def erase(self, sequence_id):
+        if sequence_id not in self.index:
+            return False
+        self._write_journal(sequence_id, 'e')
+        segment_id = self._unindex_message(sequence_id)
+        self.states.pop(sequence_id, None)
+        if segment_id is not None:
+            self.erased[sequence_id] = segment_id
+            self._check_remove_segment(segment_id)
+        return True
+
+    #------------------------------------------------------------------------------
+
+    def rotate(self):
+        """
+        Starts a new active segment and compacts the journal.
+        """
+        self._writer.close()
+        self.active_segment_id += 1
+        self.segments[self.active_segment_id] = set()
+        self.segments_lines[self.active_segment_id] = 0
+        self._writer = open(self._segment_path(self.active_segment_id), 'ab')
+        for segment_id in list(self.segments.keys()):
+            self._check_remove_segment(segment_id)
+        self.compact()
+        if _Debug:
+            lg.args(_DebugLevel, log=self)
+
+    def compact(self):
+        """
+        Re-writes the journal keeping only one record per stored message.
+        """
+        lines = []
+        for sequence_id, segment_id in self.erased.items():
+            lines.append(self._journal_line(sequence_id, 'e'))
+        for sequence_id in self.sequence_ids:
+            lines.append(self._journal_line(sequence_id, 's', self.states.get(sequence_id) or {'attempts': [], 'processed': None, }))
+        tmp_path = self._journal_path() + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal:
+            self._journal.close()
+        os.rename(tmp_path, self._journal_path())
+        self._journal = open(self._journal_path(), 'ab')
+        self.journal_lines = len(lines)
+        return True
+
+    #------------------------------------------------------------------------------
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.log_dir, '%010d%s' % (segment_id, SEGMENT_EXTENSION, ))
+
+    def _journal_path(self):
+        return os.path.join(self.log_dir, JOURNAL_FILENAME)
+
+    def _journal_line(self, sequence_id, operation, value=None):
+        return b'%d %s %s\n' % (sequence_id, operation.encode(), jsn.dumps(value, separators=(',', ':')).encode('utf-8'), )
+
+    def _write_journal(self, sequence_id, operation, value=None):
+        self._journal.write(self._journal_line(sequence_id, operation, value))
+        self._journal.flush()
+        self.journal_lines += 1
+
+    def _index_message(self, sequence_id, segment_id, offset, length):
+        self._unindex_message(sequence_id)
+        self.erased.pop(sequence_id, None)
+        self.index[sequence_id] = (segment_id, offset, length, )
+        self.segments[segment_id].add(sequence_id)
+        if not self.sequence_ids or sequence_id > self.sequence_ids[-1]:
+            self.sequence_ids.append(sequence_id)
+        else:
+            bisect.insort(self.sequence_ids, sequence_id)
+
+    def _unindex_message(self, sequence_id):
+        existing = self.index.pop(sequence_id, None)
+        if not existing:
+            return None
+        self.segments[existing[0]].discard(sequence_id)
+        pos = bisect.bisect_left(self.sequence_ids, sequence_id)
+        if pos < len(self.sequence_ids) and self.sequence_ids[pos] == sequence_id:
+            self.sequence_ids.pop(pos)
+        return existing[0]
+
+    def _check_remove_segment(self, segment_id):
+        if segment_id == self.active_segment_id or self.segments[segment_id]:
+            return False
+        reader = self._readers.pop(segment_id, None)
+        if reader:
+            reader.close()
+        try:
+            os.remove(self._segment_path(segment_id))
+        except:
+            lg.exc()
+            return False
+        self.segments.pop(segment_id)
+        self.segments_lines.pop(segment_id)
+        for sequence_id in [s for s, seg in self.erased.items() if seg == segment_id]:
+            self.erased.pop(sequence_id)
+        if _Debug:
+            lg.args(_DebugLevel, segment_id=segment_id, log=self)
+        return True
+
+    def _read_lines(self, path):
+        """
+        Yields (offset, line) for every complete line in the file, truncates incomplete tail.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset < len(data):
+            pos = data.find(b'\n', offset)
+            if pos < 0:
+                lg.warn('truncating incomplete record at position %d in %r' % (offset, path, ))
+                with open(path, 'r+b') as f:
+                    f.truncate(offset)
+                return
+            yield offset, data[offset:pos + 1]
+            offset = pos + 1
+
+    def _load_segment(self, segment_id):
+        self.segments[segment_id] = set()
+        self.segments_lines[segment_id] = 0
+        for offset, line in self._read_lines(self._segment_path(segment_id)):
+            try:
+                sequence_id = int(line.split(b' ', 1)[0])
+            except:
+                lg.err('invalid record at position %d in segment %d of %r' % (offset, segment_id, self.log_dir, ))
+                continue
+            self._index_message(sequence_id, segment_id, offset, len(line))
+            self.segments_lines[segment_id] += 1
+
+    def _load_journal(self):
+        self.journal_lines = 0
+        if not os.path.isfile(self._journal_path()):
+            return
+        erased = set()
+        for offset, line in self._read_lines(self._journal_path()):
+            self.journal_lines += 1
+            try:
+                sequence_id, operation, value = line.split(b' ', 2)
+                sequence_id = int(sequence_id)
+                operation = operation.decode()
+                value = jsn.loads_text(value.decode('utf-8'))
+            except:
+                lg.err('invalid record at position %d in journal of %r' % (offset, self.log_dir, ))
+                continue
+            if operation == 'e':
+                erased.add(sequence_id)
+                self.states.pop(sequence_id, None)
+                continue
+            if operation in ('n', 's', ):
+                erased.discard(sequence_id)
+                self.states[sequence_id] = value if operation == 's' else {'attempts': [], 'processed': None, }
+                continue
+            state = self.states.setdefault(sequence_id, {'attempts': [], 'processed': None, })
+            if operation == 'p':
+                state['processed'] = value
+            elif operation == 'a':
+                state['attempts'].append(value)
+            elif operation == 'f':
+                for attempt in reversed(state['attempts']):
+                    if attempt['message_id'] == value['message_id']:
+                        attempt.update(value)
+                        break
+        for sequence_id in erased:
+            segment_id = self._unindex_message(sequence_id)
+            if segment_id is not None:
+                self.erased[sequence_id] = segment_id
+        for sequence_id in list(self.states.keys()):
+            if sequence_id not in self.index:
+                self.states.pop(sequence_id)
+        for sequence_id in self.sequence_ids:
+            if sequence_id not in self.states:
+                # message was written, but the process stopped before the journal record was added
+                self.states[sequence_id] = {'attempts': [], 'processed': None, }
@@ -30,6 +30,11 @@
 Keep track of temporary files created in the program. The temp folder is
 placed in the BitDust data directory. All files are divided into several
 sub folders.
+
+Small files can be kept in memory instead, see ``make_memory()``.
+Such file gets a "virtual" path inside the sub folder, so it can be passed
+between transports and the gateway same way as a real file, but must be
+accessed via ``file_exists()``, ``file_size()``, ``read_file()`` and ``open_file()``.
 """
 
 #------------------------------------------------------------------------------
@@ -47,6 +52,8 @@ import os
 import tempfile
 import time
 
+from io import BytesIO
+
 from twisted.internet import task  # @UnresolvedImport
 
 #------------------------------------------------------------------------------
@@ -60,6 +67,13 @@ from system import bpio
 _TempDirPath = None
 _FilesDict = {}
 _CollectorTask = None
+_MemoryFiles = {}
+_MemoryFilesCounter = 0
+_MemoryFilesBytes = 0
+# bytes reserved for in-memory files which are still being received
+_MemoryFilesReserved = {}
+_MemoryFileMaxSize = 64 * 1024
+_MemoryFilesMaxBytes = 64 * 1024 * 1024
 _SubDirs = {
 
     'outbox': 60 * 60 * 1,
@@ -165,15 +179,22 @@ def init(temp_dir_path=''):
 
 def shutdown():
     """
-    Do not need to remove any files here, just stop the collector task.
+    Do not need to remove any files here, just stop the collector task
+    and release in-memory files.
     """
     if _Debug:
         lg.out(_DebugLevel, 'tmpfile.shutdown')
     global _CollectorTask
+    global _MemoryFiles
+    global _MemoryFilesBytes
     if _CollectorTask is not None:
         _CollectorTask.stop()
         del _CollectorTask
         _CollectorTask = None
+    for filename in list(_MemoryFiles.keys()):
+        throw_out(filename, 'shutdown')
+    _MemoryFilesReserved.clear()
+    _MemoryFilesBytes = 0
 
 
 def subdir(name):
@@ -249,6 +270,131 @@ def make_dir(name, extension='', prefix=''):
     return dirname
 
 
+def configure_memory_files(max_file_size=None, max_total_bytes=None):
+    """
+    Set limits for in-memory files: only files smaller or equal to ``max_file_size``
+    are kept in memory and all of them together can not take more than ``max_total_bytes``.
+    Set ``max_file_size`` to 0 to always use real files.
+    """
+    global _MemoryFileMaxSize
+    global _MemoryFilesMaxBytes
+    if max_file_size is not None:
+        _MemoryFileMaxSize = max_file_size
+    if max_total_bytes is not None:
+        _MemoryFilesMaxBytes = max_total_bytes
+
+
+def fits_memory(filesize):
+    """
+    Return True if file of given size can be kept in memory right now.
+    """
+    global _MemoryFileMaxSize
+    global _MemoryFilesMaxBytes
+    global _MemoryFilesBytes
+    if filesize <= 0 or filesize > _MemoryFileMaxSize:
+        return False
+    return _MemoryFilesBytes + filesize <= _MemoryFilesMaxBytes
+
+
+def make_memory(name, data=b'', extension='', prefix='', size=0):
+    """
+    Same as ``make()``, but file content is kept in memory and only a "virtual" path is returned.
+    Content can be set later with ``write_memory()``, the file is removed by collector
+    or via ``throw_out()`` the same way as a regular temporary file.
+    Expected ``size`` of the content is counted towards the limit right away,
+    so files which are still being received can not exceed it together.
+    """
+    global _FilesDict
+    global _MemoryFiles
+    global _MemoryFilesCounter
+    global _MemoryFilesBytes
+    if _TempDirPath is None:
+        init()
+    if name not in list(_FilesDict.keys()):
+        name = 'all'
+    _MemoryFilesCounter += 1
+    filename = os.path.join(subdir(name), '%smem%d%s' % (prefix, _MemoryFilesCounter, extension))
+    _FilesDict[name][filename] = time.time()
+    _MemoryFiles[filename] = b''
+    if size > 0:
+        _MemoryFilesReserved[filename] = size
+        _MemoryFilesBytes += size
+    if data:
+        write_memory(filename, data)
+    if _Debug:
+        lg.out(_DebugLevel, 'tmpfile.make_memory ' + filename)
+    return filename
+
+
+def write_memory(filename, data):
+    """
+    Replace content of existing in-memory file.
+    """
+    global _MemoryFiles
+    global _MemoryFilesBytes
+    if filename not in _MemoryFiles:
+        return False
+    data = bytes(data)
+    # reserved bytes are released when the real content is known
+    _MemoryFilesBytes += len(data) - max(len(_MemoryFiles[filename]), _MemoryFilesReserved.pop(filename, 0))
+    _MemoryFiles[filename] = data
+    return True
+
+
+def is_memory(filename):
+    return filename in _MemoryFiles
+
+
+def file_exists(filename):
+    """
+    Check if regular or in-memory file exists.
+    """
+    if filename in _MemoryFiles:
+        return True
+    return os.path.isfile(filename)
+
+
+def file_size(filename):
+    """
+    Return size of regular or in-memory file, -1 if file not exist.
+    """
+    if filename in _MemoryFiles:
+        return len(_MemoryFiles[filename])
+    try:
+        return os.path.getsize(filename)
+    except:
+        return -1
+
+
+def read_file(filename):
+    """
+    Return whole content of regular or in-memory file.
+    """
+    if filename in _MemoryFiles:
+        return _MemoryFiles[filename]
+    return bpio.ReadBinaryFile(filename)
+
+
+def open_file(filename):
+    """
+    Open regular or in-memory file for reading in binary mode.
+    """
+    if filename in _MemoryFiles:
+        return BytesIO(_MemoryFiles[filename])
+    return open(filename, 'rb')
+
+
+def memory_files_stats():
+    global _MemoryFiles
+    global _MemoryFilesBytes
+    return {
+        'files': len(_MemoryFiles),
+        'bytes': _MemoryFilesBytes,
+        'max_file_size': _MemoryFileMaxSize,
+        'max_total_bytes': _MemoryFilesMaxBytes,
+    }
+
+
 def erase(name, filename, why='no reason'):
     """
     However you can remove not needed file immediately, this is a good way
@@ -257,6 +403,8 @@ def erase(name, filename, why='no reason'):
     But outside of this module you better use method ``throw_out``.
     """
     global _FilesDict
+    global _MemoryFiles
+    global _MemoryFilesBytes
     if name in list(_FilesDict.keys()):
         try:
             _FilesDict[name].pop(filename)
@@ -266,6 +414,12 @@ def erase(name, filename, why='no reason'):
     else:
         lg.warn('we do not know sub folder: %s, we tried because %s' % (name, why))
 
+    if filename in _MemoryFiles:
+        _MemoryFilesBytes -= max(len(_MemoryFiles.pop(filename)), _MemoryFilesReserved.pop(filename, 0))
+        if _Debug:
+            lg.out(_DebugLevel, 'tmpfile.erase in-memory [%s] : "%s"' % (filename, why))
+        return
+
     if not os.path.exists(filename):
         lg.warn('[%s] not exist' % filename)
         return
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# backuplatency.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (backuplatency.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures latency of the reactor while ``storage.backup`` is running.
+
+A probe is scheduled every 5 milliseconds, the delay of every call is recorded
+and reported when backup is finished.
+With ``inline`` argument blocks are encrypted in the main thread, as it was done before:
+
+    python tests/experiments/backuplatency.py [file size in MB] [block size in MB] [inline]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.task import LoopingCall
+
+from logs import lg
+
+from system import bpio
+from system import tmpfile
+
+from main import settings
+
+from automats import automat
+
+from crypt import key
+
+from userid import my_id
+
+from raid import eccmap
+from raid import raid_worker
+
+from storage import backup
+from storage import backup_tar
+
+from tests.test_backup_restore import _some_priv_key, _some_identity_xml
+
+#------------------------------------------------------------------------------
+
+_BaseDir = '/tmp/.bitdust_latency'
+_SourceDir = '/tmp/_latency_folder'
+_ProbeInterval = 0.005
+
+
+def cleanup():
+    for dirpath in (_BaseDir, _SourceDir, ):
+        if os.path.isdir(dirpath):
+            bpio.rmdir_recursive(dirpath, ignore_errors=True)
+
+
+def init():
+    cleanup()
+    lg.set_debug_level(0)
+    settings.init(base_dir=_BaseDir)
+    for dirname in ('metadata', 'logs', ):
+        if not os.path.isdir(os.path.join(_BaseDir, dirname)):
+            os.makedirs(os.path.join(_BaseDir, dirname))
+    automat.OpenLogFile(os.path.join(_BaseDir, 'logs', 'automats.log'))
+    bpio.WriteTextFile(settings.KeyFileName(), _some_priv_key)
+    bpio.WriteTextFile(settings.LocalIdentityFilename(), _some_identity_xml)
+    key.LoadMyKey()
+    my_id.loadLocalIdentity()
+    my_id.init()
+    tmpfile.init(temp_dir_path=os.path.join(_BaseDir, 'temp'))
+    os.makedirs(os.path.join(_BaseDir, 'backups', 'master$alice@127.0.0.1_8084', '1', 'F1234'))
+    os.makedirs(_SourceDir)
+
+
+def main():
+    file_size = int(float(sys.argv[1] if len(sys.argv) > 1 else 64) * 1024 * 1024)
+    block_size = int(float(sys.argv[2] if len(sys.argv) > 2 else 8) * 1024 * 1024)
+    if 'inline' in sys.argv:
+        backup.threads.deferToThreadPool = lambda _reactor, _pool, f, *a: maybeDeferred(f, *a)
+    init()
+    with open(os.path.join(_SourceDir, 'random_file'), 'wb') as fout:
+        fout.write(os.urandom(file_size))
+    delays = []
+    latest = [time.time()]
+
+    def _probe():
+        now = time.time()
+        delays.append(max(0.0, now - latest[0] - _ProbeInterval))
+        latest[0] = now
+
+    def _bk_done(bid, result):
+        dt = time.time() - started[0]
+        probe.stop()
+        delays.sort()
+        print('result=%s file=%d MB block=%d MB inline=%s' % (
+            result, file_size // (1024 * 1024), block_size // (1024 * 1024), 'inline' in sys.argv))
+        print('  total time  : %.2f sec, %.1f MB/s' % (dt, file_size / dt / (1024 * 1024)))
+        print('  probe calls : %d' % len(delays))
+        print('  max latency : %.1f ms' % (delays[-1] * 1000.0))
+        print('  p99 latency : %.1f ms' % (delays[int(len(delays) * 0.99)] * 1000.0))
+        print('  p50 latency : %.1f ms' % (delays[len(delays) // 2] * 1000.0))
+        reactor.callLater(0, raid_worker.A, 'shutdown')  # @UndefinedVariable
+        reactor.callLater(1, reactor.stop)  # @UndefinedVariable
+
+    def _start():
+        backupPipe = backup_tar.backuptardir_thread(_SourceDir, compress='none')
+        job = backup.backup(
+            'master$alice@127.0.0.1_8084:1/F1234',
+            backupPipe,
+            blockSize=block_size,
+            ecc_map=eccmap.eccmap('ecc/4x4'),
+        )
+        job.finishCallback = _bk_done
+        started[0] = time.time()
+        latest[0] = time.time()
+        probe.start(_ProbeInterval, now=False)
+        job.automat('start')
+
+    started = [None]
+    probe = LoopingCall(_probe)
+    raid_worker.A('init')
+    reactor.callLater(1, _start)  # @UndefinedVariable
+    reactor.run()  # @UndefinedVariable
+    automat.CloseLogFile()
+    tmpfile.shutdown()
+    settings.shutdown()
+    cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# bytesloop.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (bytesloop.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures read throughput of ``backup_tar.BytesLoop`` when reader is slower than the
+producer thread and a lot of data is buffered. The old buffer which was concatenating
+and slicing bytes is measured for comparison.
+
+    python tests/experiments/bytesloop.py [total MB] [read size KB]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from storage import backup_tar
+
+WRITE_SIZE = 1024 * 1024
+
+
+class ConcatBuffer(object):
+    """
+    The way ``BytesLoop`` was storing data before.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def write(self, chunk):
+        with self._lock:
+            self._buffer += chunk
+            self._size = len(self._buffer)
+
+    def read(self, n=-1):
+        with self._lock:
+            chunk = self._buffer[:n]
+            self._buffer = self._buffer[n:]
+            self._size = len(self._buffer)
+        return chunk
+
+
+def measure(name, p, total_size, read_size):
+    chunk = os.urandom(WRITE_SIZE)
+
+    def _produce():
+        for _ in range(total_size // WRITE_SIZE):
+            p.write(chunk)
+
+    t = threading.Thread(target=_produce)
+    t.start()
+    #--- let the producer race ahead
+    time.sleep(0.5)
+    peak = p._size
+    started = time.time()
+    received = 0
+    while received < total_size:
+        data = p.read(read_size)
+        if not data:
+            time.sleep(0.001)
+        received += len(data)
+        peak = max(peak, p._size)
+    duration = time.time() - started
+    t.join()
+    print('  %-8s %6d MB  read by %5d KB  %8.1f MB/s  peak buffer %6.1f MB' % (
+        name, total_size // (1024 * 1024), read_size // 1024,
+        total_size / duration / (1024 * 1024), peak / (1024.0 * 1024.0)))
+
+
+def main():
+    total_size = int(sys.argv[1] if len(sys.argv) > 1 else 256) * 1024 * 1024
+    read_size = int(sys.argv[2] if len(sys.argv) > 2 else 64) * 1024
+    backup_tar.reactor.callFromThread = lambda f, *a: None
+    measure('concat', ConcatBuffer(), total_size, read_size)
+    measure('loop', backup_tar.BytesLoop(), total_size, read_size)
+    measure('loop', backup_tar.BytesLoop(max_buffer_size=total_size), total_size, read_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# dhtdatastore.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (dhtdatastore.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures lookups/sec of the DHT datastore depending on number of stored records.
+
+For every size an "old" database without any index is created first and measured
+with the same queries ``SQLiteVersionedJsonDataStore`` was doing before, then same file
+is opened with ``SQLiteVersionedJsonDataStore`` (which migrates the table) and measured again.
+
+    python tests/experiments/dhtdatastore.py [records count] [records count] ...
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from dht.entangled.kademlia import datastore
+
+
+def create_old_db(db_path, count):
+    db = sqlite3.connect(db_path)
+    db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision)')
+    now = int(time.time())
+    db.executemany('INSERT INTO data VALUES (?, ?, ?, ?, ?, ?, ?)', [(
+        '%040x' % i,
+        json.dumps({'k': '%040x' % i, 'd': 'value %d' % i, 'v': 1, }),
+        now, now - random.randint(0, 3600 * 24), None, 3600 * 12, 1,
+    ) for i in range(count)])
+    db.commit()
+    return db
+
+
+def measure(name, count, lookup, duration=1.0):
+    lookups = 0
+    started = time.time()
+    while time.time() - started < duration:
+        lookup('%040x' % random.randint(0, count - 1))
+        lookups += 1
+    print('  %-8s %10d records  %10.1f lookups/sec' % (name, count, lookups / (time.time() - started)))
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000, ]
+    for count in sizes:
+        db_path = os.path.join(tempfile.mkdtemp(), 'db_0')
+        db = create_old_db(db_path, count)
+
+        def _old_lookup(key):
+            cur = db.execute('SELECT * FROM data WHERE key=:reqKey', {'reqKey': key, })
+            return cur.fetchone()
+
+        measure('old', count, _old_lookup)
+        db.close()
+        started = time.time()
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=db_path)
+        print('  migrated in %.2f sec' % (time.time() - started))
+        measure('indexed', count, store.getItem)
+        started = time.time()
+        expired = store.getExpiredKeys(int(time.time()))
+        store.removeItems(expired)
+        print('  expired %d records in %.2f sec' % (len(expired), time.time() - started))
+        for suffix in ('', '-wal', '-shm', ):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.rmdir(os.path.dirname(db_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# dhtroutingtable.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (dhtroutingtable.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures lookups/sec of the DHT routing tables depending on number of known contacts.
+
+Kademlia k-buckets normally keep only a few hundreds of contacts, so to be able to measure
+big tables all contacts are placed into one k-bucket directly.
+Three methods are compared for every size:
+
+    tree    : ``TreeRoutingTable.findCloseNodes()``, walks neighbour k-buckets, result is not sorted
+    sorted  : all contacts sorted with ``RoutingTable.distance()``, same way as ``Node`` ranks contacts
+    vector  : ``VectorRoutingTable.findCloseNodes()``, exact k closest contacts
+
+    python tests/experiments/dhtroutingtable.py [contacts count] [contacts count] ...
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from dht.entangled.kademlia import constants
+from dht.entangled.kademlia import routingtable
+from dht.entangled.kademlia.contact import Contact
+
+
+def random_id():
+    return '%040x' % random.getrandbits(160)
+
+
+def measure(name, count, lookup, duration=1.0):
+    lookups = 0
+    started = time.time()
+    while time.time() - started < duration:
+        lookup(random_id())
+        lookups += 1
+    print('  %-8s %10d contacts  %10.1f lookups/sec' % (name, count, lookups / (time.time() - started)))
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000, ]
+    k = constants.k
+    for count in sizes:
+        parent_id = random_id()
+        tree = routingtable.TreeRoutingTable(parent_id)
+        vector = routingtable.VectorRoutingTable(parent_id)
+        contacts = [Contact(random_id(), '127.0.0.1', 4000, None) for _ in range(count)]
+        # KBucket.addContact() is O(n), so populate a single big k-bucket directly
+        tree._buckets[0]._contacts.extend(contacts)
+        vector._buckets[0]._contacts.extend(contacts)
+        for contact in contacts:
+            vector._indexContact(contact)
+
+        def _sorted_lookup(key):
+            return sorted(contacts, key=lambda c: tree.distance(c.id, key))[:k]
+
+        measure('tree', len(contacts), lambda key: tree.findCloseNodes(key, k))
+        measure('sorted', len(contacts), _sorted_lookup)
+        measure('vector', vector.totalContacts(), lambda key: vector.findCloseNodes(key, k))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# raidmemory.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (raidmemory.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Memory benchmark of the handoff of one block from ``storage.backup`` to ``raid.make``:
+the old way (header concatenated to the serialized block, file read into an array,
+every chunk copied and byteswapped) and the current ``raid.make.do_in_memory()``.
+
+Every variant runs in a separate process and reports peak of Python allocations and peak RSS:
+
+    python tests/experiments/raidmemory.py [block size in MB] [ecc map]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+
+sys.path.append(os.path.abspath('.'))
+sys.path.append(os.path.abspath('..'))
+
+from raid import eccmap
+from raid import make
+from raid import raidutils
+
+
+def old_handoff(serializedblock, filename, eccmapname, targetDir):
+    fileno = os.open(filename, os.O_WRONLY | os.O_CREAT)
+    os.write(fileno, str(len(serializedblock)).encode() + b":" + serializedblock)
+    os.close(fileno)
+    myeccmap = eccmap.eccmap(eccmapname)
+    make.RoundupFile(filename, myeccmap.datasegments * 4)
+    wholefile = make.ReadBinaryFileAsArray(filename)
+    seglength = int(len(wholefile) * 4 / myeccmap.datasegments)
+    sds = {}
+    for seg_num, chunk in enumerate(raidutils.chunks(wholefile, int(seglength / 4))):
+        with open(os.path.join(targetDir, '1-%d-Data' % seg_num), 'wb') as f:
+            chunk_to_write = copy.copy(chunk)
+            chunk_to_write.byteswap()
+            sds[seg_num] = iter(chunk)
+            f.write(chunk_to_write)
+    psds_list = raidutils.build_parity(sds, int(seglength / 4), myeccmap.datasegments, myeccmap, myeccmap.paritysegments)
+    for PSegNum in psds_list:
+        with open(os.path.join(targetDir, '1-%d-Parity' % PSegNum), 'wb') as f:
+            f.write(psds_list[PSegNum])
+
+
+def new_handoff(serializedblock, filename, eccmapname, targetDir):
+    with open(filename, 'wb') as f:
+        f.write(str(len(serializedblock)).encode() + b":")
+        f.write(serializedblock)
+    make.do_in_memory(filename, eccmapname, 'F1', 1, targetDir)
+
+
+def run_variant(variant, block_size, eccmapname):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        serializedblock = os.urandom(block_size)
+        tracemalloc.start()
+        {'old': old_handoff, 'new': new_handoff}[variant](serializedblock, os.path.join(tmpdir, 'block.raid'), eccmapname, tmpdir)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print('%s %d %d' % (variant, peak, maxrss))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--variant':
+        run_variant(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+    block_size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 4 * 1024 * 1024
+    eccmapname = sys.argv[2] if len(sys.argv) > 2 else 'ecc/4x4'
+    print('block size: %d bytes, ecc map: %s' % (block_size, eccmapname))
+    print('%-8s %20s %16s' % ('variant', 'python peak MB', 'peak RSS MB'))
+    for variant in ('old', 'new'):
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--variant', variant, str(block_size), eccmapname])
+        _, peak, maxrss = out.decode().strip().split('\n')[-1].split(' ')
+        print('%-8s %20.2f %16.2f' % (variant, int(peak) / (1024.0 * 1024.0), int(maxrss) / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# raidparity.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (raidparity.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Benchmark of RAID parity building, compares speed of the old int-by-int
+``raidutils.build_parity()`` with ``raidutils.build_parity_block()`` for every ecc map.
+
+    python tests/experiments/raidparity.py [block size in MB]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+import array
+
+sys.path.append(os.path.abspath('.'))
+sys.path.append(os.path.abspath('..'))
+
+from raid import eccmap
+from raid import raidutils
+
+
+def old_parity(segments, myeccmap):
+    sds = {}
+    for seg_num, seg in enumerate(segments):
+        values = array.array('i', seg)
+        values.byteswap()
+        sds[seg_num] = iter(values)
+    psds_list = raidutils.build_parity(sds, int(len(segments[0]) / 4), myeccmap.datasegments, myeccmap, myeccmap.paritysegments)
+    return {PSegNum: psds_list[PSegNum].tobytes() for PSegNum in psds_list}
+
+
+def measure(method, *args, **kwargs):
+    t = time.time()
+    result = method(*args, **kwargs)
+    return result, time.time() - t
+
+
+def main():
+    block_size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 1024 * 1024
+    print('block size: %d bytes, numpy: %s' % (block_size, raidutils.numpy is not None))
+    print('%-12s %12s %12s %12s' % ('eccmap', 'old MB/s', 'int MB/s', 'numpy MB/s'))
+    for eccmapname in eccmap.EccMapNames():
+        myeccmap = eccmap.eccmap(eccmapname)
+        seglength = int(block_size / myeccmap.datasegments / 8) * 8
+        segments = [os.urandom(seglength) for _ in range(myeccmap.datasegments)]
+        total_mb = seglength * myeccmap.datasegments / (1024.0 * 1024.0)
+        old_result, old_time = measure(old_parity, segments, myeccmap)
+        int_result, int_time = measure(raidutils.build_parity_block, segments, myeccmap, use_numpy=False)
+        if int_result != old_result:
+            print('ERROR: int parity is not the same for %s' % eccmapname)
+        numpy_speed = 'n/a'
+        if raidutils.numpy is not None:
+            numpy_result, numpy_time = measure(raidutils.build_parity_block, segments, myeccmap, use_numpy=True)
+            if numpy_result != old_result:
+                print('ERROR: numpy parity is not the same for %s' % eccmapname)
+            numpy_speed = '%.2f' % (total_mb / max(numpy_time, 0.000001))
+        print('%-12s %12.2f %12.2f %12s' % (
+            eccmapname,
+            total_mb / max(old_time, 0.000001),
+            total_mb / max(int_time, 0.000001),
+            numpy_speed,
+        ))
+
+
+if __name__ == '__main__':
+    main()
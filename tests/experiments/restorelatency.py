@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# restorelatency.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (restorelatency.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+
+"""
+Measures how long ``storage.restore_worker`` takes to download and decode a backup
+when every supplier is far away. A backup is made locally first, then all pieces are
+moved into memory and served back by fake suppliers with given round trip time and
+bandwidth instead of ``io_throttle``. Restore is measured with different prefetch windows,
+then again when one supplier is 10 times slower than others:
+
+    python tests/experiments/restorelatency.py [file size in MB] [block size in MB] [RTT in ms]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet.defer import inlineCallbacks, Deferred
+
+from logs import lg
+
+from system import bpio
+from system import tmpfile
+
+from main import settings
+
+from automats import automat
+
+from crypt import key
+
+from userid import my_id
+
+from lib import packetid
+
+from stream import io_throttle
+
+from raid import eccmap
+from raid import raid_worker
+
+from storage import backup
+from storage import backup_tar
+from storage import restore_worker
+
+from tests.test_backup_restore import _some_priv_key, _some_identity_xml
+
+#------------------------------------------------------------------------------
+
+_BaseDir = '/tmp/.bitdust_restore_latency'
+_SourceDir = '/tmp/_restore_latency_folder'
+_BackupID = 'master$alice@127.0.0.1_8084:1/F1234'
+_EccMap = 'ecc/4x4'
+_SupplierBandwidth = 2 * 1024 * 1024  # bytes per second
+_SlowSupplier = 'http://127.0.0.1/supplier1.xml'
+
+
+class FakeSuppliers(object):
+    """
+    Replaces ``io_throttle`` functions used by ``restore_worker``.
+    Every supplier sends pieces one by one with given bandwidth, every piece arrives after one round trip.
+    Download times are reported to ``io_throttle.RegisterRequestResult()`` as ``file_down()`` does.
+    """
+
+    def __init__(self, pieces, rtt, slow_factor=1):
+        self.pieces = pieces
+        self.rtt = rtt
+        self.slow_factor = slow_factor
+        self.busy_until = {}
+        self.requests = {}
+
+    def QueueRequestFile(self, callOnReceived, creatorID, packetID, ownerID, remoteID):
+        if packetID in self.requests:
+            return False
+        now = time.time()
+        self.requests[packetID] = (remoteID, callOnReceived, now, )
+        payload = self.pieces.get(packetid.SplitPacketID(packetID)[1])
+        factor = self.slow_factor if remoteID == _SlowSupplier else 1
+        start = max(now + self.rtt * factor / 2.0, self.busy_until.get(remoteID, 0))
+        self.busy_until[remoteID] = start + len(payload or b'') * factor / float(_SupplierBandwidth)
+        reactor.callLater(self.busy_until[remoteID] + self.rtt * factor / 2.0 - now, self._deliver, callOnReceived, packetID, payload)  # @UndefinedVariable
+        return True
+
+    def _deliver(self, callOnReceived, packetID, payload):
+        if packetID not in self.requests:
+            return
+        remoteID, _, requested = self.requests.pop(packetID)
+        io_throttle.RegisterRequestResult(remoteID, time.time() - requested, len(payload or b''), payload is not None)
+        if payload is None:
+            callOnReceived(packetID, 'failed')
+            return
+        newpacket = type('Packet', (object, ), {})()
+        newpacket.PacketID = packetID
+        newpacket.Payload = payload
+        callOnReceived(newpacket, 'received')
+
+    def HasPacketInRequestQueue(self, supplierIDURL, packetID):
+        return packetID in self.requests
+
+    def GetRequestQueueLength(self, supplierIDURL):
+        return len([r for r in self.requests.values() if r[0] == supplierIDURL])
+
+    def CancelRequestFile(self, supplierIDURL, packetID):
+        if packetID not in self.requests:
+            return False
+        _, callOnReceived, requested = self.requests.pop(packetID)
+        io_throttle.RegisterRequestResult(supplierIDURL, time.time() - requested, 0, False, finished=False)
+        reactor.callLater(0, callOnReceived, packetID, 'cancelled')  # @UndefinedVariable
+        return True
+
+    def DeleteBackupRequests(self, backupName):
+        self.requests.clear()
+
+
+def cleanup():
+    for dirpath in (_BaseDir, _SourceDir, ):
+        if os.path.isdir(dirpath):
+            bpio.rmdir_recursive(dirpath, ignore_errors=True)
+
+
+def init():
+    cleanup()
+    lg.set_debug_level(0)
+    settings.init(base_dir=_BaseDir)
+    for dirname in ('metadata', 'logs', ):
+        if not os.path.isdir(os.path.join(_BaseDir, dirname)):
+            os.makedirs(os.path.join(_BaseDir, dirname))
+    automat.OpenLogFile(os.path.join(_BaseDir, 'logs', 'automats.log'))
+    bpio.WriteTextFile(settings.KeyFileName(), _some_priv_key)
+    bpio.WriteTextFile(settings.LocalIdentityFilename(), _some_identity_xml)
+    key.LoadMyKey()
+    my_id.loadLocalIdentity()
+    my_id.init()
+    tmpfile.init(temp_dir_path=os.path.join(_BaseDir, 'temp'))
+    os.makedirs(os.path.join(_BaseDir, 'backups', 'master$alice@127.0.0.1_8084', '1', 'F1234'))
+    os.makedirs(_SourceDir)
+    settings.config.conf().setBool('services/backups/keep-local-copies-enabled', False)
+
+
+def run_backup(block_size):
+    result = Deferred()
+    job = backup.backup(_BackupID, backup_tar.backuptardir_thread(_SourceDir), blockSize=block_size, ecc_map=eccmap.eccmap(_EccMap))
+    job.finishCallback = lambda bid, res: reactor.callLater(0.5, result.callback, res)  # @UndefinedVariable
+    job.automat('start')
+    return result
+
+
+def take_pieces():
+    pieces = {}
+    versiondir = os.path.join(settings.getLocalBackupsDir(), 'master$alice@127.0.0.1_8084', '1', 'F1234')
+    for filename in os.listdir(versiondir):
+        pieces[os.path.join('1', 'F1234', filename)] = bpio.ReadBinaryFile(os.path.join(versiondir, filename))
+        os.remove(os.path.join(versiondir, filename))
+    return pieces
+
+
+def run_restore(prefetch_blocks):
+    result = Deferred()
+    outfd, outfilename = tmpfile.make('restore', extension='.tar')
+    r = restore_worker.RestoreWorker(_BackupID, outfd, ecc_map=eccmap.eccmap(_EccMap), prefetch_blocks=prefetch_blocks)
+    r.MyDeferred.addCallback(lambda res: result.callback((res, outfd, outfilename)))
+    r.automat('init')
+    return result
+
+
+@inlineCallbacks
+def main():
+    file_size = int(float(sys.argv[1] if len(sys.argv) > 1 else 16) * 1024 * 1024)
+    block_size = int(float(sys.argv[2] if len(sys.argv) > 2 else 1) * 1024 * 1024)
+    rtt = float(sys.argv[3] if len(sys.argv) > 3 else 200) / 1000.0
+    init()
+    raid_worker.A('init')
+    try:
+        with open(os.path.join(_SourceDir, 'random_file'), 'wb') as fout:
+            fout.write(os.urandom(file_size))
+        res = yield run_backup(block_size)
+        print('backup %s, file=%d MB block=%d MB rtt=%d ms supplier bandwidth=%d KB/s' % (
+            res, file_size // (1024 * 1024), block_size // (1024 * 1024), int(rtt * 1000), _SupplierBandwidth // 1024))
+        fake = FakeSuppliers(take_pieces(), rtt)
+        for name in ('QueueRequestFile', 'HasPacketInRequestQueue', 'GetRequestQueueLength', 'CancelRequestFile', 'DeleteBackupRequests', ):
+            setattr(restore_worker.io_throttle, name, getattr(fake, name))
+        restore_worker.contactsdb.supplier = lambda num, customer_idurl=None: 'http://127.0.0.1/supplier%d.xml' % num
+        restore_worker.online_status.isOffline = lambda idurl: False
+        for slow_factor, prefetch_blocks in ((1, 0), (1, 2), (1, 4), (1, 8), (10, 0), (10, 4), ):
+            # pieces downloaded by previous run must not be reused
+            take_pieces()
+            fake.slow_factor = slow_factor
+            io_throttle._RequestStats.clear()
+            started = time.time()
+            res, outfd, outfilename = yield run_restore(prefetch_blocks)
+            dt = time.time() - started
+            os.close(outfd)
+            print('  prefetch %-2d %-9s %-6s %6.2f sec  %6.2f MB/s  %d bytes restored' % (
+                prefetch_blocks, 'slow x%d' % slow_factor if slow_factor > 1 else '', res, dt,
+                file_size / dt / (1024 * 1024), os.path.getsize(outfilename)))
+            tmpfile.throw_out(outfilename, 'restored')
+    finally:
+        raid_worker.A('shutdown')
+        reactor.callLater(1, reactor.stop)  # @UndefinedVariable
+
+
+if __name__ == '__main__':
+    reactor.callWhenRunning(main)  # @UndefinedVariable
+    reactor.run()  # @UndefinedVariable
+    automat.CloseLogFile()
+    tmpfile.shutdown()
+    settings.shutdown()
+    cleanup()
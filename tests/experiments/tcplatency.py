@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# tcplatency.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (tcplatency.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures round trip time of a small file sent over loopback TCP with ``tcp_node``:
+from the moment file was passed to ``tcp_node.send()`` until remote side confirmed
+it was received. Also reports how many reactor calls were executed per second
+while transport was idle.
+
+    python tests/experiments/tcplatency.py [files count] [file size]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from twisted.internet import reactor, defer, task  # @UnresolvedImport
+
+from logs import lg
+
+from system import tmpfile
+
+from main import settings
+
+from transport.tcp import tcp_node
+from transport.tcp import tcp_interface
+
+PORT = 17771
+
+
+class GateProxy(object):
+    """
+    Stands in place of the ``gateway`` and only confirms every call,
+    responses are delivered during next reactor iteration as the real gateway does.
+    """
+
+    def __init__(self):
+        self.transfers = 0
+
+    def callRemote(self, method, *args):
+        result = True
+        if method in ('register_file_sending', 'register_file_receiving', ):
+            self.transfers += 1
+            result = self.transfers
+        return task.deferLater(reactor, 0, lambda: result)
+
+
+def count_reactor_calls(duration):
+    calls = [0, ]
+    original = reactor.runUntilCurrent  # @UndefinedVariable
+
+    def _counted():
+        calls[0] += 1
+        return original()
+
+    reactor.runUntilCurrent = _counted  # @UndefinedVariable
+    d = task.deferLater(reactor, duration, lambda: None)
+
+    def _done(_):
+        reactor.runUntilCurrent = original  # @UndefinedVariable
+        return calls[0] / duration
+
+    d.addCallback(_done)
+    return d
+
+
+@defer.inlineCallbacks
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    settings.init(base_dir=tempfile.mkdtemp(prefix='tcplatency_'))
+    tmpfile.init(temp_dir_path=tempfile.mkdtemp(prefix='tcplatency_'))
+    tcp_interface.proxy(GateProxy())
+    # remote peer will see a different host in the "HELLO" packet, so sending is not blocked
+    tcp_node.receive({'idurl': b'http://127.0.0.1/latency.xml', 'tcp_port': PORT, 'host': b'127.0.0.2', })
+    tcp_node.start_streams()
+    filename = os.path.join(tempfile.mkdtemp(prefix='tcplatency_'), 'packet')
+    with open(filename, 'wb') as f:
+        f.write(os.urandom(size))
+    remote = ('127.0.0.1', PORT, )
+    try:
+        # first file opens the connection
+        yield tcp_node.send(filename, remote, 'warm up')
+        delays = []
+        for i in range(count):
+            started = time.time()
+            result = yield tcp_node.send(filename, remote, 'packet %d' % i)
+            if result[-2] != 'finished':
+                print('  failed: %r' % (result, ))
+                break
+            delays.append(time.time() - started)
+        delays.sort()
+        if delays:
+            print('  %-8s %8d bytes  avg %8.2f ms  median %8.2f ms  max %8.2f ms' % (
+                'rtt', size, 1000.0 * sum(delays) / len(delays), 1000.0 * delays[len(delays) // 2], 1000.0 * delays[-1]))
+        idle_calls = yield count_reactor_calls(3.0)
+        print('  %-8s %8.1f reactor iterations/sec' % ('idle', idle_calls))
+    except:
+        lg.exc()
+    finally:
+        tcp_node.stop_streams()
+        tcp_node.close_connections()
+        tcp_node.disconnect()
+        tmpfile.shutdown()
+        reactor.callLater(0.5, reactor.stop)  # @UndefinedVariable
+
+
+if __name__ == '__main__':
+    reactor.callWhenRunning(main)  # @UndefinedVariable
+    reactor.run()  # @UndefinedVariable
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# tcppackets.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (tcppackets.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures packets/sec passed over a loopback TCP connection the same way
+``packet_out``, ``tcp_stream`` and ``gateway.inbox()`` do it: packet is stored in a
+temporary file, read by the sender in chunks, written to incoming temporary file by receiver
+and read back. Compares regular temporary files with in-memory files from ``system.tmpfile``.
+
+    python tests/experiments/tcppackets.py [packet size] [packet size] ...
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+import struct
+import tempfile
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from twisted.internet import reactor, protocol, defer  # @UnresolvedImport
+from twisted.protocols import basic  # @UnresolvedImport
+
+from system import tmpfile
+
+PACKETS_COUNT = 2000
+CHUNK_SIZE = 2 ** 14
+
+
+class Receiver(basic.Int32StringReceiver):
+
+    MAX_LENGTH = 2 ** 24
+
+    def connectionMade(self):
+        self.inbox = {}
+
+    def stringReceived(self, data):
+        file_id, file_size = struct.unpack('ii', data[:8])
+        chunk = data[8:]
+        if file_id not in self.inbox:
+            if tmpfile.fits_memory(file_size):
+                self.inbox[file_id] = (tmpfile.make_memory('tcp-in', extension='.tcp'), None, bytearray())
+            else:
+                fd, filename = tmpfile.make('tcp-in', extension='.tcp')
+                self.inbox[file_id] = (filename, fd, None)
+        filename, fd, buf = self.inbox[file_id]
+        if buf is not None:
+            buf += chunk
+            received = len(buf)
+        else:
+            os.write(fd, chunk)
+            received = os.lseek(fd, 0, os.SEEK_CUR)
+        if received < file_size:
+            return
+        self.inbox.pop(file_id)
+        if buf is not None:
+            tmpfile.write_memory(filename, buf)
+        else:
+            os.close(fd)
+        data = tmpfile.read_file(filename)
+        tmpfile.throw_out(filename, 'received')
+        self.factory.on_packet(len(data))
+
+
+class ReceiverFactory(protocol.ServerFactory):
+
+    protocol = Receiver
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.received = 0
+        self.done = defer.Deferred()
+
+    def on_packet(self, size):
+        self.received += 1
+        if self.received == self.expected:
+            self.done.callback(self.received)
+
+
+def send_packets(transport, packet, count):
+    for file_id in range(1, count + 1):
+        if tmpfile.fits_memory(len(packet)):
+            filename = tmpfile.make_memory('outbox', packet, extension='.out')
+        else:
+            fd, filename = tmpfile.make('outbox', extension='.out')
+            os.write(fd, packet)
+            os.close(fd)
+        header = struct.pack('ii', file_id, tmpfile.file_size(filename))
+        fin = tmpfile.open_file(filename)
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = header + chunk
+            transport.write(struct.pack('!i', len(data)) + data)
+        fin.close()
+        tmpfile.throw_out(filename, 'sent')
+
+
+@defer.inlineCallbacks
+def measure(name, packet_size, memory_threshold):
+    tmpfile.configure_memory_files(max_file_size=memory_threshold)
+    factory = ReceiverFactory(PACKETS_COUNT)
+    port = reactor.listenTCP(0, factory, interface='127.0.0.1')  # @UndefinedVariable
+    client = yield protocol.ClientCreator(reactor, protocol.Protocol).connectTCP(  # @UndefinedVariable
+        '127.0.0.1', port.getHost().port)
+    packet = os.urandom(packet_size)
+    started = time.time()
+    send_packets(client.transport, packet, PACKETS_COUNT)
+    yield factory.done
+    duration = time.time() - started
+    print('  %-8s %8d bytes  %10.1f packets/sec' % (name, packet_size, PACKETS_COUNT / duration))
+    client.transport.loseConnection()
+    yield port.stopListening()
+
+
+@defer.inlineCallbacks
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [200, 2 * 1024, 16 * 1024, ]
+    tmpfile.init(temp_dir_path=tempfile.mkdtemp(prefix='tcppackets_'))
+    try:
+        for packet_size in sizes:
+            yield measure('files', packet_size, 0)
+            yield measure('memory', packet_size, 64 * 1024)
+    finally:
+        tmpfile.shutdown()
+        reactor.stop()  # @UndefinedVariable
+
+
+if __name__ == '__main__':
+    reactor.callWhenRunning(main)  # @UndefinedVariable
+    reactor.run()  # @UndefinedVariable
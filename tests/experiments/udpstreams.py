@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# udpstreams.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (udpstreams.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Measures throughput of a single ``udp_stream`` sending a file over a simulated link
+with given bandwidth, one way delay, random loss and a drop-tail queue.
+Two real ``UDPStream`` objects are connected with each other in memory,
+reactor and time used by ``udp_stream`` are replaced with a virtual clock,
+so results do not depend on the CPU and a few seconds of link time are simulated quickly.
+Legacy mode is compared with the congestion controlled mode.
+
+    python tests/experiments/udpstreams.py [file size]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import random
+
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from twisted.internet import task  # @UnresolvedImport
+
+from transport.udp import udp_stream
+
+LINKS = [
+    # name, bytes/sec, one way delay, loss
+    ('lan', 12500000, 0.001, 0.0),
+    ('wan', 2500000, 0.040, 0.005),
+    ('lossy', 2500000, 0.100, 0.02),
+]
+QUEUE_SIZE = 100  # packets
+MAX_SIMULATED_TIME = 600.0
+
+
+class Clock(object):
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def time(self):
+        return self.clock.seconds()
+
+
+class Link(object):
+
+    def __init__(self, clock, bandwidth, delay, loss):
+        self.clock = clock
+        self.bandwidth = float(bandwidth)
+        self.delay = delay
+        self.loss = loss
+        self.busy_until = 0.0
+        self.dropped = 0
+
+    def send(self, data, callback):
+        now = self.clock.seconds()
+        start = max(now, self.busy_until)
+        if (start - now) * self.bandwidth > QUEUE_SIZE * udp_stream.MAX_DATAGRAM_SIZE:
+            self.dropped += 1
+            return
+        self.busy_until = start + (len(data) + 28) / self.bandwidth
+        if random.random() < self.loss:
+            self.dropped += 1
+            return
+        self.clock.callLater(self.busy_until - now + self.delay, callback, BytesIO(data))
+
+
+class Session(object):
+
+    peer_id = 'peer'
+    min_rtt = None
+    datagram_size = udp_stream.MAX_DATAGRAM_SIZE
+
+
+class Peer(object):
+    """
+    Plays the role of ``udp_file_queue.FileQueue`` for a single stream.
+    """
+
+    def __init__(self, link):
+        self.session = Session()
+        self.link = link
+        self.remote_stream = None
+        self.done = False
+
+    def do_send_data(self, stream_id, outfile, output):
+        self.link.send(output, self.remote_stream.on_block_received)
+        return True
+
+    def do_send_ack(self, stream_id, infile, ack_data):
+        if self.remote_stream.mode == udp_stream.STREAM_MODE_CONGESTION:
+            self.link.send(ack_data, self.remote_stream.on_sack_received)
+        else:
+            self.link.send(ack_data, self.remote_stream.on_ack_received)
+        return True
+
+    def on_outbox_file_done(self, stream_id):
+        self.done = True
+
+    def on_inbox_file_done(self, stream_id):
+        pass
+
+    def on_timeout_sending(self, stream_id):
+        self.done = True
+
+    def on_timeout_receiving(self, stream_id):
+        pass
+
+    def on_close_stream(self, stream_id):
+        pass
+
+    def on_close_consumer(self, consumer):
+        pass
+
+
+class Consumer(object):
+
+    def __init__(self, size, chunk_size=None):
+        self.size = size
+        self.chunk_size = chunk_size
+        self.bytes_sent = 0
+        self.bytes_delivered = 0
+        self.bytes_received = 0
+        self.stream_callback = None
+        self.status = None
+        self.error_message = ''
+        self.timeout = False
+
+    def set_stream_callback(self, stream_callback):
+        self.stream_callback = stream_callback
+
+    def clear_stream_callback(self):
+        self.stream_callback = None
+
+    def is_done(self):
+        return self.bytes_delivered == self.size
+
+    def process(self):
+        while self.stream_callback and self.bytes_sent < self.size:
+            data = b'x' * min(self.chunk_size, self.size - self.bytes_sent)
+            try:
+                self.stream_callback(data)
+            except udp_stream.BufferOverflow:
+                break
+            self.bytes_sent += len(data)
+
+    def on_sent_raw_data(self, bytes_delivered):
+        self.bytes_delivered += bytes_delivered
+        if self.is_done():
+            return True
+        self.process()
+        return False
+
+    def on_received_raw_data(self, newdata):
+        self.bytes_received += len(newdata)
+        return self.bytes_received == self.size
+
+
+def measure(mode, link_info, file_size):
+    name, bandwidth, delay, loss = link_info
+    clock = task.Clock()
+    udp_stream.reactor = clock
+    udp_stream.time = Clock(clock)
+    random.seed(1)
+    sender = Peer(Link(clock, bandwidth, delay, loss))
+    receiver = Peer(Link(clock, bandwidth, delay, loss))
+    outfile = Consumer(file_size)
+    infile = Consumer(file_size)
+    stream_out = udp_stream.create(1, outfile, sender, mode)
+    stream_in = udp_stream.create(2, infile, receiver, mode)
+    outfile.chunk_size = stream_out.chunk_size
+    sender.remote_stream = stream_in
+    receiver.remote_stream = stream_out
+    outfile.process()
+    while not sender.done and clock.seconds() < MAX_SIMULATED_TIME:
+        calls = clock.getDelayedCalls()
+        if not calls:
+            break
+        clock.advance(max(0.0, min(c.getTime() for c in calls) - clock.seconds()))
+    duration = clock.seconds()
+    print('  %-8s %-6s %6.1f Mbit/s %5d ms %4.1f%% loss  %8.1f KB/s  %6.2f sec  %5d dropped  %s' % (
+        'legacy' if mode == udp_stream.STREAM_MODE_LEGACY else 'cubic',
+        name, bandwidth * 8 / 1000000.0, int(delay * 2000), loss * 100.0,
+        outfile.bytes_delivered / duration / 1024.0, duration,
+        sender.link.dropped, outfile.status or 'not finished', ))
+    for s in (stream_out, stream_in, ):
+        if s.state != 'CLOSED':
+            s.automat('close')
+    clock.advance(1)
+    udp_stream.stop_process_streams()
+
+
+def main():
+    file_size = int(sys.argv[1]) if len(sys.argv) > 1 else 2 * 1024 * 1024
+    for link_info in LINKS:
+        measure(udp_stream.STREAM_MODE_LEGACY, link_info, file_size)
+        measure(udp_stream.STREAM_MODE_CONGESTION, link_info, file_size)
+
+
+if __name__ == '__main__':
+    main()
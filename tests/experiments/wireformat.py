@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# wireformat.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (wireformat.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+Compares JSON and binary forms of ``signed.Packet`` and ``encrypted.Block``:
+bytes on wire, serialize and parse speed in MB/s of the payload.
+
+    python tests/experiments/wireformat.py [payload size in KB] [iterations]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(1, os.path.abspath('..'))
+
+from logs import lg
+
+from system import bpio
+
+from main import settings
+
+from crypt import key
+from crypt import signed
+from crypt import encrypted
+
+from userid import my_id
+
+from tests.test_backup_restore import _some_priv_key, _some_identity_xml
+
+
+def measure(name, payload_size, iterations, serialize, unserialize):
+    raw = serialize()
+    t = time.time()
+    for _ in range(iterations):
+        serialize()
+    dt_serialize = (time.time() - t) / iterations
+    t = time.time()
+    for _ in range(iterations):
+        unserialize(raw)
+    dt_parse = (time.time() - t) / iterations
+    mb = payload_size / (1024.0 * 1024.0)
+    print('  %-14s %10d bytes on wire (x%.2f)   serialize %8.1f MB/s   parse %8.1f MB/s' % (
+        name, len(raw), len(raw) / float(payload_size), mb / dt_serialize, mb / dt_parse))
+
+
+def main():
+    payload_size = int(float(sys.argv[1] if len(sys.argv) > 1 else 1024) * 1024)
+    iterations = int(sys.argv[2] if len(sys.argv) > 2 else 10)
+    base_dir = tempfile.mkdtemp()
+    lg.set_debug_level(0)
+    settings.init(base_dir=base_dir)
+    for dirname in ('metadata', 'logs', ):
+        if not os.path.isdir(os.path.join(base_dir, dirname)):
+            os.makedirs(os.path.join(base_dir, dirname))
+    bpio.WriteTextFile(settings.KeyFileName(), _some_priv_key)
+    bpio.WriteTextFile(settings.LocalIdentityFilename(), _some_identity_xml)
+    key.LoadMyKey()
+    my_id.loadLocalIdentity()
+
+    # random bytes is the worst case for JSON: every byte above 0x7F is escaped
+    payload = os.urandom(payload_size)
+    p = signed.Packet('Data', my_id.getIDURL(), my_id.getIDURL(), 'SomeID', payload, 'http://127.0.0.1:8084/bob.xml')
+    print('signed.Packet with %d bytes payload:' % payload_size)
+    measure('json', payload_size, iterations, lambda: p.Serialize(), signed.Unserialize)
+    measure('binary', payload_size, iterations, lambda: p.Serialize(binary=True), signed.Unserialize)
+
+    b = encrypted.Block(
+        CreatorID=my_id.getIDURL(),
+        BackupID='master$alice@127.0.0.1_8084:1/F1234',
+        BlockNumber=0,
+        SessionKey=key.NewSessionKey(session_key_type=key.SessionKeyType()),
+        SessionKeyType=key.SessionKeyType(),
+        LastBlock=True,
+        Data=payload,
+    )
+    print('encrypted.Block with %d bytes of data, %d bytes encrypted:' % (payload_size, len(b.EncryptedData)))
+    measure('json', payload_size, iterations, lambda: b.Serialize(), encrypted.Unserialize)
+    measure('binary', payload_size, iterations, lambda: b.Serialize(binary=True), encrypted.Unserialize)
+
+    key.ForgetMyKey()
+    my_id.forgetLocalIdentity()
+    settings.shutdown()
+    shutil.rmtree(base_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,8 @@ from system import tmpfile
 
 from crypt import key
 
+from lib import packetid
+
 from raid import eccmap
 from raid import raid_worker
 
@@ -26,6 +28,8 @@ from storage import backup_tar
 from storage import backup
 from storage import restore_worker
 
+from stream import io_throttle
+
 from userid import my_id
 
 
@@ -76,6 +80,60 @@ _some_identity_xml = """<?xml version="1.0" encoding="utf-8"?>
 </identity>"""
 
 
+class _RemoteSuppliers(object):
+    """
+    Serves pieces moved from local backups folder instead of ``io_throttle``, requests for pieces
+    listed in ``failing`` are answered with Fail. Incoming data switches restore worker into RECEIVING
+    state as ``data_receiver()`` does.
+    """
+
+    def __init__(self, pieces, failing):
+        self.pieces = pieces
+        self.failing = failing
+        self.requests = {}
+        self.failed = []
+        self.worker = None
+
+    def QueueRequestFile(self, callOnReceived, creatorID, packetID, ownerID, remoteID):
+        if packetID in self.requests:
+            return False
+        self.requests[packetID] = callOnReceived
+        reactor.callLater(0.05, self._deliver, packetID)  # @UndefinedVariable
+        return True
+
+    def _deliver(self, packetID):
+        callOnReceived = self.requests.pop(packetID, None)
+        if not callOnReceived:
+            return
+        if self.worker and self.worker.state == 'REQUESTED':
+            self.worker.event('data-receiving-started')
+        remotePath = packetid.SplitPacketID(packetID)[1]
+        if remotePath in self.failing or remotePath not in self.pieces:
+            self.failed.append(remotePath)
+            callOnReceived(packetID, 'failed')
+            return
+        newpacket = type('Packet', (object, ), {})()
+        newpacket.PacketID = packetID
+        newpacket.Payload = self.pieces[remotePath]
+        callOnReceived(newpacket, 'received')
+
+    def HasPacketInRequestQueue(self, supplierIDURL, packetID):
+        return packetID in self.requests
+
+    def GetRequestQueueLength(self, supplierIDURL):
+        return 0
+
+    def CancelRequestFile(self, supplierIDURL, packetID):
+        callOnReceived = self.requests.pop(packetID, None)
+        if not callOnReceived:
+            return False
+        reactor.callLater(0, callOnReceived, packetID, 'cancelled')  # @UndefinedVariable
+        return True
+
+    def DeleteBackupRequests(self, backupName):
+        self.requests.clear()
+
+
 class Test(TestCase):
 
     def setUp(self):
@@ -124,13 +182,56 @@ class Test(TestCase):
         os.remove('/tmp/random_file')
 
     def test_backup_restore(self):
+        return self._backup_restore(file_size=10, block_size=1024*1024)
+
+    def test_backup_restore_many_blocks(self):
+        # blocks are read, encrypted and RAID-ed at the same time
+        return self._backup_restore(file_size=300*1024, block_size=64*1024, min_blocks=4)
+
+    def test_backup_restore_compressed(self):
+        return self._backup_restore(file_size=300*1024, block_size=64*1024, min_blocks=2, compressible=True, compression='bz2')
+
+    def test_backup_restore_failed_data_request(self):
+        # supplier of the first Data piece answers Fail and Parity pieces must be requested instead
+        return self._backup_restore(file_size=300*1024, block_size=64*1024, min_blocks=4, failing_pieces=['%d-0-Data' % block_num for block_num in range(10)])
+
+    def test_backup_restore_failed_parity_request(self):
+        # first supplier is slow, so Parity piece of the second supplier is selected and it answers Fail,
+        # piece which failed while prefetching next blocks must not be requested again
+        self.patch(io_throttle, '_RequestStats', {})
+        for _ in range(3):
+            io_throttle.RegisterRequestResult('http://127.0.0.1/supplier0.xml', 1.0, 1024, True)
+            io_throttle.RegisterRequestResult('http://127.0.0.1/supplier1.xml', 0.05, 1024, True)
+        d = self._backup_restore(file_size=300*1024, block_size=64*1024, min_blocks=4, failing_pieces=['%d-1-Parity' % block_num for block_num in range(10)])
+        d.addCallback(lambda _: self.assertEqual(sorted(set(self.remote.failed)), sorted(self.remote.failed)))
+        d.addCallback(lambda _: self.assertTrue(len(self.remote.failed) >= 4))
+        return d
+
+    def _set_remote_suppliers(self, failing_pieces):
+        pieces = {}
+        versiondir = '/tmp/.bitdust_tmp/backups/master$alice@127.0.0.1_8084/1/F1234'
+        for filename in os.listdir(versiondir):
+            pieces['1/F1234/' + filename] = bpio.ReadBinaryFile(os.path.join(versiondir, filename))
+            os.remove(os.path.join(versiondir, filename))
+        remote = _RemoteSuppliers(pieces, ['1/F1234/' + filename for filename in failing_pieces])
+        for name in ('QueueRequestFile', 'HasPacketInRequestQueue', 'GetRequestQueueLength', 'CancelRequestFile', 'DeleteBackupRequests', ):
+            self.patch(io_throttle, name, getattr(remote, name))
+        self.patch(restore_worker.contactsdb, 'supplier', lambda num, customer_idurl=None: 'http://127.0.0.1/supplier%d.xml' % num)
+        self.patch(restore_worker.online_status, 'isOffline', lambda idurl: False)
+        self.remote = remote
+        return remote
+
+    def _backup_restore(self, file_size, block_size, min_blocks=1, compressible=False, compression=None, failing_pieces=None):
         test_ecc_map = 'ecc/2x2'
         test_done = Deferred()
         backupID = 'master$alice@127.0.0.1_8084:1/F1234'
         outputLocation = '/tmp/'
+        blocks_done = []
         with open('/tmp/_some_folder/random_file', 'wb') as fout:
-            fout.write(os.urandom(10))
-            # fout.write(os.urandom(100*1024))
+            if compressible:
+                fout.write((b'some text ' + os.urandom(6)) * (file_size // 16))
+            else:
+                fout.write(os.urandom(file_size))
         backupPipe = backup_tar.backuptardir_thread('/tmp/_some_folder/')
 
         def _extract_done(retcode, backupID, source_filename, output_location):
@@ -153,11 +254,15 @@ class Test(TestCase):
                 prefix=backupID.replace('@', '_').replace('.', '_').replace('/', '_').replace(':', '_') + '_',
             )
             r = restore_worker.RestoreWorker(backupID, outfd, KeyID=None, ecc_map=eccmap.eccmap(test_ecc_map))
+            if failing_pieces is not None:
+                self._set_remote_suppliers(failing_pieces).worker = r
             r.MyDeferred.addCallback(_restore_done, backupID, outfd, outfilename, outputLocation)
             r.automat('init')
 
         def _bk_done(bid, result):
             assert result == 'done'
+            assert len(blocks_done) >= min_blocks
+            assert sorted(blocks_done) == list(range(len(blocks_done)))
 
         def _bk_closed(job):
             if False:
@@ -167,8 +272,9 @@ class Test(TestCase):
 
         reactor.callWhenRunning(raid_worker.A, 'init')  # @UndefinedVariable
 
-        job = backup.backup(backupID, backupPipe, blockSize=1024*1024, ecc_map=eccmap.eccmap(test_ecc_map))
+        job = backup.backup(backupID, backupPipe, blockSize=block_size, ecc_map=eccmap.eccmap(test_ecc_map), compression=compression)
         job.finishCallback = _bk_done
+        job.blockResultCallback = lambda bid, block_num, result: blocks_done.append(block_num)
         job.addStateChangedCallback(lambda *a, **k: _bk_closed(job), oldstate=None, newstate='DONE')
         reactor.callLater(0.5, job.automat, 'start')  # @UndefinedVariable
 
@@ -0,0 +1,65 @@
+import threading
+
+from unittest import TestCase
+
+from storage import backup_tar
+
+
+class TestBytesLoop(TestCase):
+
+    def test_partial_reads(self):
+        p = backup_tar.BytesLoop(max_buffer_size=1024)
+        p.write(b'abcdef')
+        p.write(b'ghij')
+        self.assertEqual(p.read(4), b'abcd')
+        self.assertEqual(p.read(4), b'efgh')
+        self.assertEqual(p.state(), backup_tar.BYTES_LOOP_READY2READ)
+        self.assertEqual(p.read(), b'ij')
+        self.assertEqual(p.read(10), b'')
+        p.write(b'klm')
+        self.assertEqual(p.read(3), b'klm')
+
+    def test_producer_blocked_when_full(self):
+        p = backup_tar.BytesLoop(max_buffer_size=10)
+        written = []
+
+        def _produce():
+            for _ in range(4):
+                p.write(b'x' * 5)
+                written.append(5)
+
+        t = threading.Thread(target=_produce)
+        t.start()
+        t.join(0.3)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(len(written), 2)
+        self.assertEqual(p.read(5), b'xxxxx')
+        t.join(0.3)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(len(written), 3)
+        self.assertEqual(p.read(), b'x' * 10)
+        t.join(2)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(len(written), 4)
+        self.assertEqual(p.read(), b'x' * 5)
+
+    def test_close_releases_producer(self):
+        p = backup_tar.BytesLoop(max_buffer_size=4)
+        errors = []
+
+        def _produce():
+            try:
+                p.write(b'abcd')
+                p.write(b'efgh')
+            except IOError as exc:
+                errors.append(exc)
+
+        t = threading.Thread(target=_produce)
+        t.start()
+        t.join(0.3)
+        self.assertTrue(t.is_alive())
+        p.close()
+        t.join(2)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(p.state(), backup_tar.BYTES_LOOP_CLOSED)
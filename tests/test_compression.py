@@ -0,0 +1,30 @@
+import os
+
+from unittest import TestCase
+
+from lib import compression
+
+
+class TestCompression(TestCase):
+
+    def test_round_trip(self):
+        data = b'some text which repeats, ' * 10000
+        for codec in ('gz', 'bz2', 'xz', ):
+            used_codec, output = compression.compress(data, codec, level=1)
+            self.assertEqual(used_codec, codec)
+            self.assertLess(len(output), len(data))
+            self.assertEqual(compression.decompress(output, used_codec), data)
+
+    def test_incompressible(self):
+        data = os.urandom(512 * 1024)
+        self.assertFalse(compression.is_compressible(data))
+        self.assertEqual(compression.compress(data, 'bz2'), ('none', data))
+        self.assertTrue(compression.is_compressible(b'\x00' * 1024))
+        self.assertEqual(compression.compress(b'', 'gz'), ('none', b''))
+        self.assertEqual(compression.decompress(b'abc', 'none'), b'abc')
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            compression.compress(b'a' * 1024, 'zip')
+        with self.assertRaises(ValueError):
+            compression.decompress(b'abc', 'zip')
@@ -165,3 +165,26 @@ class Test(TestCase):
             raw1 = p1.Serialize()
             p2 = signed.Unserialize(raw1)
             self.assertTrue(p2.Valid())
+
+    def test_public_keys_cache(self):
+        key.InitMyKey()
+        key.ClearPublicKeysCache()
+        p1 = signed.Packet(
+            'Data',
+            my_id.getIDURL(),
+            my_id.getIDURL(),
+            'SomeID',
+            os.urandom(1024),
+            self.bob_ident.getIDURL(),
+        )
+        for _ in range(5):
+            self.assertTrue(p1.Valid())
+        info = key.PublicKeysCacheInfo()
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 4)
+        self.assertEqual(info['size'], 1)
+        self.assertTrue(key.ForgetPublicKey(my_id.getLocalIdentity().publickey))
+        self.assertFalse(key.ForgetPublicKey(my_id.getLocalIdentity().publickey))
+        self.assertTrue(p1.Valid())
+        self.assertEqual(key.PublicKeysCacheInfo()['misses'], 2)
+        key.ClearPublicKeysCache()
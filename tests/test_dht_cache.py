@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from unittest import TestCase
+
+from twisted.internet.defer import fail, succeed
+
+from lib import utime
+
+from dht import dht_service
+
+
+class TestDHTValueCache(TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.db_dir, 'cache.db')
+        dht_service.drop_counters()
+
+    def tearDown(self):
+        dht_service.shutdown_cache()
+        for filename in os.listdir(self.db_dir):
+            os.remove(os.path.join(self.db_dir, filename))
+        os.rmdir(self.db_dir)
+
+    def test_memory_and_disk(self):
+        c = dht_service.DHTValueCache(db_path=self.db_path, max_memory_records=2, max_disk_records=3)
+        for i in range(4):
+            c.set('key%d' % i, {'i': i, }, layer_id=1)
+        # only two latest records are in memory, but all are still on disk
+        self.assertEqual(list(c.records.keys()), [(1, 'key2'), (1, 'key3')])
+        self.assertEqual(dht_service.counter('dht_cache_eviction'), 2)
+        self.assertEqual(c.get('key0', layer_id=1)['v'], {'i': 0, })
+        self.assertIsNone(c.get('key0', layer_id=2))
+        self.assertEqual(c.count(1), 4)
+        self.assertEqual(c.count(2), 0)
+        c.close()
+        c = dht_service.DHTValueCache(db_path=self.db_path, max_memory_records=2, max_disk_records=3)
+        self.assertEqual(len(c.records), 0)
+        self.assertEqual(c.get('key3', layer_id=1)['v'], {'i': 3, })
+        c.set('key4', {'i': 4, }, layer_id=1, timestamp=utime.get_sec1970() - dht_service.CACHE_MAX_AGE - 10)
+        self.assertEqual(c.cleanup(), 2)
+        self.assertEqual(c.count(), 3)
+        self.assertIsNone(c.get('key4', layer_id=1))
+        c.close()
+
+    def test_missing_key(self):
+        dht_service.init_cache(self.db_path)
+        dht_service.cache().set_missing(dht_service.key_to_hash('some_key'), layer_id=0)
+        self.assertEqual(dht_service.cache().count(), 0)
+        results = []
+        dht_service.get_cached_json_value('some_key', layer_id=0).addCallback(results.append)
+        self.assertEqual(results, [[]])
+        self.assertEqual(dht_service.counter('dht_cache_missing_hit'), 1)
+        dht_service.store_cached_key(dht_service.key_to_hash('some_key'), {'a': 'b', }, layer_id=0)
+        dht_service.get_cached_json_value('some_key', layer_id=0).addCallback(results.append)
+        self.assertEqual(results[-1], {'a': 'b', })
+        self.assertEqual(dht_service.counter('dht_cache_hit'), 1)
+
+    def test_failed_lookup_keeps_record(self):
+        dht_service.init_cache(self.db_path)
+        hash_key = dht_service.key_to_hash('some_key')
+        dht_service.store_cached_key(hash_key, {'a': 'b', }, layer_id=0)
+        original_get_value = dht_service.get_value
+        errors = []
+        try:
+            dht_service.get_value = lambda key, layer_id=0: fail(Exception('timeout'))
+            dht_service.get_json_value('some_key', layer_id=0).addErrback(errors.append)
+            dht_service.get_value = lambda key, layer_id=0: succeed({'values': [('not a json', 1), ], })
+            dht_service.get_json_value('some_key', layer_id=0).addErrback(errors.append)
+        finally:
+            dht_service.get_value = original_get_value
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(dht_service.cache().get(hash_key, layer_id=0)['v'], {'a': 'b', })
+        #--- not found result does not remove a valid record
+        dht_service.on_json_response_to_be_cached([], 'some_key', layer_id=0)
+        self.assertEqual(dht_service.cache().get(hash_key, layer_id=0)['v'], {'a': 'b', })
+        self.assertEqual(dht_service.cache().count(), 1)
+
+    def test_not_found_lookup(self):
+        dht_service.init_cache(self.db_path)
+        hash_key = dht_service.key_to_hash('other_key')
+        original_get_value = dht_service.get_value
+        results = []
+        try:
+            dht_service.get_value = lambda key, layer_id=0: succeed([])
+            dht_service.get_json_value('other_key', layer_id=0).addCallback(results.append)
+        finally:
+            dht_service.get_value = original_get_value
+        self.assertEqual(results, [[]])
+        self.assertIsNone(dht_service.cache().get(hash_key, layer_id=0)['v'])
+        dht_service.cache().forget_missing(hash_key, layer_id=0)
+        self.assertIsNone(dht_service.cache().get(hash_key, layer_id=0))
@@ -0,0 +1,71 @@
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+
+from unittest import TestCase
+
+from dht.entangled.kademlia import datastore
+
+
+class TestSQLiteDataStore(TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(prefix='dht_db_')
+        os.close(fd)
+        os.remove(self.db_path)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm', ):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_set_get_expire(self):
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=self.db_path)
+        store.setItem('key1', 'value1', 100, 100, 'node1', expireSeconds=50)
+        store.setItem('key2', {'a': 1}, 100, 100, 'node1', expireSeconds=500)
+        store.setItem('key1', 'value1.1', 120, 100, 'node1', expireSeconds=50)
+        self.assertEqual(len(store), 2)
+        self.assertIn('key1', store)
+        self.assertIn(b'key1', store)
+        self.assertNotIn('key3', store)
+        self.assertEqual(store['key1'], 'value1.1')
+        self.assertEqual(store.revision('key1'), 2)
+        self.assertEqual(store.lastPublished('key1'), 120)
+        item = store.getItem('key2')
+        self.assertEqual(item['value'], {'a': 1})
+        self.assertEqual(item['revision'], 1)
+        self.assertEqual(sorted([i['key'] for i in store.getAllItems()]), ['key1', 'key2'])
+        self.assertEqual(store.getExpiredKeys(140), [])
+        self.assertEqual(store.getExpiredKeys(151), ['key1'])
+        self.assertEqual(store.getExpiredKeys(151, skipKeys=('key1', )), [])
+        store.removeItems(store.getExpiredKeys(601))
+        self.assertEqual(len(store), 0)
+
+    def test_migrate_legacy_table(self):
+        db = sqlite3.connect(self.db_path)
+        db.execute('CREATE TABLE data(key, value, lastPublished, originallyPublished, originalPublisherID, expireSeconds, revision)')
+        for key, value, revision in [('key1', 'old', 1), ('key2', 'value2', 1), ('key1', 'new', 2), ]:
+            db.execute('INSERT INTO data VALUES (?, ?, ?, ?, ?, ?, ?)', (
+                key, json.dumps({'k': key, 'd': value, 'v': 1, }), 100, 100, None, 50, revision, ))
+        db.commit()
+        db.close()
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=self.db_path)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store['key1'], 'new')
+        self.assertEqual(store.revision('key1'), 2)
+        self.assertEqual(sorted(store.getExpiredKeys(151)), ['key1', 'key2'])
+        self.assertFalse(store.migrate())
+        # keys are unique now
+        store.setItem('key2', 'value2.1', 110, 100, None)
+        self.assertEqual(len(store), 2)
+
+    def test_access_from_another_thread(self):
+        store = datastore.SQLiteVersionedJsonDataStore(dbFile=self.db_path)
+        store.setItem('key1', 'value1', 100, 100, 'node1')
+        results = []
+        t = threading.Thread(target=lambda: results.append(store.getAllItems()))
+        t.start()
+        t.join()
+        self.assertEqual(results[0][0]['value'], 'value1')
@@ -0,0 +1,90 @@
+import time
+import random
+
+from twisted.trial.unittest import TestCase
+from twisted.internet import defer, reactor, task
+
+from dht.entangled.kademlia import constants
+from dht.entangled.kademlia.node import MultiLayerNode
+from dht.entangled.kademlia.contact import LayeredContact
+
+
+def _random_id():
+    return '%040x' % random.getrandbits(160)
+
+
+class _Response(object):
+
+    def __init__(self, nodeID, response):
+        self.nodeID = nodeID
+        self.response = response
+
+
+class _FakeProtocol(object):
+
+    def __init__(self, node):
+        self.node = node
+        self.calls = []
+
+    def sendRPC(self, contact, method, args, rawResponse=False, layerID=0, **kwargs):
+        d = defer.Deferred()
+        self.calls.append((contact, method, args[0], d, ))
+        return d
+
+    def respond(self, num, response):
+        contact, _, _, d = self.calls[num]
+        d.callback((_Response(contact.id, response), (contact.address, contact.port, ), ))
+
+
+class TestIterativeFind(TestCase):
+
+    def setUp(self):
+        self.node = MultiLayerNode(networkProtocol=_FakeProtocol)
+        self.protocol = self.node._protocol
+        for port in range(constants.k):
+            self.node.addContact(LayeredContact(_random_id(), '127.0.0.1', 5000 + port, self.protocol, layerID=0), layerID=0)
+
+    def test_coalesce_and_quorum(self):
+        key = _random_id()
+        started = time.time()
+        d1 = self.node.iterativeFindValue(key)
+        d2 = self.node.iterativeFindValue(key)
+        # only one set of RPCs was sent for both lookups
+        self.assertEqual(len(self.protocol.calls), constants.alpha)
+        self.assertEqual(set(c[2] for c in self.protocol.calls), set([key, ]))
+        # first probe has the value and the rest are still running
+        self.protocol.respond(0, {key: 'value', 'revision': 1, })
+
+        def _check(results):
+            self.assertLess(time.time() - started, constants.iterativeLookupDelay)
+            self.assertEqual(results[0][1][key], 'value')
+            self.assertEqual(results[1][1][key], 'value')
+            self.assertIsNot(results[0][1], results[1][1])
+            self.assertEqual(self.node._activeLookups, {})
+            self.assertEqual(len(self.protocol.calls), constants.alpha)
+        dl = defer.DeferredList([d1, d2, ])
+        dl.addCallback(_check)
+        return dl
+
+    def test_per_layer_parallel_calls(self):
+        self.node.setParallelCalls(0, 2)
+        started = time.time()
+        d = self.node.iterativeFindNode(_random_id())
+        self.assertEqual(len(self.protocol.calls), 2)
+        self.protocol.respond(0, [])
+        self.protocol.respond(1, [])
+
+        def _next_round(_):
+            # next iteration was started right away, without waiting for the fixed delay
+            self.assertEqual(len(self.protocol.calls), 4)
+            self.protocol.respond(2, [])
+            self.protocol.respond(3, [])
+            return d
+
+        def _check(result):
+            self.assertLess(time.time() - started, constants.iterativeLookupDelay)
+            self.assertEqual(len(result), constants.k)
+        waiter = task.deferLater(reactor, 0, lambda: None)
+        waiter.addCallback(_next_round)
+        waiter.addCallback(_check)
+        return waiter
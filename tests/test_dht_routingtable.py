@@ -0,0 +1,59 @@
+import random
+
+from unittest import TestCase
+
+from twisted.internet import defer
+
+from dht.entangled.kademlia import constants
+from dht.entangled.kademlia import datastore
+from dht.entangled.kademlia import routingtable
+from dht.entangled.kademlia.node import MultiLayerNode
+from dht.entangled.kademlia.contact import Contact
+from dht.entangled.kademlia.protocol import TimeoutError
+
+
+class _DeadProtocol(object):
+
+    def sendRPC(self, contact, method, args, **kwargs):
+        # every pinged contact is not responding and must be replaced
+        return defer.fail(TimeoutError(contact.id))
+
+
+def _random_id():
+    return '%040x' % random.getrandbits(160)
+
+
+class TestVectorRoutingTable(TestCase):
+
+    def test_find_close_nodes(self):
+        rt = routingtable.VectorRoutingTable(_random_id())
+        for _ in range(500):
+            rt.addContact(Contact(_random_id(), '127.0.0.1', 4000, _DeadProtocol()))
+        contacts = []
+        for bucket in rt._buckets:
+            contacts.extend(bucket._contacts)
+        self.assertEqual(rt.totalContacts(), len(contacts))
+        for _ in range(20):
+            key = _random_id()
+            expected = sorted(contacts, key=lambda c: rt.distance(c.id, key))
+            self.assertEqual(rt.findCloseNodes(key, constants.k), expected[:constants.k])
+            self.assertEqual(rt.findCloseNodes(key, constants.k, _rpcNodeID=expected[0].id), expected[1:constants.k + 1])
+            self.assertEqual(rt.findCloseNodes(key, len(contacts) + 10), expected)
+        for contact in contacts[:len(contacts) // 2]:
+            rt.removeContact(contact.id)
+        self.assertRaises(ValueError, rt.getContact, contacts[0].id)
+        self.assertEqual(rt.getContact(contacts[-1].id), contacts[-1])
+        key = _random_id()
+        expected = sorted(contacts[len(contacts) // 2:], key=lambda c: rt.distance(c.id, key))
+        self.assertEqual(rt.findCloseNodes(key, constants.k), expected[:constants.k])
+
+    def test_select_per_layer(self):
+        node = MultiLayerNode(routingTableClasses={1: routingtable.VectorRoutingTable, })
+        node.createLayer(1, dataStore=datastore.DictDataStore())
+        node.createLayer(2, dataStore=datastore.DictDataStore(), routingTableClass=routingtable.VectorRoutingTable)
+        node.createLayer(3, dataStore=datastore.DictDataStore())
+        self.assertIsInstance(node._routingTables[0], routingtable.TreeRoutingTable)
+        self.assertNotIsInstance(node._routingTables[0], routingtable.VectorRoutingTable)
+        self.assertIsInstance(node._routingTables[1], routingtable.VectorRoutingTable)
+        self.assertIsInstance(node._routingTables[2], routingtable.VectorRoutingTable)
+        self.assertNotIsInstance(node._routingTables[3], routingtable.VectorRoutingTable)
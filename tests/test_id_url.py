@@ -2,6 +2,7 @@ import os
 import tempfile
 import unittest
 from unittest import TestCase
+from unittest import mock
 
 
 from main import settings
@@ -522,6 +523,38 @@ class TestIDURL(TestCase):
         self.assertEqual(id_url.field(hans2).original(), strng.to_bin(hans2))
         self.assertEqual(id_url.field(hans3).original(), strng.to_bin(hans3))
 
+    def test_history_index(self):
+        self._cache_identity('hans1')
+        self._cache_identity('hans2')
+        self._cache_identity('frank')
+        known_idurls = dict(id_url.known())
+        merged_idurls = {k: dict(v) for k, v in id_url.merged().items()}
+        history_dir = id_url._IdentityHistoryDir
+        id_url.shutdown()
+        self.assertTrue(os.path.isfile(os.path.join(history_dir, id_url.HISTORY_INDEX_FILENAME)))
+        verified = []
+        original_valid = identity.identity.Valid
+
+        def _counting_valid(id_obj):
+            verified.append(id_obj.getIDURL(as_original=True))
+            return original_valid(id_obj)
+
+        with mock.patch.object(identity.identity, 'Valid', _counting_valid):
+            id_url._IdentityHistoryDir = history_dir
+            id_url.init()
+            self.assertEqual(verified, [])
+            self.assertEqual(id_url.known(), known_idurls)
+            self.assertEqual(id_url.merged(), merged_idurls)
+            self.assertEqual(id_url.field(hans1).to_text(), hans2)
+            id_url.shutdown()
+            frank_dir = [d for d in os.listdir(history_dir) if d.startswith('frank@')][0]
+            frank_path = os.path.join(history_dir, frank_dir, '0')
+            os.utime(frank_path, (1, 1))
+            id_url._IdentityHistoryDir = history_dir
+            id_url.init()
+            self.assertEqual(verified, [strng.to_bin(frank_1), ])
+            self.assertEqual(id_url.known(), known_idurls)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+from stream import io_throttle
+
+
+class TestRequestStats(TestCase):
+
+    def setUp(self):
+        io_throttle._RequestStats.clear()
+
+    def tearDown(self):
+        io_throttle._RequestStats.clear()
+
+    def test_percentile(self):
+        alice = 'http://127.0.0.1/alice.xml'
+        bob = 'http://127.0.0.1/bob.xml'
+        self.assertEqual(io_throttle.GetRequestTimePercentile(alice), io_throttle._DefaultRequestTime)
+        for i in range(10):
+            io_throttle.RegisterRequestResult(alice, 0.1 * (i + 1), 1000, True)
+        io_throttle.RegisterRequestResult(alice, 5.0, 0, False)
+        self.assertAlmostEqual(io_throttle.GetRequestTimePercentile(alice, 0.5), 0.6)
+        self.assertAlmostEqual(io_throttle.GetRequestTimePercentile(alice, 0.9), 1.0)
+        #--- unknown supplier is compared with all others
+        self.assertAlmostEqual(io_throttle.GetRequestTimePercentile(bob, 0.5), 0.6)
+        stats = io_throttle.GetRequestStats(alice)
+        self.assertEqual(stats['received'], 10)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(io_throttle.GetRequestStats(bob), {})
+
+    def test_cancelled_request(self):
+        alice = 'http://127.0.0.1/alice.xml'
+        for _ in range(3):
+            io_throttle.RegisterRequestResult(alice, 3.0, 0, False, finished=False)
+        self.assertEqual(io_throttle.GetRequestTimePercentile(alice), 3.0)
+        self.assertEqual(io_throttle.GetRequestStats(alice)['received'], 0)
+        self.assertEqual(io_throttle.GetRequestStats(alice)['failed'], 0)
+
+
+class TestPacketsQueue(TestCase):
+
+    def test_backup_index(self):
+        q = io_throttle.PacketsQueue()
+        q.append('master$alice@127.0.0.1_8084:1/F1/0-0-Data', 'a')
+        q.append('master$alice@127.0.0.1_8084:1/F1/0-1-Data', 'b')
+        q.append('master$alice@127.0.0.1_8084:1/F2/0-0-Data', 'c')
+        self.assertEqual(len(q), 3)
+        self.assertEqual([i for _, i in q.head(2)], ['a', 'b', ])
+        self.assertEqual(sorted(q.backup_keys('master$alice@127.0.0.1_8084:1/F1')), [
+            'master$alice@127.0.0.1_8084:1/F1/0-0-Data', 'master$alice@127.0.0.1_8084:1/F1/0-1-Data', ])
+        #--- not exact backup ID is matched as a sub-string, same as before
+        self.assertEqual(len(q.backup_keys('alice@127.0.0.1_8084:1/F')), 3)
+        self.assertEqual(len(q.backup_keys(None)), 3)
+        self.assertEqual(q.remove('master$alice@127.0.0.1_8084:1/F1/0-0-Data'), 'a')
+        self.assertEqual(q.remove('master$alice@127.0.0.1_8084:1/F1/0-1-Data'), 'b')
+        self.assertFalse(q.has_backup('master$alice@127.0.0.1_8084:1/F1'))
+        self.assertTrue(q.has_backup('master$alice@127.0.0.1_8084:1/F2'))
+        self.assertEqual(q.keys(), ['master$alice@127.0.0.1_8084:1/F2/0-0-Data', ])
+        with self.assertRaises(Exception):
+            q.append('master$alice@127.0.0.1_8084:1/F2/0-0-Data', 'd')
+
+
+class TestTransferWindow(TestCase):
+
+    def test_fast_supplier(self):
+        w = io_throttle.TransferWindow(initial=4, maximum=32)
+        for _ in range(50):
+            w.on_success(0.1, queued=w.limit())
+        self.assertEqual(w.limit(), 32)
+        w.on_failure()
+        self.assertEqual(w.limit(), 16)
+
+    def test_slow_supplier(self):
+        w = io_throttle.TransferWindow(initial=4, maximum=32)
+        w.on_success(0.5, queued=4)
+        self.assertEqual(w.limit(), 5)
+        #--- packets are waiting in the supplier's queue, window is not growing anymore
+        for i in range(50):
+            w.on_success(0.5 * (i + 2), queued=w.limit())
+        self.assertLessEqual(w.limit(), 4)
+        self.assertGreaterEqual(w.limit(), 2)
+
+    def test_not_used_window(self):
+        w = io_throttle.TransferWindow(initial=4, maximum=32)
+        for _ in range(10):
+            w.on_success(0.1, queued=1)
+        self.assertEqual(w.limit(), 4)
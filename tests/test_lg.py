@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from logs import lg
+
+
+class TestLogWriter(TestCase):
+
+    def setUp(self):
+        self.logs_dir = tempfile.mkdtemp(prefix='logs_')
+        self.debug_level = lg.get_debug_level()
+        self.no_output = lg._NoOutput
+        lg.set_debug_level(10)
+        lg._NoOutput = True
+
+    def tearDown(self):
+        lg.close_log_file()
+        lg.set_debug_level(self.debug_level)
+        lg._NoOutput = self.no_output
+        shutil.rmtree(self.logs_dir, ignore_errors=True)
+
+    def _read(self, filename):
+        with open(os.path.join(self.logs_dir, filename)) as f:
+            return f.read()
+
+    def test_buffered_lines_written(self):
+        lg.open_log_file(os.path.join(self.logs_dir, 'main.log'))
+        for i in range(50):
+            lg.out(4, 'line %d' % i)
+            lg.out(4, 'packet %d' % i, log_name='packets')
+        self.assertTrue(lg.log_writer_stats())
+        lg.close_log_file()
+        lines = self._read('main.log').splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertTrue(lines[-1].endswith('line 49'))
+        self.assertEqual(len(self._read('packets.log').splitlines()), 50)
+        self.assertEqual(lg.log_writer_stats(), {})
+
+    def test_drop_and_rotate(self):
+        lg.open_log_file(os.path.join(self.logs_dir, 'main.log'), async_writer=False)
+        lg.start_log_writer(max_lines=10, flush_interval=60, rotate_bytes=500, rotate_backups=2)
+        for i in range(20):
+            lg.out(4, 'line %d' % i)
+        stats = lg.log_writer_stats()
+        self.assertEqual(stats['dropped'], 10)
+        lg.stop_log_writer()
+        # every batch is bigger than the limit, so the file is rotated after each of them
+        for batch in range(3):
+            lg.start_log_writer(max_lines=1000, flush_interval=60, rotate_bytes=500, rotate_backups=2)
+            for i in range(20):
+                lg.out(4, 'another line %d' % (batch * 20 + i))
+            lg.stop_log_writer()
+        lg.out(4, 'another line 60')
+        lg.close_log_file()
+        self.assertTrue(os.path.isfile(os.path.join(self.logs_dir, 'main.log.1')))
+        self.assertTrue(os.path.isfile(os.path.join(self.logs_dir, 'main.log.2')))
+        self.assertFalse(os.path.isfile(os.path.join(self.logs_dir, 'main.log.3')))
+        self.assertTrue(self._read('main.log').splitlines()[-1].endswith('another line 60'))
@@ -0,0 +1,80 @@
+import time
+
+from twisted.trial.unittest import TestCase
+from twisted.internet.defer import DeferredList
+
+from transport import packet_in
+
+
+class TestPacketsVerifier(TestCase):
+
+    def tearDown(self):
+        self.verifier.stop()
+
+    def test_same_sender_ordering(self):
+        self.verifier = packet_in.PacketsVerifier(threads_count=4, max_pending=100)
+        self.verifier.start()
+        reported = []
+        dl = []
+
+        def _verify(num, delay):
+            time.sleep(delay)
+            return num != 3
+
+        # first packets of "alice" take longer to verify, but still must be reported first
+        for num, delay in enumerate([0.3, 0.2, 0.1, 0.0, 0.0]):
+            d = self.verifier.submit(b'alice', _verify, num, delay)
+            d.addCallback(lambda result, num=num: reported.append((b'alice', num, result)))
+            dl.append(d)
+        d = self.verifier.submit(b'bob', _verify, 10, 0.0)
+        d.addCallback(lambda result: reported.append((b'bob', 10, result)))
+        dl.append(d)
+
+        def _check(_):
+            self.assertEqual([r for r in reported if r[0] == b'alice'], [
+                (b'alice', 0, True), (b'alice', 1, True), (b'alice', 2, True), (b'alice', 3, False), (b'alice', 4, True),
+            ])
+            # another sender was not blocked by slow packets of "alice"
+            self.assertLess(reported.index((b'bob', 10, True)), reported.index((b'alice', 0, True)))
+            stats = self.verifier.stats()
+            self.assertEqual(stats['pending'], 0)
+            self.assertEqual(stats['senders'], 0)
+            self.assertEqual(stats['verified'], 5)
+            self.assertEqual(stats['invalid'], 1)
+            self.assertEqual(stats['inline'], 0)
+
+        return DeferredList(dl).addCallback(_check)
+
+    def test_backpressure(self):
+        self.verifier = packet_in.PacketsVerifier(threads_count=1, max_pending=2)
+        self.verifier.start()
+        reported = []
+        dl = []
+
+        def _verify(num):
+            time.sleep(0.05)
+            return True
+
+        for num in range(5):
+            d = self.verifier.submit(b'alice', _verify, num)
+            d.addCallback(lambda result, num=num: reported.append(num))
+            dl.append(d)
+        # queue is full, last packets were verified in the main thread but still wait for previous ones
+        self.assertEqual(self.verifier.stats()['inline'], 3)
+        self.assertEqual(self.verifier.stats()['max_pending_seen'], 5)
+        self.assertEqual(reported, [])
+
+        def _check(_):
+            self.assertEqual(reported, [0, 1, 2, 3, 4])
+            self.assertEqual(self.verifier.stats()['pending'], 0)
+
+        return DeferredList(dl).addCallback(_check)
+
+    def test_no_threads(self):
+        self.verifier = packet_in.PacketsVerifier(threads_count=0, max_pending=10)
+        self.verifier.start()
+        reported = []
+        self.verifier.submit(b'alice', lambda: 1 / 0).addCallback(reported.append)
+        self.verifier.submit(b'alice', lambda: True).addCallback(reported.append)
+        self.assertEqual(reported, [False, True])
+        self.assertEqual(self.verifier.stats()['inline'], 2)
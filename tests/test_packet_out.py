@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+from transport import packet_out
+
+from userid import my_id
+
+
+class _FakePacket(object):
+
+    def __init__(self, packet_id):
+        self.PacketID = packet_id
+
+
+class _FakePacketOut(object):
+
+    def __init__(self, packet_id, remote_idurl):
+        self.outpacket = _FakePacket(packet_id)
+        self.remote_idurl = remote_idurl
+        self.remote_idurl_key = None
+        self.filename = None
+        self.items = []
+
+
+class TestOutboxQueue(TestCase):
+
+    def test_indexes(self):
+        q = packet_out.OutboxQueue()
+        p1 = _FakePacketOut('Abc:1', b'http://127.0.0.1:8084/alice.xml')
+        p2 = _FakePacketOut('abc:1', b'http://127.0.0.1:8084/bob.xml')
+        p3 = _FakePacketOut('xyz:2', b'http://127.0.0.1:8084/bob.xml')
+        for p in (p1, p2, p3, ):
+            q.append(p)
+        self.assertEqual(len(q), 3)
+        self.assertEqual(list(q), [p1, p2, p3])
+        self.assertEqual(q.by_packet_id('ABC:1'), [p1, p2])
+        self.assertEqual(q.by_packet_id('xyz:2', 'abc:1'), [p1, p2, p3])
+        self.assertEqual(q.by_packet_id('none'), [])
+        self.assertEqual(q.remote_idurls[b'http://127.0.0.1:8084/bob.xml'], {p2: None, p3: None})
+
+        p2.filename = '/tmp/outbox/123.out'
+        q.index_filename(p2)
+        self.assertEqual(q.by_filename('/tmp/outbox/123.out'), [p2])
+
+        i1 = packet_out.WorkItem('tcp', b'127.0.0.1:7771', 100)
+        i2 = packet_out.WorkItem('udp', b'127.0.0.1:8882', 100)
+        p2.items.extend([i1, i2])
+        i1.transfer_id = 55
+        q.index_item(p2, i1)
+        self.assertEqual(q.by_transfer_id(55), (p2, i1))
+        self.assertEqual(q.by_transfer_id(66), (None, None))
+        q.forget_item(p2, i1)
+        self.assertEqual(q.by_transfer_id(55), (None, None))
+        q.index_item(p2, i1)
+
+        q.remove(p2)
+        self.assertNotIn(p2, q)
+        self.assertEqual(list(q), [p1, p3])
+        self.assertEqual(q.by_packet_id('abc:1'), [p1])
+        self.assertEqual(q.by_filename('/tmp/outbox/123.out'), [])
+        self.assertEqual(q.by_transfer_id(55), (None, None))
+        self.assertEqual(q.remote_idurls[b'http://127.0.0.1:8084/bob.xml'], {p3: None})
+        self.assertRaises(ValueError, q.remove, p2)
+
+        q.remove(p1)
+        q.remove(p3)
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.packet_ids, {})
+        self.assertEqual(q.remote_idurls, {})
+
+    def test_canonical_packet_id(self):
+        packet_out._MyRotatedCustomers = (my_id.getKnownIDURLsVersion(), 'alice@new-server.com_8084', set([
+            'alice@new-server.com_8084', 'alice@old-server.com_8084',
+        ]), )
+        try:
+            self.assertEqual(packet_out.canonical_packet_id('master$alice@old-server.com_8084:1/2/F20200101/3-4-Data'),
+                             'master$alice@new-server.com_8084:1/2/f20200101/3-4-data')
+            self.assertEqual(packet_out.canonical_packet_id('alice@Old-Server.com_8084:1/2'), 'alice@new-server.com_8084:1/2')
+            self.assertEqual(packet_out.canonical_packet_id('master$bob@old-server.com_8084:1/2'), 'master$bob@old-server.com_8084:1/2')
+            self.assertEqual(packet_out.canonical_packet_id('Identity:12345'), 'identity:12345')
+            q = packet_out.OutboxQueue()
+            p1 = _FakePacketOut('master$alice@old-server.com_8084:1/2/F20200101/3-4-Data', b'http://127.0.0.1:8084/bob.xml')
+            q.append(p1)
+            self.assertEqual(q.by_packet_id('master$alice@new-server.com_8084:1/2/F20200101/3-4-Data'), [p1])
+            self.assertEqual(q.by_packet_id('master$alice@old-server.com_8084:1/2/F20200101/3-4-Data'), [p1])
+        finally:
+            packet_out._MyRotatedCustomers = None
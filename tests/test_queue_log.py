@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from stream import queue_log
+
+
+class TestQueueLog(TestCase):
+
+    def setUp(self):
+        self.log_dir = os.path.join(tempfile.mkdtemp(prefix='queue_log_'), 'log')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.log_dir), ignore_errors=True)
+
+    def _open(self, segment_max_messages=5):
+        ql = queue_log.QueueLog(self.log_dir, segment_max_messages=segment_max_messages)
+        ql.open()
+        return ql
+
+    def test_append_read_reopen(self):
+        ql = self._open()
+        for sequence_id in range(12):
+            ql.append(sequence_id, 'alice', {'message_id': 'm%d' % sequence_id, 'data': u'х%d' % sequence_id, }, 100 + sequence_id)
+        self.assertEqual(len(ql), 12)
+        self.assertEqual(len(ql.segments), 3)
+        self.assertEqual([m['sequence_id'] for m in ql.read_after(7)], [8, 9, 10, 11])
+        self.assertEqual([m['sequence_id'] for m in ql.read_after(-1, max_messages_count=3)], [0, 1, 2])
+        self.assertTrue(ql.start_attempt(3, 'm3', started=200))
+        self.assertTrue(ql.finish_attempt(3, 'm3', ['bob'], finished=210))
+        self.assertFalse(ql.finish_attempt(3, 'unknown', []))
+        self.assertTrue(ql.mark_processed(3, 220))
+        ql.close()
+        ql = self._open()
+        self.assertEqual(len(ql), 12)
+        msg = ql.read(3)
+        self.assertEqual(msg['payload']['data'], u'х3')
+        self.assertEqual(msg['attempts'], [{'message_id': 'm3', 'started': 200, 'finished': 210, 'failed_consumers': ['bob'], }])
+        self.assertEqual(msg['processed'], 220)
+        self.assertTrue(ql.is_processed(3))
+        self.assertFalse(ql.is_processed(4))
+        ql.close()
+
+    def test_erase_and_remove_segments(self):
+        ql = self._open()
+        for sequence_id in range(12):
+            ql.append(sequence_id, 'alice', {'message_id': 'm%d' % sequence_id, }, 100)
+        for sequence_id in range(7):
+            self.assertTrue(ql.erase(sequence_id))
+        self.assertFalse(ql.erase(0))
+        # first segment is fully erased and removed, second one still has two messages
+        self.assertEqual(sorted(ql.segments.keys()), [1, 2])
+        self.assertEqual(ql.sequence_ids, [7, 8, 9, 10, 11])
+        ql.close()
+        ql = self._open()
+        self.assertEqual(ql.sequence_ids, [7, 8, 9, 10, 11])
+        self.assertEqual([m['sequence_id'] for m in ql.read_after(-1)], [7, 8, 9, 10, 11])
+        # journal was compacted during rotation and still keeps erased messages of the second segment
+        for sequence_id in range(12, 20):
+            ql.append(sequence_id, 'alice', {'message_id': 'm%d' % sequence_id, }, 100)
+        ql.close()
+        ql = self._open()
+        self.assertEqual(ql.sequence_ids, list(range(7, 20)))
+        ql.close()
+
+    def test_crash_recovery(self):
+        ql = self._open()
+        for sequence_id in range(3):
+            ql.append(sequence_id, 'alice', {'message_id': 'm%d' % sequence_id, }, 100)
+        ql.start_attempt(1, 'm1', started=200)
+        ql.close()
+        # simulate process crash in the middle of writing records
+        with open(os.path.join(self.log_dir, '%010d.seg' % 0), 'ab') as f:
+            f.write(b'3 {"sequence_id":3,"crea')
+        with open(os.path.join(self.log_dir, 'journal'), 'ab') as f:
+            f.write(b'1 p 30')
+        ql = self._open()
+        self.assertEqual(ql.sequence_ids, [0, 1, 2])
+        self.assertFalse(ql.is_processed(1))
+        self.assertEqual(len(ql.read(1)['attempts']), 1)
+        ql.append(3, 'alice', {'message_id': 'm3', }, 100)
+        self.assertEqual(ql.read(3)['payload'], {'message_id': 'm3', })
+        ql.close()
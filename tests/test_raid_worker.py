@@ -1,4 +1,5 @@
 import os
+import time
 import base64
 
 from twisted.trial.unittest import TestCase
@@ -9,6 +10,7 @@ DelayedCall.debug = True
 
 
 from raid import raid_worker
+from raid import worker
 
 from logs import lg
 
@@ -17,6 +19,15 @@ from system import bpio
 from main import settings
 
 
+def _slow_task(name, steps, threshold_control):
+    # executed inside of the child process, must be defined on module level
+    for _ in range(steps):
+        if not threshold_control(1024):
+            return None
+        time.sleep(0.01)
+    return name
+
+
 class TestRaidWorker(TestCase):
 
     def setUp(self):
@@ -300,8 +311,60 @@ class TestRaidWorker(TestCase):
             else:
                 reactor.callLater(0.1, test_result.errback, Exception('task expected to fail, but positive result was returned'))  # @UndefinedVariable
 
-        reactor.callLater(0.5, raid_worker.add_task, 'make', (  # @UndefinedVariable
-            '/tmp/source1.txt', 'ecc/64x64', 'F12345678', '5', '/tmp/raidtest/master$alice@somehost.com/0/F12345678'), _task_failed)
-        reactor.callLater(0.55, raid_worker.cancel_task, 'make', '/tmp/source1.txt')  # @UndefinedVariable
+        def _add_and_cancel():
+            # parity is built very fast now, so cancel the task right after it was submitted
+            raid_worker.add_task('make', (
+                '/tmp/source1.txt', 'ecc/64x64', 'F12345678', '5', '/tmp/raidtest/master$alice@somehost.com/0/F12345678'), _task_failed)
+            raid_worker.cancel_task('make', '/tmp/source1.txt')
+
+        reactor.callLater(0.5, _add_and_cancel)  # @UndefinedVariable
+
+        return test_result
+
+    def test_threaded_task_yields_by_bytes_processed(self):
+        sleeps = []
+        self.patch(raid_worker.time, 'sleep', sleeps.append)
+        t = raid_worker.RaidTask(1, None)
+        t._started = time.time()
+        for _ in range(9):
+            self.assertTrue(t.threshold_control(256 * 1024))
+        self.assertEqual(len(sleeps), 2)
+        self.assertEqual(t._bytes_processed, 9 * 256 * 1024)
+        t.stop()
+        self.assertFalse(t.threshold_control(256 * 1024))
+
+    def _test_task_progress_and_cancel(self, processor_class):
+        test_result = Deferred()
+        self.patch(raid_worker, '_VALID_TASKS', {'slow': (_slow_task, ())})
+        raid_worker.A('init')
+        progress = []
 
+        def _task_done(c, t, r):
+            reactor.callLater(0, raid_worker.A, 'shutdown')  # @UndefinedVariable
+            if r is not None:
+                reactor.callLater(0.1, test_result.errback, Exception('task expected to be cancelled, but result was returned: %r' % r))  # @UndefinedVariable
+            elif len(progress) < 2 or progress[-1] <= progress[0] or progress[-1] % 1024:
+                reactor.callLater(0.1, test_result.errback, Exception('progress of the running task was not reported: %r' % progress))  # @UndefinedVariable
+            else:
+                reactor.callLater(0.1, test_result.callback, True)  # @UndefinedVariable
+
+        def _check_progress():
+            bytes_processed = raid_worker.get_task_progress('slow', 'first')
+            if bytes_processed:
+                progress.append(bytes_processed)
+            if len(progress) >= 2 and progress[-1] > progress[0]:
+                self.assertIsInstance(raid_worker.A().processor, processor_class)
+                self.assertTrue(raid_worker.cancel_task('slow', 'first'))
+                return
+            reactor.callLater(0.05, _check_progress)  # @UndefinedVariable
+
+        raid_worker.add_task('slow', ('first', 100000), _task_done)
+        reactor.callLater(0.05, _check_progress)  # @UndefinedVariable
         return test_result
+
+    def test_task_progress_and_cancel_child_process(self):
+        return self._test_task_progress_and_cancel(worker.ProcessRaidProcessor)
+
+    def test_task_progress_and_cancel_threaded(self):
+        settings.config.conf().setBool('services/rebuilding/child-processes-enabled', False)
+        return self._test_task_progress_and_cancel(raid_worker.ThreadedRaidProcessor)
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import array
+from unittest import TestCase
+
+from raid import eccmap
+from raid import raidutils
+
+
+class TestBuildParity(TestCase):
+
+    def _reference_parity(self, segments, myeccmap):
+        sds = {}
+        for seg_num, seg in enumerate(segments):
+            values = array.array('i', seg)
+            values.byteswap()
+            sds[seg_num] = iter(values)
+        psds_list = raidutils.build_parity(sds, int(len(segments[0]) / 4), myeccmap.datasegments, myeccmap, myeccmap.paritysegments)
+        return {PSegNum: psds_list[PSegNum].tobytes() for PSegNum in psds_list}
+
+    def _test_eccmap(self, eccmapname, use_numpy):
+        myeccmap = eccmap.eccmap(eccmapname)
+        segments = [os.urandom(1000 * 4) for _ in range(myeccmap.datasegments)]
+        expected = self._reference_parity(segments, myeccmap)
+        result = raidutils.build_parity_block(segments, myeccmap, stripe_size=1024, use_numpy=use_numpy)
+        self.assertEqual(sorted(result.keys()), sorted(expected.keys()))
+        for PSegNum in expected:
+            self.assertEqual(result[PSegNum], expected[PSegNum])
+
+    def test_all_eccmaps_int(self):
+        for eccmapname in eccmap.EccMapNames():
+            self._test_eccmap(eccmapname, use_numpy=False)
+
+    def test_all_eccmaps_numpy(self):
+        if raidutils.numpy is None:
+            self.skipTest('numpy is not installed')
+        for eccmapname in eccmap.EccMapNames():
+            self._test_eccmap(eccmapname, use_numpy=True)
+
+    def test_cancelled(self):
+        myeccmap = eccmap.eccmap('ecc/4x4')
+        segments = [os.urandom(4096) for _ in range(myeccmap.datasegments)]
+        with self.assertRaises(Exception):
+            raidutils.build_parity_block(segments, myeccmap, threshold_control=lambda more_bytes: False)
+
+
+class TestRebuildPlan(TestCase):
+
+    def setUp(self):
+        self.dir_to_test = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_to_test)
+
+    def _piece_file_name(self, piece):
+        return os.path.join(self.dir_to_test, '%d-%s' % piece)
+
+    def _make_block(self, myeccmap, seglength):
+        data = [os.urandom(seglength) for _ in range(myeccmap.datasegments)]
+        parity = raidutils.build_parity_block(data, myeccmap)
+        for DSegNum, seg in enumerate(data):
+            with open(self._piece_file_name((DSegNum, 'Data')), 'wb') as f:
+                f.write(seg)
+        for PSegNum, seg in parity.items():
+            with open(self._piece_file_name((PSegNum, 'Parity')), 'wb') as f:
+                f.write(seg)
+        return data, parity
+
+    def test_plan_is_cached(self):
+        myeccmap = eccmap.eccmap('ecc/7x7')
+        plan1 = raidutils.build_rebuild_plan(myeccmap, [0, 1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 0])
+        plan2 = raidutils.build_rebuild_plan(myeccmap, [0, 1, 1, 1, 1, 1, 1], [1, 1, 1, 1, 1, 1, 0])
+        self.assertIs(plan1, plan2)
+        self.assertEqual([target for target, _ in plan1], [(0, 'Data'), (6, 'Parity')])
+
+    def test_rebuild_missing_pieces(self):
+        myeccmap = eccmap.eccmap('ecc/18x18')
+        data, parity = self._make_block(myeccmap, 4000)
+        data_segs = [1, ] * myeccmap.datasegments
+        parity_segs = [1, ] * myeccmap.paritysegments
+        for num in (0, 3, 11):
+            os.remove(self._piece_file_name((num, 'Data')))
+            os.remove(self._piece_file_name((num, 'Parity')))
+            data_segs[num] = 0
+            parity_segs[num] = 0
+        plan = raidutils.build_rebuild_plan(myeccmap, data_segs, parity_segs)
+        rebuilt = raidutils.rebuild_block(plan, self._piece_file_name, stripe_size=1024)
+        self.assertEqual(sorted(rebuilt), sorted([(num, kind) for num in (0, 3, 11) for kind in ('Data', 'Parity')]))
+        for DSegNum, seg in enumerate(data):
+            with open(self._piece_file_name((DSegNum, 'Data')), 'rb') as f:
+                self.assertEqual(f.read(), seg)
+        for PSegNum, seg in parity.items():
+            with open(self._piece_file_name((PSegNum, 'Parity')), 'rb') as f:
+                self.assertEqual(f.read(), seg)
+
+    def test_rebuild_cancelled(self):
+        myeccmap = eccmap.eccmap('ecc/4x4')
+        self._make_block(myeccmap, 4000)
+        os.remove(self._piece_file_name((1, 'Data')))
+        plan = raidutils.build_rebuild_plan(myeccmap, [1, 0, 1, 1], [1, 1, 1, 1])
+        with self.assertRaises(Exception):
+            raidutils.rebuild_block(plan, self._piece_file_name, threshold_control=lambda more_bytes: False)
+        self.assertFalse(os.path.exists(self._piece_file_name((1, 'Data'))))
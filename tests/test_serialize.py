@@ -8,7 +8,9 @@ from logs import lg
 from main import settings
 
 from lib import jsn
+from lib import strng
 from lib import serialization
+from lib import compression
 
 from crypt import key
 from crypt import signed
@@ -155,3 +157,117 @@ class Test(TestCase):
         data2 = b2.Data()
         self.assertEqual(data1, data2)
         self.assertEqual(raw1, raw2)
+
+    def test_fields_to_bytes(self):
+        fields1 = [b'', b'abc', os.urandom(1024), ]
+        raw = serialization.FieldsToBytes(fields1, kind=b'x', version=3)
+        self.assertTrue(serialization.IsBinary(raw))
+        self.assertFalse(serialization.IsBinary(serialization.DictToBytes({'a': 1, })))
+        version, fields2 = serialization.BytesToFields(raw, kind=b'x')
+        self.assertEqual(version, 3)
+        self.assertEqual(fields1, fields2)
+        with self.assertRaises(ValueError):
+            serialization.BytesToFields(raw[:-1], kind=b'x')
+        with self.assertRaises(ValueError):
+            serialization.BytesToFields(raw, kind=b'y')
+
+    def test_signed_packet_binary(self):
+        key.InitMyKey()
+        data1 = os.urandom(1024)
+        p1 = signed.Packet(
+            'Data',
+            my_id.getIDURL(),
+            my_id.getIDURL(),
+            'SomeID',
+            data1,
+            'RemoteID:abc',
+        )
+        raw_json = p1.Serialize()
+        raw_bin = p1.Serialize(binary=True)
+        self.assertTrue(serialization.IsBinary(raw_bin))
+        self.assertLess(len(raw_bin), len(raw_json))
+
+        p2 = signed.Unserialize(raw_bin)
+        self.assertTrue(p2.Valid())
+        self.assertEqual(data1, p2.Payload)
+        self.assertEqual(raw_bin, p2.Serialize(binary=True))
+        self.assertEqual(raw_json, p2.Serialize())
+
+    def test_signed_packet_json_not_changed(self):
+        key.InitMyKey()
+        p1 = signed.Packet(
+            'Data',
+            my_id.getIDURL(),
+            my_id.getIDURL(),
+            'SomeID',
+            os.urandom(1024),
+            'RemoteID:abc',
+        )
+        # nodes which do not know about binary format must still read and verify packets
+        raw = p1.Serialize()
+        self.assertEqual(sorted(jsn.loads(raw).keys()), sorted(['m', 'o', 'c', 'i', 'd', 'p', 'r', 'k', 's', ]))
+        p2 = signed.Unserialize(raw)
+        hash_base = b'-'.join([
+            strng.to_bin(p2.Command),
+            p2.OwnerID.original(),
+            p2.CreatorID.original(),
+            strng.to_bin(p2.PacketID),
+            strng.to_bin(p2.Date),
+            strng.to_bin(p2.Payload),
+            p2.RemoteID.original(),
+            strng.to_bin(p2.KeyID),
+        ])
+        self.assertEqual(hash_base, p2.GenerateHashBase())
+        self.assertTrue(key.Verify(my_id.getLocalIdentity(), key.Hash(hash_base), p2.Signature))
+
+    def test_binary_format_announced(self):
+        self.assertTrue(serialization.IsBinaryFormatAnnounced('1.2.3 sources %s' % serialization.BINARY_FORMAT_TAG))
+        self.assertFalse(serialization.IsBinaryFormatAnnounced('1.2.3 sources'))
+        self.assertFalse(serialization.IsBinaryFormatAnnounced(b''))
+        self.assertFalse(serialization.IsBinaryFormatAnnounced(None))
+
+    def test_encrypted_block_binary(self):
+        key.InitMyKey()
+        data1 = os.urandom(1024)
+        b1 = encrypted.Block(
+            CreatorID=my_id.getIDURL(),
+            BackupID='BackupABC',
+            BlockNumber=123,
+            SessionKey=key.NewSessionKey(session_key_type=key.SessionKeyType()),
+            SessionKeyType=key.SessionKeyType(),
+            LastBlock=True,
+            Data=data1,
+        )
+        raw_json = b1.Serialize()
+        raw_bin = b1.Serialize(binary=True)
+        self.assertTrue(serialization.IsBinary(raw_bin))
+
+        b2 = encrypted.Unserialize(raw_bin)
+        self.assertTrue(b2.Valid())
+        self.assertEqual(b2.BlockNumber, 123)
+        self.assertTrue(b2.LastBlock)
+        self.assertEqual(data1, b2.Data())
+        self.assertEqual(raw_bin, b2.Serialize(binary=True))
+        self.assertEqual(raw_json, b2.Serialize())
+
+    def test_encrypted_block_compressed(self):
+        key.InitMyKey()
+        data1 = b'compressible data ' * 1000
+        codec, compressed = compression.compress(data1, 'gz')
+        self.assertEqual(codec, 'gz')
+        b1 = encrypted.Block(
+            CreatorID=my_id.getIDURL(),
+            BackupID='BackupABC',
+            BlockNumber=123,
+            SessionKey=key.NewSessionKey(session_key_type=key.SessionKeyType()),
+            SessionKeyType=key.SessionKeyType(),
+            LastBlock=True,
+            Data=compressed,
+            Compression=codec,
+        )
+        for binary in (False, True, ):
+            b2 = encrypted.Unserialize(b1.Serialize(binary=binary))
+            self.assertTrue(b2.Valid())
+            self.assertEqual(b2.Compression, 'gz')
+            self.assertEqual(b2.Length, len(compressed))
+            self.assertEqual(data1, b2.Data())
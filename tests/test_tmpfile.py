@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+from system import tmpfile
+
+
+class TestMemoryFiles(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='tmpfile_')
+        tmpfile._TempDirPath = None
+        tmpfile.init(temp_dir_path=self.temp_dir)
+        tmpfile.configure_memory_files(max_file_size=1024, max_total_bytes=2048)
+
+    def tearDown(self):
+        tmpfile.shutdown()
+        tmpfile.configure_memory_files(max_file_size=64 * 1024, max_total_bytes=64 * 1024 * 1024)
+        tmpfile._TempDirPath = None
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_make_read_erase(self):
+        filename = tmpfile.make_memory('outbox', b'abcd', extension='.out')
+        self.assertTrue(tmpfile.is_memory(filename))
+        self.assertTrue(tmpfile.file_exists(filename))
+        self.assertFalse(os.path.exists(filename))
+        self.assertEqual(tmpfile.file_size(filename), 4)
+        self.assertEqual(tmpfile.read_file(filename), b'abcd')
+        self.assertEqual(tmpfile.open_file(filename).read(3), b'abc')
+        self.assertEqual(tmpfile.memory_files_stats()['bytes'], 4)
+        tmpfile.throw_out(filename, 'test')
+        self.assertFalse(tmpfile.file_exists(filename))
+        self.assertEqual(tmpfile.file_size(filename), -1)
+        self.assertEqual(tmpfile.memory_files_stats()['bytes'], 0)
+
+    def test_limits(self):
+        self.assertTrue(tmpfile.fits_memory(1024))
+        self.assertFalse(tmpfile.fits_memory(1025))
+        self.assertFalse(tmpfile.fits_memory(0))
+        first = tmpfile.make_memory('tcp-in', b'x' * 1024)
+        second = tmpfile.make_memory('tcp-in')
+        self.assertEqual(tmpfile.read_file(second), b'')
+        tmpfile.write_memory(second, bytearray(b'y' * 1000))
+        self.assertFalse(tmpfile.fits_memory(100))
+        tmpfile.throw_out(first, 'test')
+        self.assertTrue(tmpfile.fits_memory(100))
+        tmpfile.configure_memory_files(max_file_size=0)
+        self.assertFalse(tmpfile.fits_memory(100))
+
+    def test_reserved_size(self):
+        # files which are still being received are counted with their expected size
+        first = tmpfile.make_memory('tcp-in', size=1024)
+        second = tmpfile.make_memory('udp-in', size=1000)
+        self.assertEqual(tmpfile.memory_files_stats()['bytes'], 2024)
+        self.assertFalse(tmpfile.fits_memory(100))
+        tmpfile.write_memory(first, b'x' * 1024)
+        self.assertEqual(tmpfile.memory_files_stats()['bytes'], 2024)
+        tmpfile.throw_out(second, 'failed')
+        self.assertEqual(tmpfile.memory_files_stats()['bytes'], 1024)
+        self.assertTrue(tmpfile.fits_memory(1024))
+        tmpfile.throw_out(first, 'test')
+        self.assertEqual(tmpfile.memory_files_stats()['bytes'], 0)
+
+    def test_regular_file(self):
+        fd, filename = tmpfile.make('outbox', extension='.out')
+        os.write(fd, b'abcd')
+        os.close(fd)
+        self.assertFalse(tmpfile.is_memory(filename))
+        self.assertTrue(tmpfile.file_exists(filename))
+        self.assertEqual(tmpfile.file_size(filename), 4)
+        self.assertEqual(tmpfile.read_file(filename), b'abcd')
+        with tmpfile.open_file(filename) as f:
+            self.assertEqual(f.read(), b'abcd')
@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+from transport.udp import udp_congestion
+from transport.udp import udp_stream
+
+
+class TestSack(TestCase):
+
+    def test_pack_unpack(self):
+        data = udp_congestion.pack_sack(True, 10, [11, 13, 20, 5, 10 + 1 + udp_congestion.MAX_SACK_BLOCKS], 0.5, 1024.0)
+        eof, cumulative_block_id, pause_time, limit, received = udp_congestion.unpack_sack(data)
+        self.assertTrue(eof)
+        self.assertEqual(cumulative_block_id, 10)
+        self.assertEqual(pause_time, 0.5)
+        self.assertEqual(limit, 1024.0)
+        self.assertEqual(received, [11, 13, 20, ])
+
+    def test_too_short(self):
+        with self.assertRaises(ValueError):
+            udp_congestion.unpack_sack(b'\x00\x01')
+
+
+class TestBlocksRing(TestCase):
+
+    def test_release_out_of_order(self):
+        ring = udp_congestion.BlocksRing(4)
+        for i in range(4):
+            self.assertEqual(ring.push(b'x' * (i + 1)).block_id, i + 1)
+        self.assertTrue(ring.is_full())
+        self.assertIsNone(ring.push(b'y'))
+        ring.release(2)
+        self.assertEqual(ring.first_id, 1)
+        self.assertTrue(ring.is_full())
+        ring.release(1)
+        self.assertEqual(ring.first_id, 3)
+        self.assertEqual(len(ring), 2)
+        self.assertEqual(ring.bytes, 7)
+        self.assertEqual([b.block_id for b in ring], [3, 4, ])
+        self.assertEqual(ring.push(b'z').block_id, 5)
+        self.assertIsNone(ring.get(2))
+        self.assertEqual(ring.get(5).data, b'z')
+
+
+class TestCubicController(TestCase):
+
+    def test_slow_start_and_loss(self):
+        cc = udp_congestion.CubicController(max_window=100, initial_window=10)
+        cc.on_rtt_sample(0.1)
+        cc.on_ack(10, now=0.1)
+        self.assertEqual(cc.window(), 20)
+        self.assertTrue(cc.on_loss(now=0.2))
+        self.assertEqual(cc.window(), 14)
+        self.assertFalse(cc.in_slow_start())
+        #--- second loss within same RTT does not reduce the window again
+        self.assertFalse(cc.on_loss(now=0.25))
+        self.assertEqual(cc.window(), 14)
+        cc.on_loss(now=1.0, timeout=True)
+        self.assertEqual(cc.window(), udp_congestion.MIN_WINDOW)
+
+    def test_rto_bounds(self):
+        cc = udp_congestion.CubicController(max_window=100)
+        self.assertEqual(cc.rto(), udp_congestion.MAX_RTO)
+        cc.on_rtt_sample(0.01)
+        self.assertEqual(cc.rto(), udp_congestion.MIN_RTO)
+
+
+class TestStreamModeNegotiation(TestCase):
+
+    def test_negotiate(self):
+        self.assertEqual(udp_stream.negotiate_stream_mode(None), (udp_stream.STREAM_MODE_LEGACY, udp_stream.UDP_DATAGRAM_SIZE))
+        self.assertEqual(udp_stream.negotiate_stream_mode('bad'), (udp_stream.STREAM_MODE_LEGACY, udp_stream.UDP_DATAGRAM_SIZE))
+        mode, datagram_size = udp_stream.negotiate_stream_mode('2:1200')
+        self.assertEqual(mode, udp_stream.STREAM_MODE_CONGESTION)
+        self.assertEqual(datagram_size, 1200)
+        mode, datagram_size = udp_stream.negotiate_stream_mode(udp_stream.stream_mode_capabilities())
+        self.assertEqual(datagram_size, udp_stream.MAX_DATAGRAM_SIZE)
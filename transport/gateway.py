@@ -154,6 +154,7 @@ def init():
     else:
         _LocalListener = TransportGateLocalProxy()
     _PacketLogFileEnabled = config.conf().getBool('logs/packet-enabled')
+    tmpfile.configure_memory_files(max_file_size=config.conf().getInt('services/gateway/memory-transfer-threshold', 64 * 1024))
 
 
 def shutdown():
@@ -372,7 +373,8 @@ def detach(transport_instance):
 
 def inbox(info):
     """
-    1) The protocol modules write to temporary files and gives us that filename
+    1) The protocol modules write to temporary files (small packets are kept in memory)
+       and gives us that filename
     2) We unserialize
     3) We check that it is for us
     4) We check that it is from one of our contacts.
@@ -391,11 +393,11 @@ def inbox(info):
     if _Debug:
         lg.out(_DebugLevel, "gateway.inbox [%s]" % info.filename)
 
-    if info.filename == "" or not os.path.exists(info.filename):
+    if info.filename == "" or not tmpfile.file_exists(info.filename):
         lg.err("bad filename=" + info.filename)
         return None
     try:
-        data = bpio.ReadBinaryFile(info.filename)
+        data = tmpfile.read_file(info.filename)
     except:
         lg.err("gateway.inbox ERROR reading file " + info.filename)
         return None
@@ -76,7 +76,6 @@ from lib import nameurl
 from lib import net_misc
 from lib import strng
 
-from system import bpio
 from system import tmpfile
 
 from contacts import contactsdb
@@ -184,11 +183,9 @@ class SenderServer(resource.Resource):
             return ''
         r = ''
         for filename in _Outbox[idurl]:
-            if not os.path.isfile(filename):
+            if not tmpfile.file_exists(filename):
                 continue
-            if not os.access(filename, os.R_OK):
-                continue
-            src = bpio.ReadBinaryFile(filename)
+            src = tmpfile.read_file(filename)
             if src == '':
                 continue
             src64 = base64.b64encode(src)
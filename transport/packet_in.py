@@ -59,8 +59,14 @@ _PacketLogFileEnabled = False
 
 import os
 import time
+import threading
+
+from collections import deque
 
 from twisted.internet import reactor  # @UnresolvedImport
+from twisted.internet import threads
+from twisted.internet.defer import Deferred
+from twisted.python.threadpool import ThreadPool
 
 #------------------------------------------------------------------------------
 
@@ -74,7 +80,6 @@ from automats import automat
 from lib import nameurl
 from lib import strng
 
-from system import bpio
 from system import tmpfile
 
 from userid import global_id
@@ -95,17 +100,29 @@ from transport import callback
 _InboxItems = {}
 _PacketsCounter = 0
 _History = []
+_Verifier = None
 
 #------------------------------------------------------------------------------
 
 def init():
     global _PacketLogFileEnabled
+    global _Verifier
     _PacketLogFileEnabled = config.conf().getBool('logs/packet-enabled')
+    if _Verifier is None:
+        _Verifier = PacketsVerifier(
+            threads_count=config.conf().getInt('services/gateway/verification-threads', 2),
+            max_pending=config.conf().getInt('services/gateway/verification-queue-size', 200),
+        )
+        _Verifier.start()
 
 
 def shutdown():
     global _PacketLogFileEnabled
+    global _Verifier
     _PacketLogFileEnabled = False
+    if _Verifier is not None:
+        _Verifier.stop()
+        _Verifier = None
 
 #------------------------------------------------------------------------------
 
@@ -169,6 +186,142 @@ def history():
     global _History
     return _History
 
+
+def verifier():
+    global _Verifier
+    return _Verifier
+
+
+def verification_stats():
+    """
+    Returns counters of the signature verification stage, see ``PacketsVerifier.stats()``.
+    """
+    if _Verifier is None:
+        return {}
+    return _Verifier.stats()
+
+#------------------------------------------------------------------------------
+
+
+def _daemon_thread(*args, **kwargs):
+    t = threading.Thread(*args, **kwargs)
+    t.daemon = True
+    return t
+
+
+class VerificationItem(object):
+
+    def __init__(self, verify_func, args):
+        self.verify_func = verify_func
+        self.args = args
+        self.result = None
+        self.finished = False
+        self.cancelled = False
+        self.deferred = Deferred()
+
+
+class PacketsVerifier(object):
+    """
+    Verifies digital signatures of incoming packets in a pool of threads.
+
+    Packets from different senders are verified and reported in any order,
+    but results for packets of the same sender are always reported in the same
+    order they were submitted: finished item waits until all items of
+    that sender submitted before are finished too.
+
+    When more than ``max_pending`` items are waiting, or there are no threads
+    at all, packet is verified in the main thread right away - this way reading
+    from the network slows down until the queue is drained.
+    """
+
+    def __init__(self, threads_count, max_pending):
+        self.threads_count = max(0, int(threads_count))
+        self.max_pending = max(1, int(max_pending))
+        self.pool = None
+        self.senders = {}
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.verified = 0
+        self.invalid = 0
+        self.inline = 0
+
+    def start(self):
+        if self.threads_count > 0 and self.pool is None:
+            self.pool = ThreadPool(minthreads=0, maxthreads=self.threads_count, name='packets_verifier')
+            self.pool.threadFactory = _daemon_thread
+            self.pool.start()
+        if _Debug:
+            lg.args(_DebugLevel, threads_count=self.threads_count, max_pending=self.max_pending)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.stop()
+            self.pool = None
+        for items in self.senders.values():
+            for item in items:
+                item.cancelled = True
+        self.senders.clear()
+        self.pending = 0
+
+    def stats(self):
+        return {
+            'threads': self.threads_count,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'max_pending_seen': self.max_pending_seen,
+            'senders': len(self.senders),
+            'verified': self.verified,
+            'invalid': self.invalid,
+            'inline': self.inline,
+        }
+
+    def submit(self, sender_key, verify_func, *args):
+        """
+        Returns ``Deferred`` object which will be fired with result of ``verify_func(*args)``.
+        Function must return True or False and must not touch any shared state,
+        because it is executed in another thread.
+        """
+        item = VerificationItem(verify_func, args)
+        if sender_key not in self.senders:
+            self.senders[sender_key] = deque()
+        self.senders[sender_key].append(item)
+        self.pending += 1
+        if self.pending > self.max_pending_seen:
+            self.max_pending_seen = self.pending
+        if self.pool is None or self.pending > self.max_pending:
+            self.inline += 1
+            self._on_verified(self._do_verify(verify_func, args), sender_key, item)
+        else:
+            d = threads.deferToThreadPool(reactor, self.pool, self._do_verify, verify_func, args)
+            d.addCallback(self._on_verified, sender_key, item)
+            d.addErrback(lambda err: lg.err('failed to report verification result: %r' % err) and None)
+        return item.deferred
+
+    def _do_verify(self, verify_func, args):
+        try:
+            return bool(verify_func(*args))
+        except:
+            lg.exc()
+            return False
+
+    def _on_verified(self, result, sender_key, item):
+        if item.cancelled:
+            return None
+        item.result = result
+        item.finished = True
+        items = self.senders.get(sender_key)
+        while items and items[0].finished:
+            ready = items.popleft()
+            self.pending -= 1
+            if ready.result:
+                self.verified += 1
+            else:
+                self.invalid += 1
+            if not items and self.senders.get(sender_key) is items:
+                self.senders.pop(sender_key)
+            ready.deferred.callback(ready.result)
+        return None
+
 #------------------------------------------------------------------------------
 
 
@@ -234,16 +387,32 @@ def process(newpacket, info):
 def handle(newpacket, info):
     """
     Actually process incoming packet. Here we can be sure that owner/creator of the packet is identified.
+    Signature is verified in the ``PacketsVerifier`` threads, returns ``Deferred`` object which will be
+    fired with True if packet was handled.
     """
-    from transport import packet_out
-    handled = False
+    # identity of the creator is taken here in the main thread, verification itself is thread-safe
+    creator_identity = contactsdb.get_contact_identity(newpacket.CreatorID)
+    if _Verifier is None:
+        return _do_handle_verified(_do_verify_packet(newpacket, creator_identity), newpacket, info)
+    d = _Verifier.submit(newpacket.CreatorID.to_bin(), _do_verify_packet, newpacket, creator_identity)
+    d.addCallback(_do_handle_verified, newpacket, info)
+    d.addErrback(lambda err: lg.err('failed to handle incoming packet %r: %r' % (newpacket, err)) and None)
+    return d
+
+
+def _do_verify_packet(newpacket, creator_identity):
     # check that signed by a contact of ours
     try:
-        is_signature_valid = newpacket.Valid(raise_signature_invalid=False)
+        return newpacket.Valid(raise_signature_invalid=False, creator_identity=creator_identity)
     except:
-        is_signature_valid = False
         # lg.exc('new packet from %s://%s is NOT VALID:\n\n%r\n' % (
         #     info.proto, info.host, newpacket.Serialize()))
+        return False
+
+
+def _do_handle_verified(is_signature_valid, newpacket, info):
+    from transport import packet_out
+    handled = False
     if not is_signature_valid:
         if _Debug:
             lg.args(_DebugLevel,
@@ -476,13 +645,15 @@ class PacketIn(automat.Automat):
             # net_misc.ConnectionFailed(None, proto, 'receiveStatusReport %s' % host)
             try:
                 fd, _ = tmpfile.make('error', extension='.inbox')
-                data = bpio.ReadBinaryFile(self.filename)
+                data = tmpfile.read_file(self.filename)
                 os.write(fd, strng.to_bin('from %s:%s %s\n' % (self.proto, self.host, self.status)))
                 os.write(fd, data)
                 os.close(fd)
             except:
                 lg.exc()
-            if os.path.isfile(self.filename):
+            if tmpfile.is_memory(self.filename):
+                tmpfile.throw_out(self.filename, 'unserialize failed')
+            elif os.path.isfile(self.filename):
                 try:
                     os.remove(self.filename)
                 except:
@@ -68,6 +68,8 @@ _PacketLogFileEnabled = False
 import os
 import time
 
+from collections import OrderedDict
+
 #------------------------------------------------------------------------------
 
 from twisted.internet import reactor  # @UnresolvedImport
@@ -91,8 +93,11 @@ from system import tmpfile
 from contacts import contactsdb
 from contacts import identitycache
 
+from crypt import signed
+
 from main import settings
 from main import config
+from main import events
 
 from transport import callback
 
@@ -102,18 +107,21 @@ from userid import my_id
 
 #------------------------------------------------------------------------------
 
-_OutboxQueue = []
+_OutboxQueue = None
 _PacketsCounter = 0
+_MyRotatedCustomers = None
 
 #------------------------------------------------------------------------------
 
 def init():
     global _PacketLogFileEnabled
     _PacketLogFileEnabled = config.conf().getBool('logs/packet-enabled')
+    events.add_subscriber(on_identity_rotated, 'identity-rotated')
 
 
 def shutdown():
     global _PacketLogFileEnabled
+    events.remove_subscriber(on_identity_rotated, 'identity-rotated')
     _PacketLogFileEnabled = False
 
 #------------------------------------------------------------------------------
@@ -132,6 +140,8 @@ def increment_packets_counter():
 
 def queue():
     global _OutboxQueue
+    if _OutboxQueue is None:
+        _OutboxQueue = OutboxQueue()
     return _OutboxQueue
 
 
@@ -147,10 +157,48 @@ def create(outpacket, wide, callbacks, target=None, route=None, response_timeout
 
 #------------------------------------------------------------------------------
 
+def my_rotated_customers():
+    """
+    Returns my current global user ID and a set of all my known global user IDs, including
+    IDs from before identity rotation. Result is cached until my known IDURLs are changed.
+    """
+    global _MyRotatedCustomers
+    version = my_id.getKnownIDURLsVersion()
+    if _MyRotatedCustomers is None or _MyRotatedCustomers[0] != version:
+        if not my_id.isLocalIdentityReady():
+            return None, set()
+        current = global_id.UrlToGlobalID(my_id.getIDURL()).lower()
+        known = set([global_id.UrlToGlobalID(idurl).lower() for idurl in my_id.getKnownIDURLs()])
+        known.add(current)
+        _MyRotatedCustomers = (version, current, known, )
+    return _MyRotatedCustomers[1], _MyRotatedCustomers[2]
+
+
+def canonical_packet_id(packet_id):
+    """
+    Returns lowercased packet ID where any of my IDs known from before identity rotation
+    is replaced with my current global ID:
+
+        "master$alice@old-server.com:1/2/3" -> "master$alice@new-server.com:1/2/3"
+
+    This way responses to packets sent before rotation can be matched with a single lookup.
+    """
+    packet_id = packet_id.lower()
+    if not packet_id.count('@'):
+        return packet_id
+    head, _, path = packet_id.rpartition(':')
+    key_alias, _, customer = head.rpartition('$')
+    current, known = my_rotated_customers()
+    if not current or customer == current or customer not in known:
+        return packet_id
+    if key_alias:
+        return '%s$%s:%s' % (key_alias, current, path, )
+    return '%s:%s' % (current, path, )
+
+#------------------------------------------------------------------------------
+
 def search(proto, host, filename, remote_idurl=None):
-    for p in queue():
-        if p.filename != filename:
-            continue
+    for p in queue().by_filename(filename):
         for i in p.items:
             if i.proto == proto:
                 if not remote_idurl:
@@ -174,10 +222,12 @@ def search(proto, host, filename, remote_idurl=None):
 
 
 def search_by_packet_id(packet_id):
-    result = []
-    for p in queue():
-        if p.outpacket.PacketID.count(packet_id):
-            result.append(p)
+    result = [p for p in queue().by_packet_id(packet_id) if p.outpacket.PacketID == packet_id]
+    if not result:
+        # only part of the packet ID was given, that is not indexed
+        for p in queue():
+            if p.outpacket.PacketID.count(packet_id):
+                result.append(p)
     if _Debug:
         lg.out(_DebugLevel, 'packet_out.search_by_packet_id %s:' % packet_id)
         lg.out(_DebugLevel, '%s' % ('        \n'.join(map(str, result))))
@@ -192,7 +242,15 @@ def search_many(proto=None,
                 packet_id=None,
                 ):
     results = []
-    for p in queue():
+    if packet_id:
+        candidates = queue().by_packet_id(packet_id)
+    elif filename:
+        candidates = queue().by_filename(filename)
+    elif remote_idurl:
+        candidates = queue().by_remote_idurl(remote_idurl)
+    else:
+        candidates = queue()
+    for p in candidates:
         if remote_idurl and id_url.field(p.remote_idurl).to_bin() != id_url.field(remote_idurl).to_bin():
             continue
         if filename and p.filename != filename:
@@ -215,11 +273,9 @@ def search_many(proto=None,
 
 
 def search_by_transfer_id(transfer_id):
-    for p in queue():
-        for i in p.items:
-            if i.transfer_id and i.transfer_id == transfer_id:
-                return p, i
-    return None, None
+    if not transfer_id:
+        return None, None
+    return queue().by_transfer_id(transfer_id)
 
 
 def search_by_response_packet(newpacket=None, proto=None, host=None, outgoing_command=None, incoming_command=None, incoming_packet_id=None,
@@ -239,24 +295,14 @@ def search_by_response_packet(newpacket=None, proto=None, host=None, outgoing_co
         lg.out(_DebugLevel, 'packet_out.search_by_response_packet for incoming [%s/%s/%s]:%s|%s@%s from [%s://%s]' % (
             nameurl.GetName(incoming_owner_idurl), nameurl.GetName(incoming_creator_idurl), nameurl.GetName(incoming_remote_idurl),
             outgoing_command, incoming_command, incoming_packet_id, proto, host, ))
-    matching_packet_ids = []
-    matching_packet_ids.append(incoming_packet_id.lower())
-    if incoming_command and incoming_command in [commands.Data(), commands.Retrieve(), ] and id_url.is_cached(incoming_owner_idurl) and incoming_owner_idurl == my_id.getIDURL():
-        my_rotated_idurls = id_url.list_known_idurls(my_id.getIDURL(), num_revisions=10, include_revisions=False)
-        # TODO: my_rotated_idurls can be cached for optimization
-        for another_idurl in my_rotated_idurls:
-            another_packet_id = global_id.SubstitutePacketID(incoming_packet_id, idurl=another_idurl).lower()
-            if another_packet_id not in matching_packet_ids:
-                matching_packet_ids.append(another_packet_id)
-    if len(matching_packet_ids) > 1:
-        if _Debug:
-            lg.dbg(_DebugLevel, 'multiple packet IDs expecting to match for that packet: %r' % matching_packet_ids)
+    # packet IDs are indexed in canonical form, so packets sent before my identity rotation are also found here
+    candidates = queue().by_packet_id(incoming_packet_id)
+    if not (incoming_command and incoming_command in [commands.Data(), commands.Retrieve(), ] and id_url.is_cached(incoming_owner_idurl) and incoming_owner_idurl == my_id.getIDURL()):
+        # only Data() and Retrieve() packets are expected to match with my rotated IDURLs
+        candidates = [p for p in candidates if p.outpacket.PacketID.lower() == incoming_packet_id.lower()]
     matching_packet_ids_count = 0
     matching_command_ack_count = 0
-    for p in queue():
-        if p.outpacket.PacketID.lower() not in matching_packet_ids:
-            # PacketID of incoming packet not matching with that outgoing packet
-            continue
+    for p in candidates:
         matching_packet_ids_count += 1
         if p.outpacket.PacketID != incoming_packet_id:
             lg.warn('packet ID in queue "almost" matching with incoming: %s ~ %s' % (
@@ -300,7 +346,7 @@ def search_by_response_packet(newpacket=None, proto=None, host=None, outgoing_co
     if len(result) == 0:
         if _Debug:
             lg.out(_DebugLevel, 'packet_out.search_by_response_packet        DID NOT FOUND pending packets in outbox queue matching incoming %r' % newpacket)
-            lg.args(_DebugLevel, pkt_ids_count=matching_packet_ids_count, cmd_ack_count=matching_command_ack_count, matching_packet_ids=matching_packet_ids)
+            lg.args(_DebugLevel, pkt_ids_count=matching_packet_ids_count, cmd_ack_count=matching_command_ack_count, canonical_packet_id=canonical_packet_id(incoming_packet_id))
     return result
 
 
@@ -313,6 +359,10 @@ def search_similar_packets(outpacket):
 
 #------------------------------------------------------------------------------
 
+def on_identity_rotated(evt):
+    queue().reindex_remote_idurls()
+
+
 def on_outgoing_packet_failed(result, *a, **kw):
     if _Debug:
         lg.args(_DebugLevel, result=result, args=a, kwargs=kw)
@@ -322,6 +372,130 @@ def on_outgoing_packet_failed(result, *a, **kw):
 
 #------------------------------------------------------------------------------
 
+class OutboxQueue(object):
+    """
+    Keeps all ``PacketOut`` instances in the order they were created.
+
+    Every incoming packet and every status report from transports must find
+    matching outgoing packets, so there are secondary indexes by PacketID (in canonical form,
+    see ``canonical_packet_id()``), by file name, by remote IDURL and by transfer ID of the work items.
+    Instances of ``PacketOut`` must report here when file name, work items or
+    transfer IDs are changed.
+    """
+
+    def __init__(self):
+        self.packets = OrderedDict()
+        self.positions = {}
+        self.latest_position = 0
+        self.packet_ids = {}
+        self.packet_ids_version = None
+        self.filenames = {}
+        self.remote_idurls = {}
+        self.transfer_ids = {}
+
+    def __iter__(self):
+        return iter(list(self.packets.keys()))
+
+    def __len__(self):
+        return len(self.packets)
+
+    def __contains__(self, p):
+        return p in self.packets
+
+    def _add_index(self, index, key, p):
+        if key not in index:
+            index[key] = OrderedDict()
+        index[key][p] = None
+
+    def _remove_index(self, index, key, p):
+        packets = index.get(key)
+        if packets is None:
+            return
+        packets.pop(p, None)
+        if not packets:
+            index.pop(key)
+
+    def _lookup(self, index, keys):
+        if len(keys) == 1:
+            return list(index.get(keys[0], {}).keys())
+        result = set()
+        for key in keys:
+            result.update(index.get(key, {}).keys())
+        return sorted(result, key=self.positions.get)
+
+    def append(self, p):
+        self.latest_position += 1
+        self.packets[p] = None
+        self.positions[p] = self.latest_position
+        p.remote_idurl_key = id_url.to_bin(p.remote_idurl)
+        p.packet_id_key = canonical_packet_id(p.outpacket.PacketID)
+        self._add_index(self.packet_ids, p.packet_id_key, p)
+        self._add_index(self.remote_idurls, p.remote_idurl_key, p)
+
+    def remove(self, p):
+        if p not in self.packets:
+            raise ValueError('%r is not in the outbox queue' % p)
+        self.packets.pop(p)
+        self.positions.pop(p)
+        self._remove_index(self.packet_ids, p.packet_id_key, p)
+        self._remove_index(self.remote_idurls, p.remote_idurl_key, p)
+        if p.filename:
+            self._remove_index(self.filenames, p.filename, p)
+        for i in p.items:
+            self.forget_item(p, i)
+
+    def index_filename(self, p):
+        if p in self.packets and p.filename:
+            self._add_index(self.filenames, p.filename, p)
+
+    def index_item(self, p, i):
+        if p in self.packets and i.transfer_id:
+            self.transfer_ids[i.transfer_id] = (p, i, )
+
+    def forget_item(self, p, i):
+        if i.transfer_id and self.transfer_ids.get(i.transfer_id, (None, None, ))[1] is i:
+            self.transfer_ids.pop(i.transfer_id)
+
+    def reindex_remote_idurls(self):
+        """
+        IDURL of remote user can be changed after identity rotation.
+        """
+        self.remote_idurls.clear()
+        for p in self.packets:
+            p.remote_idurl_key = id_url.to_bin(p.remote_idurl)
+            self._add_index(self.remote_idurls, p.remote_idurl_key, p)
+
+    def reindex_packet_ids(self):
+        """
+        Canonical form of packet IDs depends on my known IDURLs, which are changed after identity rotation.
+        """
+        self.packet_ids.clear()
+        for p in self.packets:
+            p.packet_id_key = canonical_packet_id(p.outpacket.PacketID)
+            self._add_index(self.packet_ids, p.packet_id_key, p)
+
+    def by_packet_id(self, *packet_ids):
+        """
+        Returns outgoing packets which PacketID is matching one of given, case insensitive.
+        Packets where my IDURL from before identity rotation is used are matching as well.
+        """
+        if self.packet_ids_version != my_id.getKnownIDURLsVersion():
+            self.packet_ids_version = my_id.getKnownIDURLsVersion()
+            self.reindex_packet_ids()
+        return self._lookup(self.packet_ids, [canonical_packet_id(pid) for pid in packet_ids])
+
+    def by_filename(self, filename):
+        return self._lookup(self.filenames, [filename, ])
+
+    def by_remote_idurl(self, remote_idurl):
+        return self._lookup(self.remote_idurls, [id_url.field(remote_idurl).to_bin(), ])
+
+    def by_transfer_id(self, transfer_id):
+        return self.transfer_ids.get(transfer_id, (None, None, ))
+
+#------------------------------------------------------------------------------
+
+
 class WorkItem(object):
 
     def __init__(self, proto, host, size=0):
@@ -386,6 +560,8 @@ class PacketOut(automat.Automat):
         else:
             self.label = 'out_%d_%s_%s' % (
                 get_packets_counter(), packet_label, self.remote_name)
+        self.remote_idurl_key = None
+        self.packet_id_key = None
         self.keep_alive = keep_alive
         self.skip_ack = skip_ack
         automat.Automat.__init__(self,
@@ -676,10 +852,15 @@ class PacketOut(automat.Automat):
         if self.route:
             a_packet = self.route.get('packet', a_packet)
         try:
-            fileno, self.filename = tmpfile.make('outbox', extension='.out')
-            self.packetdata = a_packet.Serialize()
-            os.write(fileno, self.packetdata)
-            os.close(fileno)
+            self.packetdata = a_packet.Serialize(binary=signed.IsBinaryFormatSupported(a_packet.RemoteID))
+            if tmpfile.fits_memory(len(self.packetdata)):
+                # small packets are passed to the transports directly from memory
+                self.filename = tmpfile.make_memory('outbox', self.packetdata, extension='.out')
+            else:
+                fileno, self.filename = tmpfile.make('outbox', extension='.out')
+                os.write(fileno, self.packetdata)
+                os.close(fileno)
+            queue().index_filename(self)
             self.filesize = len(self.packetdata)
             if self.filesize < 1024 * 10:
                 if self.response_timeout:
@@ -711,6 +892,8 @@ class PacketOut(automat.Automat):
         """
         Action method.
         """
+        for i in self.items:
+            queue().forget_item(self, i)
         self.items = []
 
     def doSetTransferID(self, *args, **kwargs):
@@ -721,7 +904,9 @@ class PacketOut(automat.Automat):
         proto, host, _, transfer_id = args[0]
         for i in range(len(self.items)):
             if self.items[i].proto == proto:
+                queue().forget_item(self, self.items[i])
                 self.items[i].transfer_id = transfer_id
+                queue().index_item(self, self.items[i])
                 if _Debug:
                     lg.out(_DebugLevel, 'packet_out.doSetTransferID  %r:%r = %r' % (proto, host, transfer_id))
                 ok = True
@@ -934,6 +1119,8 @@ class PacketOut(automat.Automat):
         Remove all references to the state machine object to destroy it.
         """
         queue().remove(self)
+        if self.filename and tmpfile.is_memory(self.filename):
+            tmpfile.throw_out(self.filename, 'packet finished')
         if self not in self.outpacket.Packets:
             lg.warn('packet_out not connected to the packet')
         else:
@@ -1148,6 +1335,7 @@ class PacketOut(automat.Automat):
             for i in self.items:
                 if i.transfer_id and i.transfer_id == transfer_id:
                     self.items.remove(i)
+                    queue().forget_item(self, i)
                     i.status = status
                     i.error_message = error_message
                     i.bytes_sent = size
@@ -1162,6 +1350,7 @@ class PacketOut(automat.Automat):
             for i in self.items:
                 if i.proto == proto and i.host == host:
                     self.items.remove(i)
+                    queue().forget_item(self, i)
                     i.status = 'failed'
                     i.error_message = err_msg
                     i.bytes_sent = size
@@ -572,7 +572,7 @@ class ProxyRouter(automat.Automat):
         raw_data, pout = self._do_send_relay_packet(
             relay_cmd=commands.RelayIn(),
             inbox_packet=newpacket,
-            data=newpacket.Serialize(),
+            data=newpacket.Serialize(binary=signed.IsBinaryFormatSupported(receiver_idurl)),
             publickey=route_info['publickey'],
             receiver_idurl=receiver_idurl,
             receiver_proto=receiver_proto,
@@ -847,7 +847,7 @@ class ProxyRouter(automat.Automat):
             Data=data,
             EncryptKey=lambda inp: key.EncryptOpenSSHPublicKey(publickey, inp),
         )
-        raw_data = block.Serialize()
+        raw_data = block.Serialize(binary=signed.IsBinaryFormatSupported(receiver_idurl))
         routed_packet = signed.Packet(
             Command=relay_cmd,
             OwnerID=inbox_packet.OwnerID,
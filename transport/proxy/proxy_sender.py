@@ -329,7 +329,7 @@ class ProxySender(automat.Automat):
                 lg.out(_DebugLevel, 'proxy_sender._do_send_packet_to_router SKIP, packet addressed to router and must be sent in a usual way')
             return None
         try:
-            raw_data = outpacket.Serialize()
+            raw_data = outpacket.Serialize(binary=signed.IsBinaryFormatSupported(router_idurl))
         except:
             lg.exc('failed to Serialize %s' % outpacket)
             return None
@@ -356,7 +356,7 @@ class ProxySender(automat.Automat):
             Data=raw_bytes,
             EncryptKey=lambda inp: key.EncryptOpenSSHPublicKey(publickey, inp),
         )
-        block_encrypted = block.Serialize()
+        block_encrypted = block.Serialize(binary=signed.IsBinaryFormatSupported(router_idurl))
         newpacket = signed.Packet(
             Command=commands.RelayOut(),
             OwnerID=outpacket.OwnerID,
@@ -47,7 +47,6 @@ _DebugLevel = 16
 
 #------------------------------------------------------------------------------
 
-import os
 import time
 
 from twisted.protocols import basic  # @UnresolvedImport
@@ -61,6 +60,8 @@ from automats import automat
 from lib import strng
 from lib import net_misc
 
+from system import tmpfile
+
 #------------------------------------------------------------------------------
 
 FIRST_PRIORITY_SHORT_FILE_SIZE = 64 * 1024
@@ -369,6 +370,9 @@ class TCPConnection(automat.Automat, basic.Int32StringReceiver):
         """
         from transport.tcp import tcp_stream
         self.stream = tcp_stream.TCPFileStream(self)
+        if self.outboxQueue:
+            # files were added while connection was not ready yet, previous runs of the queue were skipped
+            tcp_stream.schedule_connection(self)
 
     def doCloseStream(self, *args, **kwargs):
         """
@@ -462,7 +466,9 @@ class TCPConnection(automat.Automat, basic.Int32StringReceiver):
         self.automat('data-received', (command, payload))
 
     def append_outbox_file(self, filename, description='', result_defer=None, keep_alive=True):
+        from transport.tcp import tcp_stream
         self.outboxQueue.append((filename, description, result_defer, keep_alive))
+        tcp_stream.schedule_connection(self)
 
     def process_outbox_queue(self):
         if self.state != 'CONNECTED':
@@ -477,14 +483,13 @@ class TCPConnection(automat.Automat, basic.Int32StringReceiver):
             # we have a queue of files to be sent
             # somehow file may be removed before we start sending it
             # so we check it here and skip not existed files
-            if not os.path.isfile(filename):
+            if not tmpfile.file_exists(filename):
                 self.failed_outbox_queue_item(filename, description, 'file not exist')
                 if not (keep_alive or self.force_keep_alive):
                     self.automat('shutdown')
                 continue
-            try:
-                filesize = os.path.getsize(filename)
-            except:
+            filesize = tmpfile.file_size(filename)
+            if filesize < 0:
                 self.failed_outbox_queue_item(filename, description, 'can not get file size')
                 if not (keep_alive or self.force_keep_alive):
                     self.automat('shutdown')
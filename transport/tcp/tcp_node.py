@@ -407,5 +407,4 @@ class TCPFactory(protocol.ClientFactory):
 
     def add_outbox_file(self, filename, description='', result_defer=None, keep_alive=True):
         self.pendingoutboxfiles.append((filename, description, result_defer, keep_alive))
-        tcp_stream.process_streams()
 
@@ -56,21 +56,17 @@ from system import tmpfile
 
 from main import settings
 
-from lib import misc
 from lib import strng
 
 #------------------------------------------------------------------------------
 
-MIN_PROCESS_STREAMS_DELAY = 0.1
-MAX_PROCESS_STREAMS_DELAY = 5
-
 MAX_SIMULTANEOUS_OUTGOING_FILES = 20
 
 #------------------------------------------------------------------------------
 
 _LastFileID = None
-_ProcessStreamsDelay = 0.1
 _ProcessStreamsTask = None
+_PendingConnections = set()
 _StreamCounter = 0
 
 #------------------------------------------------------------------------------
@@ -82,6 +78,7 @@ def start_process_streams():
 
 def stop_process_streams():
     global _ProcessStreamsTask
+    _PendingConnections.clear()
     if _ProcessStreamsTask:
         if _ProcessStreamsTask.active():
             _ProcessStreamsTask.cancel()
@@ -91,24 +88,38 @@ def stop_process_streams():
 
 
 def process_streams():
+    """
+    Starts sending queued files on all opened connections.
+    Normally not needed, every connection is processed via ``schedule_connection()``
+    when a new file is queued or an outgoing file is finished.
+    """
     from transport.tcp import tcp_node
-    global _ProcessStreamsDelay
-    global _ProcessStreamsTask
     has_activity = False
     for connections in tcp_node.opened_connections().values():
         for connection in connections:
-            has_timeouts = False  # connection.stream.timeout_incoming_files()
-            has_sends = False  # connection.stream.process_sending_data()
-            has_outbox = connection.process_outbox_queue()
-            if has_timeouts or has_sends or has_outbox:
+            if connection.process_outbox_queue():
                 has_activity = True
-    _ProcessStreamsDelay = misc.LoopAttenuation(
-        _ProcessStreamsDelay, has_activity,
-        MIN_PROCESS_STREAMS_DELAY,
-        MAX_PROCESS_STREAMS_DELAY,)
-    # attenuation
-    _ProcessStreamsTask = reactor.callLater(  # @UndefinedVariable
-        _ProcessStreamsDelay, process_streams)
+    return has_activity
+
+
+def schedule_connection(connection):
+    """
+    Process outbox queue of the given connection during the next reactor iteration.
+    All connections scheduled during same iteration are processed together.
+    """
+    global _ProcessStreamsTask
+    _PendingConnections.add(connection)
+    if _ProcessStreamsTask is None or not _ProcessStreamsTask.active():
+        _ProcessStreamsTask = reactor.callLater(0, _process_pending_connections)  # @UndefinedVariable
+
+
+def _process_pending_connections():
+    global _ProcessStreamsTask
+    _ProcessStreamsTask = None
+    pending = list(_PendingConnections)
+    _PendingConnections.clear()
+    for connection in pending:
+        connection.process_outbox_queue()
 
 #------------------------------------------------------------------------------
 
@@ -382,6 +393,9 @@ class TCPFileStream():
             self.report_outbox_file(outfile.transfer_id, status, outfile.get_bytes_sent(), error_message)
         if not outfile.keep_alive and not self.connection.factory.keep_alive:
             self.connection.automat('disconnect')
+        elif self.connection.outboxQueue:
+            # one more slot is free now, start next queued file
+            schedule_connection(self.connection)
         del outfile
 
 #------------------------------------------------------------------------------
@@ -396,7 +410,13 @@ class InboxFile():
         self.stream = stream
         self.file_id = file_id
         self.size = file_size
-        self.fin, self.filename = tmpfile.make("tcp-in", extension='.tcp')
+        self.buffer = None
+        if tmpfile.fits_memory(self.size):
+            self.fin = None
+            self.filename = tmpfile.make_memory("tcp-in", extension='.tcp', size=self.size)
+            self.buffer = bytearray()
+        else:
+            self.fin, self.filename = tmpfile.make("tcp-in", extension='.tcp')
         self.bytes_received = 0
         self.started = time.time()
         self.last_block_time = time.time()
@@ -409,6 +429,7 @@ class InboxFile():
         if _Debug:
             lg.out(_DebugLevel, '<<<TCP-IN %s CLOSED with %s | %s' % (
                 self.file_id, self.stream.connection.peer_address, self.stream.connection.peer_external_address))
+        self.buffer = None
         if self.fin:
             os.close(self.fin)
             self.fin = None
@@ -418,7 +439,12 @@ class InboxFile():
         return self.bytes_received
 
     def input_data(self, data):
-        os.write(self.fin, data)
+        if self.buffer is not None:
+            self.buffer += data
+            if len(self.buffer) >= self.size:
+                tmpfile.write_memory(self.filename, self.buffer)
+        else:
+            os.write(self.fin, data)
         self.bytes_received += len(data)
         self.stream.connection.total_bytes_received += len(data)
         self.last_block_time = time.time()
@@ -450,7 +476,7 @@ class OutboxFile():
         self.bytes_out = 0
         self.started = time.time()
         self.timeout = max(int(self.size / settings.SendingSpeedLimit()), 6)
-        self.fout = open(self.filename, 'rb')
+        self.fout = tmpfile.open_file(self.filename)
         if _Debug:
             lg.out(
                 _DebugLevel, '>>>TCP-OUT %s with %d bytes reading from %s' %
@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# udp_congestion.py
+#
+# Copyright (C) 2008 Veselin Penev, https://bitdust.io
+#
+# This file (udp_congestion.py) is part of BitDust Software.
+#
+# BitDust is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# BitDust Software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with BitDust Software.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Please contact us if you have any questions at bitdust.io@gmail.com
+
+"""
+.. module:: udp_congestion.
+
+Building blocks of the congestion controlled UDP stream mode, see ``udp_stream.STREAM_MODE_CONGESTION``.
+
+    * ``BlocksRing`` keeps outgoing blocks which are not acknowledged yet,
+      block is found by its ID without any search or sorting.
+    * ``CubicController`` estimates RTT and maintains the congestion window
+      in blocks following CUBIC algorithm (RFC 8312), sending is paced
+      to spread the window over one RTT.
+    * ``pack_sack()`` and ``unpack_sack()`` build and read the selective ACK packet.
+
+
+SACK packet format:
+
+    bytes:
+      0        EOF flag
+      1-4      cumulative block_id, all blocks up to that were received
+      5-8      pause time requested by receiver, float
+      9-12     receiving bandwidth limit, float
+      from 13  bitmap of blocks received after the cumulative block_id:
+               bit N (lowest bit first) is set when block (cumulative block_id + 1 + N) was received
+"""
+
+#------------------------------------------------------------------------------
+
+from __future__ import absolute_import
+from __future__ import division
+
+#------------------------------------------------------------------------------
+
+import struct
+
+#------------------------------------------------------------------------------
+
+SACK_HEADER_SIZE = 13
+MAX_SACK_BLOCKS = 512  # bitmap will not be longer than 64 bytes
+
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+INITIAL_WINDOW = 10  # blocks
+MIN_WINDOW = 2
+INITIAL_RTT = 0.5
+RTO_MARGIN = 0.05  # covers delayed ACKs and timer granularity
+MIN_RTO = 0.2
+MAX_RTO = 3.0
+
+#------------------------------------------------------------------------------
+
+
+def pack_sack(eof, cumulative_block_id, received_block_ids, pause_time=0.0, limit=0.0):
+    bitmap = bytearray()
+    for block_id in received_block_ids:
+        pos = block_id - cumulative_block_id - 1
+        if pos < 0 or pos >= MAX_SACK_BLOCKS:
+            continue
+        byte_pos = pos // 8
+        if byte_pos >= len(bitmap):
+            bitmap.extend(b'\x00' * (byte_pos + 1 - len(bitmap)))
+        bitmap[byte_pos] |= 1 << (pos % 8)
+    return b''.join((
+        struct.pack('?', eof),
+        struct.pack('i', cumulative_block_id),
+        struct.pack('f', pause_time),
+        struct.pack('f', limit),
+        bytes(bitmap),
+    ))
+
+
+def unpack_sack(data):
+    """
+    Returns tuple: (eof, cumulative block_id, pause time, limit, list of selectively acked block IDs).
+    Raises ``ValueError`` if packet is too short.
+    """
+    if len(data) < SACK_HEADER_SIZE:
+        raise ValueError('SACK packet is too short: %d bytes' % len(data))
+    eof = struct.unpack('?', data[0:1])[0]
+    cumulative_block_id = struct.unpack('i', data[1:5])[0]
+    pause_time = struct.unpack('f', data[5:9])[0]
+    limit = struct.unpack('f', data[9:13])[0]
+    received_block_ids = []
+    for byte_pos, byte in enumerate(bytearray(data[SACK_HEADER_SIZE:])):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (1 << bit):
+                received_block_ids.append(cumulative_block_id + 1 + byte_pos * 8 + bit)
+    return eof, cumulative_block_id, pause_time, limit, received_block_ids
+
+#------------------------------------------------------------------------------
+
+
+class OutgoingBlock(object):
+
+    __slots__ = ('block_id', 'data', 'time_sent', 'attempts', 'lost', )
+
+    def __init__(self, block_id, data):
+        self.block_id = block_id
+        self.data = data
+        self.time_sent = -1
+        self.attempts = 0
+        self.lost = False
+
+    def is_in_flight(self):
+        return self.time_sent >= 0 and not self.lost
+
+
+class BlocksRing(object):
+    """
+    Fixed size ring buffer of outgoing blocks indexed by block_id.
+    Blocks are pushed with sequential IDs starting from 1 and can be released in any order,
+    the ring moves forward when the oldest block is released.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.first_id = 1
+        self.next_id = 1
+        self.count = 0
+        self.bytes = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for block_id in range(self.first_id, self.next_id):
+            block = self.slots[block_id % self.capacity]
+            if block is not None:
+                yield block
+
+    def is_full(self):
+        return self.next_id - self.first_id >= self.capacity
+
+    def has_room(self, blocks_count):
+        return self.next_id - self.first_id + blocks_count <= self.capacity
+
+    def last_id(self):
+        return self.next_id - 1
+
+    def push(self, data):
+        if self.is_full():
+            return None
+        block = OutgoingBlock(self.next_id, data)
+        self.slots[self.next_id % self.capacity] = block
+        self.next_id += 1
+        self.count += 1
+        self.bytes += len(data)
+        return block
+
+    def get(self, block_id):
+        if block_id < self.first_id or block_id >= self.next_id:
+            return None
+        return self.slots[block_id % self.capacity]
+
+    def release(self, block_id):
+        block = self.get(block_id)
+        if block is None:
+            return None
+        self.slots[block_id % self.capacity] = None
+        self.count -= 1
+        self.bytes -= len(block.data)
+        while self.first_id < self.next_id and self.slots[self.first_id % self.capacity] is None:
+            self.first_id += 1
+        return block
+
+    def clear(self):
+        self.slots = [None] * self.capacity
+        self.first_id = self.next_id
+        self.count = 0
+        self.bytes = 0
+
+#------------------------------------------------------------------------------
+
+
+class CubicController(object):
+    """
+    Congestion window is counted in blocks.
+    """
+
+    def __init__(self, max_window, initial_window=INITIAL_WINDOW, min_window=MIN_WINDOW):
+        self.max_window = max_window
+        self.min_window = min_window
+        self.cwnd = float(min(initial_window, max_window))
+        self.ssthresh = float(max_window)
+        self.w_max = 0.0
+        self.w_est = 0.0
+        self.k = 0.0
+        self.origin = 0.0
+        self.epoch_start = None
+        self.recovery_end = -1.0
+        self.srtt = None
+        self.rttvar = 0.0
+        self.min_rtt = None
+        self.losses = 0
+
+    def window(self):
+        return int(self.cwnd)
+
+    def in_slow_start(self):
+        return self.cwnd < self.ssthresh
+
+    def rto(self):
+        if self.srtt is None:
+            return MAX_RTO
+        return min(max(self.srtt + max(4.0 * self.rttvar, RTO_MARGIN), MIN_RTO), MAX_RTO)
+
+    def pacing_rate(self, block_size):
+        """
+        Bytes per second, window is sent within one RTT with some gain
+        so the pacing itself does not become a bottleneck.
+        """
+        srtt = self.srtt or INITIAL_RTT
+        gain = 2.0 if self.in_slow_start() else 1.25
+        return gain * self.cwnd * block_size / srtt
+
+    def on_rtt_sample(self, rtt):
+        if rtt <= 0:
+            return
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    def on_ack(self, acked_blocks, now):
+        if acked_blocks <= 0 or now < self.recovery_end:
+            return
+        if self.in_slow_start():
+            self.cwnd = min(self.cwnd + acked_blocks, self.ssthresh)
+        else:
+            if self.epoch_start is None:
+                self.epoch_start = now
+                if self.cwnd < self.w_max:
+                    self.k = ((self.w_max - self.cwnd) / CUBIC_C) ** (1.0 / 3.0)
+                    self.origin = self.w_max
+                else:
+                    self.k = 0.0
+                    self.origin = self.cwnd
+                self.w_est = self.cwnd
+            t = now - self.epoch_start + (self.min_rtt or 0.0)
+            target = self.origin + CUBIC_C * (t - self.k) ** 3
+            #--- TCP friendly region
+            self.w_est += 3.0 * (1.0 - CUBIC_BETA) / (1.0 + CUBIC_BETA) * acked_blocks / self.cwnd
+            if target > self.cwnd:
+                self.cwnd += min(target - self.cwnd, self.cwnd) / self.cwnd * acked_blocks
+            else:
+                self.cwnd += 0.01 * acked_blocks / self.cwnd
+            self.cwnd = max(self.cwnd, self.w_est)
+        self.cwnd = min(self.cwnd, float(self.max_window))
+
+    def on_loss(self, now, timeout=False):
+        """
+        Reduces the window only once per RTT, returns True if window was reduced.
+        """
+        if now < self.recovery_end:
+            return False
+        self.losses += 1
+        self.epoch_start = None
+        if self.cwnd < self.w_max:
+            #--- fast convergence
+            self.w_max = self.cwnd * (1.0 + CUBIC_BETA) / 2.0
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, float(self.min_window))
+        if timeout:
+            self.cwnd = float(self.min_window)
+        else:
+            self.cwnd = self.ssthresh
+        self.recovery_end = now + (self.srtt or INITIAL_RTT)
+        return True
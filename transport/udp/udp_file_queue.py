@@ -28,7 +28,7 @@
 
 from __future__ import absolute_import
 from io import open
-from io import StringIO
+from io import BytesIO
 
 #------------------------------------------------------------------------------
 
@@ -43,7 +43,6 @@ from twisted.internet import reactor  # @UnresolvedImport
 
 from logs import lg
 
-from lib import strng
 from lib import udp
 
 from system import tmpfile
@@ -103,26 +102,39 @@ class FileQueue:
             stream.on_close()
         self.outboxQueue = []
 
+    def get_stream_mode(self, stream_id):
+        from transport.udp import udp_stream
+        s = self.streams.get(stream_id)
+        if s is None:
+            return udp_stream.STREAM_MODE_LEGACY
+        return s.mode
+
     def do_send_data(self, stream_id, outfile, output):
         #         if _Debug:
         #             import random
         #             if random.randint(1, 100) > 90:
         #                 return True
-        newoutput = ''.join((
+        from transport.udp import udp_stream
+        newoutput = b''.join((
             struct.pack('i', stream_id),
             struct.pack('i', outfile.size),
             output))
-        return self.session.send_packet(udp.CMD_DATA, strng.to_bin(newoutput))
+        if self.get_stream_mode(stream_id) == udp_stream.STREAM_MODE_CONGESTION:
+            return self.session.send_packet(udp.CMD_DATA2, newoutput)
+        return self.session.send_packet(udp.CMD_DATA, newoutput)
 
     def do_send_ack(self, stream_id, infile, ack_data):
         #         if _Debug:
         #             import random
         #             if random.randint(1, 100) > 90:
         #                 return True
-        newoutput = ''.join((
+        from transport.udp import udp_stream
+        newoutput = b''.join((
             struct.pack('i', stream_id),
             ack_data))
-        return self.session.send_packet(udp.CMD_ACK, strng.to_bin(newoutput))
+        if self.get_stream_mode(stream_id) == udp_stream.STREAM_MODE_CONGESTION:
+            return self.session.send_packet(udp.CMD_SACK, newoutput)
+        return self.session.send_packet(udp.CMD_ACK, newoutput)
 
     def append_outbox_file(self, filename, description='', result_defer=None, keep_alive=True):
         from transport.udp import udp_session
@@ -151,12 +163,11 @@ class FileQueue:
             # we have a queue of files to be sent
             # somehow file may be removed before we start sending it
             # so I check it here and skip not existed files
-            if not os.path.isfile(filename):
+            if not tmpfile.file_exists(filename):
                 self.on_failed_outbox_queue_item(filename, description, 'file not exist', result_defer, keep_alive)
                 continue
-            try:
-                filesize = os.path.getsize(filename)
-            except:
+            filesize = tmpfile.file_size(filename)
+            if filesize < 0:
                 self.on_failed_outbox_queue_item(filename, description, 'can not get file size', result_defer, keep_alive)
                 continue
             self.start_outbox_file(filename, filesize, description, result_defer, keep_alive)
@@ -177,7 +188,8 @@ class FileQueue:
                 stream_id, description, os.path.basename(filename), filesize, self.session.peer_id))
         self.outboxFiles[stream_id] = OutboxFile(
             self, stream_id, filename, filesize, description, result_defer, keep_alive)
-        self.streams[stream_id] = udp_stream.create(stream_id, self.outboxFiles[stream_id], self)
+        self.streams[stream_id] = udp_stream.create(stream_id, self.outboxFiles[stream_id], self, self.session.stream_mode)
+        self.outboxFiles[stream_id].chunk_size = self.streams[stream_id].chunk_size
         if keep_alive:
             d = udp_interface.interface_register_file_sending(
                 self.session.peer_id, self.session.peer_idurl, filename, description)
@@ -185,14 +197,15 @@ class FileQueue:
             d.addErrback(self.on_outbox_file_register_failed, stream_id)
             self.outboxFiles[stream_id].registration = d
 
-    def start_inbox_file(self, stream_id, data_size):
+    def start_inbox_file(self, stream_id, data_size, stream_mode=None):
         from transport.udp import udp_interface
         from transport.udp import udp_stream
         if _Debug:
             lg.out(12, 'udp_file_queue.start_inbox_file %d %d %s' % (
                 stream_id, data_size, self.session.peer_id))
         self.inboxFiles[stream_id] = InboxFile(self, stream_id, data_size)
-        self.streams[stream_id] = udp_stream.create(stream_id, self.inboxFiles[stream_id], self)
+        self.streams[stream_id] = udp_stream.create(
+            stream_id, self.inboxFiles[stream_id], self, stream_mode or udp_stream.STREAM_MODE_LEGACY)
         d = udp_interface.interface_register_file_receiving(
             self.session.peer_id, self.session.peer_idurl,
             self.inboxFiles[stream_id].filename, self.inboxFiles[stream_id].size)
@@ -245,8 +258,8 @@ class FileQueue:
 
     #-------------------------------------------------------------------------
 
-    def on_received_data_packet(self, payload):
-        inp = StringIO(payload)
+    def on_received_data_packet(self, payload, stream_mode=None):
+        inp = BytesIO(payload)
         try:
             stream_id = int(struct.unpack('i', inp.read(4))[0])
             data_size = int(struct.unpack('i', inp.read(4))[0])
@@ -258,14 +271,14 @@ class FileQueue:
             inp.close()
             if _Debug:
                 lg.warn('SEND ZERO ACK, peer id is unknown yet %s' % stream_id)
-            self.do_send_ack(stream_id, None, '')
+            self.do_send_ack(stream_id, None, b'')
             return
-        if stream_id not in list(self.streams.keys()):
+        if stream_id not in self.streams:
             if stream_id in self.dead_streams:
                 inp.close()
                 # if _Debug:
                 # lg.warn('SEND ZERO ACK, got old block %s' % stream_id)
-                self.do_send_ack(stream_id, None, '')
+                self.do_send_ack(stream_id, None, b'')
                 return
             if len(self.streams) >= 2 * MAX_SIMULTANEOUS_STREAMS_PER_SESSION:
                 # too many incoming streams, seems remote side is cheating - drop that session!
@@ -276,17 +289,19 @@ class FileQueue:
                 if _Debug:
                     lg.warn('SEND ZERO ACK, too many active streams: %d  skipped: %s %s' % (
                         len(self.streams), stream_id, self.session.peer_id))
-                self.do_send_ack(stream_id, None, '')
+                self.do_send_ack(stream_id, None, b'')
                 return
-            self.start_inbox_file(stream_id, data_size)
+            self.start_inbox_file(stream_id, data_size, stream_mode)
         try:
             self.streams[stream_id].on_block_received(inp)
         except:
             lg.exc()
         inp.close()
 
-    def on_received_ack_packet(self, payload):
-        inp = StringIO(payload)
+    def on_received_ack_packet(self, payload, stream_mode=None):
+        from transport.udp import udp_session
+        from transport.udp import udp_stream
+        inp = BytesIO(payload)
         try:
             stream_id = int(struct.unpack('i', inp.read(4))[0])
         except:
@@ -294,7 +309,7 @@ class FileQueue:
             lg.exc()
             # self.session.automat('shutdown')
             return
-        if stream_id not in list(self.streams.keys()):
+        if stream_id not in self.streams:
             inp.close()
             # if not self.receivedFiles.has_key(stream_id):
             # lg.warn('unknown stream_id=%d in ACK packet from %s' % (
@@ -309,11 +324,16 @@ class FileQueue:
             # self.session.automat('shutdown')
             return
         try:
-            self.streams[stream_id].on_ack_received(inp)
+            if stream_mode == udp_stream.STREAM_MODE_CONGESTION:
+                self.streams[stream_id].on_sack_received(inp)
+            else:
+                self.streams[stream_id].on_ack_received(inp)
         except:
             lg.exc()
             self.session.automat('shutdown')
         inp.close()
+        # acked blocks released space in the stream buffer, push more data
+        udp_session.schedule_session(self.session)
 
     def on_inbox_file_done(self, stream_id):
         assert stream_id in list(self.inboxFiles.keys())
@@ -477,8 +497,14 @@ class InboxFile():
         self.queue = queue
         self.stream_callback = None
         self.stream_id = stream_id
-        self.fd, self.filename = tmpfile.make("udp-in", extension='.udp')
         self.size = size
+        self.buffer = None
+        if tmpfile.fits_memory(self.size):
+            self.fd = None
+            self.filename = tmpfile.make_memory("udp-in", extension='.udp', size=self.size)
+            self.buffer = bytearray()
+        else:
+            self.fd, self.filename = tmpfile.make("udp-in", extension='.udp')
         self.bytes_received = 0
         self.started = time.time()
         self.cancelled = False
@@ -515,11 +541,18 @@ class InboxFile():
         self.stream_callback = None
 
     def close_file(self):
-        os.close(self.fd)
-        self.fd = None
+        self.buffer = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
 
     def process(self, newdata):
-        os.write(self.fd, newdata)
+        if self.buffer is not None:
+            self.buffer += newdata
+            if len(self.buffer) >= self.size:
+                tmpfile.write_memory(self.filename, self.buffer)
+        else:
+            os.write(self.fd, newdata)
         self.bytes_received += len(newdata)
 
     def is_done(self):
@@ -554,13 +587,14 @@ class OutboxFile():
         self.bytes_sent = 0
         self.bytes_delivered = 0
         self.buffer = b''
+        self.chunk_size = None
         self.eof = False
         self.cancelled = False
         self.timeout = False
         self.status = None
         self.error_message = ''
         self.started = time.time()
-        self.fileobj = open(self.filename, 'rb')
+        self.fileobj = tmpfile.open_file(self.filename)
         if _Debug:
             lg.out(18, 'udp_file_queue.OutboxFile.__init__ {%s} [%d] to %s with %d bytes' % (
                 os.path.basename(self.filename), self.stream_id, str(self.queue.session.peer_address), self.size))
@@ -625,7 +659,7 @@ class OutboxFile():
             if not self.buffer:
                 if not self.fileobj:
                     return False
-                data = self.fileobj.read(udp_stream.CHUNK_SIZE)
+                data = self.fileobj.read(self.chunk_size or udp_stream.CHUNK_SIZE)
                 if not data:
                     if _Debug:
                         lg.out(18, 'udp_file_queue.OutboxFile.process reach EOF state %d' % self.stream_id)
@@ -55,11 +55,12 @@ from twisted.internet import reactor  # @UnresolvedImport
 from logs import lg
 
 from lib import strng
-from lib import misc
 from lib import udp
 
 from automats import automat
 
+from transport.udp import udp_stream
+
 #------------------------------------------------------------------------------
 
 _Debug = False
@@ -67,7 +68,6 @@ _DebugLevel = 14
 
 #------------------------------------------------------------------------------
 
-MIN_PROCESS_SESSIONS_DELAY = 0.001
 MAX_PROCESS_SESSIONS_DELAY = 1.0
 
 #------------------------------------------------------------------------------
@@ -79,7 +79,8 @@ _KnownPeersDict = {}
 _KnownUserIDsDict = {}
 _PendingOutboxFiles = []
 _ProcessSessionsTask = None
-_ProcessSessionsDelay = MIN_PROCESS_SESSIONS_DELAY
+_PendingSessionsTask = None
+_PendingSessions = set()
 
 #------------------------------------------------------------------------------
 
@@ -184,8 +185,13 @@ def report_and_remove_pending_outbox_files_to_host(remote_host, error_message):
 
 
 def process_sessions(sessions_to_process=None):
+    """
+    Starts queued files and pushes more data of outgoing files into the streams.
+    Sessions are processed via ``schedule_session()`` when a file was queued or ACK received,
+    while there are active outgoing files all sessions are also checked every
+    ``MAX_PROCESS_SESSIONS_DELAY`` seconds.
+    """
     global _ProcessSessionsTask
-    global _ProcessSessionsDelay
     has_activity = False
     if not sessions_to_process:
         sessions_to_process = list(sessions().values())
@@ -200,20 +206,41 @@ def process_sessions(sessions_to_process=None):
         has_sends = s.file_queue.process_outbox_files()
         if has_sends or has_outbox:
             has_activity = True
-    if _ProcessSessionsTask is None or _ProcessSessionsTask.called:
-        if has_activity:
-            _ProcessSessionsDelay = MIN_PROCESS_SESSIONS_DELAY
-        else:
-            _ProcessSessionsDelay = misc.LoopAttenuation(
-                _ProcessSessionsDelay, has_activity,
-                MIN_PROCESS_SESSIONS_DELAY, MAX_PROCESS_SESSIONS_DELAY,)
-        # attenuation
-        _ProcessSessionsTask = reactor.callLater(  # @UndefinedVariable
-            _ProcessSessionsDelay, process_sessions)
+    if _ProcessSessionsTask is None or not _ProcessSessionsTask.active():
+        for s in sessions().values():
+            if s.file_queue and (s.file_queue.outboxFiles or s.file_queue.outboxQueue):
+                _ProcessSessionsTask = reactor.callLater(  # @UndefinedVariable
+                    MAX_PROCESS_SESSIONS_DELAY, process_sessions)
+                break
+    return has_activity
+
+
+def schedule_session(session):
+    """
+    Process given session during the next reactor iteration.
+    """
+    global _PendingSessionsTask
+    _PendingSessions.add(session)
+    if _PendingSessionsTask is None or not _PendingSessionsTask.active():
+        _PendingSessionsTask = reactor.callLater(0, _process_pending_sessions)  # @UndefinedVariable
+
+
+def _process_pending_sessions():
+    global _PendingSessionsTask
+    _PendingSessionsTask = None
+    pending = list(_PendingSessions)
+    _PendingSessions.clear()
+    process_sessions(pending)
 
 
 def stop_process_sessions():
     global _ProcessSessionsTask
+    global _PendingSessionsTask
+    _PendingSessions.clear()
+    if _PendingSessionsTask:
+        if _PendingSessionsTask.active():
+            _PendingSessionsTask.cancel()
+        _PendingSessionsTask = None
     if _ProcessSessionsTask:
         if _ProcessSessionsTask.active():
             _ProcessSessionsTask.cancel()
@@ -285,6 +312,8 @@ class UDPSession(automat.Automat):
         self.peer_rtt_id = '0'  # in
         self.rtts = {}
         self.min_rtt = None
+        self.stream_mode = udp_stream.STREAM_MODE_LEGACY
+        self.datagram_size = udp_stream.UDP_DATAGRAM_SIZE
 
     def send_packet(self, command, payload):
         self.bytes_sent += len(payload)
@@ -382,7 +411,7 @@ class UDPSession(automat.Automat):
         Condition method.
         """
         command = args[0][0][0]
-        return (command == udp.CMD_DATA or command == udp.CMD_ACK)
+        return command in (udp.CMD_DATA, udp.CMD_ACK, udp.CMD_DATA2, udp.CMD_SACK, )
 
     def isPing(self, *args, **kwargs):
         """
@@ -446,9 +475,10 @@ class UDPSession(automat.Automat):
         Action method.
         """
         # rtt_id_out = self._rtt_start('GREETING')
-        payload = "%s %s %s %s" % (
+        payload = "%s %s %s %s %s" % (
             str(self.node.my_id), str(self.node.my_idurl),
-            str(self.peer_rtt_id), str(self.my_rtt_id),)
+            str(self.peer_rtt_id), str(self.my_rtt_id),
+            udp_stream.stream_mode_capabilities(), )
         udp.send_command(
             self.node.listen_port,
             udp.CMD_GREETING,
@@ -483,7 +513,7 @@ class UDPSession(automat.Automat):
         Action method.
         """
         address, command, payload = self._dispatch_datagram(args[0])
-        parts = payload.split(' ')
+        parts = strng.to_text(payload).split(' ')
         try:
             new_peer_id = parts[0]
             new_peer_idurl = parts[1]
@@ -498,6 +528,8 @@ class UDPSession(automat.Automat):
         except:
             lg.exc()
             return
+        # old peers do not send stream mode capabilities, so they will receive files in legacy mode
+        self.stream_mode, self.datagram_size = udp_stream.negotiate_stream_mode(parts[4] if len(parts) >= 5 else '')
         # print 'doAcceptGreeting', self.peer_rtt_id, self.my_rtt_id
         # self._rtt_finish(rtt_id_in)
         # rtt_id_out = self._rtt_start('ALIVE')
@@ -577,6 +609,10 @@ class UDPSession(automat.Automat):
             self.file_queue.on_received_data_packet(payload)
         elif command == udp.CMD_ACK:
             self.file_queue.on_received_ack_packet(payload)
+        elif command == udp.CMD_DATA2:
+            self.file_queue.on_received_data_packet(payload, stream_mode=udp_stream.STREAM_MODE_CONGESTION)
+        elif command == udp.CMD_SACK:
+            self.file_queue.on_received_ack_packet(payload, stream_mode=udp_stream.STREAM_MODE_CONGESTION)
 #        elif command == udp.CMD_PING:
 #            pass
 #        elif command == udp.CMD_ALIVE:
@@ -625,8 +661,9 @@ class UDPSession(automat.Automat):
                 i += 1
                 # print 'skip'
         # print len(_PendingOutboxFiles)
-        if outgoings > 0:
-            reactor.callLater(0, process_sessions)  # @UndefinedVariable
+        if outgoings > 0 or self.file_queue.outboxQueue:
+            # files queued before session was connected are also started right away
+            schedule_session(self)
 
     def doClosePendingFiles(self, *args, **kwargs):
         """
@@ -81,11 +81,12 @@ Datagrams format:
 
 from __future__ import absolute_import
 from six.moves import map
-from io import StringIO
+from io import BytesIO
 
 #------------------------------------------------------------------------------
 
 import time
+import heapq
 import struct
 import bisect
 
@@ -97,6 +98,8 @@ from logs import lg
 
 from automats import automat
 
+from transport.udp import udp_congestion
+
 #------------------------------------------------------------------------------
 
 _Debug = False
@@ -104,9 +107,14 @@ _DebugLevel = 16
 
 #------------------------------------------------------------------------------
 
-POOLING_INTERVAL = 0.1   # smaller pooling size will increase CPU load
+STREAM_MODE_LEGACY = 1  # fixed window, ACK with a list of received blocks
+STREAM_MODE_CONGESTION = 2  # congestion window with pacing, selective ACK bitmap
+
+POOLING_INTERVAL = 0.1   # longest delay between two iterations of a stream with blocks in flight
 UDP_DATAGRAM_SIZE = 508  # largest safe datagram size
-BLOCK_SIZE = UDP_DATAGRAM_SIZE - 14  # 14 bytes - BitDust header
+MAX_DATAGRAM_SIZE = 1400  # fits into 1500 bytes MTU with IPv6 header and some tunnel overhead
+DATA_HEADER_SIZE = 14  # 14 bytes - BitDust header
+BLOCK_SIZE = UDP_DATAGRAM_SIZE - DATA_HEADER_SIZE
 
 BLOCKS_PER_ACK = 8  # need to verify delivery get success
 # ack packets will be sent as response,
@@ -128,6 +136,12 @@ MAX_ACK_TIMEOUTS = 5  # if we get too much errors - connection will be closed
 ACCEPTABLE_ERRORS_RATE = 0.02  # 2% errors considered to be acceptable quality
 SENDING_LIMIT_FACTOR_ON_START = 1.0  # idea was to decrease sending speed with factor
 
+SACK_BLOCKS_PER_ACK = 2  # in congestion mode receiver acks every second block
+SACK_DELAY = 0.02  # or sends ACK after a short delay, out of order block is acked immediately
+MAX_WINDOW_BLOCKS = 1024  # size of the ring of not acked blocks in congestion mode
+DUPLICATE_ACKS_THRESHOLD = 3  # block is lost when 3 blocks sent after it were acked
+PACING_BURST_BLOCKS = 4  # blocks can be sent at once without pacing
+
 # decide about the moment to kill the stream
 RECEIVING_TIMEOUT = RTT_MAX_LIMIT * (MAX_ACK_TIMEOUTS + 1)
 SENDING_TIMEOUT = RTT_MAX_LIMIT * (MAX_ACK_TIMEOUTS + 1)
@@ -136,7 +150,9 @@ SENDING_TIMEOUT = RTT_MAX_LIMIT * (MAX_ACK_TIMEOUTS + 1)
 
 _Streams = {}
 _ProcessStreamsTask = None
-_ProcessStreamsIterations = 0
+_ProcessStreamsTaskDeadline = None
+_StreamTimers = []
+_StreamDeadlines = {}
 
 _GlobalLimitReceiveBytesPerSec = 1000.0 * 125000  # default receiveing limit bps
 _GlobalLimitSendBytesPerSec = 1000.0 * 125000  # default sending limit bps
@@ -149,13 +165,13 @@ def streams():
     return _Streams
 
 
-def create(stream_id, consumer, producer):
+def create(stream_id, consumer, producer, mode=STREAM_MODE_LEGACY):
     """
     Creates a new UDP stream.
     """
     if _Debug:
-        lg.out(_DebugLevel, 'udp_stream.create stream_id=%s' % str(stream_id))
-    s = UDPStream(stream_id, consumer, producer)
+        lg.out(_DebugLevel, 'udp_stream.create stream_id=%s mode=%d' % (str(stream_id), mode))
+    s = UDPStream(stream_id, consumer, producer, mode)
     streams()[s.stream_id] = s
     s.automat('init')
     reactor.callLater(0, balance_streams_limits)  # @UndefinedVariable
@@ -175,6 +191,29 @@ def close(stream_id):
         lg.out(_DebugLevel, 'udp_stream.close send "close" to stream %s' % str(stream_id))
     return True
 
+
+def stream_mode_capabilities():
+    """
+    Sent to remote peer in the GREETING packet, see ``udp_session.doGreeting()``.
+    """
+    return '%d:%d' % (STREAM_MODE_CONGESTION, MAX_DATAGRAM_SIZE)
+
+
+def negotiate_stream_mode(capabilities):
+    """
+    Returns stream mode and datagram size to be used to send files to a peer
+    which sent given capabilities, old peers do not send them at all.
+    """
+    try:
+        mode, datagram_size = capabilities.split(':')
+        mode = int(mode)
+        datagram_size = int(datagram_size)
+    except:
+        return STREAM_MODE_LEGACY, UDP_DATAGRAM_SIZE
+    if mode < STREAM_MODE_CONGESTION or datagram_size < UDP_DATAGRAM_SIZE:
+        return STREAM_MODE_LEGACY, UDP_DATAGRAM_SIZE
+    return STREAM_MODE_CONGESTION, min(datagram_size, MAX_DATAGRAM_SIZE)
+
 #------------------------------------------------------------------------------
 
 def get_global_input_limit_bytes_per_sec():
@@ -224,22 +263,26 @@ def sort_method(stream_instance):
         return stream_instance.output_bytes_per_sec_current
     return stream_instance.input_bytes_per_sec_current
 
-def process_streams():
-    global _ProcessStreamsTask
-    global _ProcessStreamsIterations
+def iterate_streams(streams_to_iterate):
+    """
+    Sends "iterate" event to given streams and schedules their next iteration.
+    """
     global _CurrentSendingAvarageRate
-
-    for s in streams().values():
+    for s in streams_to_iterate:
         if s.state != 'RECEIVING':
             continue
         s.event('iterate')
 
+    for s in sorted(streams_to_iterate, key=lambda s: s.output_blocks_last_delta):
+        if s.state != 'SENDING':
+            continue
+        s.event('iterate')
+
     sending_streams_count = 0.0
     total_sending_rate = 0.0
-    for s in sorted(list(streams().values()), key=lambda s: s.output_blocks_last_delta):
+    for s in streams().values():
         if s.state != 'SENDING':
             continue
-        s.event('iterate')
         if s.get_output_limit_from_remote() > 0:
             continue
         total_sending_rate += s.get_current_output_speed()
@@ -250,17 +293,84 @@ def process_streams():
     else:
         _CurrentSendingAvarageRate = 0.0
 
-    if _ProcessStreamsTask is None or _ProcessStreamsTask.called:
-        _ProcessStreamsTask = reactor.callLater(  # @UndefinedVariable
-            POOLING_INTERVAL, process_streams)
+    for s in streams_to_iterate:
+        s.schedule_next_iteration()
+
+
+def process_streams():
+    """
+    Iterates all existing streams once, after that every stream is only
+    processed when its own timer fires, see ``schedule_iteration()``.
+    """
+    iterate_streams(list(streams().values()))
+
+
+def schedule_iteration(stream_id, delay):
+    """
+    Makes sure stream will receive "iterate" event not later than after ``delay`` seconds.
+    All timers are kept in a single heap and only one reactor call is scheduled
+    for the nearest deadline, so idle streams do not wake up the reactor.
+    """
+    deadline = time.time() + delay
+    current_deadline = _StreamDeadlines.get(stream_id)
+    if current_deadline is not None and current_deadline <= deadline:
+        return
+    _StreamDeadlines[stream_id] = deadline
+    heapq.heappush(_StreamTimers, (deadline, stream_id, ))
+    _schedule_timers()
+
+
+def cancel_iteration(stream_id):
+    _StreamDeadlines.pop(stream_id, None)
+
+
+def _schedule_timers():
+    global _ProcessStreamsTask
+    global _ProcessStreamsTaskDeadline
+    while _StreamTimers and _StreamDeadlines.get(_StreamTimers[0][1]) != _StreamTimers[0][0]:
+        heapq.heappop(_StreamTimers)
+    if not _StreamTimers:
+        if _ProcessStreamsTask and _ProcessStreamsTask.active():
+            _ProcessStreamsTask.cancel()
+        _ProcessStreamsTask = None
+        return
+    deadline = _StreamTimers[0][0]
+    if _ProcessStreamsTask and _ProcessStreamsTask.active():
+        if _ProcessStreamsTaskDeadline <= deadline:
+            return
+        _ProcessStreamsTask.cancel()
+    _ProcessStreamsTaskDeadline = deadline
+    _ProcessStreamsTask = reactor.callLater(  # @UndefinedVariable
+        max(0.0, deadline - time.time()), _process_timers)
+
+
+def _process_timers():
+    global _ProcessStreamsTask
+    _ProcessStreamsTask = None
+    now = time.time()
+    streams_to_iterate = []
+    while _StreamTimers and _StreamTimers[0][0] <= now:
+        deadline, stream_id = heapq.heappop(_StreamTimers)
+        if _StreamDeadlines.get(stream_id) != deadline:
+            continue
+        _StreamDeadlines.pop(stream_id)
+        s = streams().get(stream_id)
+        if s:
+            streams_to_iterate.append(s)
+    iterate_streams(streams_to_iterate)
+    _schedule_timers()
 
 
 def stop_process_streams():
     global _ProcessStreamsTask
+    global _ProcessStreamsTaskDeadline
     if _ProcessStreamsTask:
         if _ProcessStreamsTask.active():
             _ProcessStreamsTask.cancel()
         _ProcessStreamsTask = None
+    _ProcessStreamsTaskDeadline = None
+    _StreamDeadlines.clear()
+    del _StreamTimers[:]
 
 #------------------------------------------------------------------------------
 
@@ -279,10 +389,20 @@ class UDPStream(automat.Automat):
 
     post = True
 
-    def __init__(self, stream_id, consumer, producer):
+    def __init__(self, stream_id, consumer, producer, mode=STREAM_MODE_LEGACY):
         self.stream_id = stream_id
         self.consumer = consumer
         self.producer = producer
+        self.mode = mode
+        if self.mode == STREAM_MODE_CONGESTION:
+            self.block_size = self.producer.session.datagram_size - DATA_HEADER_SIZE
+            self.blocks_per_ack = SACK_BLOCKS_PER_ACK
+            self.ack_delay = SACK_DELAY
+        else:
+            self.block_size = BLOCK_SIZE
+            self.blocks_per_ack = BLOCKS_PER_ACK
+            self.ack_delay = RTT_MAX_LIMIT / 2.0
+        self.chunk_size = self.block_size * BLOCKS_PER_ACK
         self.started = time.time()
         self.consumer.set_stream_callback(self.on_consume)
         if _Debug:
@@ -332,6 +452,15 @@ class UDPStream(automat.Automat):
         self.output_limit_iteration_last_time = 0
         self.output_rtt_avarage = 0.0
         self.output_rtt_counter = 1.0
+        self.output_ring = None
+        self.output_cc = None
+        self.output_in_flight = 0
+        self.output_lost_ids = []
+        self.output_next_new_id = 1
+        self.output_rto_check_time = float('inf')
+        self.output_pacing_budget = 0.0
+        self.output_pacing_last_time = 0.0
+        self.output_next_send_delay = None
         self.input_ack_last_time = 0
         self.input_ack_error_last_check = 0
         self.input_acks_counter = 0
@@ -462,6 +591,9 @@ class UDPStream(automat.Automat):
                 newstate = 'CLOSED'
         return newstate
 
+    def state_changed(self, oldstate, newstate, event, *args, **kwargs):
+        self.schedule_next_iteration()
+
     def isEOF(self, *args, **kwargs):
         """
         Condition method.
@@ -489,6 +621,11 @@ class UDPStream(automat.Automat):
             self.output_rtt_avarage = self.producer.session.min_rtt
         else:
             self.output_rtt_avarage = (RTT_MIN_LIMIT + RTT_MAX_LIMIT) / 2.0
+        if self.mode == STREAM_MODE_CONGESTION:
+            self.output_ring = udp_congestion.BlocksRing(MAX_WINDOW_BLOCKS)
+            self.output_cc = udp_congestion.CubicController(max_window=MAX_WINDOW_BLOCKS)
+            if self.producer.session.min_rtt is not None and self.producer.session.min_rtt < RTT_MAX_LIMIT:
+                self.output_cc.on_rtt_sample(self.producer.session.min_rtt)
         if _Debug:
             lg.out(self.debug_level, 'udp_stream.doInit %d with %s limits: (in=%r|out=%r)  rtt=%r' % (
                 self.stream_id,
@@ -508,7 +645,10 @@ class UDPStream(automat.Automat):
         Action method.
         """
         current_blocks = self.output_blocks_counter
-        self._resend_blocks()
+        if self.mode == STREAM_MODE_CONGESTION:
+            self._send_window()
+        else:
+            self._resend_blocks()
         self.output_blocks_last_delta = self.output_blocks_counter - current_blocks
 
     def doResendAck(self, *args, **kwargs):
@@ -638,6 +778,10 @@ class UDPStream(automat.Automat):
         self.input_blocks_to_ack = []
         self.output_blocks.clear()
         self.output_blocks_ids = []
+        if self.output_ring:
+            self.output_ring.clear()
+        self.output_lost_ids = []
+        self.output_in_flight = 0
 
     def doUpdateLimits(self, *args, **kwargs):
         """
@@ -664,6 +808,7 @@ class UDPStream(automat.Automat):
         self.producer.on_close_stream(self.stream_id)
         self.producer = None
         streams().pop(self.stream_id)
+        cancel_iteration(self.stream_id)
         self.destroy()
         reactor.callLater(0, balance_streams_limits)  # @UndefinedVariable
 
@@ -689,7 +834,7 @@ class UDPStream(automat.Automat):
             self.input_block_id_last = block_id
             eof = False
             raw_size = 0
-            if block_id in list(self.input_blocks.keys()):
+            if block_id in self.input_blocks:
             #--- duplicated block received
                 self.input_duplicated_blocks += 1
                 self.input_duplicated_bytes += len(data)
@@ -706,7 +851,7 @@ class UDPStream(automat.Automat):
                     bisect.insort(self.input_blocks_to_ack, block_id)
             if block_id == self.input_block_id_current + 1:
             #--- receiving data and check every next block one by one
-                newdata = StringIO()
+                newdata = BytesIO()
                 while True:
                     next_block_id = self.input_block_id_current + 1
                     try:
@@ -742,6 +887,7 @@ class UDPStream(automat.Automat):
                     self.stream_id, self.eof, self.input_bytes_received, self.input_blocks_counter))
             #--- raise 'block-received' event
         self.event('block-received', (block_id, data))
+        self.schedule_next_iteration()
 
     def on_ack_received(self, inpt):
         if not (self.consumer and getattr(self.consumer, 'on_sent_raw_data', None)):
@@ -863,9 +1009,93 @@ class UDPStream(automat.Automat):
                     self.stream_id, self.output_acked_block_id_current,
                     len(self.output_blocks), eof, self.output_bytes_acked, sz, acks))
         self.event('ack-received', (acks, pause_time, remote_side_limit_receiving))
+        self.schedule_next_iteration()
+
+    def on_sack_received(self, inpt):
+        if not (self.consumer and getattr(self.consumer, 'on_sent_raw_data', None)):
+            return
+            #--- read SACK
+        relative_time = time.time() - self.creation_time
+        self.input_ack_last_time = relative_time
+        try:
+            eof_flag, cumulative_block_id, pause_time, remote_side_limit_receiving, sacked_ids = udp_congestion.unpack_sack(inpt.read())
+        except ValueError:
+            lg.exc()
+            return
+        self.input_acks_counter += 1
+        eof = False
+        acks = []
+        for block_id in range(self.output_ring.first_id, min(cumulative_block_id, self.output_ring.last_id()) + 1):
+            if self.output_ring.get(block_id):
+                acks.append(block_id)
+        for block_id in sacked_ids:
+            if self.output_ring.get(block_id):
+                acks.append(block_id)
+        if not acks and sacked_ids:
+            self.input_acks_garbage_counter += 1
+        highest_acked_id = 0
+        highest_acked_time = -1
+        for block_id in acks:
+            #--- mark block as acked and release it from the ring
+            outblock = self.output_ring.release(block_id)
+            if outblock.is_in_flight():
+                self.output_in_flight -= 1
+            if outblock.attempts == 1 and not outblock.lost:
+                #--- only blocks sent once give correct RTT
+                last_ack_rtt = relative_time - outblock.time_sent
+                self.output_cc.on_rtt_sample(last_ack_rtt)
+                self.output_rtt_avarage += last_ack_rtt
+                self.output_rtt_counter += 1.0
+                if self.output_rtt_counter > MAX_RTT_COUNTER:
+                    rtt_avarage_dropped = self.output_rtt_avarage / self.output_rtt_counter
+                    self.output_rtt_counter = round(MAX_RTT_COUNTER / 2.0, 0)
+                    self.output_rtt_avarage = rtt_avarage_dropped * self.output_rtt_counter
+            if block_id > highest_acked_id:
+                highest_acked_id = block_id
+                highest_acked_time = outblock.time_sent
+            block_size = len(outblock.data)
+            self.output_bytes_acked += block_size
+            self.output_buffer_size -= block_size
+            self.output_blocks_success_counter += 1.0
+            self.output_quality_counter += 1.0
+            self.output_blocks_acked += 1
+            #--- process delivered data
+            eof = self.consumer.on_sent_raw_data(block_size)
+            if not self.consumer:
+                break
+        self.output_acked_block_id_current = self.output_ring.first_id - 1
+        #--- not acked blocks sent before the one which was acked now are lost
+        lost_found = False
+        for block_id in range(self.output_ring.first_id, highest_acked_id - DUPLICATE_ACKS_THRESHOLD + 1):
+            outblock = self.output_ring.get(block_id)
+            if outblock and outblock.is_in_flight() and outblock.time_sent <= highest_acked_time:
+                self._mark_block_lost(outblock, relative_time)
+                lost_found = True
+        if lost_found:
+            self.output_cc.on_loss(relative_time)
+        self.output_cc.on_ack(len(acks), relative_time)
+        eof = eof or eof_flag
+        if not self.eof and eof:
+            #--- remember EOF state
+            self.eof = eof
+            if _Debug:
+                lg.out(self.debug_level, '    in-> SACK %d : EOF RICHED !!!!!!!!' % self.stream_id)
+        if _Debug:
+            lg.out(self.debug_level + 6, 'in-> SACK %d %d+%r %d cwnd=%r rto=%r %s %d' % (
+                self.stream_id, cumulative_block_id, sacked_ids, len(self.output_ring),
+                self.output_cc.window(), self.output_cc.rto(), eof, self.output_bytes_acked))
+        self.event('ack-received', (acks, pause_time, remote_side_limit_receiving))
+        self.schedule_next_iteration()
 
     def on_consume(self, data):
         if self.consumer:
+            if self.mode == STREAM_MODE_CONGESTION:
+                blocks_count = (len(data) + self.block_size - 1) // self.block_size
+                if not self.output_ring.has_room(blocks_count):
+                    raise BufferOverflow(self.output_ring.bytes)
+                self.event('consume', data)
+                self.schedule_next_iteration()
+                return
             if self.output_buffer_size + len(data) > OUTPUT_BUFFER_SIZE:
                 raise BufferOverflow(self.output_buffer_size)
             if self.output_quality_counter > BLOCKS_PER_ACK * WINDOW_SIZE:
@@ -875,6 +1105,7 @@ class UDPStream(automat.Automat):
                     if current_window > BLOCKS_PER_ACK * WINDOW_SIZE:
                         raise BufferOverflow(self.output_buffer_size)
             self.event('consume', data)
+            self.schedule_next_iteration()
 
     def on_close(self):
         if _Debug:
@@ -883,12 +1114,42 @@ class UDPStream(automat.Automat):
         if self.consumer:
             reactor.callLater(0, self.automat, 'close')  # @UndefinedVariable
 
+    def schedule_next_iteration(self):
+        """
+        Blocks in flight must be re-checked about every two RTT to detect
+        lost blocks and ACKs, otherwise only timeouts need to be verified.
+        In congestion mode the stream wakes up exactly when next block can be sent
+        according to the pacing or when the oldest block in flight times out.
+        """
+        if self.mode == STREAM_MODE_CONGESTION:
+            delay = RTT_MAX_LIMIT / 4.0
+            if self.state == 'SENDING' and len(self.output_ring):
+                if self.output_next_send_delay is not None:
+                    delay = min(delay, self.output_next_send_delay)
+                if self.output_in_flight:
+                    delay = min(delay, self.output_rto_check_time - (time.time() - self.creation_time))
+            elif self.state == 'RECEIVING' and self.input_blocks_to_ack:
+                delay = self.ack_delay
+            elif self.state not in ('SENDING', 'RECEIVING', ):
+                return
+            schedule_iteration(self.stream_id, max(delay, RTT_MIN_LIMIT))
+            return
+        if self.state == 'SENDING' and self.output_blocks:
+            schedule_iteration(self.stream_id, min(max(2.0 * self._rtt_current(), RTT_MIN_LIMIT), POOLING_INTERVAL))
+        elif self.state in ('SENDING', 'RECEIVING', ):
+            schedule_iteration(self.stream_id, RTT_MAX_LIMIT / 4.0)
+
     def _push_blocks(self, data):
-        outp = StringIO(data)
+        outp = BytesIO(data)
         while True:
-            piece = outp.read(BLOCK_SIZE)
+            piece = outp.read(self.block_size)
             if not piece:
                 break
+            if self.mode == STREAM_MODE_CONGESTION:
+                self.output_ring.push(piece)
+                self.output_block_id_current = self.output_ring.last_id()
+                self.output_buffer_size += len(piece)
+                continue
             self.output_block_id_current += 1
             #--- prepare block to be send
             bisect.insort(self.output_blocks_ids, self.output_block_id_current)
@@ -1195,7 +1456,7 @@ class UDPStream(automat.Automat):
                     if last_ack_received_delta < RTT_MAX_LIMIT:
                         self._add_iteration_result('limit3')
                         break
-            output = ''.join((struct.pack('i', block_id), piece))
+            output = b''.join((struct.pack('i', block_id), piece))
             #--- SEND DATA HERE!
             if not self.producer.do_send_data(self.stream_id, self.consumer, output):
                 self._add_iteration_result('limit4')
@@ -1223,6 +1484,131 @@ class UDPStream(automat.Automat):
             self.output_bytes_per_sec_current = self.output_bytes_sent / relative_time
         return new_blocks_counter > 0
 
+    def _send_window(self):
+        """
+        Congestion mode: lost blocks are sent again first, then new blocks,
+        as long as congestion window allows and not faster than pacing rate.
+        """
+        self.output_next_send_delay = None
+        if len(self.output_ring) == 0:
+            #--- nothing to send right now
+            return
+        relative_time = time.time() - self.creation_time
+        if self.state == 'SENDING' or self.state == 'PAUSE':
+            sending_was_limited = relative_time - self.output_limit_iteration_last_time < SENDING_TIMEOUT
+            input_ack_timed_out = relative_time - self.input_ack_last_time > SENDING_TIMEOUT
+            if not sending_was_limited and input_ack_timed_out:
+            #--- no responding activity at all - TIMEOUT
+                if _Debug:
+                    lg.out(self.debug_level, 'TIMEOUT SENDING %d cwnd=%r rto=%r last ack:%r, reltime:%r' % (
+                        self.stream_id, self.output_cc.window(), self.output_cc.rto(),
+                        round(self.input_ack_last_time, 4), relative_time))
+                reactor.callLater(0, self.automat, 'timeout')  # @UndefinedVariable
+                return
+        if self._detect_timed_out_blocks(relative_time):
+            self.output_cc.on_loss(relative_time, timeout=True)
+        rate = self.output_cc.pacing_rate(self.block_size)
+        current_limit = self.calculate_real_output_limit()
+        if current_limit > 0 and current_limit < rate:
+            rate = current_limit
+            self.output_limit_iteration_last_time = relative_time
+        burst = max(PACING_BURST_BLOCKS * self.block_size, rate * RTT_MIN_LIMIT)
+        self.output_pacing_budget = min(
+            self.output_pacing_budget + (relative_time - self.output_pacing_last_time) * rate, burst)
+        self.output_pacing_last_time = relative_time
+        window = self.output_cc.window()
+        blocks_to_send = []
+        while self.output_in_flight + len(blocks_to_send) < window:
+            outblock = None
+            while self.output_lost_ids and outblock is None:
+                outblock = self.output_ring.get(self.output_lost_ids[0])
+                if outblock is None or not outblock.lost:
+                    outblock = None
+                    self.output_lost_ids.pop(0)
+            if outblock is None:
+                outblock = self.output_ring.get(self.output_next_new_id)
+            if outblock is None:
+                #--- all blocks were sent already
+                break
+            if self.output_pacing_budget < len(outblock.data):
+                #--- wait a bit, sending too fast
+                self.output_next_send_delay = (len(outblock.data) - self.output_pacing_budget) / rate
+                self._add_iteration_result('pacing')
+                break
+            self.output_pacing_budget -= len(outblock.data)
+            if outblock.lost:
+                self.output_lost_ids.pop(0)
+                outblock.lost = False
+            else:
+                self.output_next_new_id += 1
+            blocks_to_send.append(outblock)
+        if not blocks_to_send:
+            self._add_iteration_result('skip')
+            return
+        self._send_ring_blocks(blocks_to_send, relative_time)
+        self._add_iteration_result('window')
+
+    def _send_ring_blocks(self, blocks_to_send, relative_time):
+        rto = self.output_cc.rto()
+        for position, outblock in enumerate(blocks_to_send):
+            output = b''.join((struct.pack('i', outblock.block_id), outblock.data))
+            #--- SEND DATA HERE!
+            if not self.producer.do_send_data(self.stream_id, self.consumer, output):
+                #--- blocks which were not sent will be sent first next time
+                self._add_iteration_result('limit4')
+                for notsentblock in blocks_to_send[position:]:
+                    notsentblock.lost = True
+                self.output_lost_ids[0:0] = [notsentblock.block_id for notsentblock in blocks_to_send[position:]]
+                break
+            #--- mark block as sent
+            outblock.time_sent = relative_time
+            outblock.attempts += 1
+            if outblock.attempts > 1:
+                self.output_blocks_errors_counter += 1
+                self.output_error_last_time = relative_time
+            self.output_in_flight += 1
+            data_size = len(outblock.data)
+            self.output_bytes_sent += data_size
+            self.output_bytes_sent_period += data_size
+            self.output_blocks_counter += 1
+            self.output_block_last_time = relative_time
+            self.output_rto_check_time = min(self.output_rto_check_time, relative_time + rto)
+            if _Debug:
+                lg.out(self.debug_level + 8, '<-out BLOCK %d %r %r %d/%d cwnd=%d' % (
+                    self.stream_id, self.eof, outblock.block_id,
+                    self.output_bytes_sent, self.output_bytes_acked, self.output_cc.window()))
+        if relative_time > 0:
+            #--- recalculate current sending speed
+            self.output_bytes_per_sec_current = self.output_bytes_sent / relative_time
+
+    def _detect_timed_out_blocks(self, relative_time):
+        """
+        Marks as lost blocks in flight which were not acked during RTO,
+        block sent again waits twice longer every next attempt.
+        """
+        if not self.output_in_flight or relative_time < self.output_rto_check_time:
+            return False
+        rto = self.output_cc.rto()
+        next_check_time = float('inf')
+        timed_out = False
+        for outblock in self.output_ring:
+            if not outblock.is_in_flight():
+                continue
+            deadline = outblock.time_sent + rto * (2 ** min(outblock.attempts - 1, 4))
+            if deadline <= relative_time:
+                self._mark_block_lost(outblock, relative_time)
+                timed_out = True
+            elif deadline < next_check_time:
+                next_check_time = deadline
+        self.output_rto_check_time = next_check_time
+        return timed_out
+
+    def _mark_block_lost(self, outblock, relative_time):
+        outblock.lost = True
+        self.output_in_flight -= 1
+        self.output_lost_ids.append(outblock.block_id)
+        self.output_quality_counter += 1.0
+
     def _resend_ack(self):
         if self.output_acks_counter == 0:
             #--- do send first ACK
@@ -1259,7 +1645,7 @@ class UDPStream(automat.Automat):
                     relative_time, self.eof, len(self.input_blocks_to_ack),))
             reactor.callLater(0, self.automat, 'timeout')  # @UndefinedVariable
             return
-        if len(self.input_blocks_to_ack) >= BLOCKS_PER_ACK:
+        if len(self.input_blocks_to_ack) >= self.blocks_per_ack:
             #--- received enough blocks to make a group, send ACK
             self._send_ack(self.input_blocks_to_ack, pause_time, why=1)
             return
@@ -1267,6 +1653,10 @@ class UDPStream(automat.Automat):
             #--- at EOF state, send ACK
             self._send_ack(self.input_blocks_to_ack, pause_time, why=3)
             return
+        if self.mode == STREAM_MODE_CONGESTION and self.input_blocks and self.input_blocks_to_ack:
+            #--- some blocks are missing, let sender know immediately
+            self._send_ack(self.input_blocks_to_ack, pause_time, why=5)
+            return
         if self._last_ack_timed_out() and len(self.input_blocks_to_ack) > 0:
             #--- last ack has been long time ago, send ACK
             self._send_ack(self.input_blocks_to_ack, pause_time, why=4)
@@ -1287,15 +1677,21 @@ class UDPStream(automat.Automat):
         if len(acks) == 0 and pause_time == 0.0 and not self.eof:
         #--- SKIP: no pending ACKS, no PAUSE, no EOF
             return
+        if self.mode == STREAM_MODE_CONGESTION:
+        #--- selective ACK: cumulative block ID and bitmap of blocks received out of order
+            ack_data = udp_congestion.pack_sack(
+                self.eof, self.input_block_id_current, self.input_blocks.keys(),
+                pause_time, self.input_limit_bytes_per_sec if pause_time > 0 else 0.0)
+        else:
         #--- prepare EOF state in ACK
-        ack_data = struct.pack('?', self.eof)
+            ack_data = struct.pack('?', self.eof)
         #--- prepare ACKS
-        ack_data += ''.join([struct.pack('i', bid) for bid in acks])
-        if pause_time > 0:
+            ack_data += b''.join([struct.pack('i', bid) for bid in acks])
+            if pause_time > 0:
         #--- add extra "PAUSE REQUIRED" ACK
-            ack_data += struct.pack('i', -1)
-            ack_data += struct.pack('f', pause_time)
-            ack_data += struct.pack('f', self.input_limit_bytes_per_sec)
+                ack_data += struct.pack('i', -1)
+                ack_data += struct.pack('f', pause_time)
+                ack_data += struct.pack('f', self.input_limit_bytes_per_sec)
         ack_len = len(ack_data)
         self.output_bytes_in_acks += ack_len
         self.output_acks_counter += 1
@@ -1323,7 +1719,7 @@ class UDPStream(automat.Automat):
         return (time.time() - self.creation_time) / float(self.input_blocks_counter)
 
     def _last_ack_timed_out(self):
-        return time.time() - self.output_ack_last_time > RTT_MAX_LIMIT / 2.0
+        return time.time() - self.output_ack_last_time > self.ack_delay
 
     def _last_block_timed_out(self):
         return time.time() - self.input_block_last_time > RTT_MAX_LIMIT
@@ -1337,8 +1733,12 @@ class UDPStream(automat.Automat):
     def calculate_real_output_limit(self):
         global _CurrentSendingAvarageRate
         own_limit = self.get_output_limit()
-        avarage_limit = _CurrentSendingAvarageRate * 1.5
         remote_limit = self.get_output_limit_from_remote()
+        if self.mode == STREAM_MODE_CONGESTION:
+            #--- congestion controller shares the bandwidth between streams by itself
+            limits = [l for l in (own_limit, remote_limit, ) if l > 0]
+            return min(limits) if limits else 0.0
+        avarage_limit = _CurrentSendingAvarageRate * 1.5
         return min(own_limit, avarage_limit, remote_limit)
 
     def get_current_output_speed(self):
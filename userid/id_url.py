@@ -55,6 +55,7 @@ _DebugLevel = 12
 
 import os
 import sys
+import json
 import tempfile
 
 #------------------------------------------------------------------------------
@@ -78,6 +79,13 @@ _KnownIDURLs = {}
 _MergedIDURLs = {}
 _KnownSources = {}
 _Ready = False
+_HistoryIndex = {}
+_HistoryIndexChanged = False
+
+#------------------------------------------------------------------------------
+
+HISTORY_INDEX_FILENAME = '.index'
+HISTORY_INDEX_VERSION = 1
 
 #------------------------------------------------------------------------------
 
@@ -88,6 +96,8 @@ def init():
     global _MergedIDURLs
     global _KnownSources
     global _Ready
+    global _HistoryIndex
+    global _HistoryIndexChanged
     from userid import identity
     if _Debug:
         lg.out(_DebugLevel, "id_url.init")
@@ -98,9 +108,14 @@ def init():
         lg.info('created new folder %r' % _IdentityHistoryDir)
     else:
         lg.info('using existing folder %r' % _IdentityHistoryDir)
+    cached_index = read_history_index()
+    _HistoryIndex.clear()
+    verified = 0
     for_cleanup = []
     for one_user_dir in os.listdir(_IdentityHistoryDir):
         one_user_dir_path = os.path.join(_IdentityHistoryDir, one_user_dir)
+        if not os.path.isdir(one_user_dir_path):
+            continue
         one_user_identity_files = []
         for one_filename in os.listdir(one_user_dir_path):
             try:
@@ -114,55 +129,39 @@ def init():
         one_user_identity_files.sort()
         for one_ident_file in one_user_identity_files:
             one_ident_path = os.path.join(one_user_dir_path, strng.to_text(one_ident_file))
+            one_index_key = one_user_dir + '/' + strng.to_text(one_ident_file)
             try:
-                xmlsrc = local_fs.ReadTextFile(one_ident_path)
-                known_id_obj = identity.identity(xmlsrc=xmlsrc)
-                if not known_id_obj.isCorrect():
-                    raise Exception('identity history in %r is broken, identity is not correct: %r' % (
-                        one_user_dir, one_ident_path))
-                if not known_id_obj.Valid():
-                    raise Exception('identity history in %r is broken, identity is not valid: %r' % (
-                        one_user_dir, one_ident_path))
-            except Exception as exc:
-                lg.warn(str(exc))
-                for_cleanup.append(one_ident_path)
+                one_stat = os.stat(one_ident_path)
+            except:
+                lg.exc()
                 continue
-            one_pub_key = known_id_obj.getPublicKey()
-            one_revision = known_id_obj.getRevisionValue()
-            if one_pub_key not in _KnownUsers:
-                _KnownUsers[one_pub_key] = one_user_dir_path
-            known_sources = known_id_obj.getSources(as_originals=True)
-            for known_idurl in reversed(known_sources):
-                if known_idurl not in _KnownIDURLs:
-                    _KnownIDURLs[known_idurl] = known_id_obj.getPublicKey()
-                    if _Debug:
-                        lg.out(_DebugLevel, '    new IDURL added: %r' % known_idurl)
-                else:
-                    if _KnownIDURLs[known_idurl] != known_id_obj.getPublicKey():
-                        _KnownIDURLs[known_idurl] = known_id_obj.getPublicKey()
-                        lg.warn('another user had same identity source: %r' % known_idurl)
-                if one_pub_key not in _MergedIDURLs:
-                    _MergedIDURLs[one_pub_key] = {}
-                    if _Debug:
-                        lg.out(_DebugLevel, '    new Public Key added: %s...' % one_pub_key[-10:])
-                if one_revision in _MergedIDURLs[one_pub_key]:
-                    if _MergedIDURLs[one_pub_key][one_revision] != known_idurl:
-                        if _MergedIDURLs[one_pub_key][one_revision] not in known_sources:
-                            lg.warn('rewriting existing identity revision %d : %r -> %r' % (
-                                one_revision, _MergedIDURLs[one_pub_key][one_revision], known_idurl))
-                    _MergedIDURLs[one_pub_key][one_revision] = known_idurl
-                else:
-                    _MergedIDURLs[one_pub_key][one_revision] = known_idurl
-                    if _Debug:
-                        lg.out(_DebugLevel, '        revision %d merged with other %d known items' % (
-                            one_revision, len(_MergedIDURLs[one_pub_key])))
-                if one_pub_key not in _KnownSources:
-                    _KnownSources[one_pub_key] = []
-                for one_source in known_id_obj.getSources(as_originals=True):
-                    if one_source not in _KnownSources[one_pub_key]:
-                        _KnownSources[one_pub_key].append(one_source)
-                        if _Debug:
-                            lg.out(_DebugLevel, '    new source %r added for %r' % (one_source, one_pub_key[-10:], ))
+            one_record = cached_index.get(one_index_key)
+            if not one_record or one_record[0] != one_stat.st_mtime or one_record[1] != one_stat.st_size:
+                # only new or modified files are parsed and verified again
+                try:
+                    xmlsrc = local_fs.ReadTextFile(one_ident_path)
+                    known_id_obj = identity.identity(xmlsrc=xmlsrc)
+                    if not known_id_obj.isCorrect():
+                        raise Exception('identity history in %r is broken, identity is not correct: %r' % (
+                            one_user_dir, one_ident_path))
+                    if not known_id_obj.Valid():
+                        raise Exception('identity history in %r is broken, identity is not valid: %r' % (
+                            one_user_dir, one_ident_path))
+                except Exception as exc:
+                    lg.warn(str(exc))
+                    for_cleanup.append(one_ident_path)
+                    continue
+                one_record = (
+                    one_stat.st_mtime,
+                    one_stat.st_size,
+                    known_id_obj.getPublicKey(),
+                    known_id_obj.getRevisionValue(),
+                    known_id_obj.getSources(as_originals=True),
+                )
+                _HistoryIndexChanged = True
+                verified += 1
+            _HistoryIndex[one_index_key] = one_record
+            _merge_history_record(one_user_dir_path, one_record[2], one_record[3], one_record[4])
     for one_ident_path in for_cleanup:
         if os.path.isfile(one_ident_path):
             lg.warn('about to erase broken historical identity file: %r' % one_ident_path)
@@ -170,6 +169,12 @@ def init():
                 os.remove(one_ident_path)
             except:
                 lg.exc()
+    if len(_HistoryIndex) != len(cached_index):
+        _HistoryIndexChanged = True
+    if _HistoryIndexChanged:
+        save_history_index()
+    lg.info('loaded %d identity history records of %d users, %d records verified' % (
+        len(_HistoryIndex), len(_KnownUsers), verified, ))
     _Ready = True
 
 
@@ -180,15 +185,135 @@ def shutdown():
     global _Ready
     global _MergedIDURLs
     global _KnownSources
+    global _HistoryIndex
+    global _HistoryIndexChanged
+    if _HistoryIndexChanged and _IdentityHistoryDir:
+        save_history_index()
     _IdentityHistoryDir = None
     _KnownUsers.clear()
     _KnownIDURLs.clear()
     _MergedIDURLs.clear()
     _KnownSources.clear()
+    _HistoryIndex.clear()
+    _HistoryIndexChanged = False
     _Ready = False
 
 #------------------------------------------------------------------------------
 
+def _merge_history_record(one_user_dir_path, one_pub_key, one_revision, known_sources):
+    global _KnownUsers
+    global _KnownIDURLs
+    global _MergedIDURLs
+    global _KnownSources
+    if one_pub_key not in _KnownUsers:
+        _KnownUsers[one_pub_key] = one_user_dir_path
+    for known_idurl in reversed(known_sources):
+        if known_idurl not in _KnownIDURLs:
+            _KnownIDURLs[known_idurl] = one_pub_key
+            if _Debug:
+                lg.out(_DebugLevel, '    new IDURL added: %r' % known_idurl)
+        else:
+            if _KnownIDURLs[known_idurl] != one_pub_key:
+                _KnownIDURLs[known_idurl] = one_pub_key
+                lg.warn('another user had same identity source: %r' % known_idurl)
+        if one_pub_key not in _MergedIDURLs:
+            _MergedIDURLs[one_pub_key] = {}
+            if _Debug:
+                lg.out(_DebugLevel, '    new Public Key added: %s...' % one_pub_key[-10:])
+        if one_revision in _MergedIDURLs[one_pub_key]:
+            if _MergedIDURLs[one_pub_key][one_revision] != known_idurl:
+                if _MergedIDURLs[one_pub_key][one_revision] not in known_sources:
+                    lg.warn('rewriting existing identity revision %d : %r -> %r' % (
+                        one_revision, _MergedIDURLs[one_pub_key][one_revision], known_idurl))
+            _MergedIDURLs[one_pub_key][one_revision] = known_idurl
+        else:
+            _MergedIDURLs[one_pub_key][one_revision] = known_idurl
+            if _Debug:
+                lg.out(_DebugLevel, '        revision %d merged with other %d known items' % (
+                    one_revision, len(_MergedIDURLs[one_pub_key])))
+        if one_pub_key not in _KnownSources:
+            _KnownSources[one_pub_key] = []
+        for one_source in known_sources:
+            if one_source not in _KnownSources[one_pub_key]:
+                _KnownSources[one_pub_key].append(one_source)
+                if _Debug:
+                    lg.out(_DebugLevel, '    new source %r added for %r' % (one_source, one_pub_key[-10:], ))
+
+#------------------------------------------------------------------------------
+
+def history_index_filepath():
+    global _IdentityHistoryDir
+    return os.path.join(_IdentityHistoryDir, HISTORY_INDEX_FILENAME)
+
+
+def read_history_index():
+    """
+    Loads index of already verified identity history files in one read.
+    Every record is a tuple: (mtime, size, public key, revision, sources).
+    Returns empty dictionary if index not exist or can not be read.
+    """
+    index_path = history_index_filepath()
+    if not os.path.isfile(index_path):
+        return {}
+    result = {}
+    try:
+        json_data = json.loads(local_fs.ReadTextFile(index_path))
+        if json_data.get('version') != HISTORY_INDEX_VERSION:
+            lg.warn('identity history index version mismatch in %r, rebuilding' % index_path)
+            return {}
+        pub_keys = [strng.to_bin(k) for k in json_data['keys']]
+        for index_key, (mtime, size, key_pos, revision, sources_list) in json_data['files'].items():
+            result[index_key] = (mtime, size, pub_keys[key_pos], int(revision), [strng.to_bin(i) for i in sources_list], )
+    except:
+        lg.exc('identity history index is broken: %r' % index_path)
+        return {}
+    return result
+
+
+def save_history_index():
+    """
+    Writes index of verified identity history files, public keys are stored only once.
+    """
+    global _HistoryIndex
+    global _HistoryIndexChanged
+    pub_keys = {}
+    files = {}
+    for index_key, (mtime, size, pub_key, revision, sources_list) in _HistoryIndex.items():
+        if pub_key not in pub_keys:
+            pub_keys[pub_key] = len(pub_keys)
+        files[index_key] = [mtime, size, pub_keys[pub_key], revision, [strng.to_text(i) for i in sources_list], ]
+    json_data = {
+        'version': HISTORY_INDEX_VERSION,
+        'keys': [strng.to_text(k) for k, _ in sorted(pub_keys.items(), key=lambda i: i[1])],
+        'files': files,
+    }
+    if not local_fs.WriteBinaryFile(history_index_filepath(), json.dumps(json_data, separators=(',', ':'))):
+        return False
+    _HistoryIndexChanged = False
+    return True
+
+
+def _index_history_file(identity_file_path, id_obj):
+    global _IdentityHistoryDir
+    global _HistoryIndex
+    global _HistoryIndexChanged
+    index_key = os.path.relpath(identity_file_path, _IdentityHistoryDir).replace(os.sep, '/')
+    _HistoryIndexChanged = True
+    if id_obj is None or not os.path.isfile(identity_file_path):
+        _HistoryIndex.pop(index_key, None)
+        return False
+    one_stat = os.stat(identity_file_path)
+    _HistoryIndex[index_key] = (
+        one_stat.st_mtime,
+        one_stat.st_size,
+        id_obj.getPublicKey(),
+        id_obj.getRevisionValue(),
+        id_obj.getSources(as_originals=True),
+    )
+    return True
+
+#------------------------------------------------------------------------------
+
 def known():
     global _KnownIDURLs
     return _KnownIDURLs
@@ -247,6 +372,7 @@ def identity_cached(new_id_obj):
         _KnownUsers[pub_key] = user_path
         first_identity_file_path = os.path.join(user_path, '0')
         local_fs.WriteBinaryFile(first_identity_file_path, new_id_obj.serialize())
+        _index_history_file(first_identity_file_path, new_id_obj)
         if _Debug:
             lg.out(_DebugLevel, 'id_url.identity_cached wrote first item for user %r in identity history: %r' % (
                 user_name, first_identity_file_path))
@@ -296,6 +422,7 @@ def identity_cached(new_id_obj):
                 new_sources = new_id_obj.getSources(as_originals=True)
                 if latest_sources == new_sources:
                     local_fs.WriteBinaryFile(latest_identity_file_path, new_id_obj.serialize())
+                    _index_history_file(latest_identity_file_path, new_id_obj)
                     if _Debug:
                         lg.out(_DebugLevel, 'id_url.identity_cached latest identity sources for user %r did not changed, updated file %r' % (
                             user_name, latest_identity_file_path))
@@ -303,12 +430,14 @@ def identity_cached(new_id_obj):
                     next_identity_file = user_identity_files[-1] + 1
                     next_identity_file_path = os.path.join(user_path, strng.to_text(next_identity_file))
                     local_fs.WriteBinaryFile(next_identity_file_path, new_id_obj.serialize())
+                    _index_history_file(next_identity_file_path, new_id_obj)
                     is_identity_rotated = True
                     if _Debug:
                         lg.out(_DebugLevel, 'id_url.identity_cached identity sources for user %r changed, wrote new item in the history: %r' % (
                             user_name, next_identity_file_path))
     new_revision = new_id_obj.getRevisionValue()
     new_sources = new_id_obj.getSources(as_originals=True)
+    is_merged_changed = False
     for new_idurl in reversed(new_sources):
         if new_idurl not in _KnownIDURLs:
             _KnownIDURLs[new_idurl] = new_id_obj.getPublicKey()
@@ -323,6 +452,8 @@ def identity_cached(new_id_obj):
             if _Debug:
                 lg.out(_DebugLevel, 'id_url.identity_cached new Public Key added: %s...' % pub_key[-10:])
         prev_idurl = _MergedIDURLs[pub_key].get(new_revision, None)
+        if prev_idurl != new_idurl:
+            is_merged_changed = True
         if new_revision in _MergedIDURLs[pub_key]:
             if _MergedIDURLs[pub_key][new_revision] != new_idurl:
                 if nameurl.GetName(_MergedIDURLs[pub_key][new_revision]) == nameurl.GetName(new_idurl):
@@ -344,6 +475,11 @@ def identity_cached(new_id_obj):
                 lg.out(_DebugLevel, 'id_url.identity_cached added new source %r for user %r' % (one_source, user_name, ))
     if _Debug:
         lg.args(_DebugLevel, is_identity_rotated=is_identity_rotated, latest_id_obj=bool(latest_id_obj))
+    if is_merged_changed:
+        from userid import my_id
+        if my_id.isLocalIdentityReady() and my_id.getLocalIdentity().getPublicKey() == pub_key:
+            # list of my own known IDURLs was changed
+            my_id.forgetKnownIDURLs()
     if is_identity_rotated and latest_id_obj is not None:
         latest_revision = latest_id_obj.getRevisionValue()
         if _Debug:
@@ -392,6 +528,7 @@ def identity_cached(new_id_obj):
                 os.remove(identity_file_path)
             except:
                 lg.exc()
+        _index_history_file(identity_file_path, None)
     return True
 
 #------------------------------------------------------------------------------
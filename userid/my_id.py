@@ -63,6 +63,7 @@ from main import events
 from lib import misc
 from lib import nameurl
 from lib import strng
+from lib import serialization
 
 from crypt import key
 
@@ -75,6 +76,8 @@ _LocalIdentity = None
 _LocalIDURL = None
 _LocalID = None
 _LocalName = None
+_KnownIDURLs = None
+_KnownIDURLsVersion = 0
 _ValidTransports = ['tcp', 'udp', 'http', 'proxy', ]
 
 #------------------------------------------------------------------------------
@@ -151,6 +154,7 @@ def setLocalIdentity(ident):
         id_url.identity_cached(_LocalIdentity)
     except:
         lg.exc()
+    forgetKnownIDURLs()
 
 
 def setLocalIdentityXML(idxml):
@@ -218,6 +222,34 @@ def getID():
     """
     return getGlobalID()
 
+
+def getKnownIDURLs():
+    """
+    Returns list of my latest known IDURLs (as binary strings), including IDURLs from before identity rotation.
+    Result is cached until my identity is changed, see ``forgetKnownIDURLs()``.
+    """
+    global _KnownIDURLs
+    if _KnownIDURLs is None:
+        if not isLocalIdentityReady():
+            return []
+        _KnownIDURLs = id_url.list_known_idurls(getIDURL(), num_revisions=10, include_revisions=False)
+    return _KnownIDURLs
+
+
+def getKnownIDURLsVersion():
+    """
+    Incremented every time list of my known IDURLs is changed, useful to invalidate dependent caches.
+    """
+    global _KnownIDURLsVersion
+    return _KnownIDURLsVersion
+
+
+def forgetKnownIDURLs():
+    global _KnownIDURLs
+    global _KnownIDURLsVersion
+    _KnownIDURLs = None
+    _KnownIDURLsVersion += 1
+
 #------------------------------------------------------------------------------
 
 
@@ -308,6 +340,7 @@ def forgetLocalIdentity():
     _LocalIDURL = None
     _LocalID = None
     _LocalName = None
+    forgetKnownIDURLs()
     events.send('local-identity-cleaned', data=dict())
     return True
 
@@ -589,7 +622,8 @@ def rebuildLocalIdentity(identity_object=None, skip_transports=[], new_sources=N
     repo = 'sources'
     # lid.setVersion((vernum + b' ' + strng.to_bin(repo.strip()) + b' ' + strng.to_bin(bpio.osinfo().strip()).strip()))
     # TODO: add latest commit hash from the GIT repo to the version
-    lid.setVersion(vernum + b' ' + strng.to_bin(repo.strip()))
+    # let other nodes know that packets can be sent to me in binary form
+    lid.setVersion(vernum + b' ' + strng.to_bin(repo.strip()) + b' ' + strng.to_bin(serialization.BINARY_FORMAT_TAG))
     # generate signature with changed content
     lid.sign()
     new_xmlsrc = lid.serialize()